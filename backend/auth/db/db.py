@@ -3,7 +3,7 @@ import importlib
 import os
 import pkgutil
 from pathlib import Path
-from threading import Lock
+from threading import RLock
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
@@ -15,7 +15,7 @@ load_dotenv()
 
 engine = None
 SessionLocal = None
-_db_lock = Lock()
+_db_lock = RLock()  # get_session_local chama get_engine com o lock adquirido
 
 def get_engine():
     global engine
@@ -47,13 +47,13 @@ def get_db():
 
 def create_tables():
     """Importa os modelos APÓS criar a Base"""
-    _import_all_models()
+    import_all_models()
 
     db_engine = get_engine()
     Base.metadata.create_all(bind=db_engine)
 
 def drop_tables():
-    _import_all_models()
+    import_all_models()
     db_engine = get_engine()
     Base.metadata.drop_all(bind=db_engine)
 
@@ -78,10 +78,11 @@ def _get_database_url() -> str:
     raise ValueError("DATABASE_URL não está definida e as variáveis POSTGRES_* não foram informadas.")
 
 
-def _import_all_models():
+def import_all_models():
     """
     Carrega todos os módulos em models/ dinamicamente para garantir que Base.metadata conheça todas as tabelas.
-    Evita ter que manter uma lista manual em create_tables().
+    Evita ter que manter uma lista manual em create_tables(). Processos filhos (pool do
+    match_sharding) chamam na inicializacao para resolver os relacionamentos entre modelos.
     """
     package_name = "models"
     models_pkg = importlib.import_module(package_name)
@@ -194,6 +194,20 @@ CREATE TABLE IF NOT EXISTS perfis_produtores (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE TABLE IF NOT EXISTS producer_match_features (
+    produtor_id INTEGER PRIMARY KEY REFERENCES perfis_produtores(id) ON DELETE CASCADE,
+    total_propostas INTEGER NOT NULL DEFAULT 0,
+    contratos_fechados INTEGER NOT NULL DEFAULT 0,
+    respostas INTEGER NOT NULL DEFAULT 0,
+    total_horas_resposta FLOAT NOT NULL DEFAULT 0,
+    documentos_avaliados INTEGER NOT NULL DEFAULT 0,
+    documentos_aprovados INTEGER NOT NULL DEFAULT 0,
+    latitude FLOAT,
+    longitude FLOAT,
+    celula_geo INTEGER,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE IF NOT EXISTS documentos_produtor (
     id SERIAL PRIMARY KEY,
     produtor_id INTEGER NOT NULL REFERENCES perfis_produtores(id) ON DELETE CASCADE,
@@ -322,15 +336,46 @@ CREATE TABLE IF NOT EXISTS execucoes_match (
     tipo_execucao VARCHAR(50) DEFAULT 'auto',
     status VARCHAR(50) DEFAULT 'running',
     parametros_json JSONB,
+    chave_cache VARCHAR(64),
     iniciada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     finalizada_em TIMESTAMP,
     criada_por_user_id INTEGER REFERENCES users(id)
 );
 
+CREATE TABLE IF NOT EXISTS perfis_pesos_match (
+    id SERIAL PRIMARY KEY,
+    organizacao_id INTEGER NOT NULL REFERENCES organizacoes(id) ON DELETE CASCADE,
+    nome VARCHAR(100) NOT NULL,
+    pesos_json JSONB,
+    contexto_json JSONB,
+    padrao BOOLEAN NOT NULL DEFAULT FALSE,
+    ativo BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (organizacao_id, nome)
+);
+
+-- Contador de escritas por tabela lido pela marca d'agua do cache de match (services/match_cache)
+CREATE TABLE IF NOT EXISTS versoes_dados_match (
+    tabela VARCHAR(100) PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO versoes_dados_match (tabela, versao) VALUES
+    ('perfis_produtores', 0),
+    ('itens_producao', 0),
+    ('periodos_capacidade', 0),
+    ('propostas', 0),
+    ('documentos_produtor', 0),
+    ('producer_match_features', 0),
+    ('reservas_capacidade', 0)
+ON CONFLICT (tabela) DO NOTHING;
+
 CREATE TABLE IF NOT EXISTS candidatos_match (
     id SERIAL PRIMARY KEY,
     execucao_match_id INTEGER NOT NULL REFERENCES execucoes_match(id) ON DELETE CASCADE,
     tipo_candidato VARCHAR(50) NOT NULL,
+    produtor_id INTEGER REFERENCES perfis_produtores(id) ON DELETE CASCADE,
     score_total NUMERIC(10, 2) NOT NULL,
     explicacao_json JSONB,
     percentual_cobertura NUMERIC(5, 2),
@@ -500,6 +545,25 @@ CREATE TABLE IF NOT EXISTS notificacoes (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- ============================================================================
+-- MIGRAÇÕES IDEMPOTENTES (bancos criados por versões anteriores deste script)
+-- ============================================================================
+
+-- Chave do cache de resultados do match (services/match_cache)
+ALTER TABLE execucoes_match ADD COLUMN IF NOT EXISTS chave_cache VARCHAR(64);
+
+-- Produtor do candidato individual (re-match incremental, services/match_incremental)
+ALTER TABLE candidatos_match ADD COLUMN IF NOT EXISTS produtor_id INTEGER REFERENCES perfis_produtores(id) ON DELETE CASCADE;
+
+-- A marca d'agua do cache lê versoes_dados_match: estes índices não são mais usados
+DROP INDEX IF EXISTS idx_perfis_produtores_updated_at;
+DROP INDEX IF EXISTS idx_itens_prod_updated_at;
+DROP INDEX IF EXISTS idx_per_cap_updated_at;
+DROP INDEX IF EXISTS idx_propostas_updated_at;
+DROP INDEX IF EXISTS idx_doc_prod_updated_at;
+DROP INDEX IF EXISTS idx_res_cap_updated_at;
+DROP INDEX IF EXISTS idx_producer_match_features_atualizado_em;
+
 -- ============================================================================
 -- ÍNDICES PARA PERFORMANCE
 -- ============================================================================
@@ -529,6 +593,7 @@ CREATE INDEX IF NOT EXISTS idx_tipos_documentos_codigo ON tipos_documentos(codig
 CREATE INDEX IF NOT EXISTS idx_arquivos_hash ON arquivos(hash_arquivo);
 CREATE INDEX IF NOT EXISTS idx_perfis_produtores_user_id ON perfis_produtores(user_id);
 CREATE INDEX IF NOT EXISTS idx_perfis_produtores_status ON perfis_produtores(status_perfil);
+CREATE INDEX IF NOT EXISTS ix_producer_match_features_celula_geo ON producer_match_features(celula_geo);
 CREATE INDEX IF NOT EXISTS idx_docs_produtor_produtor_id ON documentos_produtor(produtor_id);
 CREATE INDEX IF NOT EXISTS idx_docs_produtor_tipo ON documentos_produtor(tipo_documento_id);
 CREATE INDEX IF NOT EXISTS idx_docs_produtor_status ON documentos_produtor(status);
@@ -548,13 +613,17 @@ CREATE INDEX IF NOT EXISTS idx_itens_dem_user_id ON itens_demanda(user_id);
 CREATE INDEX IF NOT EXISTS idx_req_dem_versao_id ON requisitos_demanda(versao_demanda_id);
 CREATE INDEX IF NOT EXISTS idx_exec_match_versao_id ON execucoes_match(versao_demanda_id);
 CREATE INDEX IF NOT EXISTS idx_exec_match_status ON execucoes_match(status);
+CREATE INDEX IF NOT EXISTS idx_exec_match_versao_chave ON execucoes_match(versao_demanda_id, chave_cache);
+CREATE INDEX IF NOT EXISTS idx_perfis_pesos_match_org_id ON perfis_pesos_match(organizacao_id);
 CREATE INDEX IF NOT EXISTS idx_cand_match_exec_id ON candidatos_match(execucao_match_id);
+CREATE INDEX IF NOT EXISTS idx_cand_match_produtor_id ON candidatos_match(produtor_id);
 CREATE INDEX IF NOT EXISTS idx_grupos_forn_versao_id ON grupos_fornecedores(versao_demanda_id);
 CREATE INDEX IF NOT EXISTS idx_grupos_forn_status ON grupos_fornecedores(status);
 CREATE INDEX IF NOT EXISTS idx_membros_grupos_grupo_id ON membros_grupos(grupo_id);
 CREATE INDEX IF NOT EXISTS idx_membros_grupos_produtor_id ON membros_grupos(produtor_id);
 CREATE INDEX IF NOT EXISTS idx_aloc_grupos_grupo_id ON alocacoes_grupos(grupo_id);
 CREATE INDEX IF NOT EXISTS idx_aloc_grupos_item_dem_id ON alocacoes_grupos(item_demanda_id);
+CREATE INDEX IF NOT EXISTS idx_aloc_grupos_produtor_id ON alocacoes_grupos(produtor_id);
 CREATE INDEX IF NOT EXISTS idx_propostas_versao_id ON propostas(versao_demanda_id);
 CREATE INDEX IF NOT EXISTS idx_propostas_org_id ON propostas(organizacao_id);
 CREATE INDEX IF NOT EXISTS idx_propostas_status ON propostas(status);
@@ -19,6 +19,12 @@ from routers import (
 from fastapi.security import HTTPBearer
 from db.db import create_tables, get_db
 from services.seed_catalog import seed_catalogo
+from services.match_features import reconstruir_features
+from services.match_jobs import retomar_execucoes_pendentes
+from services.edital_jobs import retomar_jobs_pendentes
+from services.worker_pool import encerrar_pools
+from services import extracao_pdf
+from services.match_sharding import encerrar_processos
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
@@ -39,7 +45,34 @@ async def lifespan(app: FastAPI):
         print("Catalog seeded.")
     except Exception as e:
         print(f"Warning: Could not seed catalog: {e}")
+    # Preenche features de match para produtores que ainda não têm linha na tabela
+    try:
+        db = next(get_db())
+        total = reconstruir_features(db, somente_ausentes=True)
+        db.close()
+        print(f"Match features filled for {total} producers.")
+    except Exception as e:
+        print(f"Warning: Could not fill match features: {e}")
+    # Retoma execuções de match que estavam na fila quando o servidor parou
+    try:
+        db = next(get_db())
+        total = retomar_execucoes_pendentes(db)
+        db.close()
+        print(f"Match executions requeued: {total}.")
+    except Exception as e:
+        print(f"Warning: Could not resume match executions: {e}")
+    # Retoma processamentos de edital interrompidos ou na fila quando o servidor parou
+    try:
+        db = next(get_db())
+        total = retomar_jobs_pendentes(db)
+        db.close()
+        print(f"Edital jobs requeued: {total}.")
+    except Exception as e:
+        print(f"Warning: Could not resume edital jobs: {e}")
     yield
+    encerrar_pools(wait=False)
+    encerrar_processos(wait=False)
+    extracao_pdf.encerrar_processos(wait=False)
 
 # Criar uma instância do aplicativo FastAPI
 app = FastAPI(title="Autenticador", version="1.0.0", root_path="/api/auth", lifespan=lifespan)
@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, TIMESTAMP, ForeignKey, Text, JSON, Numeric
+from sqlalchemy import Boolean, Integer, String, TIMESTAMP, ForeignKey, Text, JSON, Numeric, BigInteger, UniqueConstraint
 from sqlalchemy.orm import mapped_column, relationship
 from db.base import Base
 
@@ -39,3 +39,48 @@ class ItemRascunho(Base):
 
     # Relacionamentos
     rascunho = relationship("RascunhoEdital", back_populates="itens")
+
+
+class AnaliseEditalCache(Base):
+    """Análise de edital já feita, reaproveitada quando o mesmo PDF é enviado de novo (services/edital_cache)"""
+    __tablename__ = "cache_analises_editais"
+    __table_args__ = (UniqueConstraint("hash_arquivo", "modelo", "versao_prompt", "modo_extracao"),)
+
+    id = mapped_column(Integer, primary_key=True)
+    hash_arquivo = mapped_column(String(64), nullable=False, index=True)  # SHA256 do PDF
+    modelo = mapped_column(String(100), nullable=False)  # modelo do Gemini
+    versao_prompt = mapped_column(String(20), nullable=False)
+    modo_extracao = mapped_column(String(30), nullable=False, default="completo")  # "completo" ou "relevante:<max_chars>"
+    texto_extraido = mapped_column(Text, nullable=False)
+    payload_json = mapped_column(JSON, nullable=False)  # payload já normalizado
+    caminho_storage = mapped_column(String(500), nullable=False)  # PDF gravado no primeiro envio
+    tamanho_bytes = mapped_column(BigInteger, nullable=True)
+    acessos = mapped_column(Integer, default=0, nullable=False)
+    criado_em = mapped_column(TIMESTAMP, nullable=False)  # TTL conta a partir daqui
+    ultimo_acesso_em = mapped_column(TIMESTAMP, nullable=False, index=True)  # ordem do LRU
+
+
+class JobEdital(Base):
+    """Processamento de edital em segundo plano (services/edital_jobs)"""
+    __tablename__ = "jobs_editais"
+
+    id = mapped_column(Integer, primary_key=True)
+    status = mapped_column(String(20), default="queued", nullable=False, index=True)  # queued|running|completed|failed
+    etapa = mapped_column(String(30), default="upload", nullable=False)  # upload|extracao|ia|normalizacao|persistencia|concluido
+    progresso = mapped_column(Integer, default=0, nullable=False)  # 0-100
+    organizacao_id = mapped_column(Integer, ForeignKey("organizacoes.id"), nullable=True)
+    criada_por_user_id = mapped_column(Integer, ForeignKey("users.id"), nullable=True)
+    gerar_rascunho = mapped_column(Boolean, default=True, nullable=False)
+    nome_original = mapped_column(String(255), nullable=False)
+    caminho_storage = mapped_column(String(500), nullable=False)  # PDF já gravado no envio
+    tamanho_bytes = mapped_column(BigInteger, nullable=True)
+    hash_arquivo = mapped_column(String(64), nullable=False)
+    rascunho_id = mapped_column(Integer, ForeignKey("rascunhos_editais.id"), nullable=True)
+    resultado_json = mapped_column(JSON, nullable=True)  # EditalProcessamentoResponse
+    erro = mapped_column(Text, nullable=True)
+    criado_em = mapped_column(TIMESTAMP, server_default='NOW()')
+    iniciado_em = mapped_column(TIMESTAMP, nullable=True)
+    finalizado_em = mapped_column(TIMESTAMP, nullable=True)
+
+    # Relacionamentos
+    rascunho = relationship("RascunhoEdital")
@@ -0,0 +1,21 @@
+# models/FeaturesMatch_model.py
+from sqlalchemy import Integer, TIMESTAMP, ForeignKey, Float
+from sqlalchemy.orm import mapped_column
+from db.base import Base
+
+
+class FeaturesMatchProdutor(Base):
+    """Agregados por produtor usados no score de match, mantidos a cada escrita relevante"""
+    __tablename__ = "producer_match_features"
+
+    produtor_id = mapped_column(Integer, ForeignKey("perfis_produtores.id", ondelete="CASCADE"), primary_key=True)
+    total_propostas = mapped_column(Integer, default=0, nullable=False)
+    contratos_fechados = mapped_column(Integer, default=0, nullable=False)  # contratos generated|signed
+    respostas = mapped_column(Integer, default=0, nullable=False)  # confirmações respondidas
+    total_horas_resposta = mapped_column(Float, default=0.0, nullable=False)
+    documentos_avaliados = mapped_column(Integer, default=0, nullable=False)
+    documentos_aprovados = mapped_column(Integer, default=0, nullable=False)
+    latitude = mapped_column(Float, nullable=True)  # do usuário ou de endereco_json
+    longitude = mapped_column(Float, nullable=True)
+    celula_geo = mapped_column(Integer, nullable=True, index=True)  # célula da grade (services/geo_index)
+    atualizado_em = mapped_column(TIMESTAMP, server_default='NOW()', onupdate='NOW()')
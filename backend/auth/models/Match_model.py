@@ -1,5 +1,5 @@
 # models/Match_model.py
-from sqlalchemy import Integer, String, TIMESTAMP, ForeignKey, JSON, Numeric, Date
+from sqlalchemy import BigInteger, Integer, String, TIMESTAMP, ForeignKey, JSON, Numeric, Date, Boolean
 from sqlalchemy.orm import mapped_column, relationship
 from db.base import Base
 
@@ -11,8 +11,9 @@ class ExecucaoMatch(Base):
     id = mapped_column(Integer, primary_key=True)
     versao_demanda_id = mapped_column(Integer, ForeignKey("versoes_demanda.id"), nullable=False)
     tipo_execucao = mapped_column(String(50), default='auto', nullable=False)  # auto|manual_trigger
-    status = mapped_column(String(50), default='running', nullable=False)  # running|completed|failed
+    status = mapped_column(String(50), default='running', nullable=False)  # queued|running|completed|failed
     parametros_json = mapped_column(JSON, nullable=True)  # pesos, regras
+    chave_cache = mapped_column(String(64), nullable=True, index=True)  # services/match_cache
     iniciada_em = mapped_column(TIMESTAMP, server_default='NOW()')
     finalizada_em = mapped_column(TIMESTAMP, nullable=True)
     criada_por_user_id = mapped_column(Integer, ForeignKey("users.id"), nullable=True)
@@ -24,6 +25,29 @@ class ExecucaoMatch(Base):
     grupos_fornecedores = relationship("GrupoFornecedor", back_populates="criado_de_match")
 
 
+class PerfilPesosMatch(Base):
+    """Perfil nomeado de pesos e regras de contexto do score de match, por organização"""
+    __tablename__ = "perfis_pesos_match"
+
+    id = mapped_column(Integer, primary_key=True)
+    organizacao_id = mapped_column(Integer, ForeignKey("organizacoes.id", ondelete="CASCADE"), nullable=False, index=True)
+    nome = mapped_column(String(100), nullable=False)  # único por organização
+    pesos_json = mapped_column(JSON, nullable=True)  # {compatibilidade_produto: 0.3, ...}; ausentes = padrão
+    contexto_json = mapped_column(JSON, nullable=True)  # {urgencia, sazonalidade, prioridades_edital}
+    padrao = mapped_column(Boolean, default=False, nullable=False)  # usado pelo motor nas demandas da organização
+    ativo = mapped_column(Boolean, default=True, nullable=False)
+    created_at = mapped_column(TIMESTAMP, server_default='NOW()')
+    updated_at = mapped_column(TIMESTAMP, server_default='NOW()', onupdate='NOW()')
+
+
+class VersaoDadosMatch(Base):
+    """Contador de escritas de cada tabela que alimenta o match (marca d'água do cache, services/match_cache)"""
+    __tablename__ = "versoes_dados_match"
+
+    tabela = mapped_column(String(100), primary_key=True)
+    versao = mapped_column(BigInteger, default=0, nullable=False)
+
+
 class CandidatoMatch(Base):
     """Candidatos gerados pelo motor de match (individual ou grupo)"""
     __tablename__ = "candidatos_match"
@@ -31,6 +55,7 @@ class CandidatoMatch(Base):
     id = mapped_column(Integer, primary_key=True)
     execucao_match_id = mapped_column(Integer, ForeignKey("execucoes_match.id", ondelete="CASCADE"), nullable=False)
     tipo_candidato = mapped_column(String(50), nullable=False)  # single|group
+    produtor_id = mapped_column(Integer, ForeignKey("perfis_produtores.id", ondelete="CASCADE"), nullable=True, index=True)  # apenas single
     score_total = mapped_column(Numeric(10, 2), nullable=False)
     explicacao_json = mapped_column(JSON, nullable=True)  # por quê recomendado
     percentual_cobertura = mapped_column(Numeric(5, 2), nullable=True)  # % dos itens cobertos
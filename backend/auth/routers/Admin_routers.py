@@ -9,6 +9,9 @@ import csv
 import io
 
 from schemas.Admin_schema import (
+    PerfilPesosMatchCreate,
+    PerfilPesosMatchUpdate,
+    PerfilPesosMatchResponse,
     SubstituicaoEquivalenciaCreate,
     SubstituicaoEquivalenciaUpdate,
     SubstituicaoEquivalenciaResponse,
@@ -19,6 +22,7 @@ from schemas.Admin_schema import (
     DashboardEditalResponse
 )
 from models.Catalogo_model import SubstitucaoEquivalencia, CatalogoProduto
+from models.Match_model import PerfilPesosMatch
 from models.User_model import User
 from models.Organizacao_model import Organizacao
 from models.Demanda_model import Demanda, VersaoDemanda
@@ -27,6 +31,7 @@ from models.Contrato_model import Contrato
 from models.Auditoria_model import EventoAuditoria
 from models.PerfilProdutor_model import PerfilProdutor
 from security.security import get_current_user, get_db
+from services import equivalencias, perfis_pesos
 
 router = APIRouter(tags=["Admin"], prefix="/admin")
 
@@ -112,6 +117,8 @@ async def criar_equivalencia(
     db.add(equivalencia)
     db.commit()
     db.refresh(equivalencia)
+    # O motor de match guarda o fecho das equivalências em memória
+    equivalencias.invalidar()
 
     return _build_equivalencia_response(equivalencia, db)
 
@@ -152,10 +159,73 @@ async def atualizar_equivalencia(
 
     db.commit()
     db.refresh(equivalencia)
+    equivalencias.invalidar()
 
     return _build_equivalencia_response(equivalencia, db)
 
 
+# ===== PERFIS DE PESOS DO MATCH (RF-31) =====
+
+@router.post("/perfis-pesos", status_code=status.HTTP_201_CREATED, response_model=PerfilPesosMatchResponse)
+async def criar_perfil_pesos(
+    perfil_data: PerfilPesosMatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """RF-31: Perfil nomeado de pesos e contexto do score, por organização"""
+    if not db.query(Organizacao).filter(Organizacao.id == perfil_data.organizacao_id).first():
+        raise HTTPException(status_code=404, detail="Organização não encontrada")
+
+    perfil = PerfilPesosMatch(organizacao_id=perfil_data.organizacao_id)
+    _aplicar_perfil_pesos(perfil, perfil_data.dict(exclude={"organizacao_id"}), db)
+    db.add(perfil)
+    db.commit()
+    db.refresh(perfil)
+    # O motor de match guarda os planos compilados em memória
+    perfis_pesos.invalidar()
+
+    return _build_perfil_pesos_response(perfil)
+
+
+@router.get("/perfis-pesos", response_model=List[PerfilPesosMatchResponse])
+async def listar_perfis_pesos(
+    organizacao_id: int = None,
+    ativo: bool = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Lista perfis de pesos do match"""
+    query = db.query(PerfilPesosMatch)
+
+    if organizacao_id is not None:
+        query = query.filter(PerfilPesosMatch.organizacao_id == organizacao_id)
+    if ativo is not None:
+        query = query.filter(PerfilPesosMatch.ativo == ativo)
+
+    return [_build_perfil_pesos_response(p) for p in query.order_by(PerfilPesosMatch.id).all()]
+
+
+@router.patch("/perfis-pesos/{perfil_id}", response_model=PerfilPesosMatchResponse)
+async def atualizar_perfil_pesos(
+    perfil_id: int,
+    perfil_update: PerfilPesosMatchUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Atualiza perfil de pesos do match"""
+    perfil = db.query(PerfilPesosMatch).filter(PerfilPesosMatch.id == perfil_id).first()
+
+    if not perfil:
+        raise HTTPException(status_code=404, detail="Perfil de pesos não encontrado")
+
+    _aplicar_perfil_pesos(perfil, perfil_update.dict(exclude_unset=True), db)
+    db.commit()
+    db.refresh(perfil)
+    perfis_pesos.invalidar()
+
+    return _build_perfil_pesos_response(perfil)
+
+
 # ===== AUDITORIA =====
 
 @router.get("/auditoria", response_model=List[EventoAuditoriaResponse])
@@ -397,3 +467,49 @@ def _build_equivalencia_response(equivalencia: SubstitucaoEquivalencia, db: Sess
         produto_destino_nome=produto_destino.nome if produto_destino else None,
         created_at=equivalencia.created_at
     )
+
+
+def _aplicar_perfil_pesos(perfil: PerfilPesosMatch, dados: dict, db: Session) -> None:
+    """Valida e grava os campos do perfil; o padrão da organização é único."""
+    if "pesos" in dados:
+        try:
+            perfis_pesos.pesos_do_perfil(dados["pesos"])
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        perfil.pesos_json = dados["pesos"] or None
+    if "contexto" in dados:
+        perfil.contexto_json = dados["contexto"]
+    if "nome" in dados and dados["nome"] is not None:
+        repetido = db.query(PerfilPesosMatch).filter(
+            PerfilPesosMatch.organizacao_id == perfil.organizacao_id,
+            PerfilPesosMatch.nome == dados["nome"],
+            PerfilPesosMatch.id != perfil.id,
+        ).first()
+        if repetido:
+            raise HTTPException(status_code=400, detail="Já existe um perfil com esse nome na organização")
+        perfil.nome = dados["nome"]
+    if dados.get("ativo") is not None:
+        perfil.ativo = dados["ativo"]
+    if dados.get("padrao") is not None:
+        perfil.padrao = dados["padrao"]
+        if perfil.padrao:
+            db.query(PerfilPesosMatch).filter(
+                PerfilPesosMatch.organizacao_id == perfil.organizacao_id,
+                PerfilPesosMatch.id != perfil.id,
+            ).update({PerfilPesosMatch.padrao: False}, synchronize_session=False)
+
+
+def _build_perfil_pesos_response(perfil: PerfilPesosMatch) -> PerfilPesosMatchResponse:
+    """Constrói resposta do perfil com os pesos efetivos (padrão nos ausentes, normalizados)"""
+    return PerfilPesosMatchResponse(
+        id=perfil.id,
+        organizacao_id=perfil.organizacao_id,
+        nome=perfil.nome,
+        pesos=perfil.pesos_json or {},
+        contexto=perfil.contexto_json,
+        padrao=perfil.padrao,
+        ativo=perfil.ativo,
+        pesos_efetivos=perfis_pesos.pesos_efetivos(perfil.pesos_json),
+        created_at=perfil.created_at,
+        updated_at=perfil.updated_at,
+    )
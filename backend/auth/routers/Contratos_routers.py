@@ -18,6 +18,7 @@ from models.Demanda_model import Demanda
 from models.Organizacao_model import Organizacao
 from models.User_model import User
 from security.security import get_current_user, get_db
+from services.match_features import atualizar_features
 import hashlib
 from datetime import datetime
 
@@ -103,6 +104,10 @@ async def atualizar_contrato(
     if contrato_update.arquivo_contrato_id:
         contrato.arquivo_contrato_id = contrato_update.arquivo_contrato_id
 
+    # Contratos gerados/assinados entram no histórico de sucesso do produtor
+    if contrato_update.status and contrato.proposta:
+        atualizar_features(db, [contrato.proposta.produtor_id])
+
     db.commit()
     db.refresh(contrato)
 
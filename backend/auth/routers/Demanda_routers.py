@@ -1,8 +1,9 @@
 # routers/Demanda_routers.py
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy import and_, func
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from decimal import Decimal
 
 from schemas.Demanda_schema import (
@@ -14,10 +15,13 @@ from schemas.Demanda_schema import (
 )
 from models.Demanda_model import Demanda, VersaoDemanda, ItemDemanda
 from models.User_model import User
-from models.Producao_model import ItemProducao, PeriodoCapacidade
+from models.Producao_model import ItemProducao
 from models.PerfilProdutor_model import PerfilProdutor
+from models.FeaturesMatch_model import FeaturesMatchProdutor
 from models.Catalogo_model import CatalogoProduto, Unidade
 from security.security import get_current_user, get_db
+from services import geo_index
+from services.match_features import extrair_coordenadas
 
 router = APIRouter(tags=["Demandas"], prefix="/demandas")
 
@@ -315,6 +319,7 @@ async def listar_demandas(
 @router.get("/{demanda_id}/produtores", response_model=List[ProdutorCapacidadeResponse])
 async def listar_produtores_capacidade(
     demanda_id: int,
+    raio_km: Optional[float] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -323,7 +328,14 @@ async def listar_produtores_capacidade(
     Retorna informações sobre quais produtos cada produtor pode fornecer.
     
     Uma demanda pode ser suprida com N produtos de N produtores.
+
+    Com raio_km, retorna apenas produtores localizados até essa distância do local de
+    entrega (índice espacial em producer_match_features); produtores sem localização
+    conhecida ficam de fora.
     """
+    if raio_km is not None and raio_km <= 0:
+        raise HTTPException(status_code=400, detail="raio_km deve ser maior que zero")
+
     # Busca a demanda e seus itens
     demanda = db.query(Demanda).filter(Demanda.id == demanda_id).first()
     
@@ -355,80 +367,93 @@ async def listar_produtores_capacidade(
     # Extrai os IDs dos produtos da demanda
     produtos_demanda_ids = [item.produto_id for item in itens_demanda]
     total_itens_demanda = len(produtos_demanda_ids)
-    
-    # Busca todos os produtores que têm pelo menos um dos produtos da demanda
-    produtores_com_produtos = db.query(PerfilProdutor).join(
-        ItemProducao, ItemProducao.produtor_id == PerfilProdutor.id
-    ).filter(
+    produtos_demanda = set(produtos_demanda_ids)
+
+    # Produtores que têm pelo menos um dos produtos da demanda, já com itens, períodos,
+    # produto, unidade e usuário carregados (sem consultas por produtor no laço)
+    com_produto = db.query(ItemProducao.produtor_id).filter(
         and_(
             ItemProducao.produto_id.in_(produtos_demanda_ids),
             ItemProducao.ativo == True
         )
-    ).distinct().all()
-    
+    )
+    query = db.query(PerfilProdutor).filter(PerfilProdutor.id.in_(com_produto)).options(
+        selectinload(PerfilProdutor.itens_producao).selectinload(ItemProducao.periodos_capacidade),
+        selectinload(PerfilProdutor.itens_producao).joinedload(ItemProducao.produto),
+        selectinload(PerfilProdutor.itens_producao).joinedload(ItemProducao.unidade),
+        joinedload(PerfilProdutor.user),
+    )
+
+    distancias = {}
+    if raio_km is not None:
+        coords = extrair_coordenadas(demanda.local_entrega_json)
+        if not coords:
+            raise HTTPException(status_code=400, detail="Demanda sem coordenadas de entrega para filtro por raio")
+        # Raio resolvido no banco pelo índice em grade; a distância exata só para quem está nas células
+        query = query.join(
+            FeaturesMatchProdutor, FeaturesMatchProdutor.produtor_id == PerfilProdutor.id
+        ).add_columns(
+            FeaturesMatchProdutor.latitude,
+            FeaturesMatchProdutor.longitude,
+        ).filter(
+            FeaturesMatchProdutor.celula_geo.isnot(None),
+            geo_index.filtro_raio(coords, raio_km),
+        )
+        produtores_com_produtos = []
+        for produtor, latitude, longitude in query:
+            distancia = geo_index.haversine_km(coords, (latitude, longitude))
+            if distancia <= raio_km:
+                distancias[produtor.id] = distancia
+                produtores_com_produtos.append(produtor)
+    else:
+        produtores_com_produtos = query.all()
+
     resultado = []
     
     for produtor in produtores_com_produtos:
-        # Busca os itens de produção do produtor que estão na demanda
-        itens_producao = db.query(ItemProducao).filter(
-            and_(
-                ItemProducao.produtor_id == produtor.id,
-                ItemProducao.produto_id.in_(produtos_demanda_ids),
-                ItemProducao.ativo == True
-            )
-        ).all()
+        # Itens de produção do produtor que estão na demanda
+        itens_producao = [
+            item for item in produtor.itens_producao or []
+            if item.ativo and item.produto_id in produtos_demanda
+        ]
         
         itens_disponiveis = []
         produtos_supriveis = set()
         
         for item_prod in itens_producao:
-            # Busca o item da demanda correspondente
-            item_demanda = next(
-                (item for item in itens_demanda if item.produto_id == item_prod.produto_id),
-                None
-            )
-            
-            if item_demanda:
-                produto = db.query(CatalogoProduto).filter(
-                    CatalogoProduto.id == item_prod.produto_id
-                ).first()
-                unidade = db.query(Unidade).filter(
-                    Unidade.id == item_prod.unidade_id
-                ).first()
-                
-                # Busca capacidade do período (se houver)
-                periodo = db.query(PeriodoCapacidade).filter(
-                    PeriodoCapacidade.item_producao_id == item_prod.id
-                ).order_by(PeriodoCapacidade.created_at.desc()).first()
-                
-                capacidade_periodo = None
-                if periodo:
-                    capacidade_periodo = {
-                        "tipo_periodo": periodo.tipo_periodo,
-                        "periodo_inicio": periodo.periodo_inicio.isoformat() if periodo.periodo_inicio else None,
-                        "periodo_fim": periodo.periodo_fim.isoformat() if periodo.periodo_fim else None,
-                        "quantidade_capacidade": float(periodo.quantidade_capacidade) if periodo.quantidade_capacidade else None,
-                        "quantidade_previsao": float(periodo.quantidade_previsao) if periodo.quantidade_previsao else None
-                    }
-                
-                itens_disponiveis.append(ProdutorCapacidadeItem(
-                    produto_id=item_prod.produto_id,
-                    produto_nome=produto.nome if produto else "Produto desconhecido",
-                    unidade_id=item_prod.unidade_id,
-                    unidade_nome=unidade.nome if unidade else "Unidade desconhecida",
-                    quantidade_disponivel=Decimal(str(periodo.quantidade_capacidade)) if periodo and periodo.quantidade_capacidade else None,
-                    preco_base=item_prod.preco_base,
-                    capacidade_periodo=capacidade_periodo
-                ))
-                
-                produtos_supriveis.add(item_prod.produto_id)
+            produto = item_prod.produto
+            unidade = item_prod.unidade
+
+            # Capacidade do período mais recente (se houver)
+            periodo = _periodo_mais_recente(item_prod.periodos_capacidade)
+
+            capacidade_periodo = None
+            if periodo:
+                capacidade_periodo = {
+                    "tipo_periodo": periodo.tipo_periodo,
+                    "periodo_inicio": periodo.periodo_inicio.isoformat() if periodo.periodo_inicio else None,
+                    "periodo_fim": periodo.periodo_fim.isoformat() if periodo.periodo_fim else None,
+                    "quantidade_capacidade": float(periodo.quantidade_capacidade) if periodo.quantidade_capacidade else None,
+                    "quantidade_previsao": float(periodo.quantidade_previsao) if periodo.quantidade_previsao else None
+                }
+
+            itens_disponiveis.append(ProdutorCapacidadeItem(
+                produto_id=item_prod.produto_id,
+                produto_nome=produto.nome if produto else "Produto desconhecido",
+                unidade_id=item_prod.unidade_id,
+                unidade_nome=unidade.nome if unidade else "Unidade desconhecida",
+                quantidade_disponivel=Decimal(str(periodo.quantidade_capacidade)) if periodo and periodo.quantidade_capacidade else None,
+                preco_base=item_prod.preco_base,
+                capacidade_periodo=capacidade_periodo
+            ))
+
+            produtos_supriveis.add(item_prod.produto_id)
         
         # Calcula percentual de cobertura
         itens_supriveis = len(produtos_supriveis)
         percentual_cobertura = (itens_supriveis / total_itens_demanda * 100) if total_itens_demanda > 0 else 0
         
-        # Busca informações do usuário
-        user = db.query(User).filter(User.id == produtor.user_id).first()
+        user = produtor.user
         
         resultado.append(ProdutorCapacidadeResponse(
             produtor_id=produtor.id,
@@ -439,7 +464,8 @@ async def listar_produtores_capacidade(
             itens_disponiveis=itens_disponiveis,
             percentual_cobertura=round(percentual_cobertura, 2),
             total_itens_demanda=total_itens_demanda,
-            itens_supriveis=itens_supriveis
+            itens_supriveis=itens_supriveis,
+            distancia_km=round(distancias[produtor.id], 1) if produtor.id in distancias else None
         ))
     
     # Ordena por percentual de cobertura (maior primeiro)
@@ -448,6 +474,13 @@ async def listar_produtores_capacidade(
     return resultado
 
 
+def _periodo_mais_recente(periodos):
+    """Período de maior created_at (sem data conta como o mais recente, como no ORDER BY DESC do PostgreSQL)."""
+    if not periodos:
+        return None
+    return max(periodos, key=lambda periodo: (periodo.created_at is None, periodo.created_at or datetime.min))
+
+
 @router.get("/diagnostico/catalogo", tags=["Diagnóstico"])
 async def diagnostico_catalogo(db: Session = Depends(get_db)):
     """
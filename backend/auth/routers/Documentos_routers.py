@@ -32,6 +32,8 @@ from models.PerfilProdutor_model import PerfilProdutor
 from models.User_model import User
 from models.Documentos_model import DocumentoUsuario, DOCUMENTOS_REQUERIDOS
 from security.security import get_current_user, get_db
+from services import armazenamento
+from services.match_features import atualizar_features
 
 router = APIRouter(tags=["Documentos"], prefix="/documentos")
 
@@ -95,6 +97,7 @@ async def criar_documento_produtor(
         documento.expires_at = datetime.utcnow() + timedelta(days=tipo_doc.validade_dias)
 
     db.add(documento)
+    atualizar_features(db, [documento.produtor_id])
     db.commit()
     db.refresh(documento)
 
@@ -327,6 +330,7 @@ async def atualizar_documento(
                 raise HTTPException(status_code=400, detail="Justificativa obrigatória para reprovação")
             documento.rejection_reason = documento_update.rejection_reason
 
+    atualizar_features(db, [documento.produtor_id])
     db.commit()
     db.refresh(documento)
 
@@ -350,23 +354,26 @@ async def upload_arquivo_documento(
     if not documento:
         raise HTTPException(status_code=404, detail="Documento não encontrado")
 
-    # TODO: Implementar upload real de arquivo
-    # Por enquanto, apenas simula
+    # Versiona arquivo do documento
+    versao_atual = db.query(ArquivoDocumento).filter(
+        ArquivoDocumento.documento_produtor_id == documento_id
+    ).count()
+
+    # Grava em disco em blocos (cada versão em um arquivo próprio)
+    caminho_storage = f"/storage/documentos/{documento_id}/v{versao_atual + 1}_{armazenamento.nome_seguro(file.filename)}"
+    gravado = await _gravar_documento(file, caminho_storage)
     arquivo = Arquivo(
         nome_original=file.filename,
-        caminho_storage=f"/storage/documentos/{documento_id}/{file.filename}",
+        caminho_storage=caminho_storage,
         mime_type=file.content_type,
+        tamanho_bytes=gravado.tamanho_bytes,
+        hash_arquivo=gravado.hash_sha256,
         uploaded_by_user_id=current_user.id
     )
 
     db.add(arquivo)
     db.flush()
 
-    # Versiona arquivo do documento
-    versao_atual = db.query(ArquivoDocumento).filter(
-        ArquivoDocumento.documento_produtor_id == documento_id
-    ).count()
-
     arquivo_doc = ArquivoDocumento(
         documento_produtor_id=documento_id,
         arquivo_id=arquivo.id,
@@ -456,13 +463,15 @@ async def upload_documento_por_nome(
 
     # Processa upload de arquivo se fornecido
     if file:
-        # Atualiza caminho do arquivo
-        documento.caminho_arquivo = f"/storage/documentos/{current_user.id}/{nome_documento}/{file.filename}"
+        # Grava em disco em blocos e atualiza caminho do arquivo
+        caminho_storage = (
+            f"/storage/documentos/{current_user.id}/{armazenamento.nome_seguro(nome_documento)}/"
+            f"{armazenamento.nome_seguro(file.filename)}"
+        )
+        await _gravar_documento(file, caminho_storage)
+        documento.caminho_arquivo = caminho_storage
         documento.data_envio = datetime.utcnow()
 
-        # TODO: Implementar upload real do arquivo para storage
-        # Por enquanto, apenas registra o caminho
-
     # Processa valor textual se fornecido (e nenhum arquivo foi enviado)
     elif valor:
         documento.observacoes = f"Valor informado: {valor}"
@@ -654,3 +663,15 @@ def _build_workflow_response(workflow: WorkflowDocumento, db: Session) -> Workfl
         tipo_documento_nome=tipo_doc.nome if tipo_doc else None,
         etapas=etapas_response
     )
+
+
+async def _gravar_documento(file: UploadFile, caminho_storage: str) -> armazenamento.ArquivoGravado:
+    """Grava o upload no storage em blocos; acima do limite, responde 413."""
+    try:
+        return await armazenamento.gravar_upload(
+            file,
+            armazenamento.caminho_no_storage(caminho_storage),
+            armazenamento.LIMITE_DOCUMENTO_BYTES,
+        )
+    except armazenamento.ArquivoMuitoGrandeError as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
@@ -1,11 +1,18 @@
+import asyncio
+import time
 from typing import Optional
 
-from fastapi import APIRouter, Depends, File, Form, UploadFile
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
 
+from db.db import get_session_local
+from models.EditalRascunho_model import JobEdital
 from models.User_model import User
-from schemas.Edital_schema import EditalProcessamentoResponse
-from security.security import get_current_user
+from schemas.Edital_schema import EditalJobResponse, EditalProcessamentoResponse
+from security.security import get_current_user, get_db
 from services.edital_ai import (
     GeminiAIError,
     GeminiConfigurationError,
@@ -13,6 +20,9 @@ from services.edital_ai import (
     PDFExtractionError,
     get_edital_processor,
 )
+from services.armazenamento import ArquivoMuitoGrandeError
+from services.edital_jobs import STATUS_FINAIS, criar_job, enfileirar_job
+from services.worker_pool import FilaCheiaError
 
 router = APIRouter(prefix="/editais", tags=["RF30 - Editais"])
 
@@ -27,11 +37,23 @@ async def processar_edital(
     organization_id: Optional[int] = Form(
         default=None, description="Identificador da organizacao requisitante."
     ),
+    assincrono: bool = False,
     current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
     """
     Processa o PDF enviado usando o Gemini, gera um rascunho pre-formatado e vincula o usuario autenticado.
+
+    Com assincrono=true, o PDF e gravado e a resposta (202) traz o id do job; extracao,
+    Gemini e gravacao do rascunho rodam em segundo plano, acompanhados em GET /editais/jobs/{id}.
     """
+    if assincrono:
+        return await _enfileirar_processamento(
+            db=db,
+            arquivo=arquivo,
+            organization_id=organization_id,
+            current_user=current_user,
+        )
     return await _executar_processamento(
         arquivo=arquivo,
         organization_id=organization_id,
@@ -63,6 +85,103 @@ async def processar_edital_publico(
     )
 
 
+@router.get(
+    "/jobs/{job_id}",
+    response_model=EditalJobResponse,
+    summary="Consulta o status, o progresso e o resultado de um processamento de edital",
+)
+async def obter_job_edital(
+    job_id: int,
+    aguardar: float = Query(0, ge=0, le=30, description="Segundos para aguardar a conclusao (long polling)."),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna status (queued|running|completed|failed), etapa e progresso do job e, quando
+    concluido, o EditalProcessamentoResponse. Com aguardar > 0, segura a resposta ate o job
+    terminar ou o tempo acabar.
+    """
+    # A espera e um asyncio.sleep: nao ocupa thread do threadpool nem conexao. A sessao da
+    # requisicao so serviu a autenticacao; cada consulta abre uma sessao curta no threadpool.
+    usuario_id = current_user.id
+    await run_in_threadpool(db.close)
+    limite = time.monotonic() + aguardar
+    job = await run_in_threadpool(_consultar_job, job_id)
+    if not job or job.criada_por_user_id != usuario_id:
+        raise HTTPException(status_code=404, detail="Job de edital nao encontrado.")
+    while job.status not in STATUS_FINAIS and time.monotonic() < limite:
+        await asyncio.sleep(0.5)
+        job = await run_in_threadpool(_consultar_job, job_id)
+
+    return _build_job_response(job)
+
+
+def _consultar_job(job_id: int) -> Optional[JobEdital]:
+    """Le o job em uma sessao curta; o objeto volta desligado da sessao, com as colunas carregadas."""
+    db = get_session_local()()
+    try:
+        return db.query(JobEdital).filter(JobEdital.id == job_id).first()
+    finally:
+        db.close()
+
+
+async def _enfileirar_processamento(
+    *,
+    db: Session,
+    arquivo: UploadFile,
+    organization_id: Optional[int],
+    current_user: User,
+):
+    try:
+        processor = get_edital_processor()
+    except GeminiConfigurationError as exc:
+        return JSONResponse(status_code=500, content={"success": False, "erro": str(exc)})
+
+    try:
+        job = await criar_job(
+            db,
+            processor,
+            arquivo,
+            organization_id=organization_id,
+            current_user=current_user,
+            gerar_rascunho=True,
+        )
+    except InvalidPDFError as exc:
+        return JSONResponse(status_code=400, content={"success": False, "erro": str(exc)})
+    except ArquivoMuitoGrandeError as exc:
+        return JSONResponse(status_code=413, content={"success": False, "erro": str(exc)})
+
+    try:
+        enfileirar_job(job.id)
+    except FilaCheiaError:
+        job.status = "failed"
+        job.erro = "Fila de editais cheia"
+        db.commit()
+        raise HTTPException(status_code=503, detail="Fila de editais cheia, tente novamente em instantes.")
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(_build_job_response(job)),
+    )
+
+
+def _build_job_response(job: JobEdital) -> EditalJobResponse:
+    return EditalJobResponse(
+        id=job.id,
+        status=job.status,
+        etapa=job.etapa,
+        progresso=job.progresso,
+        nome_original=job.nome_original,
+        hash_sha256=job.hash_arquivo,
+        rascunho_db_id=job.rascunho_id,
+        criado_em=job.criado_em,
+        iniciado_em=job.iniciado_em,
+        finalizado_em=job.finalizado_em,
+        resultado=job.resultado_json if job.status == "completed" else None,
+        erro=job.erro if job.status == "failed" else None,
+    )
+
+
 async def _executar_processamento(
     *,
     arquivo: UploadFile,
@@ -84,6 +203,8 @@ async def _executar_processamento(
         )
     except InvalidPDFError as exc:
         return JSONResponse(status_code=400, content={"success": False, "erro": str(exc)})
+    except ArquivoMuitoGrandeError as exc:
+        return JSONResponse(status_code=413, content={"success": False, "erro": str(exc)})
     except PDFExtractionError as exc:
         return JSONResponse(status_code=422, content={"success": False, "erro": str(exc)})
     except GeminiAIError as exc:
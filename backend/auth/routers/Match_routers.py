@@ -1,13 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import asyncio
+import time
+from typing import Optional
 
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from db.db import get_session_local
 from models.Demanda_model import VersaoDemanda
+from models.Match_model import CandidatoMatch, ExecucaoMatch, GrupoFornecedor, MembroGrupo
 from models.PerfilProdutor_model import PerfilProdutor
 from models.User_model import User
-from schemas.Match_schema import MatchScoreRequest, MatchScoreResponse, MatchResultResponse
+from schemas.Match_schema import (
+    AlocacaoGlobalRequest,
+    AlocacaoGlobalResponse,
+    AlocacaoProdutorItem,
+    AlocacaoVersaoResponse,
+    ExecucaoMatchResponse,
+    ExplicacaoCandidatoResponse,
+    ItemNaoAtendido,
+    MatchLoteRequest,
+    MatchLoteResponse,
+    MatchScoreRequest,
+    MatchScoreResponse,
+    MatchResultResponse,
+)
 from security.security import get_current_user, get_db
+from services import perfis_pesos
 from services.match_scoring import MatchScoringService
 from services.match_engine import MatchEngineService
+from services.match_jobs import STATUS_FINAIS, enfileirar_execucao
+from services.match_diagnosticos import metricas
+from services.match_lote import alocar_global, executar_lote, versoes_abertas
+from services.match_persistencia import carregar_resultado
+from services.worker_pool import FilaCheiaError
 
 router = APIRouter(prefix="/match", tags=["RF31 - Match Scoring"])
 
@@ -25,7 +53,8 @@ def calcular_score_match(
 ):
     """
     Executa o algoritmo RF-31 utilizando dados reais da demanda (versao) e do produtor.
-    Retorna score percentual, justificativa e pontos fortes/fracos.
+    Retorna score percentual, justificativa e pontos fortes/fracos. Os pesos vêm do perfil
+    informado em perfil_pesos ou do perfil padrão da organização da demanda.
     """
     versao = db.query(VersaoDemanda).filter(VersaoDemanda.id == payload.versao_demanda_id).first()
     if not versao:
@@ -35,8 +64,13 @@ def calcular_score_match(
     if not produtor:
         raise HTTPException(status_code=404, detail="Perfil de produtor nao encontrado.")
 
+    try:
+        plano = perfis_pesos.obter(db).plano(versao.demanda.organizacao_id, payload.perfil_pesos)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Perfil de pesos nao encontrado.")
+
     service = MatchScoringService(db)
-    return service.calculate(versao, produtor, payload.contexto)
+    return service.calculate(versao, produtor, payload.contexto, plano)
 
 
 @router.post(
@@ -44,17 +78,273 @@ def calcular_score_match(
     response_model=MatchResultResponse,
     status_code=status.HTTP_200_OK,
     summary="Executa RF-14: Match Automático para uma demanda",
+    responses={202: {"model": ExecucaoMatchResponse, "description": "Execução enfileirada (assincrono=true)"}},
 )
 def executar_match_automatico(
     versao_demanda_id: int,
     trigger: str = "manual_api",
+    assincrono: bool = False,
+    force: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
     Aciona o motor de match (RF-14) para encontrar produtores ou grupos
     capazes de atender a versão da demanda especificada.
+
+    Com assincrono=true, a execução é enfileirada e a resposta (202) traz o id da
+    ExecucaoMatch para acompanhamento em GET /match/execucoes/{id}.
+
+    Se nada mudou nos dados desde a última execução concluída, o resultado dela é
+    reaproveitado (no modo assíncrono, o 202 já vem com status completed).
+    force=true ignora o cache e recalcula.
     """
+    versao = db.query(VersaoDemanda).filter(VersaoDemanda.id == versao_demanda_id).first()
+    if not versao:
+        raise HTTPException(status_code=404, detail="Versao de demanda nao encontrada.")
+
     service = MatchEngineService(db)
     # Validar permissões se necessário (apenas governo/admin?)
-    return service.execute_match(versao_demanda_id, trigger=trigger)
+    if not assincrono:
+        return service.execute_match(versao_demanda_id, trigger=trigger, user_id=current_user.id, force=force)
+
+    execucao = None if force else service.buscar_em_cache(versao_demanda_id)
+    if execucao is not None:
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=jsonable_encoder(_build_execucao_response(db, execucao)),
+        )
+
+    execucao = service.criar_execucao(versao_demanda_id, trigger=trigger, user_id=current_user.id)
+
+    try:
+        enfileirar_execucao(execucao.id)
+    except FilaCheiaError:
+        execucao.status = "failed"
+        execucao.parametros_json = {"error": "Fila de match cheia"}
+        db.commit()
+        raise HTTPException(status_code=503, detail="Fila de match cheia, tente novamente em instantes.")
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(_build_execucao_response(db, execucao)),
+    )
+
+
+@router.post(
+    "/execute-batch",
+    response_model=MatchLoteResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Executa RF-14 para várias versões de demanda em uma passada",
+)
+def executar_match_em_lote(
+    payload: MatchLoteRequest,
+    trigger: str = "manual_api",
+    force: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Executa o motor de match para todas as versões informadas, hidratando e lendo as
+    features de cada produtor uma única vez. Devolve uma execução por versão, na ordem
+    pedida; versões sem mudanças nos dados reaproveitam o resultado em cache
+    (force=true recalcula todas).
+    """
+    versao_ids = list(dict.fromkeys(payload.versao_demanda_ids))
+    versoes = {
+        versao.id: versao
+        for versao in db.query(VersaoDemanda)
+        .filter(VersaoDemanda.id.in_(versao_ids))
+        .options(selectinload(VersaoDemanda.itens), joinedload(VersaoDemanda.demanda))
+    }
+    faltando = [versao_id for versao_id in versao_ids if versao_id not in versoes]
+    if faltando:
+        raise HTTPException(status_code=404, detail=f"Versoes de demanda nao encontradas: {faltando}")
+
+    resultados = executar_lote(
+        db, [versoes[versao_id] for versao_id in versao_ids], trigger=trigger, user_id=current_user.id, force=force
+    )
+    return MatchLoteResponse(
+        execucoes=[_build_execucao_response(db, execucao, resultado) for execucao, resultado in resultados]
+    )
+
+
+@router.post(
+    "/alocacao-global",
+    response_model=AlocacaoGlobalResponse,
+    summary="Distribui a capacidade livre dos produtores entre demandas abertas",
+)
+def alocar_capacidade_global(
+    payload: Optional[AlocacaoGlobalRequest] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Resolve, de uma vez, a alocação de todas as versões (fluxo de custo mínimo sobre a
+    capacidade livre: períodos declarados menos reservas ativas e alocações de grupos
+    assumidos). Sem lista de versões, usa a última versão de cada demanda aberta.
+    """
+    if payload is not None and payload.versao_demanda_ids:
+        versao_ids = list(dict.fromkeys(payload.versao_demanda_ids))
+        encontradas = {
+            versao.id: versao
+            for versao in db.query(VersaoDemanda).filter(VersaoDemanda.id.in_(versao_ids))
+        }
+        faltando = [versao_id for versao_id in versao_ids if versao_id not in encontradas]
+        if faltando:
+            raise HTTPException(status_code=404, detail=f"Versoes de demanda nao encontradas: {faltando}")
+        versoes = [encontradas[versao_id] for versao_id in versao_ids]
+    else:
+        versoes = versoes_abertas(db)
+
+    plano = alocar_global(db, versoes)
+    return AlocacaoGlobalResponse(
+        versoes=[
+            AlocacaoVersaoResponse(
+                versao_demanda_id=versao.id,
+                alocacoes=[
+                    AlocacaoProdutorItem(
+                        item_demanda_id=alocacao.item_demanda_id,
+                        produto_id=alocacao.produto_id,
+                        produtor_id=alocacao.produtor_id,
+                        quantidade=alocacao.quantidade,
+                    )
+                    for alocacao in plano.alocacoes[versao.id]
+                ],
+                nao_atendido=[
+                    ItemNaoAtendido(item_demanda_id=item_id, quantidade=quantidade)
+                    for item_id, quantidade in plano.nao_atendido[versao.id].items()
+                ],
+            )
+            for versao in versoes
+        ],
+        custo_total=plano.custo,
+    )
+
+
+@router.get(
+    "/execucoes/{execucao_id}",
+    response_model=ExecucaoMatchResponse,
+    summary="Consulta o status e o resultado de uma execução de match",
+)
+async def obter_execucao_match(
+    execucao_id: int,
+    aguardar: float = Query(0, ge=0, le=30, description="Segundos para aguardar a conclusão (long polling)."),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna o status da execução (queued|running|completed|failed) e, quando concluída,
+    o MatchResultResponse. Com aguardar > 0, segura a resposta até a execução terminar
+    ou o tempo acabar.
+    """
+    # A espera e um asyncio.sleep: nao ocupa thread do threadpool nem conexao. A sessao da
+    # requisicao so serviu a autenticacao; cada consulta abre uma sessao curta no threadpool.
+    await run_in_threadpool(db.close)
+    limite = time.monotonic() + aguardar
+    status_execucao = await run_in_threadpool(_status_execucao, execucao_id)
+    if status_execucao is None:
+        raise HTTPException(status_code=404, detail="Execucao de match nao encontrada.")
+    while status_execucao not in STATUS_FINAIS and time.monotonic() < limite:
+        await asyncio.sleep(0.5)
+        status_execucao = await run_in_threadpool(_status_execucao, execucao_id)
+
+    return await run_in_threadpool(_responder_execucao, execucao_id)
+
+
+def _status_execucao(execucao_id: int) -> Optional[str]:
+    db = get_session_local()()
+    try:
+        return db.query(ExecucaoMatch.status).filter(ExecucaoMatch.id == execucao_id).scalar()
+    finally:
+        db.close()
+
+
+def _responder_execucao(execucao_id: int) -> ExecucaoMatchResponse:
+    db = get_session_local()()
+    try:
+        execucao = db.get(ExecucaoMatch, execucao_id)
+        if not execucao:
+            raise HTTPException(status_code=404, detail="Execucao de match nao encontrada.")
+        return _build_execucao_response(db, execucao)
+    finally:
+        db.close()
+
+
+@router.get(
+    "/execucoes/{execucao_id}/candidatos/{produtor_id}/explicacao",
+    response_model=ExplicacaoCandidatoResponse,
+    summary="Explicação completa de um candidato de uma execução de match",
+)
+def explicar_candidato_match(
+    execucao_id: int,
+    produtor_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Breakdown por critério, pontos fortes/fracos e justificativa de qualquer produtor
+    (retornado ou não) para a demanda da execução. A execução não guarda o score de quem
+    ficou de fora, então a explicação é recalculada com os dados atuais.
+    """
+    execucao = db.query(ExecucaoMatch).filter(ExecucaoMatch.id == execucao_id).first()
+    if not execucao:
+        raise HTTPException(status_code=404, detail="Execucao de match nao encontrada.")
+
+    produtor = db.query(PerfilProdutor).filter(PerfilProdutor.id == produtor_id).first()
+    if not produtor:
+        raise HTTPException(status_code=404, detail="Perfil de produtor nao encontrado.")
+
+    candidato = (
+        db.query(CandidatoMatch)
+        .filter(CandidatoMatch.execucao_match_id == execucao.id, CandidatoMatch.produtor_id == produtor.id)
+        .first()
+    )
+    membro = candidato is None and db.query(
+        db.query(MembroGrupo)
+        .join(GrupoFornecedor, MembroGrupo.grupo_id == GrupoFornecedor.id)
+        .filter(GrupoFornecedor.criado_de_match_id == execucao.id, MembroGrupo.produtor_id == produtor.id)
+        .exists()
+    ).scalar()
+
+    explicacao = MatchEngineService(db).explicar_candidato(execucao.versao_demanda, produtor)
+    return ExplicacaoCandidatoResponse(
+        execucao_match_id=execucao.id,
+        produtor_id=produtor.id,
+        retornado=candidato is not None or bool(membro),
+        score_execucao=float(candidato.score_total) if candidato is not None else None,
+        **explicacao,
+    )
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    summary="Metricas do motor de match no formato de texto do Prometheus.",
+)
+def metricas_match():
+    """
+    Execucoes por status e, por etapa do pipeline, histograma de duracao, comandos SQL e
+    candidatos. Os valores sao do processo que atende a requisicao, desde que ele subiu.
+    """
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+
+def _build_execucao_response(
+    db: Session, execucao: ExecucaoMatch, resultado: Optional[MatchResultResponse] = None
+) -> ExecucaoMatchResponse:
+    parametros = execucao.parametros_json or {}
+    if resultado is None and execucao.status == "completed" and parametros:
+        resultado = carregar_resultado(db, execucao)
+    return ExecucaoMatchResponse(
+        id=execucao.id,
+        versao_demanda_id=execucao.versao_demanda_id,
+        tipo_execucao=execucao.tipo_execucao,
+        status=execucao.status,
+        iniciada_em=execucao.iniciada_em,
+        finalizada_em=execucao.finalizada_em,
+        resultado=resultado,
+        erro=parametros.get("error") if execucao.status == "failed" else None,
+        diagnosticos=parametros.get("diagnosticos"),
+    )
+
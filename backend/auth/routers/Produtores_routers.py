@@ -27,6 +27,8 @@ from models.Contrato_model import Contrato
 from models.Notificacao_model import Notificacao
 from models.User_model import User
 from security.security import get_current_user, get_db
+from services.match_features import atualizar_features
+from services.match_jobs import agendar_rematch_produtor
 
 router = APIRouter(tags=["Produtores"], prefix="/produtores")
 
@@ -40,6 +42,8 @@ async def criar_perfil_produtor(
     """RF-04: Cadastro e perfil do produtor"""
     perfil = PerfilProdutor(**perfil_data.dict())
     db.add(perfil)
+    db.flush()
+    atualizar_features(db, [perfil.id])
     db.commit()
     db.refresh(perfil)
     return perfil
@@ -73,6 +77,7 @@ async def atualizar_perfil_produtor(
     for key, value in perfil_update.dict(exclude_unset=True).items():
         setattr(perfil, key, value)
 
+    atualizar_features(db, [perfil.id])
     db.commit()
     db.refresh(perfil)
     return perfil
@@ -89,6 +94,7 @@ async def criar_item_producao(
     db.add(item)
     db.commit()
     db.refresh(item)
+    agendar_rematch_produtor(item.produtor_id)
     return item
 
 
@@ -145,6 +151,7 @@ async def criar_item_producao_manual(
     db.add(periodo)
     db.commit()
     db.refresh(item)
+    agendar_rematch_produtor(item.produtor_id)
 
     return ItemProducaoResponse(
         id=item.id,
@@ -218,6 +225,8 @@ async def criar_periodo_capacidade(
     db.add(periodo)
     db.commit()
     db.refresh(periodo)
+    # Repontua só este produtor nas demandas abertas afetadas (services/match_incremental)
+    agendar_rematch_produtor(periodo.item_producao.produtor_id if periodo.item_producao else None)
     return periodo
 
 
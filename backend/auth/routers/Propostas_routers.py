@@ -31,6 +31,7 @@ from models.PerfilProdutor_model import PerfilProdutor
 from models.Catalogo_model import CatalogoProduto, Unidade
 from models.User_model import User
 from security.security import get_current_user, get_db
+from services.match_features import atualizar_features
 
 router = APIRouter(tags=["Propostas"], prefix="/propostas")
 
@@ -86,6 +87,7 @@ async def criar_proposta(
         )
         db.add(item)
 
+    atualizar_features(db, [nova_proposta.produtor_id])
     db.commit()
     db.refresh(nova_proposta)
 
@@ -228,6 +230,7 @@ async def responder_confirmacao(
     confirmacao.motivo_recusa = confirmacao_update.motivo_recusa
     confirmacao.respondido_em = datetime.utcnow()
 
+    atualizar_features(db, [confirmacao.produtor_id])
     db.commit()
     db.refresh(confirmacao)
 
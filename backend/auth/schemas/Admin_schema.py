@@ -3,6 +3,8 @@ from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 
+from schemas.Match_schema import MatchContextInput
+
 
 class ConfiguracaoMatchBase(BaseModel):
     """Configuração dos pesos do motor de match"""
@@ -25,6 +27,36 @@ class ConfiguracaoMatchResponse(ConfiguracaoMatchBase):
         from_attributes = True
 
 
+class PerfilPesosMatchBase(BaseModel):
+    """Perfil nomeado de pesos e contexto do score de match (services/perfis_pesos)"""
+    nome: str = Field(..., min_length=1, max_length=100)
+    # Por nome do criterio (compatibilidade_produto, capacidade_entrega, ...); ausentes = padrao
+    pesos: Dict[str, float] = Field(default_factory=dict)
+    contexto: Optional[MatchContextInput] = None
+    padrao: bool = False
+    ativo: bool = True
+
+
+class PerfilPesosMatchCreate(PerfilPesosMatchBase):
+    organizacao_id: int
+
+
+class PerfilPesosMatchUpdate(BaseModel):
+    nome: Optional[str] = Field(None, min_length=1, max_length=100)
+    pesos: Optional[Dict[str, float]] = None
+    contexto: Optional[MatchContextInput] = None
+    padrao: Optional[bool] = None
+    ativo: Optional[bool] = None
+
+
+class PerfilPesosMatchResponse(PerfilPesosMatchBase):
+    id: int
+    organizacao_id: int
+    pesos_efetivos: Dict[str, float]  # todos os criterios, ja normalizados
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 class SubstituicaoEquivalenciaBase(BaseModel):
     from_product_id: int
     to_product_id: int
@@ -140,3 +140,4 @@ class ProdutorCapacidadeResponse(BaseModel):
     percentual_cobertura: float = Field(..., description="Percentual de itens da demanda que o produtor pode suprir")
     total_itens_demanda: int
     itens_supriveis: int
+    distancia_km: Optional[float] = Field(None, description="Distância até o local de entrega (apenas com filtro por raio)")
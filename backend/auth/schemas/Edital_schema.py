@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
@@ -24,6 +25,7 @@ class ArquivoProcessado(BaseModel):
     nome_original: Optional[str] = None
     caminho: Optional[str] = None
     tamanho_bytes: Optional[int] = None
+    hash_sha256: Optional[str] = None
 
 
 class UsuarioProcessamento(BaseModel):
@@ -42,3 +44,21 @@ class EditalProcessamentoResponse(BaseModel):
     dados_extraidos: Dict[str, Any] = Field(default_factory=dict)
     arquivo_processado: Optional[ArquivoProcessado] = None
     processado_por: Optional[UsuarioProcessamento] = None
+    cache_hit: bool = False  # analise reaproveitada de um envio anterior do mesmo PDF
+
+
+class EditalJobResponse(BaseModel):
+    """Estado de um processamento de edital em segundo plano."""
+
+    id: int
+    status: str  # queued | running | completed | failed
+    etapa: str  # upload | extracao | ia | normalizacao | persistencia | concluido
+    progresso: int  # 0-100
+    nome_original: Optional[str] = None
+    hash_sha256: Optional[str] = None
+    rascunho_db_id: Optional[int] = None
+    criado_em: Optional[datetime] = None
+    iniciado_em: Optional[datetime] = None
+    finalizado_em: Optional[datetime] = None
+    resultado: Optional[EditalProcessamentoResponse] = None
+    erro: Optional[str] = None
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
@@ -47,6 +48,10 @@ class MatchScoreRequest(BaseModel):
     contexto: Optional[MatchContextInput] = Field(
         default=None, description="Opcional: contexto adicional para ajuste fino."
     )
+    perfil_pesos: Optional[str] = Field(
+        default=None,
+        description="Opcional: perfil de pesos da organizacao da demanda (padrao: o perfil padrao dela).",
+    )
 
 
 class MatchScoreResponse(BaseModel):
@@ -65,6 +70,15 @@ class MatchScoreResponse(BaseModel):
     metadados: Dict[str, Any] = Field(default_factory=dict)
 
 
+class AlocacaoItemOption(BaseModel):
+    """Parte de um item da demanda atribuida a um membro do grupo (espelha AlocacaoGrupo)."""
+
+    item_demanda_id: int
+    produto_id: int
+    quantidade: float
+    unidade_id: Optional[int] = None
+
+
 class MatchOptionProdutor(BaseModel):
     id: int
     nome: str
@@ -72,6 +86,7 @@ class MatchOptionProdutor(BaseModel):
     quantidade_fornecida: float
     percentual_da_demanda: float
     justificativa: str
+    alocacoes: List[AlocacaoItemOption] = Field(default_factory=list)
 
 
 class MatchOption(BaseModel):
@@ -89,3 +104,73 @@ class MatchResultResponse(BaseModel):
     opcoes: List[MatchOption]
     alternativas: List[Dict[str, Any]] = Field(default_factory=list)
     substituicoes_sugeridas: List[Dict[str, Any]] = Field(default_factory=list)
+
+
+class ExecucaoMatchResponse(BaseModel):
+    """Estado de uma execucao do motor de match (modo assincrono)."""
+
+    id: int
+    versao_demanda_id: int
+    tipo_execucao: str
+    status: str  # queued | running | completed | failed
+    iniciada_em: Optional[datetime] = None
+    finalizada_em: Optional[datetime] = None
+    resultado: Optional[MatchResultResponse] = None
+    erro: Optional[str] = None
+    # Tempo, comandos SQL e candidatos por etapa do pipeline (services/match_diagnosticos)
+    diagnosticos: Optional[Dict[str, Any]] = None
+
+
+class ExplicacaoCandidatoResponse(BaseModel):
+    """Explicacao sob demanda de um candidato de uma execucao (retornado ou nao)."""
+
+    execucao_match_id: int
+    produtor_id: int
+    retornado: bool  # aparece no resultado da execucao (individual ou membro de grupo)
+    elegivel: bool  # passa hoje nos filtros eliminatorios
+    score_final: float  # score com RN-14.1, como o motor ordena
+    score_execucao: Optional[float] = None  # score gravado na execucao (so individuais retornados)
+    explicacao: MatchScoreResponse
+
+
+class MatchLoteRequest(BaseModel):
+    versao_demanda_ids: List[int] = Field(
+        ..., min_length=1, max_length=100, description="Versoes de demanda a executar na mesma passada."
+    )
+
+
+class MatchLoteResponse(BaseModel):
+    """Uma execucao por versao, na ordem pedida (reaproveitada do cache quando nada mudou)."""
+
+    execucoes: List[ExecucaoMatchResponse]
+
+
+class AlocacaoGlobalRequest(BaseModel):
+    versao_demanda_ids: Optional[List[int]] = Field(
+        None, max_length=200, description="Versoes a alocar juntas (padrao: ultima versao de cada demanda aberta)."
+    )
+
+
+class AlocacaoProdutorItem(BaseModel):
+    item_demanda_id: int
+    produto_id: int
+    produtor_id: int
+    quantidade: float
+
+
+class ItemNaoAtendido(BaseModel):
+    item_demanda_id: int
+    quantidade: float
+
+
+class AlocacaoVersaoResponse(BaseModel):
+    versao_demanda_id: int
+    alocacoes: List[AlocacaoProdutorItem]
+    nao_atendido: List[ItemNaoAtendido] = Field(default_factory=list)
+
+
+class AlocacaoGlobalResponse(BaseModel):
+    """Plano de alocacao da capacidade livre entre demandas (nao grava nada)."""
+
+    versoes: List[AlocacaoVersaoResponse]
+    custo_total: float
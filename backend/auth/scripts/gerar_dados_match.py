@@ -0,0 +1,252 @@
+"""
+Gerador deterministico de dados sinteticos para o motor de match.
+
+Cria um catalogo, N produtores (usuario, perfil com endereco/coordenadas, itens de producao
+e periodos de capacidade, propostas, contratos, confirmacoes e documentos) e demandas com M
+itens cada. Com a mesma semente, os dados gerados sao os mesmos (so e-mails e codigos levam
+um sufixo aleatorio, para poder gerar de novo no mesmo banco). As linhas entram com INSERT
+em lote e, no fim, producer_match_features e reconstruida.
+
+Uso (a partir de backend/auth, com DATABASE_URL apontando para o banco de teste):
+    python -m scripts.gerar_dados_match --produtores 10000 --itens 10 --demandas 3
+"""
+import argparse
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models.Catalogo_model import CatalogoProduto, Unidade
+from models.Contrato_model import Contrato
+from models.Demanda_model import Demanda, ItemDemanda, VersaoDemanda
+from models.Documento_model import DocumentoProdutor, TipoDocumento
+from models.Organizacao_model import Organizacao
+from models.PerfilProdutor_model import PerfilProdutor
+from models.Producao_model import ItemProducao, PeriodoCapacidade
+from models.Proposta_model import ConfirmacaoParticipante, Proposta
+from models.User_model import User
+from services.match_features import reconstruir_features
+
+TAMANHO_INSERT = 5000
+
+# Centro (Rio de Janeiro) e espalhamento em graus: boa parte dos produtores fica fora do
+# raio maximo do motor, como em uma base estadual real
+CENTRO = (-22.9, -43.2)
+ESPALHAMENTO_GRAUS = 4.0
+CIDADES = ("Rio de Janeiro", "Niteroi", "Campos", "Petropolis", "Volta Redonda", "Macae")
+STATUS_PROPOSTA = ("pending", "open", "analyzing", "draft", "selected", "rejected")
+STATUS_CONTRATO = ("signed", "generated", "draft")
+
+
+@dataclass
+class CenarioSintetico:
+    demanda_ids: List[int] = field(default_factory=list)
+    versao_ids: List[int] = field(default_factory=list)
+    produtor_ids: List[int] = field(default_factory=list)
+    governo_user_id: int = 0
+
+
+def _inserir(db: Session, modelo, linhas: List[Dict[str, Any]]) -> List[int]:
+    """INSERT em lote devolvendo os ids na ordem das linhas."""
+    ids: List[int] = []
+    for inicio in range(0, len(linhas), TAMANHO_INSERT):
+        lote = linhas[inicio:inicio + TAMANHO_INSERT]
+        ids.extend(db.scalars(insert(modelo).returning(modelo.id, sort_by_parameter_order=True), lote))
+    return ids
+
+
+def _coordenadas(rng: random.Random):
+    return (
+        round(CENTRO[0] + rng.uniform(-ESPALHAMENTO_GRAUS, ESPALHAMENTO_GRAUS), 5),
+        round(CENTRO[1] + rng.uniform(-ESPALHAMENTO_GRAUS, ESPALHAMENTO_GRAUS), 5),
+    )
+
+
+def gerar(
+    db: Session,
+    produtores: int,
+    itens_por_demanda: int = 10,
+    demandas: int = 1,
+    produtos: int = 200,
+    semente: int = 42,
+) -> CenarioSintetico:
+    rng = random.Random(semente)
+    sufixo = uuid.uuid4().hex[:8]
+    agora = datetime(2026, 1, 15, 12, 0, 0)
+    cenario = CenarioSintetico()
+
+    # --- Catalogo e entidades de apoio
+    unidade_id = _inserir(db, Unidade, [{"codigo": f"kg_{sufixo}", "nome": "Quilograma", "tipo": "mass"}])[0]
+    produto_ids = _inserir(db, CatalogoProduto, [
+        {"nome": f"Produto {i} {sufixo}", "categoria": "hortifruti", "unidade_padrao_id": unidade_id}
+        for i in range(produtos)
+    ])
+    # Produtos populares aparecem mais nos portfolios e nas demandas (cauda longa)
+    pesos_produto = [1.0 / (posicao + 1) for posicao in range(produtos)]
+    tipo_documento_id = _inserir(db, TipoDocumento, [{"codigo": f"DAP_{sufixo}", "nome": "DAP"}])[0]
+    organizacao_id = _inserir(db, Organizacao, [{"tipo": "municipality", "nome": f"Prefeitura {sufixo}"}])[0]
+    cenario.governo_user_id = _inserir(db, User, [{
+        "name": "Governo Benchmark",
+        "email": f"governo_{sufixo}@example.com",
+        "senha": "nao-usada",
+        "tipo_usuario": "entidade_executora",
+        "subtipo_usuario": "governo",
+    }])[0]
+
+    # --- Demandas e versoes
+    demandas_linhas = []
+    for indice in range(demandas):
+        cidade = CIDADES[indice % len(CIDADES)]
+        lat, lng = _coordenadas(rng) if indice else CENTRO
+        demandas_linhas.append({
+            "titulo": f"Demanda benchmark {indice}",
+            "status": "published",
+            "local_entrega_json": {"cidade": cidade, "coords": {"lat": lat, "lng": lng}},
+            "criada_por_user_id": cenario.governo_user_id,
+        })
+    cenario.demanda_ids = _inserir(db, Demanda, demandas_linhas)
+    cenario.versao_ids = _inserir(db, VersaoDemanda, [
+        {"demanda_id": demanda_id, "numero_versao": 1} for demanda_id in cenario.demanda_ids
+    ])
+    itens_demanda = []
+    for versao_id in cenario.versao_ids:
+        escolhidos = set()
+        while len(escolhidos) < min(itens_por_demanda, produtos):
+            escolhidos.add(rng.choices(produto_ids, weights=pesos_produto)[0])
+        for produto_id in sorted(escolhidos):
+            itens_demanda.append({
+                "versao_demanda_id": versao_id,
+                "produto_id": produto_id,
+                "user_id": cenario.governo_user_id,
+                "unidade_id": unidade_id,
+                "quantidade": rng.randint(50, 2000),
+            })
+    _inserir(db, ItemDemanda, itens_demanda)
+
+    # --- Produtores
+    usuarios, perfis, coordenadas = [], [], []
+    for indice in range(produtores):
+        lat, lng = _coordenadas(rng)
+        no_usuario = rng.random() < 0.6
+        usuarios.append({
+            "name": f"Produtor {indice}",
+            "email": f"produtor_{indice}_{sufixo}@example.com",
+            "senha": "nao-usada",
+            "tipo_usuario": "produtor",
+            "subtipo_usuario": "fornecedor_individual",
+            "latitude": lat if no_usuario else None,
+            "longitude": lng if no_usuario else None,
+        })
+        endereco = {"cidade": rng.choice(CIDADES)}
+        if not no_usuario and rng.random() < 0.8:
+            endereco["geo"] = {"lat": lat, "lng": lng}
+        perfis.append({
+            "tipo_produtor": "individual",
+            "endereco_json": endereco,
+            "status_perfil": rng.choices(("complete", "incomplete", "blocked"), weights=(85, 12, 3))[0],
+        })
+        coordenadas.append((lat, lng))
+    user_ids = _inserir(db, User, usuarios)
+    for perfil, user_id in zip(perfis, user_ids):
+        perfil["user_id"] = user_id
+    cenario.produtor_ids = _inserir(db, PerfilProdutor, perfis)
+
+    itens_producao, portfolio = [], []
+    for produtor_id in cenario.produtor_ids:
+        escolhidos = set()
+        for _ in range(rng.randint(1, 4)):
+            escolhidos.add(rng.choices(produto_ids, weights=pesos_produto)[0])
+        for produto_id in sorted(escolhidos):
+            itens_producao.append({"produtor_id": produtor_id, "produto_id": produto_id, "unidade_id": unidade_id})
+            portfolio.append(rng.randint(0, 3))  # periodos de capacidade do item
+    item_ids = _inserir(db, ItemProducao, itens_producao)
+    periodos = []
+    for item_id, quantidade_periodos in zip(item_ids, portfolio):
+        for _ in range(quantidade_periodos):
+            inicio = date(2026, rng.randint(1, 12), 1)
+            periodos.append({
+                "item_producao_id": item_id,
+                "tipo_periodo": "month",
+                "periodo_inicio": inicio,
+                "periodo_fim": inicio + timedelta(days=27),
+                "quantidade_capacidade": rng.randint(20, 1500),
+            })
+    _inserir(db, PeriodoCapacidade, periodos)
+
+    # --- Historico: propostas, contratos, confirmacoes e documentos
+    propostas, contratos_por_proposta, confirmacoes_por_proposta = [], [], []
+    documentos = []
+    for produtor_id in cenario.produtor_ids:
+        for _ in range(rng.choices(range(8), weights=(30, 20, 15, 10, 8, 7, 5, 5))[0]):
+            propostas.append({
+                "versao_demanda_id": rng.choice(cenario.versao_ids),
+                "organizacao_id": organizacao_id,
+                "tipo_proposta": "single",
+                "produtor_id": produtor_id,
+                "status": rng.choice(STATUS_PROPOSTA),
+            })
+            contratos_por_proposta.append(rng.choice(STATUS_CONTRATO) if rng.random() < 0.3 else None)
+            horas = rng.randint(1, 240) if rng.random() < 0.5 else None
+            confirmacoes_por_proposta.append((produtor_id, horas))
+        for _ in range(rng.randint(0, 3)):
+            documentos.append({
+                "produtor_id": produtor_id,
+                "tipo_documento_id": tipo_documento_id,
+                "status": rng.choice(("approved", "approved", "pending", "rejected")),
+            })
+    proposta_ids = _inserir(db, Proposta, propostas)
+    demanda_por_versao = dict(zip(cenario.versao_ids, cenario.demanda_ids))
+    contratos, confirmacoes = [], []
+    for proposta, proposta_id, contrato, (produtor_id, horas) in zip(
+        propostas, proposta_ids, contratos_por_proposta, confirmacoes_por_proposta
+    ):
+        if contrato:
+            contratos.append({
+                "organizacao_id": organizacao_id,
+                "demanda_id": demanda_por_versao[proposta["versao_demanda_id"]],
+                "proposta_id": proposta_id,
+                "status": contrato,
+            })
+        if horas is not None:
+            confirmacoes.append({
+                "proposta_id": proposta_id,
+                "produtor_id": produtor_id,
+                "status": "accepted",
+                "convidado_em": agora,
+                "respondido_em": agora + timedelta(hours=horas),
+            })
+    _inserir(db, Contrato, contratos)
+    _inserir(db, ConfirmacaoParticipante, confirmacoes)
+    _inserir(db, DocumentoProdutor, documentos)
+    db.commit()
+
+    reconstruir_features(db)
+    return cenario
+
+
+def main():
+    from db.db import create_tables, get_session_local
+
+    parser = argparse.ArgumentParser(description="Gera dados sinteticos para o motor de match.")
+    parser.add_argument("--produtores", type=int, default=1000)
+    parser.add_argument("--itens", type=int, default=10, help="Itens por demanda.")
+    parser.add_argument("--demandas", type=int, default=1)
+    parser.add_argument("--produtos", type=int, default=200, help="Tamanho do catalogo.")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    create_tables()
+    db = get_session_local()()
+    try:
+        cenario = gerar(db, args.produtores, args.itens, args.demandas, args.produtos, args.semente)
+        print(f"{len(cenario.produtor_ids)} produtores; versoes de demanda: {cenario.versao_ids}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
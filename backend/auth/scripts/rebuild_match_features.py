@@ -0,0 +1,31 @@
+"""
+Reconstrói a tabela producer_match_features a partir das tabelas de origem.
+
+Uso (a partir de backend/auth):
+    python -m scripts.rebuild_match_features            # recalcula todos os produtores
+    python -m scripts.rebuild_match_features --ausentes # apenas produtores sem linha
+"""
+import argparse
+
+from db.db import create_tables, get_session_local
+from services.match_features import reconstruir_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstrói as features de match por produtor.")
+    parser.add_argument("--ausentes", action="store_true", help="Processa apenas produtores sem features.")
+    args = parser.parse_args()
+
+    # Garante que a tabela existe e que todos os modelos estão registrados
+    create_tables()
+
+    db = get_session_local()()
+    try:
+        total = reconstruir_features(db, somente_ausentes=args.ausentes)
+        print(f"Features de match recalculadas para {total} produtores.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Gravacao em disco, em fluxo, dos arquivos enviados (editais e documentos).
+
+O UploadFile do Starlette ja chega num SpooledTemporaryFile. Ele e copiado em blocos de
+TAMANHO_BLOCO numa thread, para a leitura e a escrita nao segurarem o event loop, e o
+SHA-256 e o tamanho sao calculados no caminho. A copia vai para um arquivo temporario ao
+lado do destino, que so e renomeado no fim. Se o arquivo passar do limite, a copia para,
+o temporario e apagado e sai ArquivoMuitoGrandeError (os routers respondem 413).
+"""
+import hashlib
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+TAMANHO_BLOCO = 1024 * 1024
+LIMITE_EDITAL_BYTES = int(os.getenv("UPLOAD_EDITAL_MAX_BYTES", str(200 * 1024 * 1024)))
+LIMITE_DOCUMENTO_BYTES = int(os.getenv("UPLOAD_DOCUMENTO_MAX_BYTES", str(25 * 1024 * 1024)))
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", str(BASE_DIR / "storage")))
+
+
+class ArquivoMuitoGrandeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, limite_bytes: int):
+        super().__init__(f"O arquivo excede o limite de {limite_bytes // (1024 * 1024)} MB.")
+        self.limite_bytes = limite_bytes
+
+
+@dataclass
+class ArquivoGravado:
+    caminho: Optional[Path]  # None quando so foi resumido (resumir_upload)
+    tamanho_bytes: int
+    hash_sha256: str
+
+
+def nome_seguro(nome: Optional[str], padrao: str = "arquivo") -> str:
+    """Nome de arquivo sem diretorios nem caracteres fora de [a-zA-Z0-9._-]."""
+    base = Path(nome or "").name
+    base = re.sub(r"[^a-zA-Z0-9._-]", "_", base).strip("._")
+    return base[:120] or padrao
+
+
+def caminho_no_storage(relativo: str) -> Path:
+    """Caminho em disco de um caminho_storage logico ("/storage/documentos/...")."""
+    partes = Path(relativo.lstrip("/")).parts
+    if partes and partes[0] == "storage":
+        partes = partes[1:]
+    return STORAGE_DIR.joinpath(*partes)
+
+
+def _verificar_tamanho_declarado(upload_file: UploadFile, limite_bytes: Optional[int]) -> None:
+    # Tamanho ja conhecido pelo Starlette: recusa antes de ler qualquer bloco
+    tamanho = getattr(upload_file, "size", None)
+    if limite_bytes is not None and tamanho is not None and tamanho > limite_bytes:
+        raise ArquivoMuitoGrandeError(limite_bytes)
+
+
+def _copiar(origem: BinaryIO, destino: Optional[Path], limite_bytes: Optional[int]) -> ArquivoGravado:
+    origem.seek(0)
+    resumo = hashlib.sha256()
+    tamanho = 0
+    saida = None
+    temporario = None
+    if destino is not None:
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=destino.parent, prefix=".", suffix=".parcial")
+        saida = os.fdopen(descritor, "wb")
+    try:
+        while True:
+            bloco = origem.read(TAMANHO_BLOCO)
+            if not bloco:
+                break
+            tamanho += len(bloco)
+            if limite_bytes is not None and tamanho > limite_bytes:
+                raise ArquivoMuitoGrandeError(limite_bytes)
+            resumo.update(bloco)
+            if saida is not None:
+                saida.write(bloco)
+        if saida is not None:
+            saida.close()
+            os.replace(temporario, destino)
+    except BaseException:
+        if saida is not None:
+            saida.close()
+            os.unlink(temporario)
+        raise
+    finally:
+        origem.seek(0)
+    return ArquivoGravado(destino, tamanho, resumo.hexdigest())
+
+
+async def resumir_upload(upload_file: UploadFile, limite_bytes: Optional[int] = None) -> ArquivoGravado:
+    """SHA-256 e tamanho do upload, lido em blocos, sem gravar nada."""
+    _verificar_tamanho_declarado(upload_file, limite_bytes)
+    return await run_in_threadpool(_copiar, upload_file.file, None, limite_bytes)
+
+
+async def gravar_upload(upload_file: UploadFile, destino: Path, limite_bytes: Optional[int] = None) -> ArquivoGravado:
+    """Copia o upload para `destino` em blocos, com SHA-256, tamanho e limite."""
+    _verificar_tamanho_declarado(upload_file, limite_bytes)
+    return await run_in_threadpool(_copiar, upload_file.file, destino, limite_bytes)
@@ -1,4 +1,5 @@
 import json
+import logging
 import os
 import re
 import secrets
@@ -7,10 +8,9 @@ from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import google.generativeai as genai
-import pdfplumber
 from dotenv import load_dotenv
 from fastapi import UploadFile
 from fastapi.concurrency import run_in_threadpool
@@ -18,6 +18,9 @@ from fastapi.concurrency import run_in_threadpool
 from db import get_session_local
 from models.Documento_model import Arquivo
 from models.EditalRascunho_model import ItemRascunho, RascunhoEdital
+from services import armazenamento, edital_cache, extracao_pdf
+
+logger = logging.getLogger(__name__)
 
 # Garantir que variaveis do .env estejam carregadas antes de usar os serviços de IA.
 load_dotenv()
@@ -39,6 +42,10 @@ class GeminiConfigurationError(RuntimeError):
     """Raised when Gemini configuration is missing or invalid."""
 
 
+# "completo": texto de todas as paginas, cortado em max_chars; "relevante": so as paginas
+# mais relevantes que cabem em max_chars, com tabelas (services/extracao_pdf)
+EXTRACTION_MODES = ("completo", "relevante")
+
 PDF_MIME_TYPES = {
     "application/pdf",
     "application/x-pdf",
@@ -52,54 +59,93 @@ class ProcessedArquivo:
     caminho_absoluto: Path
     caminho_relativo: str
     tamanho_bytes: int
+    hash_sha256: Optional[str] = None
+
+
+@dataclass
+class PreparedUpload:
+    arquivo_info: ProcessedArquivo
+    chave: edital_cache.ChaveAnalise
+    em_cache: Optional[Dict[str, Any]]  # retorno de EditalProcessor._consultar_cache
 
 
 class PDFProcessor:
-    def __init__(self, upload_dir: Path, project_root: Path) -> None:
+    def __init__(self, upload_dir: Path, project_root: Path, max_bytes: Optional[int] = None) -> None:
         self.upload_dir = upload_dir
         self.project_root = project_root
+        self.max_bytes = max_bytes if max_bytes is not None else armazenamento.LIMITE_EDITAL_BYTES
         self.upload_dir.mkdir(parents=True, exist_ok=True)
 
-    async def save_upload(self, upload_file: UploadFile) -> ProcessedArquivo:
+    async def inspect_upload(self, upload_file: UploadFile) -> armazenamento.ArquivoGravado:
+        """SHA-256 e tamanho do PDF, lidos em blocos, sem gravar (o cache decide se grava)."""
         self._validate_upload(upload_file)
-        filename = self._build_filename(upload_file.filename or "edital.pdf")
-        destination = self.upload_dir / filename
-
-        contents = await upload_file.read()
-        if not contents:
+        resumo = await armazenamento.resumir_upload(upload_file, self.max_bytes)
+        if not resumo.tamanho_bytes:
             raise InvalidPDFError("O arquivo PDF enviado esta vazio.")
+        return resumo
 
-        destination.write_bytes(contents)
-        await upload_file.seek(0)  # Permite reuso em outros pontos se necessario.
-
-        rel_path = os.path.relpath(destination, self.project_root)
-        tamanho_bytes = destination.stat().st_size
+    async def save_upload(self, upload_file: UploadFile) -> ProcessedArquivo:
+        """Copia o PDF para upload_dir em blocos, numa thread, sem carregar tudo em memoria."""
+        self._validate_upload(upload_file)
+        original_name = upload_file.filename or "edital.pdf"
+        destination = self.upload_dir / self._build_filename(original_name)
+        gravado = await armazenamento.gravar_upload(upload_file, destination, self.max_bytes)
+        if not gravado.tamanho_bytes:
+            destination.unlink(missing_ok=True)
+            raise InvalidPDFError("O arquivo PDF enviado esta vazio.")
         return ProcessedArquivo(
-            nome_original=upload_file.filename or "edital.pdf",
+            nome_original=original_name,
             caminho_absoluto=destination,
-            caminho_relativo=rel_path,
-            tamanho_bytes=tamanho_bytes,
+            caminho_relativo=os.path.relpath(destination, self.project_root),
+            tamanho_bytes=gravado.tamanho_bytes,
+            hash_sha256=gravado.hash_sha256,
+        )
+
+    def stored_upload(
+        self, original_name: str, caminho_relativo: str, tamanho_bytes: Optional[int], hash_sha256: str
+    ) -> ProcessedArquivo:
+        """Arquivo ja gravado por um envio anterior do mesmo PDF."""
+        return ProcessedArquivo(
+            nome_original=original_name,
+            caminho_absoluto=self.project_root / caminho_relativo,
+            caminho_relativo=caminho_relativo,
+            tamanho_bytes=tamanho_bytes or 0,
+            hash_sha256=hash_sha256,
         )
 
     def extract_text(self, file_path: Path, max_pages: Optional[int] = None) -> str:
+        """Texto das paginas, extraido em faixas paralelas quando PDF_EXTRACAO_PROCESSOS > 1."""
         try:
-            with pdfplumber.open(str(file_path)) as pdf:
-                pages = pdf.pages
-                if max_pages:
-                    pages = pages[:max_pages]
-                text_parts: List[str] = []
-                for page in pages:
-                    page_text = page.extract_text() or ""
-                    if page_text.strip():
-                        text_parts.append(page_text.strip())
+            page_texts = extracao_pdf.extrair_paginas(file_path, max_pages)
+        except TimeoutError as exc:
+            raise PDFExtractionError("A leitura do PDF excedeu o tempo limite.") from exc
         except Exception as exc:  # pragma: no cover - pdfplumber internals
             raise PDFExtractionError("Nao foi possivel ler o PDF enviado.") from exc
 
-        combined = "\n".join(text_parts).strip()
+        combined = "\n".join(text for text in page_texts if text).strip()
         if not combined:
             raise PDFExtractionError("Nenhum texto foi encontrado no PDF enviado.")
         return combined
 
+    def extract_relevant_text(self, file_path: Path, max_chars: int) -> str:
+        """Ate max_chars caracteres das paginas mais relevantes, com as tabelas linha a linha."""
+        try:
+            extracao = extracao_pdf.extrair_relevante(file_path, max_chars)
+        except TimeoutError as exc:
+            raise PDFExtractionError("A leitura do PDF excedeu o tempo limite.") from exc
+        except Exception as exc:  # pragma: no cover - pdfplumber internals
+            raise PDFExtractionError("Nao foi possivel ler o PDF enviado.") from exc
+
+        if not extracao.texto.strip():
+            raise PDFExtractionError("Nenhum texto foi encontrado no PDF enviado.")
+        logger.info(
+            "Extracao relevante: %s de %s paginas lidas, paginas %s selecionadas",
+            extracao.paginas_lidas,
+            extracao.paginas_total,
+            extracao.paginas_selecionadas,
+        )
+        return extracao.texto
+
     @staticmethod
     def _build_filename(original_name: str) -> str:
         timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
@@ -117,6 +163,8 @@ class PDFProcessor:
 
 class GeminiClient:
     DEFAULT_MODEL = "gemini-2.5-flash-lite"
+    # Mudar sempre que _build_prompt mudar: entra na chave do cache de analises
+    VERSAO_PROMPT = "1"
 
     def __init__(self, api_key: str, model_name: Optional[str] = None) -> None:
         if not api_key:
@@ -125,7 +173,8 @@ class GeminiClient:
             )
 
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name or self.DEFAULT_MODEL)
+        self.model_name = model_name or self.DEFAULT_MODEL
+        self.model = genai.GenerativeModel(self.model_name)
         self._generation_config = {
             "temperature": 0.2,
             "response_mime_type": "application/json",
@@ -201,11 +250,15 @@ class EditalProcessor:
         model_name: Optional[str] = None,
         max_chars: int = 18000,
         preview_items: int = 5,
+        extraction_mode: str = "relevante",
     ) -> None:
+        if extraction_mode not in EXTRACTION_MODES:
+            raise ValueError(f"Modo de extracao invalido: {extraction_mode}")
         self.pdf_processor = PDFProcessor(upload_dir=upload_dir, project_root=project_root)
         self.gemini_client = GeminiClient(api_key=api_key, model_name=model_name)
         self.max_chars = max_chars
         self.preview_items = preview_items
+        self.extraction_mode = extraction_mode
 
     async def process_upload(
         self,
@@ -215,73 +268,155 @@ class EditalProcessor:
         current_user: Optional[Any],
         gerar_rascunho: bool,
     ) -> Dict[str, Any]:
-        arquivo_info = await self.pdf_processor.save_upload(upload_file)
-        extracted_text = await run_in_threadpool(self.pdf_processor.extract_text, arquivo_info.caminho_absoluto)
-        truncated_text = self._truncate_text(extracted_text)
-        ai_payload = await run_in_threadpool(self.gemini_client.analyze_edital, truncated_text)
-        normalized_payload = self._normalize_payload(ai_payload)
+        preparado = await self.prepare_upload(upload_file)
+        normalized_payload, cache_hit = await run_in_threadpool(self.analyze, preparado)
 
         # Persistir rascunho e arquivo caso solicitado
-        db_saved = False
         rascunho_db_id = None
         if gerar_rascunho:
             Session = get_session_local()
             db = Session()
             try:
-                arquivo_db = Arquivo(
-                    nome_original=arquivo_info.nome_original,
-                    caminho_storage=arquivo_info.caminho_relativo,
-                    mime_type="application/pdf",
-                    tamanho_bytes=arquivo_info.tamanho_bytes,
-                    uploaded_by_user_id=getattr(current_user, "id", None),
-                )
-                db.add(arquivo_db)
-                db.flush()
-
-                rascunho = RascunhoEdital(
-                    titulo=normalized_payload.get("titulo"),
-                    descricao=normalized_payload.get("resumo"),
-                    organizacao_id=organization_id,
-                    arquivo_id=arquivo_db.id,
-                    criada_por_user_id=getattr(current_user, "id", None),
-                    conteudo_estruturado_json=normalized_payload,
+                rascunho_db_id = self.save_draft(
+                    db,
+                    preparado.arquivo_info,
+                    normalized_payload,
+                    organization_id=organization_id,
+                    user_id=getattr(current_user, "id", None),
                 )
-                db.add(rascunho)
-                db.flush()
-
-                itens = normalized_payload.get("itens", [])
-                for it in itens:
-                    # try to parse price into Decimal for Numeric field
-                    preco_val = None
-                    try:
-                        preco_str = it.get("preco_estimado") or it.get("preco") or it.get("valor")
-                        if preco_str:
-                            preco_val = self._parse_price(preco_str)
-                    except Exception:
-                        preco_val = None
-
-                    item_db = ItemRascunho(
-                        rascunho_id=rascunho.id,
-                        produto_nome=it.get("produto_nome"),
-                        descricao_adicional=it.get("descricao_adicional"),
-                        quantidade=it.get("quantidade"),
-                        unidade=it.get("unidade"),
-                        categoria=it.get("categoria"),
-                        preco_estimado=preco_val,
-                        frequencia=it.get("frequencia"),
-                        criterios_observacoes=it.get("criterios_observacoes"),
-                        confianca=it.get("confianca"),
-                    )
-                    db.add(item_db)
-
                 db.commit()
-                db_saved = True
-                rascunho_db_id = rascunho.id
             except Exception:
                 db.rollback()
+                rascunho_db_id = None
+                logger.exception("Falha ao gravar o rascunho do edital")
             finally:
                 db.close()
 
+        return self.build_result(
+            normalized_payload=normalized_payload,
+            arquivo_info=preparado.arquivo_info,
+            organization_id=organization_id,
+            current_user=current_user,
+            gerar_rascunho=gerar_rascunho,
+            cache_hit=cache_hit,
+            rascunho_db_id=rascunho_db_id,
+        )
+
+    async def prepare_upload(self, upload_file: UploadFile) -> PreparedUpload:
+        """Valida o PDF e consulta o cache; so grava o arquivo se nao houver copia do mesmo PDF."""
+        resumo = await self.pdf_processor.inspect_upload(upload_file)
+        original_name = upload_file.filename or "edital.pdf"
+        chave = self._cache_key(resumo.hash_sha256)
+
+        # Mesmo PDF ja enviado: reaproveita o arquivo gravado (e, se houver, texto e analise)
+        em_cache = await run_in_threadpool(self._consultar_cache, chave)
+        if em_cache is not None:
+            arquivo_info = self.pdf_processor.stored_upload(
+                original_name, em_cache["caminho_storage"], em_cache["tamanho_bytes"], resumo.hash_sha256
+            )
+        else:
+            arquivo_info = await self.pdf_processor.save_upload(upload_file)
+        return PreparedUpload(arquivo_info, chave, em_cache)
+
+    def prepare_stored(self, arquivo_info: ProcessedArquivo) -> PreparedUpload:
+        """PreparedUpload de um arquivo ja gravado (jobs em segundo plano)."""
+        chave = self._cache_key(arquivo_info.hash_sha256)
+        return PreparedUpload(arquivo_info, chave, self._consultar_cache(chave))
+
+    def analyze(
+        self, preparado: PreparedUpload, on_stage: Optional[Callable[[str], None]] = None
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Extracao -> Gemini -> normalizacao, pulando o que o cache ja tem. Bloqueante (rodar
+        numa thread); on_stage recebe "extracao", "ia" e "normalizacao" ao iniciar cada etapa.
+        Retorna (payload normalizado, cache_hit).
+        """
+        em_cache = preparado.em_cache
+        # Mesmo PDF, modelo e prompt: nada de extrair texto ou chamar o Gemini
+        if em_cache is not None and em_cache["payload"] is not None:
+            return em_cache["payload"], True
+
+        avisar = on_stage or (lambda etapa: None)
+        # Mesmo PDF com outro modelo/prompt: reaproveita o texto extraido no mesmo modo
+        extracted_text = em_cache["texto"] if em_cache is not None else None
+        if extracted_text is None:
+            avisar("extracao")
+            extracted_text = self._extract_text(preparado.arquivo_info.caminho_absoluto)
+        avisar("ia")
+        ai_payload = self.gemini_client.analyze_edital(self._truncate_text(extracted_text))
+        avisar("normalizacao")
+        normalized_payload = self._normalize_payload(ai_payload)
+        self._gravar_cache(preparado.chave, extracted_text, normalized_payload, preparado.arquivo_info)
+        return normalized_payload, False
+
+    def save_draft(
+        self,
+        db: Any,
+        arquivo_info: ProcessedArquivo,
+        normalized_payload: Dict[str, Any],
+        *,
+        organization_id: Optional[int],
+        user_id: Optional[int],
+    ) -> int:
+        """Adiciona Arquivo, RascunhoEdital e itens na sessao (sem commit) e retorna o id do rascunho."""
+        arquivo_db = Arquivo(
+            nome_original=arquivo_info.nome_original,
+            caminho_storage=arquivo_info.caminho_relativo,
+            mime_type="application/pdf",
+            tamanho_bytes=arquivo_info.tamanho_bytes,
+            hash_arquivo=arquivo_info.hash_sha256,
+            uploaded_by_user_id=user_id,
+        )
+        db.add(arquivo_db)
+        db.flush()
+
+        rascunho = RascunhoEdital(
+            titulo=normalized_payload.get("titulo"),
+            descricao=normalized_payload.get("resumo"),
+            organizacao_id=organization_id,
+            arquivo_id=arquivo_db.id,
+            criada_por_user_id=user_id,
+            conteudo_estruturado_json=normalized_payload,
+        )
+        db.add(rascunho)
+        db.flush()
+
+        for it in normalized_payload.get("itens", []):
+            # try to parse price into Decimal for Numeric field
+            preco_val = None
+            try:
+                preco_str = it.get("preco_estimado") or it.get("preco") or it.get("valor")
+                if preco_str:
+                    preco_val = self._parse_price(preco_str)
+            except Exception:
+                preco_val = None
+
+            db.add(
+                ItemRascunho(
+                    rascunho_id=rascunho.id,
+                    produto_nome=it.get("produto_nome"),
+                    descricao_adicional=it.get("descricao_adicional"),
+                    quantidade=it.get("quantidade"),
+                    unidade=it.get("unidade"),
+                    categoria=it.get("categoria"),
+                    preco_estimado=preco_val,
+                    confianca=it.get("confianca"),
+                )
+            )
+        db.flush()
+        return rascunho.id
+
+    def build_result(
+        self,
+        *,
+        normalized_payload: Dict[str, Any],
+        arquivo_info: ProcessedArquivo,
+        organization_id: Optional[int],
+        current_user: Optional[Any],
+        gerar_rascunho: bool,
+        cache_hit: bool,
+        rascunho_db_id: Optional[int],
+    ) -> Dict[str, Any]:
         response = self._build_response(
             normalized_payload=normalized_payload,
             arquivo_info=arquivo_info,
@@ -290,13 +425,85 @@ class EditalProcessor:
             gerar_rascunho=gerar_rascunho,
         )
 
+        response["cache_hit"] = cache_hit
+
         # Add DB metadata to response when persisted
-        if db_saved:
+        if rascunho_db_id is not None:
             response["db_saved"] = True
             response["rascunho_db_id"] = rascunho_db_id
 
         return response
 
+    def _cache_key(self, hash_sha256: str) -> edital_cache.ChaveAnalise:
+        return edital_cache.ChaveAnalise(
+            hash_sha256, self.gemini_client.model_name, self.gemini_client.VERSAO_PROMPT, self._modo_cache()
+        )
+
+    def _extract_text(self, file_path: Path) -> str:
+        if self.extraction_mode == "relevante":
+            return self.pdf_processor.extract_relevant_text(file_path, self.max_chars)
+        return self.pdf_processor.extract_text(file_path)
+
+    def _modo_cache(self) -> str:
+        # O texto do modo relevante depende do orcamento de caracteres
+        if self.extraction_mode == "relevante":
+            return f"relevante:{self.max_chars}"
+        return self.extraction_mode
+
+    def _consultar_cache(self, chave: edital_cache.ChaveAnalise) -> Optional[Dict[str, Any]]:
+        """
+        Analise em cache para a chave ou, na falta dela, so o texto (mesmo modo de extracao) e
+        o arquivo de um envio anterior do mesmo PDF (payload None; texto None se o modo for
+        outro). Falhas do cache contam como ausencia.
+        """
+        db = get_session_local()()
+        try:
+            entrada = edital_cache.buscar(db, chave)
+            payload = entrada.payload_json if entrada is not None else None
+            texto = entrada.texto_extraido if entrada is not None else None
+            if entrada is None:
+                entrada = edital_cache.buscar_texto(db, chave.hash_arquivo, chave.modo_extracao)
+                texto = entrada.texto_extraido if entrada is not None else None
+            if entrada is None:
+                entrada = edital_cache.buscar_texto(db, chave.hash_arquivo, None)
+            if entrada is None:
+                return None
+            return {
+                "payload": payload,
+                "texto": texto,
+                "caminho_storage": entrada.caminho_storage,
+                "tamanho_bytes": entrada.tamanho_bytes,
+            }
+        except Exception:
+            db.rollback()
+            logger.exception("Falha ao consultar o cache de analises de edital")
+            return None
+        finally:
+            db.close()
+
+    def _gravar_cache(
+        self,
+        chave: edital_cache.ChaveAnalise,
+        extracted_text: str,
+        normalized_payload: Dict[str, Any],
+        arquivo_info: ProcessedArquivo,
+    ) -> None:
+        db = get_session_local()()
+        try:
+            edital_cache.gravar(
+                db,
+                chave,
+                texto=extracted_text,
+                payload=normalized_payload,
+                caminho_storage=arquivo_info.caminho_relativo,
+                tamanho_bytes=arquivo_info.tamanho_bytes,
+            )
+        except Exception:
+            db.rollback()
+            logger.exception("Falha ao gravar o cache de analises de edital")
+        finally:
+            db.close()
+
     def _parse_price(self, value: Any) -> Optional[Decimal]:
         if value is None:
             return None
@@ -404,6 +611,7 @@ class EditalProcessor:
                 "nome_original": arquivo_info.nome_original,
                 "caminho": arquivo_info.caminho_relativo,
                 "tamanho_bytes": arquivo_info.tamanho_bytes,
+                "hash_sha256": arquivo_info.hash_sha256,
             },
         }
 
@@ -443,11 +651,13 @@ def get_edital_processor() -> EditalProcessor:
 
     api_key = os.getenv("GEMINI_API_KEY", "")
     model_name = os.getenv("GEMINI_MODEL_NAME")
+    extraction_mode = os.getenv("EDITAL_EXTRACAO_MODO", "relevante")
 
     _PROCESSOR_INSTANCE = EditalProcessor(
         upload_dir=upload_dir,
         project_root=BASE_DIR,
         api_key=api_key,
         model_name=model_name,
+        extraction_mode=extraction_mode,
     )
     return _PROCESSOR_INSTANCE
@@ -0,0 +1,139 @@
+"""
+Cache persistente das analises de edital (RF-30), enderecado pelo conteudo do PDF.
+
+A chave e (SHA-256 do arquivo, modelo do Gemini, versao do prompt, modo de extracao): o
+mesmo PDF enviado de novo reaproveita o payload normalizado sem gravar o arquivo outra vez
+nem consultar o Gemini. Trocar de modelo ou de prompt (GeminiClient.VERSAO_PROMPT) muda a
+chave, mas o texto extraido no mesmo modo e o arquivo gravado continuam valendo para o
+mesmo hash (buscar_texto); outro modo de extracao reaproveita so o arquivo.
+
+Entradas expiram TTL_HORAS depois de criadas; passando de MAX_ENTRADAS, as acessadas ha
+mais tempo saem primeiro (LRU). A poda roda a cada gravacao.
+"""
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.EditalRascunho_model import AnaliseEditalCache
+
+TTL_HORAS = float(os.getenv("EDITAL_CACHE_TTL_H", "720"))
+MAX_ENTRADAS = int(os.getenv("EDITAL_CACHE_MAX_ENTRADAS", "1000"))
+
+
+@dataclass(frozen=True)
+class ChaveAnalise:
+    hash_arquivo: str
+    modelo: str
+    versao_prompt: str
+    modo_extracao: str = "completo"
+
+
+def _expirada(entrada: AnaliseEditalCache, agora: datetime) -> bool:
+    return entrada.criado_em < agora - timedelta(hours=TTL_HORAS)
+
+
+def _filtro(chave: ChaveAnalise):
+    return (
+        AnaliseEditalCache.hash_arquivo == chave.hash_arquivo,
+        AnaliseEditalCache.modelo == chave.modelo,
+        AnaliseEditalCache.versao_prompt == chave.versao_prompt,
+        AnaliseEditalCache.modo_extracao == chave.modo_extracao,
+    )
+
+
+def buscar(db: Session, chave: ChaveAnalise, agora: Optional[datetime] = None) -> Optional[AnaliseEditalCache]:
+    """Analise ainda valida para a chave, marcando o acesso (LRU). Expirada conta como ausente."""
+    agora = agora or datetime.now()
+    entrada = db.query(AnaliseEditalCache).filter(*_filtro(chave)).first()
+    if entrada is None or _expirada(entrada, agora):
+        return None
+    entrada.ultimo_acesso_em = agora
+    entrada.acessos += 1
+    db.commit()
+    return entrada
+
+
+def buscar_texto(
+    db: Session,
+    hash_arquivo: str,
+    modo_extracao: Optional[str] = "completo",
+    agora: Optional[datetime] = None,
+) -> Optional[AnaliseEditalCache]:
+    """
+    Entrada valida mais recente do mesmo PDF e modo de extracao com qualquer modelo/prompt.
+    Com modo_extracao None, de qualquer modo (so o arquivo gravado e reaproveitavel).
+    """
+    agora = agora or datetime.now()
+    consulta = db.query(AnaliseEditalCache).filter(
+        AnaliseEditalCache.hash_arquivo == hash_arquivo,
+        AnaliseEditalCache.criado_em >= agora - timedelta(hours=TTL_HORAS),
+    )
+    if modo_extracao is not None:
+        consulta = consulta.filter(AnaliseEditalCache.modo_extracao == modo_extracao)
+    return consulta.order_by(AnaliseEditalCache.criado_em.desc()).first()
+
+
+def gravar(
+    db: Session,
+    chave: ChaveAnalise,
+    *,
+    texto: str,
+    payload: Dict[str, Any],
+    caminho_storage: str,
+    tamanho_bytes: Optional[int],
+    agora: Optional[datetime] = None,
+) -> None:
+    """Grava (ou renova) a analise da chave e poda o cache."""
+    agora = agora or datetime.now()
+    entrada = db.query(AnaliseEditalCache).filter(*_filtro(chave)).first()
+    if entrada is None:
+        entrada = AnaliseEditalCache(
+            hash_arquivo=chave.hash_arquivo,
+            modelo=chave.modelo,
+            versao_prompt=chave.versao_prompt,
+            modo_extracao=chave.modo_extracao,
+            acessos=0,
+        )
+        db.add(entrada)
+    entrada.texto_extraido = texto
+    entrada.payload_json = payload
+    entrada.caminho_storage = caminho_storage
+    entrada.tamanho_bytes = tamanho_bytes
+    entrada.criado_em = agora
+    entrada.ultimo_acesso_em = agora
+    try:
+        db.commit()
+    except IntegrityError:
+        # Outro envio do mesmo PDF gravou a chave primeiro: a analise dele vale igual
+        db.rollback()
+        return
+    podar(db, agora)
+
+
+def podar(db: Session, agora: Optional[datetime] = None) -> int:
+    """Remove as entradas expiradas e, acima de MAX_ENTRADAS, as menos usadas recentemente."""
+    agora = agora or datetime.now()
+    removidas = (
+        db.query(AnaliseEditalCache)
+        .filter(AnaliseEditalCache.criado_em < agora - timedelta(hours=TTL_HORAS))
+        .delete(synchronize_session=False)
+    )
+    excedentes = db.query(func.count(AnaliseEditalCache.id)).scalar() - MAX_ENTRADAS
+    if excedentes > 0:
+        antigas = (
+            db.query(AnaliseEditalCache.id)
+            .order_by(AnaliseEditalCache.ultimo_acesso_em, AnaliseEditalCache.id)
+            .limit(excedentes)
+        )
+        removidas += (
+            db.query(AnaliseEditalCache)
+            .filter(AnaliseEditalCache.id.in_([linha.id for linha in antigas]))
+            .delete(synchronize_session=False)
+        )
+    db.commit()
+    return removidas
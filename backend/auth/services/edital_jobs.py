@@ -0,0 +1,188 @@
+"""
+Processamento de editais em segundo plano (RF-30).
+
+A requisicao so valida o PDF e o grava (ou reaproveita a copia de um envio anterior do
+mesmo arquivo), registra um JobEdital "queued" e devolve o id. Um pool limitado de threads
+roda extracao -> Gemini -> normalizacao -> RascunhoEdital com sessao propria, atualizando
+etapa e progresso do job a cada passo: queued -> running -> completed|failed.
+
+O rascunho e o status "completed" sao gravados na mesma transacao, e o PDF ja esta em disco
+desde o envio: um job interrompido pelo reinicio do servidor volta para a fila e e refeito
+do comeco, sem rascunho duplicado.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from fastapi import UploadFile
+from sqlalchemy.orm import Session
+
+from db.db import get_session_local
+from models.EditalRascunho_model import JobEdital
+from models.User_model import User
+from services.edital_ai import (
+    EditalProcessor,
+    GeminiAIError,
+    GeminiConfigurationError,
+    InvalidPDFError,
+    PDFExtractionError,
+    get_edital_processor,
+)
+from services.worker_pool import FilaCheiaError, PoolTrabalho, get_pool
+
+logger = logging.getLogger(__name__)
+
+STATUS_FINAIS = ("completed", "failed")
+
+# Progresso (%) do job ao entrar em cada etapa
+PROGRESSO_ETAPAS = {
+    "upload": 10,
+    "extracao": 20,
+    "ia": 50,
+    "normalizacao": 80,
+    "persistencia": 90,
+    "concluido": 100,
+}
+
+
+def get_edital_pool() -> PoolTrabalho:
+    return get_pool(
+        "editais",
+        max_workers=int(os.getenv("EDITAL_WORKERS", "2")),
+        max_pendentes=int(os.getenv("EDITAL_QUEUE_SIZE", "20")),
+    )
+
+
+async def criar_job(
+    db: Session,
+    processor: EditalProcessor,
+    upload_file: UploadFile,
+    *,
+    organization_id: Optional[int],
+    current_user: Optional[Any],
+    gerar_rascunho: bool,
+) -> JobEdital:
+    """Valida e grava o PDF e registra o job "queued" (sem enfileirar)."""
+    preparado = await processor.prepare_upload(upload_file)
+    arquivo_info = preparado.arquivo_info
+    job = JobEdital(
+        status="queued",
+        etapa="upload",
+        progresso=PROGRESSO_ETAPAS["upload"],
+        organizacao_id=organization_id,
+        criada_por_user_id=getattr(current_user, "id", None),
+        gerar_rascunho=gerar_rascunho,
+        nome_original=arquivo_info.nome_original,
+        caminho_storage=arquivo_info.caminho_relativo,
+        tamanho_bytes=arquivo_info.tamanho_bytes,
+        hash_arquivo=arquivo_info.hash_sha256,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def enfileirar_job(job_id: int, session_factory: Optional[Callable[[], Session]] = None):
+    """Agenda o job no pool. Levanta FilaCheiaError se o pool estiver no limite."""
+    return get_edital_pool().submit(_executar_em_background, job_id, session_factory)
+
+
+def _executar_em_background(job_id: int, session_factory: Optional[Callable[[], Session]] = None) -> None:
+    db = (session_factory or get_session_local())()
+    try:
+        job = db.query(JobEdital).filter(JobEdital.id == job_id).first()
+        if not job or job.status in STATUS_FINAIS:
+            return
+        job.status = "running"
+        job.iniciado_em = datetime.now()
+        db.commit()
+        try:
+            executar_job(db, job, get_edital_processor())
+        except (InvalidPDFError, PDFExtractionError, GeminiAIError, GeminiConfigurationError) as exc:
+            db.rollback()
+            _marcar_falha(job, str(exc))
+            db.commit()
+        except Exception:
+            logger.exception("Job de edital %s falhou", job_id)
+            db.rollback()
+            _marcar_falha(job, "Falha inesperada ao processar o edital.")
+            db.commit()
+    finally:
+        db.close()
+
+
+def executar_job(db: Session, job: JobEdital, processor: EditalProcessor) -> None:
+    """Roda o pipeline do job; o rascunho e o status final vao no mesmo commit."""
+    arquivo_info = processor.pdf_processor.stored_upload(
+        job.nome_original, job.caminho_storage, job.tamanho_bytes, job.hash_arquivo
+    )
+    preparado = processor.prepare_stored(arquivo_info)
+    normalized_payload, cache_hit = processor.analyze(preparado, on_stage=lambda etapa: _avancar(db, job, etapa))
+
+    _avancar(db, job, "persistencia")
+    rascunho_id = None
+    if job.gerar_rascunho:
+        rascunho_id = processor.save_draft(
+            db,
+            arquivo_info,
+            normalized_payload,
+            organization_id=job.organizacao_id,
+            user_id=job.criada_por_user_id,
+        )
+    usuario = db.get(User, job.criada_por_user_id) if job.criada_por_user_id else None
+    job.resultado_json = processor.build_result(
+        normalized_payload=normalized_payload,
+        arquivo_info=arquivo_info,
+        organization_id=job.organizacao_id,
+        current_user=usuario,
+        gerar_rascunho=job.gerar_rascunho,
+        cache_hit=cache_hit,
+        rascunho_db_id=rascunho_id,
+    )
+    job.rascunho_id = rascunho_id
+    job.status = "completed"
+    job.etapa = "concluido"
+    job.progresso = PROGRESSO_ETAPAS["concluido"]
+    job.finalizado_em = datetime.now()
+    db.commit()
+
+
+def _avancar(db: Session, job: JobEdital, etapa: str) -> None:
+    job.etapa = etapa
+    job.progresso = PROGRESSO_ETAPAS[etapa]
+    if etapa != "persistencia":
+        db.commit()  # a persistencia so e gravada junto com o rascunho
+
+
+def retomar_jobs_pendentes(db: Session) -> int:
+    """
+    Na subida da aplicacao: jobs "queued" e "running" (interrompidos com o processo
+    anterior) voltam para a fila. Retorna quantos foram reenfileirados.
+    """
+    pendentes = (
+        db.query(JobEdital)
+        .filter(JobEdital.status.in_(("queued", "running")))
+        .order_by(JobEdital.id)
+        .all()
+    )
+    reenfileirados = 0
+    for job in pendentes:
+        job.status = "queued"
+        job.etapa = "upload"
+        job.progresso = PROGRESSO_ETAPAS["upload"]
+        db.commit()
+        try:
+            enfileirar_job(job.id)
+            reenfileirados += 1
+        except FilaCheiaError:
+            _marcar_falha(job, "Fila de editais cheia ao retomar jobs pendentes.")
+            db.commit()
+    return reenfileirados
+
+
+def _marcar_falha(job: JobEdital, motivo: str) -> None:
+    job.status = "failed"
+    job.erro = motivo
+    job.finalizado_em = datetime.now()
@@ -0,0 +1,146 @@
+"""
+Fecho das equivalencias de substituicao entre produtos (RF-29), para o motor de match.
+
+Cada SubstitucaoEquivalencia ativa liga dois produtos nos dois sentidos, com a razao de
+conversao de razao_equivalencia ("a:b" = a unidades do produto de origem valem b do
+destino; um numero solto, com ou sem unidade, vale "1:n"; vazio ou ilegivel vale "1:1").
+O fecho e transitivo: se A troca por B e B por C, A troca por C com as razoes compostas
+pelo caminho mais curto (e, no empate, pelos menores ids).
+
+O fecho fica em memoria no processo e so e remontado quando /admin/equivalencias grava
+(invalidar()) ou quando passa TTL_SEGUNDOS (outros workers nao veem a invalidacao). O
+motor nunca consulta a tabela por candidato.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.Catalogo_model import SubstitucaoEquivalencia
+
+TTL_SEGUNDOS = float(os.getenv("MATCH_EQUIVALENCIAS_TTL_S", "300"))
+
+_NUMERO = r"(\d+(?:[.,]\d+)?)"
+_RAZAO = re.compile(rf"^\s*{_NUMERO}\s*[a-zA-Z]*\s*:\s*{_NUMERO}")
+_ESCALAR = re.compile(rf"^\s*{_NUMERO}")
+
+
+class FechoEquivalencias:
+    """
+    Mapa de adjacencia ja fechado: fator(demandado, ofertado) = quantas unidades do produto
+    demandado cada unidade do ofertado cobre.
+    """
+
+    def __init__(self, fatores: Dict[int, Dict[int, float]], assinatura: str):
+        self._fatores = fatores
+        self.assinatura = assinatura
+
+    def substitutos(self, produto_id: int) -> Dict[int, float]:
+        """{produto ofertado: fator} dos substitutos do produto (sem ele mesmo)."""
+        return self._fatores.get(produto_id, {})
+
+    def fator(self, demandado_id: int, ofertado_id: int) -> Optional[float]:
+        if demandado_id == ofertado_id:
+            return 1.0
+        return self._fatores.get(demandado_id, {}).get(ofertado_id)
+
+    def expandir(self, produto_ids) -> set:
+        """Produtos da demanda mais todos os seus substitutos."""
+        expandidos = set(produto_ids)
+        for produto_id in produto_ids:
+            expandidos.update(self.substitutos(produto_id))
+        return expandidos
+
+
+def razao(texto: Optional[str]) -> float:
+    """Unidades do destino por unidade da origem."""
+    if not texto:
+        return 1.0
+    achado = _RAZAO.match(texto)
+    if achado:
+        origem, destino = (float(valor.replace(",", ".")) for valor in achado.groups())
+    else:
+        achado = _ESCALAR.match(texto)
+        if not achado:
+            return 1.0
+        origem, destino = 1.0, float(achado.group(1).replace(",", "."))
+    if origem <= 0 or destino <= 0:
+        return 1.0
+    return destino / origem
+
+
+def montar_fecho(arestas: List[Tuple[int, int, float]]) -> Dict[int, Dict[int, float]]:
+    """
+    Fecho transitivo de arestas (origem, destino, unidades do destino por unidade da origem).
+    Devolve fatores[demandado][ofertado] = unidades do demandado por unidade do ofertado.
+    """
+    # vizinhos[a][b] = unidades de a por unidade de b
+    vizinhos: Dict[int, Dict[int, float]] = {}
+    for origem, destino, unidades in arestas:
+        if origem == destino:
+            continue
+        vizinhos.setdefault(origem, {}).setdefault(destino, 1.0 / unidades)
+        vizinhos.setdefault(destino, {}).setdefault(origem, unidades)
+
+    fatores: Dict[int, Dict[int, float]] = {}
+    for inicio in sorted(vizinhos):
+        alcancados = {inicio: 1.0}
+        fila = deque([inicio])
+        while fila:
+            atual = fila.popleft()
+            for vizinho in sorted(vizinhos[atual]):
+                if vizinho not in alcancados:
+                    # unidades de inicio por unidade de vizinho
+                    alcancados[vizinho] = alcancados[atual] * vizinhos[atual][vizinho]
+                    fila.append(vizinho)
+        del alcancados[inicio]
+        fatores[inicio] = alcancados
+    return fatores
+
+
+def carregar(db: Session) -> FechoEquivalencias:
+    linhas = (
+        db.query(
+            SubstitucaoEquivalencia.from_product_id,
+            SubstitucaoEquivalencia.to_product_id,
+            SubstitucaoEquivalencia.razao_equivalencia,
+        )
+        .filter(SubstitucaoEquivalencia.ativo.is_(True))
+        .order_by(SubstitucaoEquivalencia.id)
+        .all()
+    )
+    arestas = [(origem, destino, razao(texto)) for origem, destino, texto in linhas]
+    assinatura = hashlib.sha256(repr(arestas).encode("utf-8")).hexdigest()[:16]
+    return FechoEquivalencias(montar_fecho(arestas), assinatura)
+
+
+_lock = threading.Lock()
+_fecho: Optional[FechoEquivalencias] = None
+_carregado_em = 0.0
+_geracao = 0  # muda a cada invalidar(): um fecho montado antes dela nao e guardado
+
+
+def obter(db: Session) -> FechoEquivalencias:
+    """Fecho em cache no processo (remontado apos invalidar() ou TTL_SEGUNDOS)."""
+    global _fecho, _carregado_em
+    with _lock:
+        if _fecho is not None and time.monotonic() - _carregado_em < TTL_SEGUNDOS:
+            return _fecho
+        geracao = _geracao
+    fecho = carregar(db)
+    with _lock:
+        if geracao == _geracao:
+            _fecho, _carregado_em = fecho, time.monotonic()
+    return fecho
+
+
+def invalidar() -> None:
+    global _fecho, _geracao
+    with _lock:
+        _fecho = None
+        _geracao += 1
@@ -0,0 +1,326 @@
+"""
+Extracao de texto de PDF por faixas de paginas em varios processos (RF-30).
+
+O pdfplumber e Python puro e preso ao GIL: um edital de centenas de paginas extraido numa
+thread so ocupa um nucleo. Com PDF_EXTRACAO_PROCESSOS > 1, as paginas sao divididas em
+faixas contiguas distribuidas num ProcessPoolExecutor; cada processo abre o arquivo so com
+as paginas da sua faixa e devolve o texto delas. O processo pai remonta o texto na ordem
+das paginas, igual a extracao sequencial.
+
+PDFs com menos de MIN_PAGINAS_PARALELO paginas sao extraidos no proprio processo (abrir o
+arquivo em cada filho custaria mais do que a extracao). No modo paralelo, se o documento
+inteiro passar de PDF_EXTRACAO_TIMEOUT_S, sai TimeoutError e o pool e descartado com os
+processos filhos terminados, para um filho travado num PDF patologico nao prender as
+proximas extracoes (outra extracao que dividia o mesmo pool falha com BrokenProcessPool).
+
+extrair_relevante e o modo da etapa de IA: em vez do texto inteiro, monta um texto de ate
+`max_chars` caracteres com as paginas mais relevantes (palavras como "item", "quantidade",
+"kg", "valor estimado" e densidade de tabelas), na ordem do documento. As tabelas saem da
+extracao de tabelas do pdfplumber, uma linha por registro com as celulas separadas por
+" | "; o restante da pagina vem do texto fora delas. A leitura para assim que o orcamento
+esta cheio so com paginas acima de LIMIAR_RELEVANCIA.
+"""
+import multiprocessing
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pdfplumber
+
+PROCESSOS = int(os.getenv("PDF_EXTRACAO_PROCESSOS", "0"))  # <= 1: extrai no proprio processo
+TIMEOUT_SEGUNDOS = float(os.getenv("PDF_EXTRACAO_TIMEOUT_S", "120"))
+MIN_PAGINAS_PARALELO = int(os.getenv("PDF_EXTRACAO_MIN_PAGINAS", "16"))
+FAIXAS_POR_PROCESSO = 2  # faixas menores equilibram paginas com muito texto/tabela
+
+# Modo relevante: peso de cada termo (sem acento, minusculo), contado ate MAX_OCORRENCIAS vezes
+PALAVRAS_RELEVANCIA = {
+    "item": 1.0,
+    "itens": 1.0,
+    "lote": 1.0,
+    "produto": 1.0,
+    "especificacao": 1.0,
+    "quantidade": 2.0,
+    "quant": 1.0,
+    "unidade": 1.0,
+    "unid": 1.0,
+    "kg": 1.5,
+    "preco": 1.5,
+    "valor unitario": 2.0,
+    "valor estimado": 3.0,
+}
+MAX_OCORRENCIAS = 5
+PESO_CELULA = 0.1  # por celula preenchida de linhas de tabela com 2+ colunas
+MAX_CELULAS = 100
+LIMIAR_RELEVANCIA = 8.0  # ~ uma pagina com tabela de itens
+OCUPACAO_MINIMA = 0.9  # fracao de max_chars que conta como orcamento cheio
+PAGINAS_POR_JANELA = 4  # por processo, entre uma verificacao de parada e outra
+
+_PADROES = {
+    termo: re.compile(r"\b" + re.escape(termo) + r"\b") for termo in PALAVRAS_RELEVANCIA
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_processos = 0
+_executor_lock = threading.Lock()
+
+
+def get_executor(processos: int) -> ProcessPoolExecutor:
+    """Pool de processos compartilhado; recriado apenas se o numero de processos mudar."""
+    global _executor, _executor_processos
+    with _executor_lock:
+        if _executor is None or _executor_processos != processos:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn"))
+            _executor_processos = processos
+        return _executor
+
+
+def encerrar_processos(wait: bool = False) -> None:
+    global _executor, _executor_processos
+    with _executor_lock:
+        executor, _executor, _executor_processos = _executor, None, 0
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def _descartar_executor() -> None:
+    """
+    Descarta o pool apos um timeout. shutdown() nao interrompe uma faixa em andamento, entao
+    os processos filhos sao terminados; o proximo get_executor cria um pool novo.
+    """
+    global _executor, _executor_processos
+    with _executor_lock:
+        executor, _executor, _executor_processos = _executor, None, 0
+    if executor is None:
+        return
+    processos = list((executor._processes or {}).values())
+    for processo in processos:
+        processo.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def contar_paginas(caminho: Path) -> int:
+    with pdfplumber.open(str(caminho)) as pdf:
+        return len(pdf.pages)
+
+
+def extrair_faixa(caminho: str, inicio: int, fim: int) -> List[str]:
+    """Texto (sem espacos nas pontas) das paginas [inicio, fim), base 0; roda no processo filho."""
+    textos = []
+    with pdfplumber.open(caminho, pages=list(range(inicio + 1, fim + 1))) as pdf:
+        for page in pdf.pages:
+            textos.append((page.extract_text() or "").strip())
+            page.close()  # libera o cache de objetos da pagina antes da proxima
+    return textos
+
+
+@dataclass
+class PaginaAnalisada:
+    indice: int  # base 0
+    relevancia: float
+    bloco: str  # "[pagina N]", texto fora das tabelas e as tabelas; vazio se a pagina nao tem texto
+
+
+@dataclass
+class ExtracaoRelevante:
+    texto: str
+    paginas_total: int
+    paginas_lidas: int
+    paginas_selecionadas: List[int]  # base 1, na ordem do documento
+    parada_antecipada: bool
+
+
+def _sem_acento(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(char for char in decomposto if not unicodedata.combining(char)).lower()
+
+
+def relevancia(texto: str, celulas: int) -> float:
+    """Pontuacao de uma pagina pelos termos de itens/quantidades/precos e pelas celulas de tabela."""
+    normalizado = _sem_acento(texto)
+    pontos = 0.0
+    for termo, peso in PALAVRAS_RELEVANCIA.items():
+        ocorrencias = len(_PADROES[termo].findall(normalizado))
+        pontos += peso * min(ocorrencias, MAX_OCORRENCIAS)
+    return pontos + PESO_CELULA * min(celulas, MAX_CELULAS)
+
+
+def _linha_tabela(linha) -> str:
+    return " | ".join(" ".join((celula or "").split()) for celula in linha)
+
+
+def _analisar_pagina(page, indice: int) -> PaginaAnalisada:
+    tabelas = page.find_tables()
+    fora = page
+    linhas: List[str] = []
+    celulas = 0
+    for tabela in tabelas:
+        fora = fora.outside_bbox(tabela.bbox)
+        registros = [linha for linha in tabela.extract() if any(celula and celula.strip() for celula in linha)]
+        if not registros:
+            continue
+        linhas.append("[tabela]")
+        linhas.extend(_linha_tabela(linha) for linha in registros)
+        celulas += sum(
+            sum(1 for celula in linha if celula and celula.strip())
+            for linha in registros
+            if len(linha) >= 2
+        )
+    texto = (fora.extract_text() or "").strip()
+    partes = [parte for parte in [texto, "\n".join(linhas)] if parte]
+    if not partes:
+        return PaginaAnalisada(indice, 0.0, "")
+    corpo = "\n".join(partes)
+    return PaginaAnalisada(indice, relevancia(corpo, celulas), f"[pagina {indice + 1}]\n{corpo}")
+
+
+def analisar_faixa(caminho: str, inicio: int, fim: int) -> List[PaginaAnalisada]:
+    """Paginas [inicio, fim) com relevancia e bloco de texto/tabelas; roda no processo filho."""
+    analisadas = []
+    with pdfplumber.open(caminho, pages=list(range(inicio + 1, fim + 1))) as pdf:
+        for deslocamento, page in enumerate(pdf.pages):
+            analisadas.append(_analisar_pagina(page, inicio + deslocamento))
+            page.close()
+    return analisadas
+
+
+def selecionar(paginas: List[PaginaAnalisada], max_chars: int) -> List[PaginaAnalisada]:
+    """
+    Paginas que cabem em `max_chars` (blocos separados por uma linha em branco): a primeira
+    (capa: orgao, numero, objeto) e depois as mais relevantes; devolvidas na ordem do documento.
+    """
+    com_texto = [pagina for pagina in paginas if pagina.bloco]
+    ordem = sorted(com_texto, key=lambda pagina: (pagina.indice != 0, -pagina.relevancia, pagina.indice))
+    escolhidas = []
+    usados = 0
+    for pagina in ordem:
+        custo = len(pagina.bloco) + (2 if escolhidas else 0)
+        if usados + custo <= max_chars:
+            escolhidas.append(pagina)
+            usados += custo
+    if not escolhidas and ordem:
+        # Nenhuma pagina cabe inteira: a mais relevante vai cortada no limite
+        melhor = min(ordem[1:] or ordem, key=lambda pagina: (-pagina.relevancia, pagina.indice))
+        escolhidas = [PaginaAnalisada(melhor.indice, melhor.relevancia, melhor.bloco[:max_chars])]
+    return sorted(escolhidas, key=lambda pagina: pagina.indice)
+
+
+def _orcamento_cheio(escolhidas: List[PaginaAnalisada], max_chars: int) -> bool:
+    usados = sum(len(pagina.bloco) for pagina in escolhidas) + 2 * max(len(escolhidas) - 1, 0)
+    if usados < OCUPACAO_MINIMA * max_chars:
+        return False
+    relevancias = [pagina.relevancia for pagina in escolhidas if pagina.indice != 0]
+    return bool(relevancias) and min(relevancias) >= LIMIAR_RELEVANCIA
+
+
+def extrair_relevante(
+    caminho: Path,
+    max_chars: int,
+    processos: Optional[int] = None,
+    timeout_s: Optional[float] = None,
+) -> ExtracaoRelevante:
+    """
+    Texto de ate `max_chars` caracteres com as paginas mais relevantes, lidas em janelas (em
+    paralelo quando ha mais de um processo). Para de ler quando o orcamento ja esta cheio so
+    com paginas relevantes. TimeoutError apos `timeout_s` no modo paralelo.
+    """
+    processos = PROCESSOS if processos is None else processos
+    timeout_s = TIMEOUT_SEGUNDOS if timeout_s is None else timeout_s
+    total = contar_paginas(caminho)
+    paralelo = processos > 1 and total >= MIN_PAGINAS_PARALELO
+    janela = PAGINAS_POR_JANELA * (processos if paralelo else 1)
+    limite = time.monotonic() + timeout_s
+
+    analisadas: List[PaginaAnalisada] = []
+    escolhidas: List[PaginaAnalisada] = []
+    lidas = 0
+    while lidas < total and not _orcamento_cheio(escolhidas, max_chars):
+        fim = min(lidas + janela, total)
+        if paralelo:
+            analisadas.extend(_analisar_em_processos(str(caminho), lidas, fim, processos, limite, timeout_s))
+        else:
+            analisadas.extend(analisar_faixa(str(caminho), lidas, fim))
+        lidas = fim
+        escolhidas = selecionar(analisadas, max_chars)
+
+    return ExtracaoRelevante(
+        texto="\n\n".join(pagina.bloco for pagina in escolhidas),
+        paginas_total=total,
+        paginas_lidas=lidas,
+        paginas_selecionadas=[pagina.indice + 1 for pagina in escolhidas],
+        parada_antecipada=lidas < total,
+    )
+
+
+def _analisar_em_processos(
+    caminho: str, inicio: int, fim: int, processos: int, limite: float, timeout_s: float
+) -> List[PaginaAnalisada]:
+    executor = get_executor(processos)
+    futuros = [
+        executor.submit(analisar_faixa, caminho, inicio + faixa_inicio, inicio + faixa_fim)
+        for faixa_inicio, faixa_fim in dividir_faixas(fim - inicio, processos)
+    ]
+    _, pendentes = wait(futuros, timeout=max(0.0, limite - time.monotonic()))
+    if pendentes:
+        _descartar_executor()
+        raise TimeoutError(f"Extracao do PDF passou de {timeout_s:.0f}s.")
+    analisadas: List[PaginaAnalisada] = []
+    for futuro in futuros:
+        analisadas.extend(futuro.result())
+    return analisadas
+
+
+def dividir_faixas(total_paginas: int, partes: int) -> List[Tuple[int, int]]:
+    """Faixas contiguas [inicio, fim) cobrindo as paginas, com tamanhos diferindo em no maximo 1."""
+    partes = max(1, min(partes, total_paginas))
+    base, sobra = divmod(total_paginas, partes)
+    faixas = []
+    inicio = 0
+    for parte in range(partes):
+        fim = inicio + base + (1 if parte < sobra else 0)
+        faixas.append((inicio, fim))
+        inicio = fim
+    return faixas
+
+
+def extrair_paginas(
+    caminho: Path,
+    max_pages: Optional[int] = None,
+    processos: Optional[int] = None,
+    timeout_s: Optional[float] = None,
+) -> List[str]:
+    """
+    Texto de cada pagina, na ordem do documento (paginas sem texto vem vazias). Paralelo
+    quando ha mais de um processo e paginas suficientes; TimeoutError apos `timeout_s`.
+    """
+    processos = PROCESSOS if processos is None else processos
+    timeout_s = TIMEOUT_SEGUNDOS if timeout_s is None else timeout_s
+    total = contar_paginas(caminho)
+    if max_pages:
+        total = min(total, max_pages)
+    if total == 0:
+        return []
+    if processos <= 1 or total < MIN_PAGINAS_PARALELO:
+        return extrair_faixa(str(caminho), 0, total)
+
+    executor = get_executor(processos)
+    futuros = [
+        executor.submit(extrair_faixa, str(caminho), inicio, fim)
+        for inicio, fim in dividir_faixas(total, processos * FAIXAS_POR_PROCESSO)
+    ]
+    _, pendentes = wait(futuros, timeout=timeout_s)
+    if pendentes:
+        _descartar_executor()
+        raise TimeoutError(f"Extracao do PDF passou de {timeout_s:.0f}s.")
+
+    textos: List[str] = []
+    for futuro in futuros:  # ordem das faixas = ordem das paginas
+        textos.extend(futuro.result())
+    return textos
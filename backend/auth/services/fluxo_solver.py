@@ -0,0 +1,103 @@
+"""
+Fluxo de custo minimo (caminhos minimos sucessivos com potenciais) para a alocacao global
+de capacidade entre demandas (services/match_capacidade).
+
+Sem dependencias alem da biblioteca padrao: a rede da alocacao tem alguns milhares de
+arcos (itens x candidatos), e Dijkstra com potenciais de Johnson resolve cada aumento em
+O(E log V). Capacidades sao float (quantidades de producao); custos devem ser >= 0 na rede
+original (os arcos reversos do residual ficam com custo reduzido >= 0 pelos potenciais).
+"""
+import heapq
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Tuple
+
+TOLERANCIA = 1e-9
+
+
+@dataclass
+class _Arco:
+    destino: int
+    capacidade: float
+    custo: float
+    reverso: int  # indice do arco reverso na lista do destino
+    original: bool
+
+
+class RedeFluxo:
+    """Rede direcionada com nos identificados por qualquer valor hashable."""
+
+    def __init__(self):
+        self._indice: Dict[Hashable, int] = {}
+        self._adjacencia: List[List[_Arco]] = []
+        self._arcos: List[Tuple[int, int]] = []  # (no, posicao) de cada arco original
+
+    def no(self, chave: Hashable) -> int:
+        indice = self._indice.get(chave)
+        if indice is None:
+            indice = len(self._adjacencia)
+            self._indice[chave] = indice
+            self._adjacencia.append([])
+        return indice
+
+    def adicionar_arco(self, origem: Hashable, destino: Hashable, capacidade: float, custo: float) -> int:
+        """Adiciona o arco e devolve seu id (para consultar o fluxo depois)."""
+        if custo < 0:
+            raise ValueError("Custos negativos nao sao suportados")
+        u, v = self.no(origem), self.no(destino)
+        self._adjacencia[u].append(_Arco(v, capacidade, custo, len(self._adjacencia[v]), True))
+        self._adjacencia[v].append(_Arco(u, 0.0, -custo, len(self._adjacencia[u]) - 1, False))
+        self._arcos.append((u, len(self._adjacencia[u]) - 1))
+        return len(self._arcos) - 1
+
+    def fluxo(self, arco_id: int) -> float:
+        u, posicao = self._arcos[arco_id]
+        arco = self._adjacencia[u][posicao]
+        return self._adjacencia[arco.destino][arco.reverso].capacidade
+
+    def resolver(self, fonte: Hashable, sumidouro: Hashable) -> Tuple[float, float]:
+        """Fluxo maximo de custo minimo de `fonte` a `sumidouro`. Devolve (fluxo, custo)."""
+        s, t = self.no(fonte), self.no(sumidouro)
+        n = len(self._adjacencia)
+        potencial = [0.0] * n
+        fluxo_total = 0.0
+        custo_total = 0.0
+        while True:
+            distancia = [float("inf")] * n
+            anterior: List[Tuple[int, int]] = [(-1, -1)] * n
+            distancia[s] = 0.0
+            fila = [(0.0, s)]
+            while fila:
+                d, u = heapq.heappop(fila)
+                if d > distancia[u]:
+                    continue
+                for posicao, arco in enumerate(self._adjacencia[u]):
+                    if arco.capacidade <= TOLERANCIA:
+                        continue
+                    nd = d + arco.custo + potencial[u] - potencial[arco.destino]
+                    if nd < distancia[arco.destino] - TOLERANCIA:
+                        distancia[arco.destino] = nd
+                        anterior[arco.destino] = (u, posicao)
+                        heapq.heappush(fila, (nd, arco.destino))
+            if distancia[t] == float("inf"):
+                break
+            for v in range(n):
+                if distancia[v] < float("inf"):
+                    potencial[v] += distancia[v]
+
+            # Gargalo do caminho e aumento
+            gargalo = float("inf")
+            v = t
+            while v != s:
+                u, posicao = anterior[v]
+                gargalo = min(gargalo, self._adjacencia[u][posicao].capacidade)
+                v = u
+            v = t
+            while v != s:
+                u, posicao = anterior[v]
+                arco = self._adjacencia[u][posicao]
+                arco.capacidade -= gargalo
+                self._adjacencia[v][arco.reverso].capacidade += gargalo
+                custo_total += gargalo * arco.custo
+                v = u
+            fluxo_total += gargalo
+        return fluxo_total, custo_total
@@ -0,0 +1,171 @@
+"""
+Indice espacial em grade para localizacao de produtores.
+
+A superficie e dividida em celulas de GRAU_CELULA x GRAU_CELULA graus, numeradas linha a
+linha (celula = linha * COLUNAS + coluna). O numero da celula fica em
+producer_match_features.celula_geo, com indice B-tree. Uma busca por raio vira alguns
+intervalos BETWEEN sobre esse indice (um por faixa de latitude, ja recortados pela
+largura real do circulo naquela faixa), seguidos da distancia exata (haversine) so para
+quem caiu dentro dos intervalos.
+"""
+import math
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from models.FeaturesMatch_model import FeaturesMatchProdutor
+
+RAIO_TERRA_KM = 6371.0
+GRAU_CELULA = 0.5  # ~55 km no equador
+LINHAS = int(180 / GRAU_CELULA)
+COLUNAS = int(360 / GRAU_CELULA)
+# Folga para arredondamentos (a checagem exata usa distancia arredondada a 0,1 km)
+MARGEM_KM = 0.1
+
+
+def haversine_km(coord_a: Tuple[float, float], coord_b: Tuple[float, float]) -> float:
+    lat1, lon1 = math.radians(coord_a[0]), math.radians(coord_a[1])
+    lat2, lon2 = math.radians(coord_b[0]), math.radians(coord_b[1])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return RAIO_TERRA_KM * c
+
+
+def _linha(lat: float) -> int:
+    return min(LINHAS - 1, max(0, int(math.floor((lat + 90.0) / GRAU_CELULA))))
+
+
+def _coluna(lon: float) -> int:
+    lon = ((lon + 180.0) % 360.0) - 180.0
+    return min(COLUNAS - 1, max(0, int(math.floor((lon + 180.0) / GRAU_CELULA))))
+
+
+def celula_de(lat: Optional[float], lon: Optional[float]) -> Optional[int]:
+    """Numero da celula que contem o ponto (None sem coordenadas)."""
+    if lat is None or lon is None:
+        return None
+    return _linha(lat) * COLUNAS + _coluna(lon)
+
+
+def _meia_largura_lon(lat0: float, dist_angular: float, lat_min: float, lat_max: float) -> Optional[float]:
+    """
+    Maior diferenca de longitude (graus) do circulo dentro da faixa [lat_min, lat_max].
+    None quando o circulo nao alcanca a faixa; 180 quando a faixa contorna o polo.
+    """
+    if dist_angular >= math.pi / 2:
+        return 180.0
+    phi0 = math.radians(lat0)
+    # Latitude onde o circulo e mais largo, recortada para a faixa
+    seno_pico = math.sin(phi0) / max(math.cos(dist_angular), 1e-12)
+    phi_pico = math.asin(max(-1.0, min(1.0, seno_pico)))
+    phi = min(max(phi_pico, math.radians(lat_min)), math.radians(lat_max))
+
+    denominador = math.cos(phi0) * math.cos(phi)
+    if denominador <= 1e-12:
+        return 180.0
+    cos_dlon = (math.cos(dist_angular) - math.sin(phi0) * math.sin(phi)) / denominador
+    if cos_dlon > 1.0:
+        return None
+    if cos_dlon <= -1.0:
+        return 180.0
+    return math.degrees(math.acos(cos_dlon))
+
+
+def faixas_celulas(coords: Tuple[float, float], raio_km: float) -> List[Tuple[int, int]]:
+    """
+    Intervalos fechados [inicio, fim] de numeros de celula que cobrem o circulo de raio_km.
+    Cobertura conservadora: toda celula que toca o circulo esta em algum intervalo.
+    """
+    lat0, lon0 = coords
+    dist_angular = min(math.pi, (raio_km + MARGEM_KM) / RAIO_TERRA_KM)
+    delta_lat = math.degrees(dist_angular)
+
+    faixas: List[Tuple[int, int]] = []
+    for linha in range(_linha(lat0 - delta_lat), _linha(lat0 + delta_lat) + 1):
+        lat_min = max(-90.0, linha * GRAU_CELULA - 90.0)
+        lat_max = min(90.0, lat_min + GRAU_CELULA)
+        meia_largura = _meia_largura_lon(lat0, dist_angular, lat_min, lat_max)
+        if meia_largura is None:
+            continue
+
+        base = linha * COLUNAS
+        if meia_largura >= 180.0:
+            faixas.append((base, base + COLUNAS - 1))
+            continue
+        inicio = _coluna(lon0 - meia_largura)
+        fim = _coluna(lon0 + meia_largura)
+        if inicio <= fim:
+            faixas.append((base + inicio, base + fim))
+        else:  # atravessa o antimeridiano
+            faixas.append((base, base + fim))
+            faixas.append((base + inicio, base + COLUNAS - 1))
+
+    faixas.sort()
+    unidas: List[Tuple[int, int]] = []
+    for inicio, fim in faixas:
+        if unidas and inicio <= unidas[-1][1] + 1:
+            unidas[-1] = (unidas[-1][0], max(unidas[-1][1], fim))
+        else:
+            unidas.append((inicio, fim))
+    return unidas
+
+
+def filtro_raio(coords: Tuple[float, float], raio_km: float, incluir_sem_coordenadas: bool = False):
+    """
+    Expressao SQL sobre FeaturesMatchProdutor.celula_geo para compor em outras consultas.
+    Com incluir_sem_coordenadas, produtores sem celula (sem localizacao ou sem linha de
+    features, via outer join) tambem passam.
+    """
+    coluna = FeaturesMatchProdutor.celula_geo
+    condicoes = [coluna.between(inicio, fim) for inicio, fim in faixas_celulas(coords, raio_km)]
+    if incluir_sem_coordenadas:
+        condicoes.append(coluna.is_(None))
+    return or_(*condicoes)
+
+
+def produtores_no_raio(
+    db: Session,
+    coords: Tuple[float, float],
+    raio_km: float,
+    produtor_ids: Optional[List[int]] = None,
+) -> List[Tuple[int, float]]:
+    """(produtor_id, distancia_km) dos produtores dentro do raio, do mais proximo ao mais distante."""
+    query = db.query(
+        FeaturesMatchProdutor.produtor_id,
+        FeaturesMatchProdutor.latitude,
+        FeaturesMatchProdutor.longitude,
+    ).filter(and_(FeaturesMatchProdutor.celula_geo.isnot(None), filtro_raio(coords, raio_km)))
+    if produtor_ids is not None:
+        query = query.filter(FeaturesMatchProdutor.produtor_id.in_(produtor_ids))
+
+    resultado = []
+    for produtor_id, latitude, longitude in query:
+        distancia = haversine_km(coords, (latitude, longitude))
+        if distancia <= raio_km:
+            resultado.append((produtor_id, distancia))
+    resultado.sort(key=lambda par: (par[1], par[0]))
+    return resultado
+
+
+def produtores_mais_proximos(
+    db: Session,
+    coords: Tuple[float, float],
+    k: int,
+    raio_maximo_km: float,
+    raio_inicial_km: float = 25.0,
+) -> List[Tuple[int, float]]:
+    """
+    k vizinhos mais proximos (ate raio_maximo_km), dobrando o raio de busca ate achar k.
+    Retorna (produtor_id, distancia_km) ordenado por distancia.
+    """
+    if k <= 0:
+        return []
+    raio = min(raio_inicial_km, raio_maximo_km)
+    while True:
+        encontrados = produtores_no_raio(db, coords, raio)
+        if len(encontrados) >= k or raio >= raio_maximo_km:
+            return encontrados[:k]
+        raio = min(raio * 2, raio_maximo_km)
@@ -0,0 +1,304 @@
+"""
+Formacao de grupos de fornecedores (RF-14, Opcao B) como problema de cobertura por produto.
+
+Cada produto da demanda precisa ser coberto pela soma das capacidades dos membros do grupo
+naquele produto (e nao pela soma global, que deixaria um produto descoberto enquanto outro
+sobra). Entre os grupos viaveis, o melhor e o de menos membros e, no empate, o de maior
+score medio. So entram grupos irredundantes (nenhum membro sobra).
+
+Os K grupos saem em rodadas, um por rodada, e cada um precisa ser diferente dos anteriores:
+dois grupos dividem menos da metade dos membros do menor deles (senao os K grupos seriam o
+mesmo grupo trocando um membro). Cada rodada e um branch-and-bound em profundidade:
+
+- antes da busca, os candidatos sao recortados por produto: os CANDIDATOS_POR_PRODUTO de
+  maior capacidade (mais quantos forem precisos para fechar o produto) e os de maior score;
+- a semente e a cobertura gulosa (irredundante) sem os membros dos grupos anteriores; ela
+  ja e uma resposta, entao a rodada nunca termina vazia so porque o prazo estourou;
+- ramifica sempre no produto mais dificil de fechar, tentando primeiro quem cobre mais do
+  deficit restante;
+- poda pelo limite inferior de membros ainda necessarios (em cada produto, quantos dos
+  maiores fornecedores restantes seriam precisos), pelo score medio otimista e por
+  ramos que ja repetem metade de algum grupo anterior;
+- o prazo em milissegundos e dividido entre as rodadas restantes; quando estoura, a rodada
+  fica com o melhor grupo achado ate ali (no minimo, a semente).
+
+O modulo trabalha so com arrays; o MatchEngineService monta as entradas a partir da
+ScoreMatrix e transforma o resultado em MatchOption.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOLERANCIA = 1e-9
+# Candidatos mantidos por produto, pela capacidade e pelo score (cada lista com ate N)
+CANDIDATOS_POR_PRODUTO = 10
+
+
+@dataclass
+class GrupoSolucao:
+    """Grupo viavel: `membros` sao indices das linhas de entrada, em ordem de score."""
+
+    membros: List[int]
+    score_medio: float
+
+
+@dataclass
+class ResultadoGrupos:
+    grupos: List[GrupoSolucao] = field(default_factory=list)
+    completo: bool = True  # False quando o prazo interrompeu a busca
+    nos_visitados: int = 0
+
+
+@dataclass
+class ItemAlocacao:
+    """Linha da demanda a ser distribuida entre os membros (coluna de produto + quantidade)."""
+
+    produto_pos: int
+    quantidade: float
+
+
+class _PrazoEsgotado(Exception):
+    pass
+
+
+def resolver_grupos(
+    capacidades: np.ndarray,
+    demanda: np.ndarray,
+    scores: np.ndarray,
+    k: int = 3,
+    prazo_ms: float = 200.0,
+    min_membros: int = 2,
+    max_membros: int = None,
+) -> ResultadoGrupos:
+    """
+    Busca ate `k` grupos que cobrem `demanda` (P,) produto a produto, do melhor para o pior;
+    dois grupos devolvidos dividem menos da metade dos membros do menor deles.
+
+    `capacidades` (n, P) e a quantidade que cada candidato consegue entregar de cada produto;
+    `scores` (n,) o score final de cada candidato. Grupos com menos de `min_membros` sao
+    ignorados (um unico produtor cobrindo tudo e match individual, nao grupo).
+    """
+    fim = time.monotonic() + max(prazo_ms, 0.0) / 1000.0
+    resultado = ResultadoGrupos()
+    n = capacidades.shape[0]
+    if k <= 0 or n == 0:
+        return resultado
+
+    relevantes = np.flatnonzero(demanda > TOLERANCIA)
+    if relevantes.size == 0:
+        return resultado
+    alvo = demanda[relevantes].astype(float)
+    # Capacidade acima da demanda nao ajuda a cobrir: recorta para o limite inferior ficar justo
+    cap = np.minimum(capacidades[:, relevantes].astype(float), alvo)
+
+    uteis = np.flatnonzero(cap.sum(axis=1) > TOLERANCIA)
+    if uteis.size == 0 or np.any(cap[uteis].sum(axis=0) < alvo - TOLERANCIA):
+        return resultado
+    uteis = _recortar_por_produto(cap, scores, alvo, uteis)
+    # Ordem global por score (estavel), usada no bound otimista do score medio
+    uteis = uteis[np.argsort(-scores[uteis], kind="stable")]
+    cap = cap[uteis]
+    score = scores[uteis].astype(float)
+    limite_membros = min(max_membros or len(uteis), len(uteis))
+
+    escolhidos: List[Tuple[int, ...]] = []
+
+    def redundante(membros: Sequence[int]) -> bool:
+        total = cap[list(membros)].sum(axis=0)
+        return any(np.all(total - cap[i] >= alvo - TOLERANCIA) for i in membros)
+
+    def repete_anterior(membros: Sequence[int], tamanho_final: int) -> bool:
+        """`membros` divide metade ou mais do menor grupo com algum grupo anterior."""
+        conjunto = set(membros)
+        return any(
+            2 * len(conjunto.intersection(anterior)) >= min(len(anterior), tamanho_final)
+            for anterior in escolhidos
+        )
+
+    def semente() -> Optional[Tuple[int, ...]]:
+        """Cobertura gulosa sem os membros dos grupos anteriores, sem membros sobrando."""
+        usados = {membro for anterior in escolhidos for membro in anterior}
+        livres = np.array([i for i in range(len(uteis)) if i not in usados], dtype=int)
+        deficit = alvo.copy()
+        selecionados: List[int] = []
+        while np.any(deficit > TOLERANCIA):
+            if livres.size == 0:
+                return None
+            ganho = (np.minimum(cap[livres], np.maximum(deficit, 0.0)) / alvo).sum(axis=1)
+            pos = int(np.lexsort((-score[livres], -ganho))[0])
+            if ganho[pos] <= TOLERANCIA:
+                return None
+            selecionados.append(int(livres[pos]))
+            deficit = deficit - cap[livres[pos]]
+            livres = np.delete(livres, pos)
+        # Tira quem sobra, do menor score para o maior: o que fica e irredundante
+        for membro in sorted(selecionados, key=lambda i: (score[i], -i)):
+            sem = [i for i in selecionados if i != membro]
+            if sem and np.all(cap[sem].sum(axis=0) >= alvo - TOLERANCIA):
+                selecionados = sem
+        if not min_membros <= len(selecionados) <= limite_membros:
+            return None
+        return tuple(sorted(selecionados))
+
+    def chave_de(membros: Tuple[int, ...]) -> Tuple:
+        return (len(membros), -float(sum(score[i] for i in membros) / len(membros)), membros)
+
+    def limite_inferior(deficit: np.ndarray, disponiveis: np.ndarray) -> int:
+        """Membros adicionais minimos; -1 se algum produto nao pode mais ser fechado."""
+        abertos = deficit > TOLERANCIA
+        if not np.any(abertos):
+            return 0
+        if disponiveis.size == 0:
+            return -1
+        bloco = cap[np.ix_(disponiveis, np.flatnonzero(abertos))]
+        acumulado = np.cumsum(-np.sort(-bloco, axis=0), axis=0)
+        necessario = deficit[abertos]
+        if np.any(acumulado[-1] < necessario - TOLERANCIA):
+            return -1
+        return int(((acumulado < necessario - TOLERANCIA).sum(axis=0) + 1).max())
+
+    def rodada(prazo: float) -> Optional[Tuple]:
+        """Melhor grupo diferente dos anteriores; a chave (membros, -score medio, conjunto)."""
+        inicial = semente()
+        melhor = [chave_de(inicial) if inicial else None]
+
+        def registrar(selecionados: List[int]):
+            membros = tuple(sorted(selecionados))
+            if redundante(membros) or repete_anterior(membros, len(membros)):
+                return
+            chave = chave_de(membros)
+            if melhor[0] is None or chave < melhor[0]:
+                melhor[0] = chave
+
+        def explorar(selecionados: List[int], soma_scores: float, deficit: np.ndarray, disponiveis: np.ndarray):
+            resultado.nos_visitados += 1
+            if time.monotonic() > prazo:
+                raise _PrazoEsgotado()
+
+            falta = limite_inferior(deficit, disponiveis)
+            if falta < 0:
+                return
+            if falta == 0:
+                if len(selecionados) >= min_membros:
+                    registrar(selecionados)
+                # Um grupo viavel so piora com mais membros
+                return
+
+            tamanho = max(len(selecionados) + falta, min_membros)
+            if tamanho > limite_membros:
+                return
+            # Com mais membros a intersecao so cresce: nenhum grupo deste ramo seria diferente
+            if escolhidos and repete_anterior(selecionados, limite_membros):
+                return
+            pior = melhor[0]
+            if pior is not None:
+                if tamanho > pior[0]:
+                    return
+                if tamanho == pior[0]:
+                    # Melhor media possivel: completar com os maiores scores ainda disponiveis
+                    extra = tamanho - len(selecionados)
+                    otimista = (soma_scores + float(score[disponiveis[:extra]].sum())) / tamanho
+                    if -otimista >= pior[1]:
+                        return
+
+            # Produto mais apertado: maior deficit relativo a capacidade restante
+            abertos = np.flatnonzero(deficit > TOLERANCIA)
+            restante = cap[disponiveis][:, abertos].sum(axis=0)
+            produto = abertos[int(np.argmax(deficit[abertos] / np.maximum(restante, TOLERANCIA)))]
+
+            fornecedores = disponiveis[cap[disponiveis, produto] > TOLERANCIA]
+            ganho = (np.minimum(cap[fornecedores], np.maximum(deficit, 0.0)) / alvo).sum(axis=1)
+            ordem = fornecedores[np.lexsort((-score[fornecedores], -ganho))]
+
+            # Ramo j: inclui ordem[j] e exclui ordem[:j] da subarvore (cada conjunto aparece uma vez)
+            excluidos = np.zeros(len(uteis), dtype=bool)
+            for candidato in ordem.tolist():
+                restantes = disponiveis[~excluidos[disponiveis] & (disponiveis != candidato)]
+                selecionados.append(candidato)
+                explorar(
+                    selecionados,
+                    soma_scores + float(score[candidato]),
+                    deficit - cap[candidato],
+                    restantes,
+                )
+                selecionados.pop()
+                excluidos[candidato] = True
+
+        try:
+            explorar([], 0.0, alvo.copy(), np.arange(len(uteis)))
+        except _PrazoEsgotado:
+            resultado.completo = False
+        return melhor[0]
+
+    for numero in range(k):
+        agora = time.monotonic()
+        chave = rodada(agora + max(fim - agora, 0.0) / (k - numero))
+        if chave is None:
+            break
+        escolhidos.append(chave[2])
+
+    # Uma rodada cortada pelo prazo pode ficar atras da seguinte: devolve na ordem da chave
+    for chave in sorted(chave_de(membros) for membros in escolhidos):
+        membros = sorted(chave[2], key=lambda i: (-score[i], i))
+        resultado.grupos.append(
+            GrupoSolucao(membros=[int(uteis[i]) for i in membros], score_medio=-chave[1])
+        )
+    return resultado
+
+
+def _recortar_por_produto(cap: np.ndarray, scores: np.ndarray, alvo: np.ndarray, uteis: np.ndarray) -> np.ndarray:
+    """
+    Candidatos mantidos para a busca: em cada produto, os CANDIDATOS_POR_PRODUTO de maior
+    capacidade (e os seguintes ate a capacidade somada fechar o produto) e os de maior score.
+    """
+    if uteis.size <= CANDIDATOS_POR_PRODUTO:
+        return uteis
+    bloco = cap[uteis]
+    mantidos = np.zeros(uteis.size, dtype=bool)
+    # Maiores capacidades de todos os produtos numa particao so (empates em qualquer ordem)
+    topo = np.argpartition(-bloco, CANDIDATOS_POR_PRODUTO - 1, axis=0)[:CANDIDATOS_POR_PRODUTO]
+    for pos in range(bloco.shape[1]):
+        linhas = topo[:, pos]
+        linhas = linhas[bloco[linhas, pos] > TOLERANCIA]
+        if bloco[linhas, pos].sum() < alvo[pos] - TOLERANCIA:
+            # Poucos grandes fornecedores: ordena o produto inteiro ate fechar a demanda
+            ordem = np.argsort(-bloco[:, pos], kind="stable")
+            fecha = int(np.searchsorted(np.cumsum(bloco[ordem, pos]), alvo[pos] - TOLERANCIA)) + 1
+            linhas = ordem[:fecha]
+        mantidos[linhas] = True
+    por_score = np.argsort(-scores[uteis], kind="stable")
+    for pos in range(bloco.shape[1]):
+        mantidos[por_score[bloco[por_score, pos] > TOLERANCIA][:CANDIDATOS_POR_PRODUTO]] = True
+    return uteis[mantidos]
+
+
+def alocar_itens(
+    membros: Sequence[int],
+    capacidades: np.ndarray,
+    itens: Sequence[ItemAlocacao],
+) -> List[List[Tuple[int, float]]]:
+    """
+    Distribui cada item entre os membros do grupo, na ordem dos membros (melhor score
+    primeiro), consumindo a capacidade de cada um no produto. Retorna, por item, a lista de
+    (membro, quantidade); quantidade nao coberta simplesmente fica sem alocacao.
+    """
+    saldo = {membro: capacidades[membro].astype(float).copy() for membro in membros}
+    alocacoes: List[List[Tuple[int, float]]] = []
+    for item in itens:
+        falta = float(item.quantidade)
+        partes: List[Tuple[int, float]] = []
+        for membro in membros:
+            if falta <= TOLERANCIA:
+                break
+            disponivel = saldo[membro][item.produto_pos]
+            if disponivel <= TOLERANCIA:
+                continue
+            quantidade = min(disponivel, falta)
+            saldo[membro][item.produto_pos] -= quantidade
+            falta -= quantidade
+            partes.append((membro, quantidade))
+        alocacoes.append(partes)
+    return alocacoes
+
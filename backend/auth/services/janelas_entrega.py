@@ -0,0 +1,198 @@
+"""
+Capacidade por janela de entrega (RF-14).
+
+ItemDemanda.cronograma_entrega_json descreve quando cada parcela precisa ser entregue:
+
+    {"parcelas": [{"data": "2026-03-10", "quantidade": 50},
+                  {"inicio": "2026-04-01", "fim": "2026-04-15", "quantidade": 50}]}
+
+Parcela sem quantidade divide igualmente o que sobrar do item; cronograma ausente ou
+invalido vale como uma parcela unica sem janela (qualquer periodo serve).
+
+Os periodos de capacidade do lote de candidatos sao indexados uma vez por produto em uma
+ArvoreIntervalos; cada parcela consulta so os periodos que cruzam sua janela, e a capacidade
+de um periodo usada por uma parcela nao conta de novo para a seguinte.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.group_solver import TOLERANCIA
+
+_MIN = date.min.toordinal()
+_MAX = date.max.toordinal()
+
+
+@dataclass
+class Parcela:
+    inicio: Optional[date]
+    fim: Optional[date]
+    quantidade: float
+
+
+class ArvoreIntervalos:
+    """
+    Arvore de intervalos fechados, estatica: intervalos ordenados pelo inicio formam uma
+    arvore binaria balanceada implicita, com o maior fim de cada subarvore. A consulta por
+    sobreposicao custa O(log n + k).
+    """
+
+    def __init__(self, intervalos: Iterable[Tuple[int, int, Any]]):
+        self._itens = sorted(intervalos, key=lambda item: (item[0], item[1]))
+        self._max_fim = [0] * len(self._itens)
+        if self._itens:
+            self._montar(0, len(self._itens) - 1)
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def _montar(self, lo: int, hi: int) -> int:
+        meio = (lo + hi) // 2
+        maior = self._itens[meio][1]
+        if lo < meio:
+            maior = max(maior, self._montar(lo, meio - 1))
+        if meio < hi:
+            maior = max(maior, self._montar(meio + 1, hi))
+        self._max_fim[meio] = maior
+        return maior
+
+    def sobrepostos(self, inicio: int, fim: int) -> List[Any]:
+        """Payloads dos intervalos que cruzam [inicio, fim], em ordem de inicio."""
+        achados = []
+        pilha = [(0, len(self._itens) - 1)]
+        while pilha:
+            lo, hi = pilha.pop()
+            if lo > hi:
+                continue
+            meio = (lo + hi) // 2
+            if self._max_fim[meio] < inicio:
+                continue  # tudo nesta subarvore termina antes da janela
+            pilha.append((lo, meio - 1))
+            item_inicio, item_fim, payload = self._itens[meio]
+            if item_inicio <= fim:
+                if item_fim >= inicio:
+                    achados.append((meio, payload))
+                pilha.append((meio + 1, hi))
+        achados.sort(key=lambda achado: achado[0])
+        return [payload for _, payload in achados]
+
+
+def _data(valor: Any) -> Optional[date]:
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    if isinstance(valor, str):
+        try:
+            return date.fromisoformat(valor[:10])
+        except ValueError:
+            return None
+    return None
+
+
+def _quantidade(valor: Any) -> Optional[float]:
+    try:
+        return float(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def parcelas_entrega(cronograma: Any, quantidade_item: float) -> List[Parcela]:
+    """Parcelas do cronograma do item; sem cronograma utilizavel, uma parcela sem janela."""
+    sem_janela = [Parcela(None, None, quantidade_item)]
+    brutas = cronograma.get("parcelas") if isinstance(cronograma, dict) else None
+    if not isinstance(brutas, list) or not brutas:
+        return sem_janela
+
+    parcelas: List[Parcela] = []
+    sem_quantidade = []
+    for bruta in brutas:
+        if not isinstance(bruta, dict):
+            return sem_janela
+        inicio = _data(bruta.get("inicio") or bruta.get("data"))
+        fim = _data(bruta.get("fim") or bruta.get("data"))
+        if inicio is None or fim is None or fim < inicio:
+            return sem_janela
+        quantidade = _quantidade(bruta.get("quantidade"))
+        parcela = Parcela(inicio, fim, quantidade or 0.0)
+        if quantidade is None:
+            sem_quantidade.append(parcela)
+        parcelas.append(parcela)
+
+    if sem_quantidade:
+        restante = max(0.0, quantidade_item - sum(p.quantidade for p in parcelas))
+        for parcela in sem_quantidade:
+            parcela.quantidade = restante / len(sem_quantidade)
+    return parcelas
+
+
+def tem_cronograma(parcelas: List[Parcela]) -> bool:
+    return any(p.inicio is not None for p in parcelas)
+
+
+def indexar_periodos(
+    produtores: List[Any],
+    produto_ids: Iterable[int],
+    substituicoes: Optional[Dict[int, List[Tuple[int, float]]]] = None,
+    livres: Optional[Dict[int, float]] = None,
+) -> Dict[int, ArvoreIntervalos]:
+    """
+    Uma arvore por produto com os periodos de capacidade do lote. Payload de cada periodo:
+    (linha do produtor no lote, id do periodo, capacidade). Com `substituicoes` (produto
+    ofertado -> [(produto demandado, fator)]), periodos de substitutos entram na arvore do
+    produto demandado com a capacidade convertida. Com `livres` (id do periodo -> capacidade
+    livre, LedgerCapacidade.livre_por_periodo), a capacidade de cada periodo e a livre.
+    """
+    produto_ids = set(produto_ids)
+    por_produto: Dict[int, List[Tuple[int, int, Any]]] = {produto_id: [] for produto_id in produto_ids}
+    for linha, produtor in enumerate(produtores):
+        for item in produtor.itens_producao or []:
+            destinos = []
+            if item.produto_id in por_produto:
+                destinos.append((item.produto_id, 1.0))
+            for produto_id, fator in (substituicoes or {}).get(item.produto_id, ()):
+                if produto_id in por_produto:
+                    destinos.append((produto_id, fator))
+            if not destinos:
+                continue
+            for periodo in item.periodos_capacidade or []:
+                capacidade = float(periodo.quantidade_capacidade or 0)
+                if livres is not None:
+                    capacidade = livres.get(periodo.id, capacidade)
+                if capacidade <= 0:
+                    continue
+                for produto_id, fator in destinos:
+                    por_produto[produto_id].append((
+                        periodo.periodo_inicio.toordinal(),
+                        periodo.periodo_fim.toordinal(),
+                        (linha, periodo.id, capacidade * fator),
+                    ))
+    return {produto_id: ArvoreIntervalos(intervalos) for produto_id, intervalos in por_produto.items()}
+
+
+def capacidade_por_janela(arvore: Optional[ArvoreIntervalos], parcelas: List[Parcela]) -> Dict[int, float]:
+    """
+    Quanto cada produtor (linha) atende das parcelas, usando so periodos que cruzam a janela
+    de cada uma. Parcelas em ordem de data consomem os periodos do mais cedo para o mais tarde;
+    parcelas sem janela vem por ultimo, com o que sobrar.
+    """
+    atendido: Dict[int, float] = {}
+    if arvore is None or not len(arvore):
+        return atendido
+    restante: Dict[int, float] = {}
+    ordenadas = sorted(parcelas, key=lambda p: (p.inicio is None, p.inicio or date.max))
+    for parcela in ordenadas:
+        inicio = parcela.inicio.toordinal() if parcela.inicio else _MIN
+        fim = parcela.fim.toordinal() if parcela.fim else _MAX
+        usado: Dict[int, float] = {}
+        for linha, periodo_id, capacidade in arvore.sobrepostos(inicio, fim):
+            falta = parcela.quantidade - usado.get(linha, 0.0)
+            livre = restante.get(periodo_id, capacidade)
+            if falta <= TOLERANCIA or livre <= TOLERANCIA:
+                continue
+            debito = min(falta, livre)
+            restante[periodo_id] = livre - debito
+            usado[linha] = usado.get(linha, 0.0) + debito
+        for linha, quantidade in usado.items():
+            atendido[linha] = atendido.get(linha, 0.0) + quantidade
+    return atendido
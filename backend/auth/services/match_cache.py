@@ -0,0 +1,211 @@
+"""
+Cache de resultados do motor de match (RF-14).
+
+A chave de uma execucao combina a versao da demanda, um hash dos parametros do motor
+(pesos e limites) e uma marca d'agua dos dados de entrada: a versao de cada tabela que
+alimenta o match (produtores, itens de producao, periodos de capacidade, reservas de
+capacidade, propostas, documentos e features de match), mais os itens da propria versao e
+os grupos ja assumidos (cujas alocacoes consomem capacidade, services/match_capacidade).
+Com a mesma chave, o resultado (parametros_json) da ultima execucao concluida e devolvido
+sem recalcular nem gravar nada.
+
+A versao de cada tabela fica em versoes_dados_match. Todo flush da sessao que insere, altera
+ou remove linhas dessas tabelas, e todo UPDATE/DELETE em massa do ORM sobre elas, anota a
+tabela na sessao; depois do commit, um UPDATE em transacao curta propria soma 1 as versoes
+anotadas (rollback descarta). A transacao de quem grava nunca toca a linha do contador:
+escritores da mesma tabela nao ficam em fila nem em deadlock por causa dela. Ler a marca e
+uma busca por chave primaria, sem varrer as tabelas.
+
+Entre o commit e o incremento (um UPDATE) outra sessao ainda pode montar a chave antiga e
+receber o resultado de antes da escrita. A propria sessao, enquanto tem escritas anotadas e
+nao commitadas, monta a marca dessas tabelas com um token da transacao, que nenhuma
+execucao gravada tem. SQL escrito a mao fora do ORM nao passa pelos eventos.
+"""
+import hashlib
+import json
+import logging
+import uuid
+from typing import Any, Dict, Iterable, Optional, Union
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from models.Demanda_model import Demanda, ItemDemanda, VersaoDemanda
+from models.Documento_model import DocumentoProdutor
+from models.FeaturesMatch_model import FeaturesMatchProdutor
+from models.Match_model import ExecucaoMatch, GrupoFornecedor, VersaoDadosMatch
+from models.PerfilProdutor_model import PerfilProdutor
+from models.Producao_model import ItemProducao, PeriodoCapacidade
+from models.Proposta_model import Proposta, ReservaCapacidade
+from services.match_capacidade import STATUS_GRUPO_COMPROMETIDO
+
+logger = logging.getLogger(__name__)
+
+# Incrementar quando a logica do motor mudar de forma que invalide resultados ja gravados
+VERSAO_ALGORITMO = 2
+
+# Tabelas cujas escritas mudam o resultado do match
+_TABELA_POR_CLASSE = {
+    modelo: modelo.__tablename__
+    for modelo in (
+        PerfilProdutor,
+        ItemProducao,
+        PeriodoCapacidade,
+        Proposta,
+        DocumentoProdutor,
+        FeaturesMatchProdutor,
+        ReservaCapacidade,
+    )
+}
+TABELAS_MARCA = tuple(_TABELA_POR_CLASSE.values())
+
+# session.info: tabelas escritas na transacao corrente e o token que as marca ate o commit
+_PENDENTES = "match_cache.tabelas_pendentes"
+_TOKEN = "match_cache.token_transacao"
+
+
+def hash_parametros(parametros: Dict[str, Any]) -> str:
+    conteudo = json.dumps(parametros, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def marca_dados(db: Session, versao_demanda_id: int) -> Dict[str, Any]:
+    """Marca d'agua dos dados que alimentam o match, lida em uma unica consulta."""
+    versoes = [
+        select(VersaoDadosMatch.versao).where(VersaoDadosMatch.tabela == tabela).scalar_subquery()
+        for tabela in TABELAS_MARCA
+    ]
+
+    # Grupos "forming" sao gravados pelo proprio motor; so os assumidos entram na marca
+    grupos = [
+        select(agregado).where(GrupoFornecedor.status.in_(STATUS_GRUPO_COMPROMETIDO)).scalar_subquery()
+        for agregado in (func.max(GrupoFornecedor.updated_at), func.count(GrupoFornecedor.id))
+    ]
+
+    itens = (
+        select(func.count(ItemDemanda.id), func.max(ItemDemanda.id), func.sum(ItemDemanda.quantidade))
+        .where(ItemDemanda.versao_demanda_id == versao_demanda_id)
+        .subquery()
+    )
+    demanda_atualizada = (
+        select(Demanda.updated_at)
+        .join(VersaoDemanda, VersaoDemanda.demanda_id == Demanda.id)
+        .where(VersaoDemanda.id == versao_demanda_id)
+        .scalar_subquery()
+    )
+    linha = db.execute(select(*versoes, demanda_atualizada, *itens.c, *grupos)).one()
+
+    valores = list(linha)
+    marca: Dict[str, Any] = dict(zip(TABELAS_MARCA, valores))
+    base = len(TABELAS_MARCA)
+    marca["demanda"] = str(valores[base])
+    marca["itens_demanda"] = [valores[base + 1], valores[base + 2], str(valores[base + 3])]
+    marca["grupos_comprometidos"] = [str(valores[base + 4]), valores[base + 5]]
+    # Escritas ainda nao commitadas desta sessao nao estao no contador
+    for tabela in sorted(db.info.get(_PENDENTES, ())):
+        marca[tabela] = [marca[tabela], db.info[_TOKEN]]
+    return marca
+
+
+def chave_execucao(db: Session, versao_demanda_id: int, parametros: Dict[str, Any]) -> str:
+    conteudo = {
+        "versao_demanda_id": versao_demanda_id,
+        "algoritmo": VERSAO_ALGORITMO,
+        "parametros": hash_parametros(parametros),
+        "dados": marca_dados(db, versao_demanda_id),
+    }
+    return hash_parametros(conteudo)
+
+
+def buscar_execucao(db: Session, versao_demanda_id: int, chave: str) -> Optional[ExecucaoMatch]:
+    """Ultima execucao concluida com a mesma chave (indice em versao_demanda_id, chave_cache)."""
+    return (
+        db.query(ExecucaoMatch)
+        .filter(
+            ExecucaoMatch.versao_demanda_id == versao_demanda_id,
+            ExecucaoMatch.chave_cache == chave,
+            ExecucaoMatch.status == "completed",
+        )
+        .order_by(ExecucaoMatch.id.desc())
+        .first()
+    )
+
+
+def incrementar_versoes(bind: Union[Engine, Connection], tabelas: Iterable[str]) -> None:
+    """Soma 1 a versao das tabelas em uma transacao curta propria (cria a linha que faltar)."""
+    tabelas = sorted(set(tabelas))  # sempre na mesma ordem: sem deadlock entre escritores
+    if not tabelas:
+        return
+    if isinstance(bind, Engine):
+        with bind.begin() as conexao:
+            _incrementar(conexao, tabelas)
+    else:
+        # Sessao presa a uma conexao com transacao externa (testes): segue nela
+        _incrementar(bind, tabelas)
+
+
+def _incrementar(conexao: Connection, tabelas: list) -> None:
+    contador = VersaoDadosMatch.__table__
+    resultado = conexao.execute(
+        contador.update().where(contador.c.tabela.in_(tabelas)).values(versao=contador.c.versao + 1)
+    )
+    if resultado.rowcount == len(tabelas):
+        return
+    # Banco criado sem as linhas iniciais de db/init.sql (create_all)
+    existentes = set(conexao.execute(select(contador.c.tabela).where(contador.c.tabela.in_(tabelas))).scalars())
+    conexao.execute(
+        contador.insert(),
+        [{"tabela": tabela, "versao": 1} for tabela in tabelas if tabela not in existentes],
+    )
+
+
+def _anotar(session: Session, tabelas: Iterable[str]) -> None:
+    tabelas = set(tabelas)
+    if tabelas:
+        session.info.setdefault(_PENDENTES, set()).update(tabelas)
+        session.info.setdefault(_TOKEN, uuid.uuid4().hex)
+
+
+@event.listens_for(Session, "before_flush")
+def _versionar_flush(session: Session, flush_context, instances) -> None:
+    tabelas = {
+        _TABELA_POR_CLASSE[type(obj)]
+        for obj in (*session.new, *session.deleted)
+        if type(obj) in _TABELA_POR_CLASSE
+    }
+    tabelas.update(
+        _TABELA_POR_CLASSE[type(obj)]
+        for obj in session.dirty
+        if type(obj) in _TABELA_POR_CLASSE and session.is_modified(obj, include_collections=False)
+    )
+    _anotar(session, tabelas)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _versionar_em_massa(estado: ORMExecuteState) -> None:
+    # query.update()/query.delete() e update()/delete() do ORM nao passam pelo flush
+    if not (estado.is_update or estado.is_delete) or estado.bind_mapper is None:
+        return
+    tabela = _TABELA_POR_CLASSE.get(estado.bind_mapper.class_)
+    if tabela is not None:
+        _anotar(estado.session, [tabela])
+
+
+@event.listens_for(Session, "after_commit")
+def _versionar_commit(session: Session) -> None:
+    tabelas = session.info.pop(_PENDENTES, None)
+    session.info.pop(_TOKEN, None)
+    if not tabelas:
+        return
+    try:
+        incrementar_versoes(session.get_bind(), tabelas)
+    except Exception:
+        # Os dados ja foram commitados: falhar aqui so faria o chamador achar que nao foram
+        logger.exception("Falha ao incrementar a marca d'agua do match: %s", sorted(tabelas))
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_versoes(session: Session) -> None:
+    session.info.pop(_PENDENTES, None)
+    session.info.pop(_TOKEN, None)
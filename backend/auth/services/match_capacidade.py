@@ -0,0 +1,473 @@
+"""
+Capacidade livre dos produtores e alocacao global entre demandas abertas (RF-14).
+
+LedgerCapacidade guarda, por (produtor, produto), os periodos de capacidade declarados e
+quanto de cada um ja esta comprometido:
+
+- reservas ativas (ReservaCapacidade.quantidades_reservadas_json, na janela da reserva);
+- quantidades de AlocacaoGrupo de grupos ja assumidos (STATUS_GRUPO_COMPROMETIDO), nas
+  janelas do cronograma de entrega do item da demanda. Grupos "forming" sao so sugestoes
+  do motor e nao consomem capacidade.
+
+Cada compromisso e debitado dos periodos que cruzam sua janela, do mais cedo para o mais
+tarde, ate a capacidade de cada um.
+
+O ledger fica em memoria no processo, como o fecho de equivalencias, e e montado por
+produtor: obter() le do banco so os produtores que ainda nao estao nele, que foram
+invalidados ou que passaram de TTL_SEGUNDOS, e devolve uma copia dos produtores pedidos
+(alocar() debita na copia). Um commit que grava reservas, itens ou periodos de capacidade,
+ou alocacoes e status de grupos assumidos, invalida so os produtores envolvidos; UPDATE e
+DELETE em massa do ORM nessas tabelas invalidam o ledger inteiro. Outros processos (scripts,
+pool de shards) nao veem essas invalidacoes e dependem do TTL, assim como mudancas no
+cronograma de um item que ja tem grupo assumido.
+
+O motor (match_scoring) usa a capacidade livre de cada periodo nos produtos com cronograma
+de entrega e desconta o total comprometido nos demais, como alocar(); alocar()
+distribui varias demandas de uma vez sobre a capacidade livre com fluxo de custo minimo
+(services/fluxo_solver): fonte -> item (quantidade) -> parcela do cronograma de entrega
+(services/janelas_entrega) -> periodo de capacidade do candidato que cruza a janela da
+parcela (custo pelo score) -> sumidouro (capacidade livre do periodo), com um arco caro
+item -> sumidouro para o nao atendido.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from models.Demanda_model import ItemDemanda, VersaoDemanda
+from models.Match_model import AlocacaoGrupo, GrupoFornecedor
+from models.PerfilProdutor_model import PerfilProdutor
+from models.Producao_model import ItemProducao, PeriodoCapacidade
+from models.Proposta_model import ReservaCapacidade
+from services import janelas_entrega
+from services.fluxo_solver import TOLERANCIA, RedeFluxo
+from services.match_ranking import AcumuladorCapacidade
+
+STATUS_GRUPO_COMPROMETIDO = ("validated", "submitted", "won")
+STATUS_RESERVA_ATIVA = "active"
+
+# Custo por unidade alocada: (1 - score) em milesimos; nao atender custa mais que qualquer alocacao
+CUSTO_ESCALA = 1000
+CUSTO_NAO_ATENDIDO = 10 ** 6
+MAX_CANDIDATOS_POR_ITEM = int(os.getenv("MATCH_ALLOCATION_CANDIDATES", "50"))
+TTL_SEGUNDOS = float(os.getenv("MATCH_LEDGER_TTL_S", "300"))
+
+Chave = Tuple[int, int]  # (produtor_id, produto_id)
+
+
+@dataclass
+class PeriodoLivre:
+    inicio: Optional[date]
+    fim: Optional[date]
+    capacidade: float
+    comprometido: float = 0.0
+    periodo_id: Optional[int] = None  # PeriodoCapacidade.id
+
+    @property
+    def livre(self) -> float:
+        return max(0.0, self.capacidade - self.comprometido)
+
+    def cruza(self, inicio: Optional[date], fim: Optional[date]) -> bool:
+        if inicio is not None and self.fim is not None and self.fim < inicio:
+            return False
+        if fim is not None and self.inicio is not None and self.inicio > fim:
+            return False
+        return True
+
+
+class LedgerCapacidade:
+    def __init__(self):
+        # produtor -> produto -> periodos, do mais cedo para o mais tarde
+        self._periodos: Dict[int, Dict[int, List[PeriodoLivre]]] = {}
+
+    def _lista(self, produtor_id: int, produto_id: int) -> List[PeriodoLivre]:
+        return self._periodos.get(produtor_id, {}).get(produto_id, [])
+
+    def adicionar_periodo(
+        self,
+        produtor_id: int,
+        produto_id: int,
+        inicio: Optional[date],
+        fim: Optional[date],
+        capacidade: float,
+        periodo_id: Optional[int] = None,
+    ) -> None:
+        periodos = self._periodos.setdefault(produtor_id, {}).setdefault(produto_id, [])
+        periodos.append(PeriodoLivre(inicio, fim, capacidade, periodo_id=periodo_id))
+        periodos.sort(key=lambda p: (p.inicio is not None, p.inicio or date.min))
+
+    def comprometer(
+        self,
+        produtor_id: int,
+        produto_id: int,
+        quantidade: float,
+        inicio: Optional[date] = None,
+        fim: Optional[date] = None,
+    ) -> float:
+        """Debita `quantidade` dos periodos que cruzam a janela; devolve quanto coube."""
+        restante = quantidade
+        for periodo in self._lista(produtor_id, produto_id):
+            if restante <= TOLERANCIA:
+                break
+            if not periodo.cruza(inicio, fim):
+                continue
+            debito = min(restante, periodo.livre)
+            periodo.comprometido += debito
+            restante -= debito
+        return quantidade - restante
+
+    def disponivel(
+        self, produtor_id: int, produto_id: int, inicio: Optional[date] = None, fim: Optional[date] = None
+    ) -> float:
+        return sum(periodo.livre for periodo in self._lista(produtor_id, produto_id) if periodo.cruza(inicio, fim))
+
+    def periodos_livres(
+        self, produtor_id: int, produto_id: int, inicio: Optional[date] = None, fim: Optional[date] = None
+    ) -> List[PeriodoLivre]:
+        """Periodos com capacidade livre que cruzam a janela, do mais cedo para o mais tarde."""
+        return [
+            periodo
+            for periodo in self._lista(produtor_id, produto_id)
+            if periodo.livre > TOLERANCIA and periodo.cruza(inicio, fim)
+        ]
+
+    def livre_por_periodo(self) -> Dict[int, float]:
+        """Capacidade livre de cada PeriodoCapacidade (por id), ja descontados os compromissos."""
+        return {
+            periodo.periodo_id: periodo.livre
+            for por_produto in self._periodos.values()
+            for periodos in por_produto.values()
+            for periodo in periodos
+            if periodo.periodo_id is not None
+        }
+
+    def comprometido_por_chave(self) -> Dict[Chave, float]:
+        """Total comprometido de cada (produtor, produto) que tem algum compromisso."""
+        totais = {}
+        for produtor_id, por_produto in self._periodos.items():
+            for produto_id, periodos in por_produto.items():
+                total = sum(periodo.comprometido for periodo in periodos)
+                if total > 0:
+                    totais[(produtor_id, produto_id)] = total
+        return totais
+
+    def recorte(self, produtor_ids: Iterable[int]) -> "LedgerCapacidade":
+        """Copia independente so com os produtores pedidos (custo proporcional aos periodos deles)."""
+        copia = LedgerCapacidade()
+        for produtor_id in produtor_ids:
+            por_produto = self._periodos.get(produtor_id)
+            if por_produto is not None:
+                copia._periodos[produtor_id] = {
+                    produto_id: [replace(periodo) for periodo in periodos]
+                    for produto_id, periodos in por_produto.items()
+                }
+        return copia
+
+    def substituir(self, outro: "LedgerCapacidade", produtor_ids: Iterable[int]) -> None:
+        """Troca os produtores pelos de `outro` (produtor sem periodos fica vazio)."""
+        for produtor_id in produtor_ids:
+            self._periodos[produtor_id] = outro._periodos.get(produtor_id, {})
+
+    def remover(self, produtor_ids: Iterable[int]) -> None:
+        for produtor_id in produtor_ids:
+            self._periodos.pop(produtor_id, None)
+
+
+def carregar_ledger(
+    db: Session,
+    produtor_ids: Optional[Iterable[int]] = None,
+    produtores: Optional[List[PerfilProdutor]] = None,
+) -> LedgerCapacidade:
+    """
+    Monta o ledger dos produtores informados (todos, se nenhum) direto do banco. Com
+    `produtores` ja hidratados (itens_producao e periodos carregados), os periodos nao sao
+    consultados.
+    """
+    ledger = LedgerCapacidade()
+    if produtores is not None:
+        produtor_ids = [p.id for p in produtores]
+        for produtor in produtores:
+            for item in produtor.itens_producao or []:
+                for periodo in item.periodos_capacidade or []:
+                    ledger.adicionar_periodo(
+                        produtor.id, item.produto_id, periodo.periodo_inicio, periodo.periodo_fim,
+                        float(periodo.quantidade_capacidade or 0), periodo.id,
+                    )
+    else:
+        consulta = db.query(
+            PeriodoCapacidade.id,
+            ItemProducao.produtor_id,
+            ItemProducao.produto_id,
+            PeriodoCapacidade.periodo_inicio,
+            PeriodoCapacidade.periodo_fim,
+            PeriodoCapacidade.quantidade_capacidade,
+        ).join(PeriodoCapacidade, PeriodoCapacidade.item_producao_id == ItemProducao.id)
+        if produtor_ids is not None:
+            produtor_ids = list(produtor_ids)
+            consulta = consulta.filter(ItemProducao.produtor_id.in_(produtor_ids))
+        for periodo_id, produtor_id, produto_id, inicio, fim, quantidade in consulta.order_by(PeriodoCapacidade.id):
+            ledger.adicionar_periodo(produtor_id, produto_id, inicio, fim, float(quantidade or 0), periodo_id)
+
+    _debitar_compromissos(db, ledger, produtor_ids)
+    return ledger
+
+
+def _debitar_compromissos(db: Session, ledger: LedgerCapacidade, produtor_ids: Optional[List[int]]) -> None:
+    if produtor_ids is not None and not produtor_ids:
+        return
+
+    reservas = db.query(
+        ReservaCapacidade.produtor_id,
+        ReservaCapacidade.periodo_inicio,
+        ReservaCapacidade.periodo_fim,
+        ReservaCapacidade.quantidades_reservadas_json,
+    ).filter(ReservaCapacidade.status == STATUS_RESERVA_ATIVA)
+    if produtor_ids is not None:
+        reservas = reservas.filter(ReservaCapacidade.produtor_id.in_(produtor_ids))
+    for produtor_id, inicio, fim, quantidades in reservas.order_by(ReservaCapacidade.id):
+        # JSON: {produto_id: quantidade}, com chaves em texto
+        for produto_id, quantidade in (quantidades or {}).items():
+            ledger.comprometer(produtor_id, int(produto_id), float(quantidade or 0), inicio, fim)
+
+    alocacoes = (
+        db.query(
+            AlocacaoGrupo.produtor_id,
+            ItemDemanda.produto_id,
+            AlocacaoGrupo.quantidade_alocada,
+            ItemDemanda.quantidade,
+            ItemDemanda.cronograma_entrega_json,
+        )
+        .join(GrupoFornecedor, GrupoFornecedor.id == AlocacaoGrupo.grupo_id)
+        .join(ItemDemanda, ItemDemanda.id == AlocacaoGrupo.item_demanda_id)
+        .filter(GrupoFornecedor.status.in_(STATUS_GRUPO_COMPROMETIDO))
+    )
+    if produtor_ids is not None:
+        alocacoes = alocacoes.filter(AlocacaoGrupo.produtor_id.in_(produtor_ids))
+    for produtor_id, produto_id, quantidade, quantidade_item, cronograma in alocacoes.order_by(AlocacaoGrupo.id):
+        # A alocacao se divide pelas parcelas do item na proporcao de cada uma
+        quantidade = float(quantidade or 0)
+        parcelas = janelas_entrega.parcelas_entrega(cronograma, float(quantidade_item or 0))
+        total = sum(parcela.quantidade for parcela in parcelas)
+        for parcela in sorted(parcelas, key=lambda p: (p.inicio is None, p.inicio or date.max)):
+            parte = quantidade * parcela.quantidade / total if total > 0 else quantidade / len(parcelas)
+            ledger.comprometer(produtor_id, produto_id, parte, parcela.inicio, parcela.fim)
+
+
+# --- Ledger do processo ------------------------------------------------------
+
+_lock = threading.Lock()
+_ledger = LedgerCapacidade()
+_carregado_em: Dict[int, float] = {}  # produtor -> quando entrou no ledger do processo
+_geracao = 0  # muda a cada invalidar(): produtores lidos antes dela nao sao guardados
+
+# session.info: produtores com escritas ainda nao commitadas na sessao (None = todos)
+_ALTERADOS = "match_capacidade.alterados"
+
+
+def obter(
+    db: Session,
+    produtor_ids: Optional[Iterable[int]] = None,
+    produtores: Optional[List[PerfilProdutor]] = None,
+) -> LedgerCapacidade:
+    """
+    Copia do ledger do processo com os produtores pedidos. So os ausentes, invalidados,
+    vencidos (TTL_SEGUNDOS) ou com escrita pendente na propria sessao sao lidos do banco
+    (carregar_ledger); os demais nao custam consulta.
+    """
+    if produtores is not None:
+        produtor_ids = [p.id for p in produtores]
+    produtor_ids = list(dict.fromkeys(produtor_ids or ()))
+    alterados = db.info.get(_ALTERADOS, set())
+    agora = time.monotonic()
+    with _lock:
+        faltando = [
+            produtor_id
+            for produtor_id in produtor_ids
+            if None in alterados
+            or produtor_id in alterados
+            or agora - _carregado_em.get(produtor_id, float("-inf")) >= TTL_SEGUNDOS
+        ]
+        ausentes = set(faltando)
+        recorte = _ledger.recorte(p for p in produtor_ids if p not in ausentes)
+        geracao = _geracao
+    if not faltando:
+        return recorte
+
+    if produtores is not None:
+        lidos = carregar_ledger(db, produtores=[p for p in produtores if p.id in ausentes])
+    else:
+        lidos = carregar_ledger(db, faltando)
+    # Escrita pendente na sessao nao vai para o ledger do processo (pode nao ser commitada)
+    guardar = [p for p in faltando if None not in alterados and p not in alterados]
+    with _lock:
+        if guardar and geracao == _geracao:
+            _ledger.substituir(lidos.recorte(guardar), guardar)
+            carregado_em = time.monotonic()
+            _carregado_em.update((produtor_id, carregado_em) for produtor_id in guardar)
+    recorte.substituir(lidos, faltando)
+    return recorte
+
+
+def invalidar(produtor_ids: Optional[Iterable[int]] = None) -> None:
+    """Tira os produtores (todos, sem argumento) do ledger do processo."""
+    global _geracao
+    with _lock:
+        if produtor_ids is None:
+            _ledger.remover(list(_carregado_em))
+            _carregado_em.clear()
+        else:
+            produtor_ids = list(produtor_ids)
+            _ledger.remover(produtor_ids)
+            for produtor_id in produtor_ids:
+                _carregado_em.pop(produtor_id, None)
+        _geracao += 1
+
+
+def _grupo_assumido(grupo: Optional[GrupoFornecedor]) -> bool:
+    """O grupo esta, ou estava antes desta escrita, num status que consome capacidade."""
+    if grupo is None:
+        return True  # so o grupo_id: na duvida, invalida
+    historico = inspect(grupo).attrs.status.history
+    return any(status in STATUS_GRUPO_COMPROMETIDO for status in historico.sum())
+
+
+def _produtores_alterados(session: Session) -> Set[int]:
+    alterados: Set[int] = set()
+    with session.no_autoflush:
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, (ReservaCapacidade, ItemProducao)):
+                alterados.update(inspect(obj).attrs.produtor_id.history.sum())
+            elif isinstance(obj, PeriodoCapacidade):
+                if obj.item_producao is not None:
+                    alterados.add(obj.item_producao.produtor_id)
+            elif isinstance(obj, AlocacaoGrupo):
+                if _grupo_assumido(obj.grupo):
+                    alterados.update(inspect(obj).attrs.produtor_id.history.sum())
+            elif isinstance(obj, GrupoFornecedor):
+                if _grupo_assumido(obj):
+                    alterados.update(alocacao.produtor_id for alocacao in obj.alocacoes)
+    alterados.discard(None)
+    return alterados
+
+
+@event.listens_for(Session, "before_flush")
+def _anotar_escritas(session: Session, flush_context, instances) -> None:
+    alterados = _produtores_alterados(session)
+    if alterados:
+        session.info.setdefault(_ALTERADOS, set()).update(alterados)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _anotar_escritas_em_massa(estado: ORMExecuteState) -> None:
+    # query.update()/query.delete() nao passam pelo flush: nao ha como saber os produtores
+    if not (estado.is_update or estado.is_delete) or estado.bind_mapper is None:
+        return
+    if estado.bind_mapper.class_ in (ReservaCapacidade, ItemProducao, PeriodoCapacidade, AlocacaoGrupo, GrupoFornecedor):
+        estado.session.info.setdefault(_ALTERADOS, set()).add(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_escritas(session: Session) -> None:
+    alterados = session.info.pop(_ALTERADOS, None)
+    if alterados:
+        invalidar(None if None in alterados else alterados)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_escritas(session: Session) -> None:
+    session.info.pop(_ALTERADOS, None)
+
+
+@dataclass
+class AlocacaoPlanejada:
+    item_demanda_id: int
+    produto_id: int
+    produtor_id: int
+    quantidade: float
+
+
+@dataclass
+class PlanoAlocacao:
+    alocacoes: Dict[int, List[AlocacaoPlanejada]] = field(default_factory=dict)  # por versao
+    nao_atendido: Dict[int, Dict[int, float]] = field(default_factory=dict)  # versao -> item -> qtd
+    custo: float = 0.0
+
+
+def alocar(
+    ledger: LedgerCapacidade,
+    demandas: List[Tuple[VersaoDemanda, AcumuladorCapacidade]],
+    max_candidatos: int = MAX_CANDIDATOS_POR_ITEM,
+) -> PlanoAlocacao:
+    """
+    Aloca todas as demandas de uma vez sobre a capacidade livre do ledger (fluxo de custo
+    minimo) e compromete o resultado no ledger. Os candidatos de cada versao sao os do
+    AcumuladorCapacidade do motor, em ordem de score (no maximo `max_candidatos` por item).
+    Cada parcela do cronograma de entrega so alcanca os periodos que cruzam sua janela.
+    """
+    rede = RedeFluxo()
+    # (arco, versao, item, produtor, periodo)
+    arcos_alocacao: List[Tuple[int, int, ItemDemanda, int, PeriodoLivre]] = []
+    arcos_sobra: List[Tuple[int, int, ItemDemanda]] = []
+    ligados = set()
+    for versao, capacidade in demandas:
+        produtor_ids, scores, _ = capacidade.ordenado()
+        for item in versao.itens:
+            quantidade = float(item.quantidade or 0)
+            if quantidade <= 0:
+                continue
+            parcelas = janelas_entrega.parcelas_entrega(item.cronograma_entrega_json, quantidade)
+            no_item = ("item", item.id)
+            rede.adicionar_arco("fonte", no_item, quantidade, 0)
+            arcos_sobra.append((rede.adicionar_arco(no_item, "sumidouro", quantidade, CUSTO_NAO_ATENDIDO), versao.id, item))
+            candidatos = []
+            for produtor_id, score in zip(produtor_ids.tolist(), scores.tolist()):
+                if len(candidatos) >= max_candidatos:
+                    break
+                if ledger.periodos_livres(produtor_id, item.produto_id):
+                    custo = round((1.0 - min(1.0, max(0.0, score))) * CUSTO_ESCALA)
+                    candidatos.append((produtor_id, custo))
+
+            # Cada parcela so alcanca os periodos que cruzam sua janela
+            for indice, parcela in enumerate(parcelas):
+                if parcela.quantidade <= TOLERANCIA:
+                    continue
+                no_parcela = ("parcela", item.id, indice)
+                rede.adicionar_arco(no_item, no_parcela, parcela.quantidade, 0)
+                for produtor_id, custo in candidatos:
+                    for periodo in ledger.periodos_livres(produtor_id, item.produto_id, parcela.inicio, parcela.fim):
+                        no_periodo = ("periodo", id(periodo))
+                        if no_periodo not in ligados:
+                            rede.adicionar_arco(no_periodo, "sumidouro", periodo.livre, 0)
+                            ligados.add(no_periodo)
+                        arco = rede.adicionar_arco(no_parcela, no_periodo, parcela.quantidade, custo)
+                        arcos_alocacao.append((arco, versao.id, item, produtor_id, periodo))
+
+    _, custo = rede.resolver("fonte", "sumidouro")
+
+    plano = PlanoAlocacao(custo=custo)
+    for versao, _ in demandas:
+        plano.alocacoes[versao.id] = []
+        plano.nao_atendido[versao.id] = {}
+    # Um item pode receber de varios periodos do mesmo produtor: soma por (item, produtor)
+    por_item_produtor: Dict[Tuple[int, int], List] = {}
+    for arco, versao_id, item, produtor_id, periodo in arcos_alocacao:
+        quantidade = rede.fluxo(arco)
+        if quantidade <= TOLERANCIA:
+            continue
+        periodo.comprometido += quantidade
+        acumulado = por_item_produtor.setdefault((item.id, produtor_id), [versao_id, item, 0.0])
+        acumulado[2] += quantidade
+    for (_, produtor_id), (versao_id, item, quantidade) in por_item_produtor.items():
+        plano.alocacoes[versao_id].append(
+            AlocacaoPlanejada(item.id, item.produto_id, produtor_id, round(quantidade, 2))
+        )
+    for arco, versao_id, item in arcos_sobra:
+        quantidade = rede.fluxo(arco)
+        if quantidade > TOLERANCIA:
+            plano.nao_atendido[versao_id][item.id] = round(quantidade, 2)
+    return plano
@@ -0,0 +1,162 @@
+"""
+Diagnostico por etapa das execucoes do motor de match (RF-14).
+
+DiagnosticoMatch acumula, para cada etapa do pipeline (filtro, score, ranking, individual,
+grupos, persistencia), o tempo de relogio, a quantidade de comandos SQL e contadores de
+candidatos. Filtro, score e ranking se alternam a cada lote do cursor; o tempo de cada
+etapa e a soma dos seus trechos. Os comandos SQL sao contados por um listener
+before_cursor_execute na engine, filtrado pela thread da execucao (outras sessoes da mesma
+engine nao entram; consultas feitas em processos de shard tambem nao).
+
+O resultado vai para ExecucaoMatch.parametros_json["diagnosticos"] e alimenta as metricas
+do processo (formato de texto do Prometheus), expostas em GET /match/metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+ETAPAS = ("filtro", "score", "ranking", "individual", "grupos", "persistencia")
+
+# Limites (segundos) dos buckets do histograma de duracao por etapa
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class DiagnosticoMatch:
+    def __init__(self):
+        self.tempos: Dict[str, float] = {}
+        self.consultas: Dict[str, int] = {}
+        self.contadores: Dict[str, Dict[str, int]] = {}
+        self._pilha: List[Tuple[str, float]] = []  # (etapa, inicio do trecho atual)
+        self._inicio = time.perf_counter()
+        self._engine = None
+        self._thread: Optional[int] = None
+
+    # --- Contagem de SQL ---------------------------------------------------
+
+    def acompanhar(self, db: Session) -> "DiagnosticoMatch":
+        """Passa a contar os comandos SQL emitidos por esta thread na engine da sessao."""
+        bind = db.get_bind()
+        self._engine = getattr(bind, "engine", bind)
+        self._thread = threading.get_ident()
+        event.listen(self._engine, "before_cursor_execute", self._contar_sql)
+        return self
+
+    def encerrar(self) -> None:
+        if self._engine is not None:
+            event.remove(self._engine, "before_cursor_execute", self._contar_sql)
+            self._engine = None
+
+    def _contar_sql(self, *args) -> None:
+        if self._pilha and threading.get_ident() == self._thread:
+            etapa = self._pilha[-1][0]
+            self.consultas[etapa] = self.consultas.get(etapa, 0) + 1
+
+    # --- Etapas ----------------------------------------------------------
+
+    @contextmanager
+    def etapa(self, nome: str):
+        """
+        Soma o tempo (e os comandos SQL) do bloco na etapa. Uma etapa aberta dentro de outra
+        pausa a externa: cada trecho conta para uma etapa so.
+        """
+        agora = time.perf_counter()
+        if self._pilha:
+            externa, inicio = self._pilha[-1]
+            self.tempos[externa] = self.tempos.get(externa, 0.0) + agora - inicio
+        self._pilha.append((nome, agora))
+        try:
+            yield
+        finally:
+            agora = time.perf_counter()
+            _, inicio = self._pilha.pop()
+            self.tempos[nome] = self.tempos.get(nome, 0.0) + agora - inicio
+            if self._pilha:
+                self._pilha[-1] = (self._pilha[-1][0], agora)
+
+    def contar(self, etapa: str, chave: str, quantidade: int) -> None:
+        contadores = self.contadores.setdefault(etapa, {})
+        contadores[chave] = contadores.get(chave, 0) + int(quantidade)
+
+    def como_dict(self) -> Dict[str, Any]:
+        etapas = {}
+        for nome in ETAPAS:
+            if nome not in self.tempos and nome not in self.contadores:
+                continue
+            etapas[nome] = {
+                "tempo_ms": round(self.tempos.get(nome, 0.0) * 1000, 3),
+                "consultas_sql": self.consultas.get(nome, 0),
+                **self.contadores.get(nome, {}),
+            }
+        return {
+            "tempo_total_ms": round((time.perf_counter() - self._inicio) * 1000, 3),
+            "consultas_sql": sum(self.consultas.values()),
+            "etapas": etapas,
+        }
+
+
+# --- Metricas do processo (texto do Prometheus) --------------------------------
+
+class _Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.execucoes: Dict[str, int] = {}
+        self.duracao: Dict[str, Tuple[List[int], float, int]] = {}  # etapa -> (buckets, soma, contagem)
+        self.consultas: Dict[str, int] = {}
+        self.candidatos: Dict[Tuple[str, str], int] = {}
+
+    def registrar(self, status: str, diagnostico: Dict[str, Any]) -> None:
+        with self._lock:
+            self.execucoes[status] = self.execucoes.get(status, 0) + 1
+            for etapa, dados in diagnostico.get("etapas", {}).items():
+                segundos = dados["tempo_ms"] / 1000.0
+                buckets, soma, contagem = self.duracao.get(etapa, ([0] * len(BUCKETS_SEGUNDOS), 0.0, 0))
+                for posicao, limite in enumerate(BUCKETS_SEGUNDOS):
+                    if segundos <= limite:
+                        buckets[posicao] += 1
+                self.duracao[etapa] = (buckets, soma + segundos, contagem + 1)
+                self.consultas[etapa] = self.consultas.get(etapa, 0) + dados["consultas_sql"]
+                for chave, valor in dados.items():
+                    if chave not in ("tempo_ms", "consultas_sql"):
+                        self.candidatos[(etapa, chave)] = self.candidatos.get((etapa, chave), 0) + valor
+
+    def exportar(self) -> str:
+        with self._lock:
+            linhas = [
+                "# HELP match_execucoes_total Execucoes do motor de match por status.",
+                "# TYPE match_execucoes_total counter",
+            ]
+            for status, total in sorted(self.execucoes.items()):
+                linhas.append(f'match_execucoes_total{{status="{status}"}} {total}')
+
+            linhas += [
+                "# HELP match_etapa_duracao_segundos Tempo de relogio de cada etapa do pipeline de match.",
+                "# TYPE match_etapa_duracao_segundos histogram",
+            ]
+            for etapa, (buckets, soma, contagem) in sorted(self.duracao.items()):
+                for limite, total in zip(BUCKETS_SEGUNDOS, buckets):
+                    linhas.append(f'match_etapa_duracao_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {total}')
+                linhas.append(f'match_etapa_duracao_segundos_bucket{{etapa="{etapa}",le="+Inf"}} {contagem}')
+                linhas.append(f'match_etapa_duracao_segundos_sum{{etapa="{etapa}"}} {soma:.6f}')
+                linhas.append(f'match_etapa_duracao_segundos_count{{etapa="{etapa}"}} {contagem}')
+
+            linhas += [
+                "# HELP match_etapa_consultas_sql_total Comandos SQL emitidos em cada etapa.",
+                "# TYPE match_etapa_consultas_sql_total counter",
+            ]
+            for etapa, total in sorted(self.consultas.items()):
+                linhas.append(f'match_etapa_consultas_sql_total{{etapa="{etapa}"}} {total}')
+
+            linhas += [
+                "# HELP match_etapa_candidatos_total Candidatos contados em cada etapa.",
+                "# TYPE match_etapa_candidatos_total counter",
+            ]
+            for (etapa, chave), total in sorted(self.candidatos.items()):
+                linhas.append(f'match_etapa_candidatos_total{{etapa="{etapa}",contador="{chave}"}} {total}')
+            return "\n".join(linhas) + "\n"
+
+
+metricas = _Metricas()
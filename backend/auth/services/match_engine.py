@@ -1,68 +1,164 @@
 import json
 import logging
-from typing import List, Dict, Any, Optional, Tuple
-from sqlalchemy.orm import Session
+import os
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, selectinload
 from datetime import datetime
 
 from models.Demanda_model import VersaoDemanda
 from models.PerfilProdutor_model import PerfilProdutor
-from models.Match_model import ExecucaoMatch, CandidatoMatch, GrupoFornecedor, MembroGrupo, AlocacaoGrupo
+from models.Match_model import ExecucaoMatch
 from models.Producao_model import ItemProducao
 from models.Proposta_model import Proposta
-from schemas.Match_schema import MatchResultResponse, MatchOption, MatchOptionProdutor
+from models.User_model import User
+from models.FeaturesMatch_model import FeaturesMatchProdutor
+from schemas.Match_schema import MatchResultResponse, MatchOption, MatchOptionProdutor, AlocacaoItemOption
+from services import (
+    equivalencias,
+    geo_index,
+    group_solver,
+    match_cache,
+    match_capacidade,
+    match_persistencia,
+    match_sharding,
+    perfis_pesos,
+)
+from services.match_diagnosticos import DiagnosticoMatch, metricas
+from services.match_kernel import ScoreMatrix
+from services.match_ranking import AcumuladorCapacidade, CandidatoPontuado, RankingTopK
 from services.match_scoring import MatchScoringService
 
 logger = logging.getLogger(__name__)
 
+
 class MatchEngineService:
+    RAIO_MAXIMO_KM = 300  # Exemplo hardcode seguro
+    LIMITE_PROPOSTAS_PENDENTES = 5
+    STATUS_PROPOSTA_PENDENTE = ('pending', 'analyzing', 'open')  # Statues hipotéticos
+    TOP_INDIVIDUAIS = int(os.getenv("MATCH_TOP_K", "5"))
+    TAMANHO_LOTE = int(os.getenv("MATCH_CHUNK_SIZE", "500"))
+    GRUPOS_TOP_K = int(os.getenv("MATCH_GROUP_TOP_K", "3"))
+    GRUPOS_PRAZO_MS = float(os.getenv("MATCH_GROUP_DEADLINE_MS", "200"))
+    PROCESSOS_SHARD = int(os.getenv("MATCH_SHARD_PROCESSES", "0"))  # <= 1: pontua no próprio processo
+
     def __init__(self, db: Session):
         self.db = db
         self.scoring_service = MatchScoringService(db)
+        self.diagnostico = DiagnosticoMatch()
 
-    def execute_match(self, versao_demanda_id: int, trigger: str = "auto") -> MatchResultResponse:
+    def execute_match(
+        self,
+        versao_demanda_id: int,
+        trigger: str = "auto",
+        user_id: Optional[int] = None,
+        force: bool = False,
+    ) -> MatchResultResponse:
         """
         Executa o motor de match para uma versão de demanda específica.
         Seguindo o fluxo: Filtros -> Score -> Estratégias -> Resultado.
+
+        Se os dados de entrada não mudaram desde a última execução concluída, devolve o
+        resultado gravado nela sem recalcular (force=True ignora o cache).
         """
+        if not force:
+            em_cache = self.buscar_em_cache(versao_demanda_id)
+            if em_cache is not None:
+                return match_persistencia.carregar_resultado(self.db, em_cache)
+
+        execucao = self.criar_execucao(versao_demanda_id, trigger, user_id=user_id, status="running")
+        return self.executar(execucao)
+
+    def parametros_cache(self, versao: VersaoDemanda) -> Dict[str, Any]:
+        """Parâmetros do motor que entram na chave do cache de resultados."""
+        plano = self.plano_score(versao)
+        return {
+            "pesos": {key: crit.weight for key, crit in self.scoring_service._build_base_criterios(plano.pesos).items()},
+            "plano_score": plano.assinatura,
+            "raio_maximo_km": self.RAIO_MAXIMO_KM,
+            "limite_propostas_pendentes": self.LIMITE_PROPOSTAS_PENDENTES,
+            "grupos_top_k": self.GRUPOS_TOP_K,
+            "grupos_prazo_ms": self.GRUPOS_PRAZO_MS,
+            "equivalencias": equivalencias.obter(self.db).assinatura,
+        }
+
+    def plano_score(self, versao: VersaoDemanda) -> perfis_pesos.PlanoScore:
+        """Pesos e regras do perfil padrão da organização da demanda (já compilados, em cache)."""
+        return perfis_pesos.obter(self.db).plano(versao.demanda.organizacao_id)
+
+    def buscar_em_cache(self, versao_demanda_id: int) -> Optional[ExecucaoMatch]:
+        """Execução concluída cujo resultado ainda vale para os dados atuais, se houver."""
+        versao = self.db.get(VersaoDemanda, versao_demanda_id)
+        if versao is None:
+            return None
+        chave = match_cache.chave_execucao(self.db, versao_demanda_id, self.parametros_cache(versao))
+        return match_cache.buscar_execucao(self.db, versao_demanda_id, chave)
+
+    def criar_execucao(
+        self,
+        versao_demanda_id: int,
+        trigger: str = "auto",
+        user_id: Optional[int] = None,
+        status: str = "queued",
+    ) -> ExecucaoMatch:
+        """Registra a ExecucaoMatch (queued para a fila, running para execução imediata)."""
         # 1. Recuperar Contexto
         versao = self.db.query(VersaoDemanda).filter(VersaoDemanda.id == versao_demanda_id).first()
         if not versao:
             raise ValueError(f"VersaoDemanda {versao_demanda_id} not found")
-        
-        # Registrar início da execução
+
         execucao = ExecucaoMatch(
             versao_demanda_id=versao.id,
             tipo_execucao=trigger,
-            status="running",
-            iniciada_em=datetime.now()
+            status=status,
+            iniciada_em=datetime.now(),
+            criada_por_user_id=user_id,
         )
         self.db.add(execucao)
         self.db.commit()
+        return execucao
+
+    def executar(
+        self,
+        execucao: ExecucaoMatch,
+        ranqueado: Optional[Tuple[RankingTopK, AcumuladorCapacidade]] = None,
+        diagnostico_lote: Optional[Dict[str, Any]] = None,
+    ) -> MatchResultResponse:
+        """
+        Roda o pipeline para uma execução já registrada (síncrona ou retirada da fila).
+        Com `ranqueado`, usa filtros e scores já calculados (e chave de cache já gravada) por
+        uma passada compartilhada entre várias versões (services/match_lote); o diagnóstico
+        dessa passada vem em `diagnostico_lote` e é gravado junto.
+        """
+        versao = execucao.versao_demanda
+        if execucao.status != "running":
+            execucao.status = "running"
+            execucao.iniciada_em = datetime.now()
+            self.db.commit()
 
+        # Tempo, comandos SQL e candidatos por etapa (services/match_diagnosticos)
+        self.diagnostico = DiagnosticoMatch().acompanhar(self.db)
         try:
-            # 2. Filtragem Eliminatória
-            candidatos_validos = self._filtrar_produtores(versao)
-
-            # 3. Cálculo de Score
-            scored_candidates = []
-            for produtor in candidatos_validos:
-                score_data = self.scoring_service.calculate(versao, produtor)
-                adjusted_score = self._aplicar_regras_negocio_extras(versao, produtor, score_data)
-                
-                scored_candidates.append({
-                    "produtor": produtor,
-                    "score_data": score_data,
-                    "final_score": adjusted_score
-                })
+            # Chave do cache calculada antes de ler os dados: se algo mudar durante a
+            # execução, a próxima chamada vê outra marca d'água e recalcula
+            if ranqueado is None:
+                execucao.chave_cache = match_cache.chave_execucao(self.db, versao.id, self.parametros_cache(versao))
 
-            # Ordenar por score decrescente
-            scored_candidates.sort(key=lambda x: x["final_score"], reverse=True)
+                # 2. Filtragem Eliminatória + 3. Cálculo de Score, em fluxo
+                ranqueado = self.ranquear(versao)
+            ranking, capacidade = ranqueado
+            self.diagnostico.contar("ranking", "top_k", len(ranking.melhores()))
+            self.diagnostico.contar("ranking", "candidatos_grupos", len(capacidade))
 
             # 4. Estratégias de Atendimento
             opcoes = []
 
             # Opção A: Individual
-            matches_individuais = self._strategy_individual(versao, scored_candidates)
+            with self.diagnostico.etapa("individual"):
+                matches_individuais = self._strategy_individual(versao, ranking.melhores())
+            self.diagnostico.contar("individual", "opcoes", len(matches_individuais))
             opcoes.extend(matches_individuais)
 
             # Opção B: Grupos (apenas se não houver match individual perfeito ou para dar alternativas)
@@ -71,144 +167,315 @@ class MatchEngineService:
             # Porém, vamos gerar sempre para dar comparativo, ou seguir estrito? 
             # "Se nenhum produtor individual atende 100%" -> Option A is empty or suboptimal.
             # Vou gerar grupos se não houver ou se solicitado. Vou gerar sempre como alternativa se possível.
-            matches_grupos = self._strategy_groups(versao, scored_candidates)
+            with self.diagnostico.etapa("grupos"):
+                matches_grupos = self._strategy_groups(versao, capacidade)
+            self.diagnostico.contar("grupos", "opcoes", len(matches_grupos))
             opcoes.extend(matches_grupos)
 
             # 5. Gerar Resultado Final
-            status_match = "sem_match"
-            if any(opt.percentual_da_demanda >= 100 for match in opcoes for opt in match.produtores if match.tipo == 'individual'): # Check logic
-                 status_match = "match_encontrado"
-            elif any(match.tipo == 'grupo' for match in opcoes):
-                 status_match = "grupo_formado"
-            elif opcoes:
-                 status_match = "parcial"
-
-            best_coverage = 0.0
-            # Simplificação: Cobertura do melhor match
-            for opt in opcoes:
-                # Assuming simple total coverage logic for now
-                pass 
-            
-            # Persistir Candidatos (Top matches)
-            for opt in opcoes:
-                if opt.tipo == 'individual':
-                    for p in opt.produtores:
-                        candidato = CandidatoMatch(
-                            execucao_match_id=execucao.id,
-                            tipo_candidato="single",
-                            score_total=p.score,
-                            explicacao_json={"justificativa": p.justificativa},
-                            percentual_cobertura=p.percentual_da_demanda,
-                            status="active"
-                        )
-                        self.db.add(candidato)
-                elif opt.tipo == 'grupo':
-                    # Persistir grupo como sugestão (ExecucaoMatch -> GrupoFornecedor logic matches better directly saving groups potentially)
-                    # Mas CandidatoMatch pode representar o grupo também? O modelo tem 'tipo_candidato="group"'.
-                    candidato = CandidatoMatch(
-                        execucao_match_id=execucao.id,
-                        tipo_candidato="group",
-                        score_total=opt.score_agregado,
-                        explicacao_json={"membros": [m.nome for m in opt.produtores]},
-                        percentual_cobertura=100.0, # Assumed logic for group
-                        status="active"
-                    )
-                    self.db.add(candidato)
+            status_match, cobertura = match_persistencia.status_resultado(
+                individual_completo=any(
+                    opt.percentual_da_demanda >= 100 for match in opcoes for opt in match.produtores if match.tipo == 'individual'
+                ),
+                tem_grupo=any(match.tipo == 'grupo' for match in opcoes),
+                tem_opcoes=bool(opcoes),
+            )
 
             match_response = MatchResultResponse(
                 demanda_id=versao.demanda_id,
                 status=status_match,
-                cobertura_percentual=100.0 if status_match in ["match_encontrado", "grupo_formado"] else 0.0, # Placeholder logic
-                opcoes=opcoes
+                cobertura_percentual=cobertura,
+                opcoes=opcoes,
+                substituicoes_sugeridas=self._substituicoes_sugeridas(versao),
             )
 
+            # Persistir candidatos, grupos, membros e alocações em lote, na mesma transação
+            with self.diagnostico.etapa("persistencia"):
+                match_persistencia.persistir_resultado(self.db, execucao, versao, match_response)
+                self.db.flush()
+
             # Atualizar execução
+            diagnostico = self.diagnostico.como_dict()
+            if diagnostico_lote is not None:
+                diagnostico["passada_compartilhada"] = diagnostico_lote
+            execucao.parametros_json = {**execucao.parametros_json, "diagnosticos": diagnostico}
             execucao.status = "completed"
             execucao.finalizada_em = datetime.now()
-            execucao.parametros_json = match_response.model_dump(mode='json')
             self.db.commit()
+            metricas.registrar("completed", diagnostico)
 
             return match_response
 
         except Exception as e:
             self.db.rollback()
+            diagnostico = self.diagnostico.como_dict()
             execucao.status = "failed"
             execucao.finalizada_em = datetime.now()
-            execucao.parametros_json = {"error": str(e)}
+            execucao.parametros_json = {"error": str(e), "diagnosticos": diagnostico}
             self.db.commit()
+            metricas.registrar("failed", diagnostico)
             logger.error(f"Match execution failed: {e}")
             raise e
+        finally:
+            self.diagnostico.encerrar()
 
-    def _filtrar_produtores(self, versao: VersaoDemanda) -> List[PerfilProdutor]:
-        """Aplica filtros eliminatórios (Passo 2)"""
-        # 1. Documentação e Perfil
-        # Permite qualquer produtor que nÃ£o esteja bloqueado.
-        query = self.db.query(PerfilProdutor).filter(
-            PerfilProdutor.status_perfil != 'blocked'
-            # Idealmente verificar status de docs especificos se necessario
-        )
-        
-        todos = query.all()
-        validos = []
+    def ranquear(
+        self, versao: VersaoDemanda, produtor_ids: Optional[List[int]] = None
+    ) -> Tuple[RankingTopK, AcumuladorCapacidade]:
+        """
+        Filtra (Passo 2) e pontua (Passo 3) os candidatos da versão em lotes vindos do cursor.
+        Retém apenas o top-K individual (com a linha da matriz para renderizar textos) e a
+        capacidade por produto de quem pode compor grupos; cada lote é descartado em seguida.
+        Com produtor_ids, considera apenas esses produtores (re-match incremental).
+        Com PROCESSOS_SHARD > 1, os lotes são pontuados em processos (services/match_sharding).
+        """
+        ranking = RankingTopK(self.TOP_INDIVIDUAIS)
+        capacidade = AcumuladorCapacidade()
+        lotes = self._lotes_medidos(self._lotes_ids(versao, produtor_ids))
+        if self.PROCESSOS_SHARD > 1 and produtor_ids is None:
+            # Hidratação e score rodam nos processos: aqui só se vê a espera por eles
+            # Plano e fecho vão do pai: o cache dos filhos não vê o invalidar() dos endpoints admin
+            plano = self.plano_score(versao)
+            fecho = equivalencias.obter(self.db)
+            with self.diagnostico.etapa("score"):
+                match_sharding.ranquear_em_processos(
+                    versao.id, lotes, ranking, capacidade, self.PROCESSOS_SHARD, plano=plano, fecho=fecho
+                )
+            return ranking, capacidade
+
+        ordem = 0
+        for lote_ids, sem_features in lotes:
+            self.pontuar_lote(versao, lote_ids, sem_features, ordem, ranking, capacidade)
+            ordem += len(lote_ids)
+        return ranking, capacidade
+
+    def _lotes_medidos(self, lotes: Iterator[Tuple[List[int], set]]) -> Iterator[Tuple[List[int], set]]:
+        """Repassa os lotes do cursor contando o tempo de cada avanço (e os ids) na etapa de filtro."""
+        while True:
+            with self.diagnostico.etapa("filtro"):
+                lote = next(lotes, None)
+            if lote is None:
+                return
+            self.diagnostico.contar("filtro", "ids_filtrados", len(lote[0]))
+            yield lote
+
+    def pontuar_lote(
+        self,
+        versao: VersaoDemanda,
+        lote_ids: List[int],
+        sem_features: set,
+        ordem_inicial: int,
+        ranking: RankingTopK,
+        capacidade: AcumuladorCapacidade,
+        plano: Optional[perfis_pesos.PlanoScore] = None,
+        fecho: Optional[equivalencias.FechoEquivalencias] = None,
+    ) -> None:
+        """Hidrata e pontua um lote de ids, oferecendo o resultado ao ranking e à capacidade."""
+        with self.diagnostico.etapa("filtro"):
+            lote = self._hidratar_lote(versao, lote_ids, sem_features)
+        self.diagnostico.contar("filtro", "candidatos", len(lote))
+        self.pontuar_produtores(versao, lote, ordem_inicial, ranking, capacidade, plano=plano, fecho=fecho)
+
+    def pontuar_produtores(
+        self,
+        versao: VersaoDemanda,
+        produtores: List[PerfilProdutor],
+        ordem_inicial: int,
+        ranking: RankingTopK,
+        capacidade: AcumuladorCapacidade,
+        features: Optional[Dict[int, Any]] = None,
+        ledger: Optional[match_capacidade.LedgerCapacidade] = None,
+        plano: Optional[perfis_pesos.PlanoScore] = None,
+        fecho: Optional[equivalencias.FechoEquivalencias] = None,
+    ) -> None:
+        """Pontua produtores já hidratados e filtrados (em ordem de id) para a versão."""
+        if not produtores:
+            return
+        if plano is None:
+            plano = self.plano_score(versao)
+        with self.diagnostico.etapa("score"):
+            matriz = self.scoring_service.score_batch(
+                versao, produtores, features=features, ledger=ledger, plano=plano, fecho=fecho
+            )
+            final_scores = self._aplicar_regras_negocio_extras(versao, produtores, matriz)
+        self.diagnostico.contar("score", "candidatos", len(produtores))
+        with self.diagnostico.etapa("ranking"):
+            ranking.oferecer_lote(produtores, final_scores, matriz, ordem_inicial)
+            capacidade.adicionar(matriz, [p.id for p in produtores], final_scores, ordem_inicial)
+
+    def _filtrar_produtores(
+        self, versao: VersaoDemanda, produtor_ids: Optional[List[int]] = None
+    ) -> List[PerfilProdutor]:
+        """Aplica filtros eliminatórios (Passo 2) e devolve todos os sobreviventes."""
+        return [produtor for lote in self._filtrar_em_lotes(versao, produtor_ids) for produtor in lote]
 
+    def _filtrar_em_lotes(
+        self, versao: VersaoDemanda, produtor_ids: Optional[List[int]] = None
+    ) -> Iterator[List[PerfilProdutor]]:
+        """
+        Aplica filtros eliminatórios (Passo 2) e hidrata os sobreviventes em lotes de
+        TAMANHO_LOTE, na ordem de id.
+        """
+        for lote_ids, sem_features in self._lotes_ids(versao, produtor_ids):
+            lote = self._hidratar_lote(versao, lote_ids, sem_features)
+            if lote:
+                yield lote
+
+    def _lotes_ids(
+        self, versao: VersaoDemanda, produtor_ids: Optional[List[int]] = None
+    ) -> Iterator[Tuple[List[int], set]]:
+        """
+        Ids dos candidatos que passam nos filtros resolvidos no banco, em lotes de TAMANHO_LOTE.
+        Produto, limite de propostas (RN-14.2) e raio máximo (índice espacial em grade) vão
+        na consulta; os ids chegam por cursor do lado do servidor, na ordem de id. Cada lote
+        leva junto os ids sem linha de features (distância conferida na hidratação).
+        """
         demanda_produtos = {item.produto_id for item in versao.itens}
+        if not demanda_produtos:
+            return
+        # Produtores de substitutos também são candidatos (fecho em cache, services/equivalencias)
+        demanda_produtos = equivalencias.obter(self.db).expandir(demanda_produtos)
+
+        # RN-14.2 — Limite de Participação (Max 5 propostas pendentes), agregado em uma única consulta
+        propostas_pendentes = (
+            self.db.query(Proposta.produtor_id.label("produtor_id"))
+            .filter(
+                Proposta.produtor_id.isnot(None),
+                Proposta.status.in_(self.STATUS_PROPOSTA_PENDENTE),
+            )
+            .group_by(Proposta.produtor_id)
+            .having(func.count(Proposta.id) >= self.LIMITE_PROPOSTAS_PENDENTES)
+            .subquery()
+        )
+
+        # 1. Documentação e Perfil + 2. Produto Compatível (ou substituto equivalente)
+        query = (
+            self.db.query(PerfilProdutor.id)
+            .join(ItemProducao, ItemProducao.produtor_id == PerfilProdutor.id)
+            .outerjoin(propostas_pendentes, propostas_pendentes.c.produtor_id == PerfilProdutor.id)
+            .filter(
+                PerfilProdutor.status_perfil != 'blocked',
+                ItemProducao.produto_id.in_(demanda_produtos),
+                propostas_pendentes.c.produtor_id.is_(None),
+            )
+        )
+        if produtor_ids is not None:
+            query = query.filter(PerfilProdutor.id.in_(produtor_ids))
+
+        # 3. Região (Raio Máximo) - índice em grade sobre producer_match_features.
+        # Sem linha de features ou sem localização, o produtor segue (proximidade neutra no score).
+        demanda_coords = self.scoring_service._extract_coords(
+            getattr(versao.demanda, "local_entrega_json", None)
+        )
+        if demanda_coords:
+            query = query.outerjoin(
+                FeaturesMatchProdutor, FeaturesMatchProdutor.produtor_id == PerfilProdutor.id
+            ).add_columns(
+                FeaturesMatchProdutor.produtor_id.label("feature_id"),
+                FeaturesMatchProdutor.latitude,
+                FeaturesMatchProdutor.longitude,
+            ).filter(
+                geo_index.filtro_raio(demanda_coords, self.RAIO_MAXIMO_KM, incluir_sem_coordenadas=True)
+            )
 
-        for p in todos:
-            # 2. Produto Compatível
-            prod_produtos = {item.produto_id for item in p.itens_producao}
-            if not demanda_produtos.intersection(prod_produtos):
-                 # Fail RF-16 check (substitutes not implemented here yet, assuming exact match for now)
-                 continue
-            
-            # 3. Região (Raio Máximo) - Simplificado
-            dist = self.scoring_service._score_proximidade(versao, p)
-            # Se _score_proximidade retorna score > 0 (dist < 600km ou similar logic internal to scoring), aceitamos.
-            # Mas o RF diz "Região elegível: respeita raio máximo". 
-            # Vamos assumir 300km como hard limit para "Filtro".
-            dist_km = dist[2].get("distancia_km")
-            if dist_km is not None and dist_km > 300: # Exemplo hardcode seguro
-                continue
-
-            # 4. RN-14.2 - Limite de Participação (Max 5 propostas pendentes)
-            pending_proposals = self.db.query(Proposta).filter(
-                Proposta.produtor_id == p.id,
-                Proposta.status.in_(['pending', 'analyzing', 'open']) # Statues hipotéticos
-            ).count()
-            
-            if pending_proposals >= 5:
-                continue
+        # Cursor do lado do servidor: ids chegam aos poucos, na ordem de id
+        linhas = (
+            query.distinct()
+            .order_by(PerfilProdutor.id)
+            .execution_options(stream_results=True, yield_per=self.TAMANHO_LOTE)
+        )
+        lote_ids = []
+        sem_features = set()
+        for row in linhas:
+            if demanda_coords and row.feature_id is None:
+                sem_features.add(row.id)
+            elif demanda_coords and row.latitude is not None and row.longitude is not None:
+                # Checagem exata de distância (haversine) apenas para quem caiu nas células do raio
+                distancia = round(geo_index.haversine_km(demanda_coords, (row.latitude, row.longitude)), 1)
+                if distancia > self.RAIO_MAXIMO_KM:
+                    continue
+            lote_ids.append(row.id)
+            if len(lote_ids) >= self.TAMANHO_LOTE:
+                yield lote_ids, sem_features
+                lote_ids, sem_features = [], set()
+        if lote_ids:
+            yield lote_ids, sem_features
+
+    def _hidratar_lote(
+        self, versao: VersaoDemanda, produtor_ids: List[int], sem_features: set
+    ) -> List[PerfilProdutor]:
+        """Carrega um lote de sobreviventes e descarta quem, sem features, está fora do raio."""
+        return self._descartar_fora_do_raio(versao, self._carregar_lote(produtor_ids), sem_features)
+
+    def _carregar_lote(self, produtor_ids: List[int]) -> List[PerfilProdutor]:
+        """Produtores do lote, em ordem de id, com os relacionamentos usados no score em lote."""
+        return (
+            self.db.query(PerfilProdutor)
+            .filter(PerfilProdutor.id.in_(produtor_ids))
+            .options(
+                selectinload(PerfilProdutor.itens_producao).selectinload(ItemProducao.periodos_capacidade),
+                joinedload(PerfilProdutor.user),
+            )
+            .order_by(PerfilProdutor.id)
+            .all()
+        )
+
+    def _descartar_fora_do_raio(
+        self, versao: VersaoDemanda, candidatos: List[PerfilProdutor], sem_features: set
+    ) -> List[PerfilProdutor]:
+        validos = []
+        for p in candidatos:
+            # Produtor ainda sem features: distância calculada a partir do cadastro
+            if p.id in sem_features:
+                dist_km = self.scoring_service._score_proximidade(versao, p)[2].get("distancia_km")
+                if dist_km is not None and dist_km > self.RAIO_MAXIMO_KM:
+                    continue
 
             # 5. Capacidade (pelo menos X%)
             # ... implementacao futura
 
             validos.append(p)
-            
+
         return validos
 
-    def _aplicar_regras_negocio_extras(self, versao: VersaoDemanda, produtor: PerfilProdutor, score_data: Dict) -> float:
-        """Aplica RN-14.1 e outros ajustes pós-score base"""
-        base_score = score_data["score_percentual"] / 100.0
-        bonus = 0.0
+    def _aplicar_regras_negocio_extras(
+        self, versao: VersaoDemanda, produtores: List[PerfilProdutor], matriz: ScoreMatrix
+    ) -> np.ndarray:
+        """Aplica RN-14.1 e outros ajustes pós-score base, para todos os candidatos de uma vez"""
+        base_score = np.array([valor / 100.0 for valor in matriz.score_percentual()], dtype=float)
 
         # RN-14.1 — Priorização Regional
         # Mesmo munícipio: +10 pontos (0.10)
         demanda_loc = self._get_location_data(versao.demanda.local_entrega_json)
-        produtor_loc = self._get_location_data(produtor.endereco_json)
+        cidade_demanda = demanda_loc.get('cidade') if demanda_loc else None
+        mesma_cidade = np.zeros(len(produtores), dtype=bool)
+        if cidade_demanda:
+            for linha, produtor in enumerate(produtores):
+                produtor_loc = self._get_location_data(produtor.endereco_json)
+                if produtor_loc and produtor_loc.get('cidade'):
+                    mesma_cidade[linha] = cidade_demanda.lower() == produtor_loc['cidade'].lower()
 
-        if demanda_loc and produtor_loc:
-             if demanda_loc.get('cidade') and produtor_loc.get('cidade'):
-                 if demanda_loc['cidade'].lower() == produtor_loc['cidade'].lower():
-                     bonus += 0.10
-        
-        # Mesma região (até 50km) +5 pontos
-        # Já está parcialmente no score de proximidade?
-        # A RN diz "têm bônus". O score de proximidade é logaritmico/faixas. 
-        # Se for bonus ADICIONAL:
-        dist_km = score_data.get("breakdown", {}).get("proximidade_geografica", {}).get("detalhes", {}).get("distancia_km")
-        if dist_km is not None and dist_km <= 50:
-            bonus += 0.05
+        # Mesma região (até 50km) +5 pontos, adicional ao score de proximidade
+        ate_50km = np.array(
+            [dist is not None and dist <= 50 for dist in matriz.distancia_km], dtype=bool
+        )
 
-        return min(1.0, base_score + bonus)
+        bonus = np.where(mesma_cidade, 0.10, 0.0) + np.where(ate_50km, 0.05, 0.0)
+        return np.minimum(1.0, base_score + bonus)
+
+    def explicar_candidato(self, versao: VersaoDemanda, produtor: PerfilProdutor) -> Dict[str, Any]:
+        """
+        Explicação completa (breakdown, pontos fortes/fracos) de um candidato qualquer, sob
+        demanda. Recalculada com os dados atuais: a execução só guarda o texto dos retornados.
+        """
+        elegivel = bool(self._filtrar_produtores(versao, [produtor.id]))
+        matriz = self.scoring_service.score_batch(versao, [produtor], plano=self.plano_score(versao))
+        final_score = float(self._aplicar_regras_negocio_extras(versao, [produtor], matriz)[0])
+        return {
+            "elegivel": elegivel,
+            "score_final": round(final_score * 100, 2),
+            "explicacao": self.scoring_service.render(versao, produtor, matriz, 0),
+        }
 
     def _get_location_data(self, json_data):
         if not json_data: return {}
@@ -217,95 +484,143 @@ class MatchEngineService:
             except: return {}
         return json_data
 
-    def _strategy_individual(self, versao: VersaoDemanda, scored_candidates: List[Dict]) -> List[MatchOption]:
+    def _substituicoes_sugeridas(self, versao: VersaoDemanda) -> List[Dict[str, Any]]:
+        """Substitutos aprovados de cada produto da demanda, com a razão de conversão."""
+        fecho = equivalencias.obter(self.db)
+        demandados = {item.produto_id for item in versao.itens if item.produto_id}
+        sugestoes = []
+        for produto_id in sorted(demandados):
+            for substituto_id, fator in sorted(fecho.substitutos(produto_id).items()):
+                if substituto_id in demandados:
+                    continue
+                sugestoes.append({
+                    "produto_id": produto_id,
+                    "substituto_id": substituto_id,
+                    "quantidade_por_unidade_substituta": round(fator, 6),
+                })
+        return sugestoes
+
+    def _strategy_individual(
+        self, versao: VersaoDemanda, scored_candidates: List[CandidatoPontuado]
+    ) -> List[MatchOption]:
         """Retorna opções de atendimento individual se cobrirem 100%"""
         matches = []
-        # Top 5
-        candidates = scored_candidates[:5]
+        candidates = scored_candidates[:self.TOP_INDIVIDUAIS]
         
         # Calcular demanda total
         total_demand = sum(self.scoring_service._as_float(i.quantidade) for i in versao.itens)
         if total_demand == 0: return []
 
         for cand in candidates:
-            produtor = cand["produtor"]
-            score = cand["final_score"]
-            # Capacidade do produtor para os produtos da demanda
-            # Reutilizando logica do scoring service p/ calcular cobertura
-            # (Idealmente refatorar scoring service para retornar raw numbers mais fácil)
-            cap_details = cand["score_data"]["breakdown"]["capacidade_entrega"]["detalhes"]
-            qtd_coberta = cap_details.get("quantidade_coberta", 0)
-            
-            percentual = (qtd_coberta / total_demand) * 100 if total_demand > 0 else 0
-            
-            if percentual >= 100: # Match Total
+            opcao = self._opcao_individual(versao, cand, total_demand)
+            if opcao is not None: # Match Total
                 matches.append(MatchOption(
                     tipo="individual",
-                    score_agregado=round(score * 100, 2),
-                    produtores=[
-                         MatchOptionProdutor(
-                             id=produtor.id,
-                             nome=produtor.user.name if produtor.user else f"Produtor {produtor.id}",
-                             score=round(score * 100, 2),
-                             quantidade_fornecida=qtd_coberta,
-                             percentual_da_demanda=round(percentual, 2),
-                             justificativa=cand["score_data"]["justificativa"]
-                         )
-                    ]
+                    score_agregado=opcao.score,
+                    produtores=[opcao]
                 ))
         
         return matches
 
-    def _strategy_groups(self, versao: VersaoDemanda, scored_candidates: List[Dict]) -> List[MatchOption]:
+    def _opcao_individual(
+        self, versao: VersaoDemanda, cand: CandidatoPontuado, total_demand: float
+    ) -> Optional[MatchOptionProdutor]:
+        """Opção do candidato se cobrir 100% da demanda; já vem pronta quando pontuada em outro processo."""
+        if cand.matriz is None:
+            return cand.opcao
+
+        produtor = cand.produtor
+        score = cand.final_score
+        # Capacidade do produtor para os produtos da demanda (coluna do kernel)
+        qtd_coberta = cand.quantidade_coberta
+
+        percentual = (qtd_coberta / total_demand) * 100 if total_demand > 0 else 0
+        if percentual < 100:
+            return None
+
+        # Só a justificativa: o breakdown completo sai sob demanda (explicar_candidato)
+        justificativa = self.scoring_service.render_justificativa(cand.matriz, cand.linha)
+        return MatchOptionProdutor(
+            id=produtor.id,
+            nome=produtor.user.name if produtor.user else f"Produtor {produtor.id}",
+            score=round(score * 100, 2),
+            quantidade_fornecida=qtd_coberta,
+            percentual_da_demanda=round(percentual, 2),
+            justificativa=justificativa
+        )
+
+    def _strategy_groups(self, versao: VersaoDemanda, capacidade: AcumuladorCapacidade) -> List[MatchOption]:
         """
-        Heurística simples para formação de grupos (Opção B)
-        Tenta combinar produtores para atingir 100% de cobertura.
+        Formação de grupos (Opção B): até K grupos, diferentes entre si, que cobrem cada produto
+        da demanda, com a distribuição de cada item entre os membros (services/group_solver).
         """
-        # Se já temos matches individuais suficientes, talvez pular?
-        # Vamos tentar montar 1 grupo bom.
-        
         total_demand = sum(self.scoring_service._as_float(i.quantidade) for i in versao.itens)
-        if total_demand == 0: return []
+        if total_demand == 0 or not capacidade.produto_ids or not capacidade.cobre_demanda():
+            return []
+
+        # Candidatos com alguma capacidade nos produtos da demanda, em ordem de score
+        ids, scores, capacidades = capacidade.ordenado()
+
+        resultado = group_solver.resolver_grupos(
+            capacidades,
+            capacidade.demanda,
+            scores,
+            k=self.GRUPOS_TOP_K,
+            prazo_ms=self.GRUPOS_PRAZO_MS,
+        )
+        if not resultado.completo:
+            logger.info(
+                "Formação de grupos da versão %s interrompida pelo prazo (%s nós, %s grupos)",
+                versao.id, resultado.nos_visitados, len(resultado.grupos),
+            )
+
+        posicao = {produto_id: pos for pos, produto_id in enumerate(capacidade.produto_ids)}
+        itens = [item for item in versao.itens if item.produto_id in posicao]
+        itens_alocacao = [
+            group_solver.ItemAlocacao(posicao[item.produto_id], self.scoring_service._as_float(item.quantidade))
+            for item in itens
+        ]
+
+        membros_ids = sorted({int(ids[membro]) for grupo in resultado.grupos for membro in grupo.membros})
+        nomes = {}
+        if membros_ids:
+            nomes = dict(
+                self.db.query(PerfilProdutor.id, User.name)
+                .outerjoin(User, User.id == PerfilProdutor.user_id)
+                .filter(PerfilProdutor.id.in_(membros_ids))
+                .all()
+            )
+
+        grupos = []
+        for grupo in resultado.grupos:
+            por_membro: Dict[int, List[AlocacaoItemOption]] = {membro: [] for membro in grupo.membros}
+            alocacoes = group_solver.alocar_itens(grupo.membros, capacidades, itens_alocacao)
+            for item, partes in zip(itens, alocacoes):
+                for membro, quantidade in partes:
+                    por_membro[membro].append(AlocacaoItemOption(
+                        item_demanda_id=item.id,
+                        produto_id=item.produto_id,
+                        quantidade=round(quantidade, 2),
+                        unidade_id=item.unidade_id,
+                    ))
 
-        grupo_candidatos = []
-        current_coverage = 0.0
-        
-        # Greedy: Pega os melhores scores que tenham capacidade sobrando
-        for cand in scored_candidates:
-            if current_coverage >= total_demand:
-                break
-            
-            produtor = cand["produtor"]
-            cap_details = cand["score_data"]["breakdown"]["capacidade_entrega"]["detalhes"]
-            cap_disponivel = cap_details.get("quantidade_coberta", 0) # Simplificação: assumindo que isso é o que ele tem total para essa demanda
-            
-            if cap_disponivel > 0:
-                grupo_candidatos.append(cand)
-                current_coverage += cap_disponivel
-        
-        if current_coverage >= total_demand and len(grupo_candidatos) > 1:
-            # Temos um grupo válido
             membros_opt = []
-            score_acc = 0.0
-            for c in grupo_candidatos:
-                p = c["produtor"]
-                cap = c["score_data"]["breakdown"]["capacidade_entrega"]["detalhes"].get("quantidade_coberta", 0)
+            for membro in grupo.membros:
+                produtor_id = int(ids[membro])
+                fornecido = round(sum(aloc.quantidade for aloc in por_membro[membro]), 2)
                 membros_opt.append(MatchOptionProdutor(
-                    id=p.id,
-                    nome=p.user.name if p.user else f"Produtor {p.id}",
-                    score=round(c["final_score"] * 100, 2),
-                    quantidade_fornecida=cap,
-                    percentual_da_demanda=round((cap/total_demand)*100, 2),
-                    justificativa="Membro de grupo complementar"
+                    id=produtor_id,
+                    nome=nomes.get(produtor_id) or f"Produtor {produtor_id}",
+                    score=round(float(scores[membro]) * 100, 2),
+                    quantidade_fornecida=fornecido,
+                    percentual_da_demanda=round((fornecido / total_demand) * 100, 2),
+                    justificativa=match_persistencia.JUSTIFICATIVA_MEMBRO,
+                    alocacoes=por_membro[membro],
                 ))
-                score_acc += c["final_score"]
-            
-            avg_score = score_acc / len(grupo_candidatos)
-            
-            return [MatchOption(
+
+            grupos.append(MatchOption(
                 tipo="grupo",
-                score_agregado=round(avg_score * 100, 2),
-                produtores=membros_opt
-            )]
-            
-        return []
+                score_agregado=round(grupo.score_medio * 100, 2),
+                produtores=membros_opt,
+            ))
+        return grupos
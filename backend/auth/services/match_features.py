@@ -0,0 +1,230 @@
+"""
+Tabela materializada de agregados por produtor para o match (producer_match_features).
+
+Cada linha guarda os numeros que o score consome (historico de propostas/contratos, tempo
+de resposta, documentos e coordenadas), recalculados por produtor sempre que os routers de
+Propostas, Contratos, Documentos e Produtores gravam algo que os afeta. O score le tudo
+em uma unica consulta pela chave primaria; reconstruir_features serve para recuperacao.
+"""
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from models.Contrato_model import Contrato
+from models.Documento_model import DocumentoProdutor
+from models.FeaturesMatch_model import FeaturesMatchProdutor
+from models.PerfilProdutor_model import PerfilProdutor
+from models.Proposta_model import ConfirmacaoParticipante, Proposta
+from models.User_model import User
+from services.geo_index import celula_de
+
+logger = logging.getLogger(__name__)
+
+# Limite de parametros por clausula IN nas consultas em lote
+IN_CHUNK_SIZE = 1000
+
+STATUS_CONTRATO_FECHADO = ("generated", "signed")
+
+CAMPOS_FEATURES = (
+    "total_propostas",
+    "contratos_fechados",
+    "respostas",
+    "total_horas_resposta",
+    "documentos_avaliados",
+    "documentos_aprovados",
+    "latitude",
+    "longitude",
+    "celula_geo",
+)
+
+
+def _chunks(values: List[int], size: int):
+    for inicio in range(0, len(values), size):
+        yield values[inicio:inicio + size]
+
+
+def extrair_coordenadas(payload) -> Optional[Tuple[float, float]]:
+    """Le lat/lon de um JSON de endereco ({lat, lng}, {coords: {...}} ou {geo: {...}})."""
+    if not payload:
+        return None
+    data = payload
+    if isinstance(payload, str):
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError:
+            return None
+
+    if not isinstance(data, dict):
+        return None
+
+    candidates = [
+        data,
+        data.get("coords") if isinstance(data.get("coords"), dict) else None,
+        data.get("geo") if isinstance(data.get("geo"), dict) else None,
+    ]
+    for candidate in candidates:
+        if not isinstance(candidate, dict):
+            continue
+        lat = candidate.get("lat") or candidate.get("latitude")
+        lon = candidate.get("lng") or candidate.get("lon") or candidate.get("longitude")
+        if lat is not None and lon is not None:
+            return float(lat), float(lon)
+    return None
+
+
+def coordenadas_produtor(user_latitude, user_longitude, endereco_json) -> Optional[Tuple[float, float]]:
+    """Coordenadas do usuario tem prioridade sobre as do endereco do perfil."""
+    if user_latitude is not None and user_longitude is not None:
+        return float(user_latitude), float(user_longitude)
+    return extrair_coordenadas(endereco_json)
+
+
+def calcular_features(db: Session, produtor_ids: Iterable[int]) -> Dict[int, FeaturesMatchProdutor]:
+    """
+    Calcula os agregados a partir das tabelas de origem, sem persistir.
+    Produtores inexistentes sao ignorados.
+    """
+    features: Dict[int, FeaturesMatchProdutor] = {}
+    ids = sorted(set(produtor_ids))
+
+    for lote in _chunks(ids, IN_CHUNK_SIZE):
+        for produtor_id, endereco_json, latitude, longitude in (
+            db.query(PerfilProdutor.id, PerfilProdutor.endereco_json, User.latitude, User.longitude)
+            .outerjoin(User, User.id == PerfilProdutor.user_id)
+            .filter(PerfilProdutor.id.in_(lote))
+        ):
+            coords = coordenadas_produtor(latitude, longitude, endereco_json)
+            features[produtor_id] = FeaturesMatchProdutor(
+                produtor_id=produtor_id,
+                total_propostas=0,
+                contratos_fechados=0,
+                respostas=0,
+                total_horas_resposta=0.0,
+                documentos_avaliados=0,
+                documentos_aprovados=0,
+                latitude=coords[0] if coords else None,
+                longitude=coords[1] if coords else None,
+                celula_geo=celula_de(*coords) if coords else None,
+            )
+
+        for produtor_id, total in (
+            db.query(Proposta.produtor_id, func.count(Proposta.id))
+            .filter(Proposta.produtor_id.in_(lote))
+            .group_by(Proposta.produtor_id)
+        ):
+            if produtor_id in features:
+                features[produtor_id].total_propostas = total
+
+        for produtor_id, total in (
+            db.query(Proposta.produtor_id, func.count(Contrato.id))
+            .join(Contrato, Contrato.proposta_id == Proposta.id)
+            .filter(
+                Proposta.produtor_id.in_(lote),
+                Contrato.status.in_(STATUS_CONTRATO_FECHADO),
+            )
+            .group_by(Proposta.produtor_id)
+        ):
+            if produtor_id in features:
+                features[produtor_id].contratos_fechados = total
+
+        # Soma em Python, na ordem de id, para manter o mesmo resultado de ponto flutuante
+        for produtor_id, convidado_em, respondido_em in (
+            db.query(
+                ConfirmacaoParticipante.produtor_id,
+                ConfirmacaoParticipante.convidado_em,
+                ConfirmacaoParticipante.respondido_em,
+            )
+            .filter(
+                ConfirmacaoParticipante.produtor_id.in_(lote),
+                ConfirmacaoParticipante.respondido_em.isnot(None),
+                ConfirmacaoParticipante.convidado_em.isnot(None),
+            )
+            .order_by(ConfirmacaoParticipante.id)
+        ):
+            dados = features.get(produtor_id)
+            if dados is None:
+                continue
+            delta = respondido_em - convidado_em
+            dados.respostas += 1
+            dados.total_horas_resposta += max(delta.total_seconds(), 0) / 3600.0
+
+        for produtor_id, total, aprovados in (
+            db.query(
+                DocumentoProdutor.produtor_id,
+                func.count(DocumentoProdutor.id),
+                func.sum(case((DocumentoProdutor.status == "approved", 1), else_=0)),
+            )
+            .filter(DocumentoProdutor.produtor_id.in_(lote))
+            .group_by(DocumentoProdutor.produtor_id)
+        ):
+            if produtor_id in features:
+                features[produtor_id].documentos_avaliados = total
+                features[produtor_id].documentos_aprovados = int(aprovados or 0)
+
+    return features
+
+
+def atualizar_features(db: Session, produtor_ids: Iterable[Optional[int]]) -> None:
+    """
+    Recalcula e grava as features dos produtores informados (upsert), sem commit.
+    Chamado pelos routers logo antes do commit da escrita que alterou os dados de origem.
+    """
+    ids = {pid for pid in produtor_ids if pid}
+    if not ids:
+        return
+
+    # A sessao usa autoflush=False: garante que as escritas pendentes entram no calculo
+    db.flush()
+    calculadas = calcular_features(db, ids)
+    for lote in _chunks(sorted(calculadas), IN_CHUNK_SIZE):
+        existentes = {
+            f.produtor_id: f
+            for f in db.query(FeaturesMatchProdutor).filter(FeaturesMatchProdutor.produtor_id.in_(lote))
+        }
+        for produtor_id in lote:
+            nova = calculadas[produtor_id]
+            atual = existentes.get(produtor_id)
+            if atual is None:
+                db.add(nova)
+                continue
+            for campo in CAMPOS_FEATURES:
+                setattr(atual, campo, getattr(nova, campo))
+    db.flush()
+
+
+def carregar_features(db: Session, produtor_ids: List[int]) -> Dict[int, FeaturesMatchProdutor]:
+    """
+    Le as features de varios produtores em uma consulta pela chave primaria.
+    Produtores ainda sem linha na tabela tem as features calculadas em memoria.
+    """
+    features: Dict[int, FeaturesMatchProdutor] = {}
+    for lote in _chunks(list(produtor_ids), IN_CHUNK_SIZE):
+        for row in db.query(FeaturesMatchProdutor).filter(FeaturesMatchProdutor.produtor_id.in_(lote)):
+            features[row.produtor_id] = row
+
+    ausentes = [pid for pid in produtor_ids if pid not in features]
+    if ausentes:
+        logger.debug("Features de match ausentes para %d produtores; calculando sob demanda", len(ausentes))
+        features.update(calcular_features(db, ausentes))
+    return features
+
+
+def reconstruir_features(db: Session, somente_ausentes: bool = False) -> int:
+    """
+    Recalcula a tabela inteira (ou apenas produtores sem linha), com commit por lote.
+    Retorna a quantidade de produtores processados.
+    """
+    query = db.query(PerfilProdutor.id)
+    if somente_ausentes:
+        query = query.outerjoin(
+            FeaturesMatchProdutor, FeaturesMatchProdutor.produtor_id == PerfilProdutor.id
+        ).filter(FeaturesMatchProdutor.produtor_id.is_(None))
+    ids = [row.id for row in query.order_by(PerfilProdutor.id)]
+
+    for lote in _chunks(ids, IN_CHUNK_SIZE):
+        atualizar_features(db, lote)
+        db.commit()
+    return len(ids)
@@ -0,0 +1,148 @@
+"""
+Re-match incremental (RF-14) para mudancas do lado do produtor.
+
+Quando um produtor altera capacidade ou itens de producao, so ele e repontuado, e so contra
+as versoes de demandas abertas cujo conjunto de produtos cruza o catalogo dele (ou em que
+ele ja aparece no ranking). O ranking persistido da ultima execucao concluida de cada versao
+e atualizado no lugar: a linha anterior do produtor vira "superseded" e, se ele ainda atende
+100% da demanda, entra uma linha nova, respeitando o limite TOP_INDIVIDUAIS do motor (quem
+sai do top tambem vira "superseded"). O cabecalho da execucao (status e cobertura) e
+recalculado a partir das linhas que continuam ativas.
+
+Grupos nao sao refeitos aqui: dependem de todos os candidatos (group_solver). Por isso a
+chave de cache da execucao nao e regravada: a escrita que disparou o re-match ja mudou a
+marca d'agua, e o proximo POST /match/execute recalcula tudo, grupos inclusive. O ranking
+atualizado aqui so e visto por quem consulta a execucao (GET /match/execucoes/{id}) ate
+essa proxima execucao completa.
+"""
+import logging
+from typing import List, Optional
+
+from sqlalchemy import func, select, union
+from sqlalchemy.orm import Session
+
+from models.Demanda_model import Demanda, ItemDemanda, VersaoDemanda
+from models.Match_model import CandidatoMatch, ExecucaoMatch
+from models.Producao_model import ItemProducao
+from schemas.Match_schema import MatchOptionProdutor
+from services.match_engine import MatchEngineService
+from services.match_persistencia import linha_candidato_individual, status_resultado
+
+logger = logging.getLogger(__name__)
+
+STATUS_DEMANDA_ABERTA = ("published", "receiving_proposals")
+
+
+def execucoes_afetadas(db: Session, produtor_id: int) -> List[ExecucaoMatch]:
+    """Ultima execucao concluida de cada versao aberta que pode mudar com o produtor."""
+    produtos = select(ItemProducao.produto_id).where(ItemProducao.produtor_id == produtor_id)
+    por_catalogo = select(ItemDemanda.versao_demanda_id).where(ItemDemanda.produto_id.in_(produtos))
+    no_ranking = (
+        select(ExecucaoMatch.versao_demanda_id)
+        .join(CandidatoMatch, CandidatoMatch.execucao_match_id == ExecucaoMatch.id)
+        .where(CandidatoMatch.produtor_id == produtor_id, CandidatoMatch.status == "active")
+    )
+    versoes = union(por_catalogo, no_ranking).subquery()
+    # Linhas gravadas antes de candidatos_match.produtor_id: sem como achar a do produtor,
+    # a execucao fica para a proxima execucao completa
+    legadas = select(CandidatoMatch.execucao_match_id).where(
+        CandidatoMatch.tipo_candidato == "single",
+        CandidatoMatch.status == "active",
+        CandidatoMatch.produtor_id.is_(None),
+    )
+
+    ultimas = (
+        select(func.max(ExecucaoMatch.id))
+        .join(VersaoDemanda, VersaoDemanda.id == ExecucaoMatch.versao_demanda_id)
+        .join(Demanda, Demanda.id == VersaoDemanda.demanda_id)
+        .where(
+            Demanda.status.in_(STATUS_DEMANDA_ABERTA),
+            ExecucaoMatch.status == "completed",
+            ExecucaoMatch.versao_demanda_id.in_(select(versoes.c[0])),
+        )
+        .group_by(ExecucaoMatch.versao_demanda_id)
+    )
+    return (
+        db.query(ExecucaoMatch)
+        .filter(ExecucaoMatch.id.in_(ultimas), ExecucaoMatch.id.not_in(legadas))
+        .order_by(ExecucaoMatch.id)
+        .all()
+    )
+
+
+def rematch_produtor(db: Session, produtor_id: int) -> int:
+    """
+    Repontua o produtor nas execucoes afetadas e atualiza os rankings, com um unico commit.
+    Retorna quantas execucoes foram revisitadas.
+    """
+    engine = MatchEngineService(db)
+    execucoes = execucoes_afetadas(db, produtor_id)
+    for execucao in execucoes:
+        versao = execucao.versao_demanda
+        ranking, _ = engine.ranquear(versao, [produtor_id])
+        opcoes = engine._strategy_individual(versao, ranking.melhores())
+        novo = opcoes[0].produtores[0] if opcoes else None
+        _atualizar_ranking(db, engine, execucao, produtor_id, novo)
+    db.commit()
+    return len(execucoes)
+
+
+def _atualizar_ranking(
+    db: Session,
+    engine: MatchEngineService,
+    execucao: ExecucaoMatch,
+    produtor_id: int,
+    novo: Optional[MatchOptionProdutor],
+) -> None:
+    ativos = (
+        db.query(CandidatoMatch)
+        .filter(
+            CandidatoMatch.execucao_match_id == execucao.id,
+            CandidatoMatch.tipo_candidato == "single",
+            CandidatoMatch.status == "active",
+        )
+        .all()
+    )
+    restantes = []
+    for candidato in ativos:
+        if candidato.produtor_id == produtor_id:
+            candidato.status = "superseded"
+        else:
+            restantes.append(candidato)
+
+    if novo is not None and len(restantes) >= engine.TOP_INDIVIDUAIS:
+        # Empate no score: sai o mais recente, que entrou depois no ranking
+        pior = min(restantes, key=lambda c: (float(c.score_total), -c.id))
+        if novo.score <= float(pior.score_total):
+            novo = None
+        else:
+            pior.status = "superseded"
+            restantes.remove(pior)
+    if novo is not None:
+        linha = CandidatoMatch(**linha_candidato_individual(execucao.id, novo))
+        db.add(linha)
+        restantes.append(linha)
+    _atualizar_cabecalho(db, execucao, restantes)
+
+
+def _atualizar_cabecalho(db: Session, execucao: ExecucaoMatch, individuais: List[CandidatoMatch]) -> None:
+    """Status e cobertura da execucao conforme os candidatos individuais e grupos ainda ativos."""
+    cabecalho = execucao.parametros_json or {}
+    if "status" not in cabecalho:
+        return
+    tem_grupo = db.query(
+        db.query(CandidatoMatch)
+        .filter(
+            CandidatoMatch.execucao_match_id == execucao.id,
+            CandidatoMatch.tipo_candidato == "group",
+            CandidatoMatch.status == "active",
+        )
+        .exists()
+    ).scalar()
+    status, cobertura = status_resultado(
+        individual_completo=any(float(c.percentual_cobertura) >= 100 for c in individuais),
+        tem_grupo=bool(tem_grupo),
+        tem_opcoes=bool(individuais) or bool(tem_grupo),
+    )
+    # JSON nao rastreia mutacao no lugar: atribui um dict novo
+    execucao.parametros_json = {**cabecalho, "status": status, "cobertura_percentual": cobertura}
@@ -0,0 +1,101 @@
+"""
+Execucao assincrona do motor de match (RF-14).
+
+A requisicao registra a ExecucaoMatch com status "queued" e devolve o id; um pool limitado
+de threads roda o pipeline com sessao propria. O proprio status da execucao e a maquina de
+estados: queued -> running -> completed|failed.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from db.db import get_session_local
+from models.Match_model import ExecucaoMatch
+from services.match_engine import MatchEngineService
+from services.match_incremental import rematch_produtor
+from services.worker_pool import FilaCheiaError, PoolTrabalho, get_pool
+
+logger = logging.getLogger(__name__)
+
+STATUS_FINAIS = ("completed", "failed")
+
+
+def get_match_pool() -> PoolTrabalho:
+    return get_pool(
+        "match",
+        max_workers=int(os.getenv("MATCH_WORKERS", "2")),
+        max_pendentes=int(os.getenv("MATCH_QUEUE_SIZE", "20")),
+    )
+
+
+def enfileirar_execucao(execucao_id: int, session_factory: Optional[Callable[[], Session]] = None):
+    """Agenda a execucao no pool. Levanta FilaCheiaError se o pool estiver no limite."""
+    return get_match_pool().submit(_executar_em_background, execucao_id, session_factory)
+
+
+def _executar_em_background(execucao_id: int, session_factory: Optional[Callable[[], Session]] = None) -> None:
+    db = (session_factory or get_session_local())()
+    try:
+        execucao = db.query(ExecucaoMatch).filter(ExecucaoMatch.id == execucao_id).first()
+        if not execucao or execucao.status in STATUS_FINAIS:
+            return
+        try:
+            MatchEngineService(db).executar(execucao)
+        except Exception:
+            # O motor ja marcou a execucao como failed e registrou o erro
+            logger.warning("Execucao de match %s terminou com falha", execucao_id)
+    finally:
+        db.close()
+
+
+def agendar_rematch_produtor(produtor_id: Optional[int], session_factory: Optional[Callable[[], Session]] = None):
+    """
+    Agenda o re-match incremental do produtor. Com a fila cheia apenas registra o aviso:
+    a proxima execucao completa (o cache ja foi invalidado pela escrita) atualiza o ranking.
+    """
+    if not produtor_id:
+        return None
+    try:
+        return get_match_pool().submit(_rematch_em_background, produtor_id, session_factory)
+    except FilaCheiaError:
+        logger.warning("Fila de match cheia; re-match do produtor %s adiado", produtor_id)
+        return None
+
+
+def _rematch_em_background(produtor_id: int, session_factory: Optional[Callable[[], Session]] = None) -> None:
+    db = (session_factory or get_session_local())()
+    try:
+        rematch_produtor(db, produtor_id)
+    finally:
+        db.close()
+
+
+def retomar_execucoes_pendentes(db: Session) -> int:
+    """
+    Na subida da aplicacao: execucoes "running" foram interrompidas com o processo anterior
+    e viram "failed"; as "queued" voltam para a fila. Retorna quantas foram reenfileiradas.
+    """
+    interrompidas = db.query(ExecucaoMatch).filter(ExecucaoMatch.status == "running").all()
+    for execucao in interrompidas:
+        _marcar_falha(execucao, "Execucao interrompida pelo reinicio do servidor")
+    db.commit()
+
+    pendentes = db.query(ExecucaoMatch).filter(ExecucaoMatch.status == "queued").order_by(ExecucaoMatch.id).all()
+    reenfileiradas = 0
+    for execucao in pendentes:
+        try:
+            enfileirar_execucao(execucao.id)
+            reenfileiradas += 1
+        except FilaCheiaError:
+            _marcar_falha(execucao, "Fila de match cheia ao retomar execucoes pendentes")
+    db.commit()
+    return reenfileiradas
+
+
+def _marcar_falha(execucao: ExecucaoMatch, motivo: str) -> None:
+    execucao.status = "failed"
+    execucao.finalizada_em = datetime.now()
+    execucao.parametros_json = {"error": motivo}
@@ -0,0 +1,284 @@
+"""
+Kernel colunar do score de match (RF-31).
+
+Os seis criterios sao calculados como arrays NumPy sobre todos os candidatos de uma vez;
+o MatchScoringService cuida de montar as colunas a partir do banco e de renderizar
+textos (justificativa, pontos fortes/fracos) apenas para as linhas efetivamente retornadas.
+A ordem das operacoes de ponto flutuante replica o calculo escalar original, para que o
+resultado por produtor seja identico ao de antes da vetorizacao.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+CRITERIOS = ("produto", "capacidade", "historico", "proximidade", "tempo_resposta", "certificacoes")
+IDX = {key: pos for pos, key in enumerate(CRITERIOS)}
+
+# Faixas de distancia (km) -> score de proximidade
+FAIXAS_DISTANCIA = ((50, 1.0), (150, 0.85), (300, 0.65), (600, 0.45))
+SCORE_DISTANCIA_MAXIMA = 0.25
+# Produto da demanda coberto so por um substituto (services/equivalencias) vale meio item
+PESO_SUBSTITUTO = 0.5
+
+
+@dataclass
+class ColunasCandidatos:
+    """Dados brutos por candidato, ja extraidos do banco, no formato colunar."""
+
+    n: int
+    # Produto x candidato (apenas produtos da demanda, na ordem de primeira aparicao)
+    produtos_cobertos: np.ndarray  # bool (n, P)
+    capacidade_por_produto: np.ndarray  # float (n, P)
+    tem_produtos: np.ndarray  # bool (n,) - portfolio nao vazio
+    tem_itens: np.ndarray  # bool (n,) - algum item de producao cadastrado
+    tem_capacidade: np.ndarray  # bool (n,) - alguma capacidade > 0 (em qualquer produto)
+    total_propostas: np.ndarray  # int (n,)
+    contratos_fechados: np.ndarray  # int (n,)
+    respostas: np.ndarray  # int (n,)
+    total_horas_resposta: np.ndarray  # float (n,)
+    documentos_avaliados: np.ndarray  # int (n,)
+    documentos_aprovados: np.ndarray  # int (n,)
+    perfil_completo: np.ndarray  # bool (n,)
+    latitude: np.ndarray  # float (n,), NaN quando ausente
+    longitude: np.ndarray  # float (n,), NaN quando ausente
+    produto_ids: List[int] = field(default_factory=list)  # id do produto de cada coluna
+    # bool (n, P): produto coberto apenas por substituto; None quando a demanda nao tem substitutos
+    produtos_substitutos: Optional[np.ndarray] = None
+
+
+@dataclass
+class RegraContexto:
+    """Ajuste de contexto resolvido: aplica `delta` e registra `nota` onde `mascara` for verdadeira."""
+
+    mascara: np.ndarray
+    delta: float
+    nota: str
+
+
+@dataclass
+class ScoreMatrix:
+    """Resultado numerico do kernel para N candidatos."""
+
+    pesos: np.ndarray  # (6,)
+    scores: np.ndarray  # (n, 6)
+    disponivel: np.ndarray  # bool (n, 6)
+    base: np.ndarray
+    ajuste: np.ndarray
+    total: np.ndarray
+    confianca: np.ndarray
+    regras_contexto: List[RegraContexto] = field(default_factory=list)
+    # Detalhes por criterio (valores ja arredondados como no payload)
+    total_itens_demanda: int = 0
+    itens_cobertos: np.ndarray = None
+    itens_substitutos: np.ndarray = None
+    quantidade_demandada: float = 0.0
+    quantidade_coberta: List[float] = None
+    total_propostas: np.ndarray = None
+    contratos_fechados: np.ndarray = None
+    distancia_km: List[Optional[float]] = None
+    tempo_medio_horas: List[Optional[float]] = None
+    documentos_avaliados: np.ndarray = None
+    documentos_aprovados: np.ndarray = None
+    # Colunas por produto, reaproveitadas pela formacao de grupos
+    produto_ids: List[int] = field(default_factory=list)
+    demanda_quantidades: np.ndarray = None
+    capacidade_por_produto: np.ndarray = None
+    produtos_cobertos: np.ndarray = None
+    tem_capacidade: np.ndarray = None
+
+    def __len__(self) -> int:
+        return len(self.total)
+
+    def score_percentual(self) -> List[float]:
+        # round() do Python (e nao np.round) para manter o mesmo arredondamento do payload
+        return [round(valor * 100, 2) for valor in self.total.tolist()]
+
+
+def calcular(
+    colunas: ColunasCandidatos,
+    demanda_quantidades: np.ndarray,
+    demanda_coords: Optional[Tuple[float, float]],
+    pesos: np.ndarray,
+    regras_contexto_fn=None,
+) -> ScoreMatrix:
+    """
+    Executa o kernel. `demanda_quantidades` tem a quantidade total por produto da demanda
+    (mesma ordem das colunas de produto). `regras_contexto_fn(scores)` devolve as regras de
+    contexto ja resolvidas para os scores calculados.
+    """
+    n = colunas.n
+    scores = np.zeros((n, len(CRITERIOS)), dtype=float)
+    disponivel = np.zeros((n, len(CRITERIOS)), dtype=bool)
+
+    # --- Compatibilidade de produto
+    total_itens = demanda_quantidades.shape[0]
+    itens_cobertos = colunas.produtos_cobertos.sum(axis=1).astype(int) if total_itens else np.zeros(n, dtype=int)
+    itens_substitutos = None
+    if total_itens:
+        disponivel[:, IDX["produto"]] = colunas.tem_produtos
+        if colunas.produtos_substitutos is None:
+            scores[:, IDX["produto"]] = np.where(colunas.tem_produtos, itens_cobertos / total_itens, 0.0)
+        else:
+            itens_substitutos = (colunas.produtos_substitutos & ~colunas.produtos_cobertos).sum(axis=1).astype(int)
+            equivalentes = itens_cobertos + PESO_SUBSTITUTO * itens_substitutos
+            scores[:, IDX["produto"]] = np.where(colunas.tem_produtos, equivalentes / total_itens, 0.0)
+            itens_substitutos = np.where(colunas.tem_produtos, itens_substitutos, 0)
+        itens_cobertos = np.where(colunas.tem_produtos, itens_cobertos, 0)
+
+    # --- Capacidade de entrega
+    demanda_total = 0
+    for quantidade in demanda_quantidades.tolist():
+        demanda_total += quantidade
+    cobertura = np.zeros(n, dtype=float)
+    for pos in range(total_itens):
+        cobertura = cobertura + np.minimum(demanda_quantidades[pos], colunas.capacidade_por_produto[:, pos])
+    if not demanda_total:
+        quantidade_coberta = [0.0] * n
+        quantidade_demandada = 0.0
+    else:
+        quantidade_demandada = round(demanda_total, 2)
+        com_capacidade = colunas.tem_capacidade
+        disponivel[:, IDX["capacidade"]] = com_capacidade
+        fallback = np.where(colunas.tem_itens, 0.4, 0.0)
+        scores[:, IDX["capacidade"]] = np.where(
+            com_capacidade, np.minimum(1.0, cobertura / demanda_total), fallback
+        )
+        # Sem capacidade declarada, assume cobrir a demanda para fins de match inicial
+        quantidade_coberta = [
+            round(valor, 2) if tem else quantidade_demandada
+            for valor, tem in zip(cobertura.tolist(), com_capacidade.tolist())
+        ]
+
+    # --- Historico de sucesso
+    com_historico = colunas.total_propostas > 0
+    disponivel[:, IDX["historico"]] = com_historico
+    scores[:, IDX["historico"]] = np.where(
+        com_historico,
+        colunas.contratos_fechados / np.maximum(colunas.total_propostas, 1),
+        0.35,
+    )
+
+    # --- Proximidade geografica
+    distancias = _haversine(demanda_coords, colunas.latitude, colunas.longitude)
+    com_distancia = ~np.isnan(distancias)
+    disponivel[:, IDX["proximidade"]] = com_distancia
+    score_dist = np.full(n, SCORE_DISTANCIA_MAXIMA)
+    for limite, valor in reversed(FAIXAS_DISTANCIA):
+        score_dist = np.where(distancias <= limite, valor, score_dist)
+    scores[:, IDX["proximidade"]] = np.where(com_distancia, score_dist, 0.5)
+    distancia_km = [None if np.isnan(valor) else round(valor, 1) for valor in distancias.tolist()]
+
+    # --- Tempo medio de resposta (decai linearmente ate 7 dias)
+    com_respostas = colunas.respostas > 0
+    media_horas = colunas.total_horas_resposta / np.maximum(colunas.respostas, 1)
+    disponivel[:, IDX["tempo_resposta"]] = com_respostas
+    scores[:, IDX["tempo_resposta"]] = np.where(
+        com_respostas, np.clip(1 - (media_horas / 168), 0.0, 1.0), 0.5
+    )
+    tempo_medio_horas = [
+        round(valor, 1) if tem else None for valor, tem in zip(media_horas.tolist(), com_respostas.tolist())
+    ]
+
+    # --- Certificacoes e selos
+    com_documentos = colunas.documentos_avaliados > 0
+    disponivel[:, IDX["certificacoes"]] = com_documentos
+    scores[:, IDX["certificacoes"]] = np.where(
+        com_documentos,
+        colunas.documentos_aprovados / np.maximum(colunas.documentos_avaliados, 1),
+        np.where(colunas.perfil_completo, 0.4, 0.25),
+    )
+
+    # --- Combinacao ponderada (soma sequencial, na ordem dos criterios)
+    base = np.zeros(n, dtype=float)
+    for pos in range(len(CRITERIOS)):
+        base = base + scores[:, pos] * pesos[pos]
+
+    regras = regras_contexto_fn(scores) if regras_contexto_fn else []
+    ajuste = np.zeros(n, dtype=float)
+    for regra in regras:
+        ajuste = ajuste + np.where(regra.mascara, regra.delta, 0.0)
+    total = np.clip(base + ajuste, 0.0, 1.0)
+
+    confianca = _confianca(scores, disponivel)
+
+    return ScoreMatrix(
+        pesos=pesos,
+        scores=scores,
+        disponivel=disponivel,
+        base=base,
+        ajuste=ajuste,
+        total=total,
+        confianca=confianca,
+        regras_contexto=regras,
+        total_itens_demanda=total_itens,
+        itens_cobertos=itens_cobertos,
+        itens_substitutos=itens_substitutos,
+        quantidade_demandada=quantidade_demandada,
+        quantidade_coberta=quantidade_coberta,
+        total_propostas=colunas.total_propostas,
+        contratos_fechados=colunas.contratos_fechados,
+        distancia_km=distancia_km,
+        tempo_medio_horas=tempo_medio_horas,
+        documentos_avaliados=colunas.documentos_avaliados,
+        documentos_aprovados=colunas.documentos_aprovados,
+        produto_ids=list(colunas.produto_ids),
+        demanda_quantidades=demanda_quantidades,
+        capacidade_por_produto=colunas.capacidade_por_produto,
+        produtos_cobertos=colunas.produtos_cobertos,
+        tem_capacidade=colunas.tem_capacidade,
+    )
+
+
+def detalhes(matriz: ScoreMatrix, linha: int) -> Dict[str, Dict[str, Any]]:
+    """Reconstroi os dicts de detalhes de cada criterio para uma linha da matriz."""
+    disp = matriz.disponivel[linha]
+    total_propostas = int(matriz.total_propostas[linha])
+    documentos = int(matriz.documentos_avaliados[linha])
+    produto = {
+        "total_itens_demanda": matriz.total_itens_demanda,
+        "itens_cobertos": int(matriz.itens_cobertos[linha]),
+    }
+    if matriz.itens_substitutos is not None:
+        produto["itens_por_substituto"] = int(matriz.itens_substitutos[linha])
+    return {
+        "produto": produto,
+        "capacidade": {
+            "quantidade_demandada": matriz.quantidade_demandada,
+            "quantidade_coberta": matriz.quantidade_coberta[linha],
+        },
+        "historico": {
+            "total_propostas": total_propostas,
+            "contratos_fechados": int(matriz.contratos_fechados[linha]) if total_propostas else 0,
+        },
+        "proximidade": {"distancia_km": matriz.distancia_km[linha] if disp[IDX["proximidade"]] else None},
+        "tempo_resposta": {"tempo_medio_horas": matriz.tempo_medio_horas[linha]},
+        "certificacoes": {
+            "documentos_avaliados": documentos,
+            "documentos_aprovados": int(matriz.documentos_aprovados[linha]) if documentos else 0,
+        },
+    }
+
+
+def _haversine(
+    origem: Optional[Tuple[float, float]], latitudes: np.ndarray, longitudes: np.ndarray
+) -> np.ndarray:
+    if not origem or latitudes.size == 0:
+        return np.full(latitudes.shape, np.nan)
+    lat1, lon1 = np.radians(origem[0]), np.radians(origem[1])
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return 6371 * c
+
+
+def _confianca(scores: np.ndarray, disponivel: np.ndarray) -> np.ndarray:
+    disponiveis = disponivel.sum(axis=1)
+    soma = np.zeros(scores.shape[0], dtype=float)
+    for pos in range(scores.shape[1]):
+        soma = soma + np.where(disponivel[:, pos], scores[:, pos], 0.0)
+    media = np.where(disponiveis > 0, soma / np.maximum(disponiveis, 1), 0.5)
+    base = disponiveis / scores.shape[1]
+    return np.clip((base * 0.7) + (media * 0.3), 0.2, 1.0)
@@ -0,0 +1,146 @@
+"""
+Execucao do motor de match para varias versoes de demanda de uma vez (RF-14).
+
+Varias versoes costumam ser publicadas juntas (uma por escola, por exemplo). Em vez de uma
+execucao completa por versao, os filtros de cada versao rodam so no banco (ids) e o resto e
+uma passada compartilhada: cada produtor elegivel para alguma versao e hidratado e tem as
+features e a capacidade comprometida lidas uma unica vez por lote, e o lote e pontuado
+contra cada versao que o aceita (uma matriz de score por versao sobre o mesmo lote). Cada
+versao ainda ganha sua propria ExecucaoMatch, com cache, estrategias e persistencia iguais
+as da execucao individual.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.Demanda_model import Demanda, VersaoDemanda
+from models.Match_model import ExecucaoMatch
+from schemas.Match_schema import MatchResultResponse
+from services import match_cache, match_capacidade, match_features, match_persistencia
+from services.match_diagnosticos import DiagnosticoMatch
+from services.match_engine import MatchEngineService
+from services.match_incremental import STATUS_DEMANDA_ABERTA
+from services.match_ranking import AcumuladorCapacidade, RankingTopK
+
+logger = logging.getLogger(__name__)
+
+
+def executar_lote(
+    db: Session,
+    versoes: List[VersaoDemanda],
+    trigger: str = "manual_api",
+    user_id: Optional[int] = None,
+    force: bool = False,
+) -> List[Tuple[ExecucaoMatch, Optional[MatchResultResponse]]]:
+    """
+    Executa o match das versoes, na ordem recebida. Versoes cujo resultado esta em cache
+    (e force=False) nao entram na passada. Uma versao que falha fica com a execucao "failed"
+    e resultado None, sem derrubar as demais.
+    """
+    engine = MatchEngineService(db)
+    saida: Dict[int, Tuple[ExecucaoMatch, Optional[MatchResultResponse]]] = {}
+    pendentes: List[Tuple[VersaoDemanda, ExecucaoMatch]] = []
+    for versao in versoes:
+        em_cache = None if force else engine.buscar_em_cache(versao.id)
+        if em_cache is not None:
+            saida[versao.id] = (em_cache, match_persistencia.carregar_resultado(db, em_cache))
+            continue
+        execucao = engine.criar_execucao(versao.id, trigger, user_id=user_id, status="running")
+        pendentes.append((versao, execucao))
+
+    if pendentes:
+        try:
+            # Chaves antes de ler os dados, como na execucao individual
+            for versao, execucao in pendentes:
+                execucao.chave_cache = match_cache.chave_execucao(db, versao.id, engine.parametros_cache(versao))
+            engine.diagnostico = DiagnosticoMatch().acompanhar(db)
+            try:
+                ranqueados = ranquear_lote(engine, [versao for versao, _ in pendentes])
+            finally:
+                engine.diagnostico.encerrar()
+            compartilhado = engine.diagnostico.como_dict()
+        except Exception as e:
+            db.rollback()
+            for _, execucao in pendentes:
+                execucao.status = "failed"
+                execucao.finalizada_em = datetime.now()
+                execucao.parametros_json = {"error": str(e)}
+            db.commit()
+            logger.error(f"Batch match execution failed: {e}")
+            raise
+
+        for versao, execucao in pendentes:
+            try:
+                resultado = engine.executar(
+                    execucao, ranqueado=ranqueados[versao.id], diagnostico_lote=compartilhado
+                )
+            except Exception:
+                # O motor ja marcou a execucao como failed e registrou o erro
+                resultado = None
+            saida[versao.id] = (execucao, resultado)
+
+    return [saida[versao.id] for versao in versoes]
+
+
+def ranquear_lote(
+    engine: MatchEngineService, versoes: List[VersaoDemanda]
+) -> Dict[int, Tuple[RankingTopK, AcumuladorCapacidade]]:
+    """Ranking e capacidade de cada versao, a partir de uma unica hidratacao dos produtores."""
+    elegiveis: Dict[int, set] = {}
+    sem_features: Dict[int, set] = {}
+    for versao in versoes:
+        elegiveis[versao.id], sem_features[versao.id] = set(), set()
+        for lote_ids, lote_sem_features in engine._lotes_medidos(engine._lotes_ids(versao)):
+            elegiveis[versao.id].update(lote_ids)
+            sem_features[versao.id].update(lote_sem_features)
+
+    ranqueados = {versao.id: (RankingTopK(engine.TOP_INDIVIDUAIS), AcumuladorCapacidade()) for versao in versoes}
+    todos = sorted(set().union(*elegiveis.values()))
+    for inicio in range(0, len(todos), engine.TAMANHO_LOTE):
+        with engine.diagnostico.etapa("filtro"):
+            lote = engine._carregar_lote(todos[inicio:inicio + engine.TAMANHO_LOTE])
+        engine.diagnostico.contar("filtro", "candidatos", len(lote))
+        with engine.diagnostico.etapa("score"):
+            features = match_features.carregar_features(engine.db, [p.id for p in lote])
+            ledger = match_capacidade.obter(engine.db, produtores=lote)
+        for versao in versoes:
+            with engine.diagnostico.etapa("filtro"):
+                produtores = engine._descartar_fora_do_raio(
+                    versao, [p for p in lote if p.id in elegiveis[versao.id]], sem_features[versao.id]
+                )
+            # A posicao do lote na uniao (ordem de id) preserva o desempate da execucao individual
+            ranking, capacidade = ranqueados[versao.id]
+            engine.pontuar_produtores(
+                versao, produtores, inicio, ranking, capacidade, features=features, ledger=ledger
+            )
+    return ranqueados
+
+
+def versoes_abertas(db: Session) -> List[VersaoDemanda]:
+    """Versao mais recente de cada demanda aberta, em ordem de id."""
+    ultimas = (
+        db.query(func.max(VersaoDemanda.id))
+        .join(Demanda, Demanda.id == VersaoDemanda.demanda_id)
+        .filter(Demanda.status.in_(STATUS_DEMANDA_ABERTA))
+        .group_by(VersaoDemanda.demanda_id)
+    )
+    return db.query(VersaoDemanda).filter(VersaoDemanda.id.in_(ultimas)).order_by(VersaoDemanda.id).all()
+
+
+def alocar_global(db: Session, versoes: List[VersaoDemanda]) -> match_capacidade.PlanoAlocacao:
+    """
+    Distribui a capacidade livre entre todas as versoes ao mesmo tempo (fluxo de custo
+    minimo), em vez de cada execucao supor a capacidade inteira dos mesmos produtores.
+    Candidatos e scores vem da passada compartilhada; o ledger e uma copia do ledger do
+    processo (match_capacidade.obter), so com os candidatos. Nada e gravado.
+    """
+    engine = MatchEngineService(db)
+    ranqueados = ranquear_lote(engine, versoes)
+    produtor_ids = set()
+    for _, capacidade in ranqueados.values():
+        produtor_ids.update(capacidade.ordenado()[0].tolist())
+    ledger = match_capacidade.obter(db, sorted(produtor_ids))
+    return match_capacidade.alocar(ledger, [(versao, ranqueados[versao.id][1]) for versao in versoes])
@@ -0,0 +1,265 @@
+"""
+Persistencia em lote do resultado do motor de match (RF-14).
+
+Uma execucao grava, na mesma transacao e com INSERTs de varias linhas (executemany):
+
+- um CandidatoMatch por opcao individual, com payload compacto (justificativa e quantidade);
+- GrupoFornecedor, MembroGrupo e AlocacaoGrupo de cada grupo sugerido, mais o CandidatoMatch
+  do grupo (payload compacto: grupo_id, posicao e score/quantidade de cada membro).
+
+Antes de gravar, os grupos "forming" que execucoes anteriores sugeriram para a mesma versao
+sao apagados (com membros e alocacoes) e os candidatos deles viram "superseded": cada versao
+fica so com as sugestoes da execucao mais recente. Grupos ja assumidos, ou "forming" com
+proposta vinculada, ficam.
+
+ExecucaoMatch.parametros_json guarda apenas o cabecalho do resultado. O MatchResultResponse
+completo e remontado por carregar_resultado a partir dessas linhas, o que tambem reflete as
+atualizacoes incrementais do ranking (services/match_incremental).
+"""
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import delete, exists, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.Demanda_model import ItemDemanda, VersaoDemanda
+from models.Match_model import AlocacaoGrupo, CandidatoMatch, ExecucaoMatch, GrupoFornecedor, MembroGrupo
+from models.PerfilProdutor_model import PerfilProdutor
+from models.Proposta_model import Proposta
+from models.User_model import User
+from schemas.Match_schema import AlocacaoItemOption, MatchOption, MatchOptionProdutor, MatchResultResponse
+
+FORMATO_COMPACTO = "compacto"
+JUSTIFICATIVA_MEMBRO = "Membro de grupo complementar"
+
+
+def status_resultado(individual_completo: bool, tem_grupo: bool, tem_opcoes: bool) -> Tuple[str, float]:
+    """Status e cobertura do cabecalho do resultado, a partir das opcoes que restaram."""
+    if individual_completo:
+        status = "match_encontrado"
+    elif tem_grupo:
+        status = "grupo_formado"
+    elif tem_opcoes:
+        status = "parcial"
+    else:
+        status = "sem_match"
+    return status, 100.0 if status in ("match_encontrado", "grupo_formado") else 0.0
+
+
+def linha_candidato_individual(execucao_id: int, opcao: MatchOptionProdutor) -> Dict[str, Any]:
+    return {
+        "execucao_match_id": execucao_id,
+        "tipo_candidato": "single",
+        "produtor_id": opcao.id,
+        "score_total": opcao.score,
+        "explicacao_json": {"justificativa": opcao.justificativa, "quantidade": opcao.quantidade_fornecida},
+        "percentual_cobertura": opcao.percentual_da_demanda,
+        "status": "active",
+    }
+
+
+def persistir_resultado(
+    db: Session, execucao: ExecucaoMatch, versao: VersaoDemanda, resultado: MatchResultResponse
+) -> None:
+    """Grava candidatos, grupos, membros e alocacoes em lote, sem commit."""
+    _descartar_grupos_sugeridos(db, execucao, versao)
+    candidatos: List[Dict[str, Any]] = []
+    grupos: List[MatchOption] = []
+    for opcao in resultado.opcoes:
+        if opcao.tipo == "individual":
+            candidatos.extend(linha_candidato_individual(execucao.id, p) for p in opcao.produtores)
+        elif opcao.tipo == "grupo":
+            grupos.append(opcao)
+
+    membros: List[Dict[str, Any]] = []
+    alocacoes: List[Dict[str, Any]] = []
+    if grupos:
+        grupo_ids = db.scalars(
+            insert(GrupoFornecedor).returning(GrupoFornecedor.id, sort_by_parameter_order=True),
+            [
+                {
+                    "versao_demanda_id": versao.id,
+                    "criado_de_match_id": execucao.id,
+                    "status": "forming",
+                    "nome_grupo": f"Grupo sugerido {posicao + 1}",
+                }
+                for posicao in range(len(grupos))
+            ],
+        ).all()
+
+        for posicao, (grupo_id, opcao) in enumerate(zip(grupo_ids, grupos)):
+            for indice, membro in enumerate(opcao.produtores):
+                membros.append({
+                    "grupo_id": grupo_id,
+                    "produtor_id": membro.id,
+                    "papel": "leader" if indice == 0 else "member",
+                })
+                alocacoes.extend(
+                    {
+                        "grupo_id": grupo_id,
+                        "item_demanda_id": alocacao.item_demanda_id,
+                        "produtor_id": membro.id,
+                        "quantidade_alocada": alocacao.quantidade,
+                        "unidade_id": alocacao.unidade_id,
+                    }
+                    for alocacao in membro.alocacoes
+                )
+            candidatos.append({
+                "execucao_match_id": execucao.id,
+                "tipo_candidato": "group",
+                "produtor_id": None,
+                "score_total": opcao.score_agregado,
+                "explicacao_json": {
+                    "grupo_id": grupo_id,
+                    "posicao": posicao,
+                    # [produtor_id, score, quantidade_fornecida, percentual_da_demanda]
+                    "membros": [
+                        [m.id, m.score, m.quantidade_fornecida, m.percentual_da_demanda] for m in opcao.produtores
+                    ],
+                },
+                "percentual_cobertura": 100.0,
+                "status": "active",
+            })
+
+    for modelo, linhas in ((MembroGrupo, membros), (AlocacaoGrupo, alocacoes), (CandidatoMatch, candidatos)):
+        if linhas:
+            db.execute(insert(modelo), linhas)
+
+    execucao.parametros_json = {
+        "formato": FORMATO_COMPACTO,
+        "demanda_id": resultado.demanda_id,
+        "status": resultado.status,
+        "cobertura_percentual": resultado.cobertura_percentual,
+        "alternativas": resultado.alternativas,
+        "substituicoes_sugeridas": resultado.substituicoes_sugeridas,
+    }
+
+
+def _descartar_grupos_sugeridos(db: Session, execucao: ExecucaoMatch, versao: VersaoDemanda) -> None:
+    """Apaga os grupos "forming" de execucoes anteriores da versao, sem commit."""
+    grupo_ids = set(db.scalars(
+        select(GrupoFornecedor.id).where(
+            GrupoFornecedor.versao_demanda_id == versao.id,
+            GrupoFornecedor.status == "forming",
+            GrupoFornecedor.criado_de_match_id != execucao.id,
+            ~exists().where(Proposta.grupo_id == GrupoFornecedor.id),
+        )
+    ))
+    if not grupo_ids:
+        return
+
+    candidatos = db.execute(
+        select(CandidatoMatch.id, CandidatoMatch.explicacao_json)
+        .join(ExecucaoMatch, ExecucaoMatch.id == CandidatoMatch.execucao_match_id)
+        .where(
+            ExecucaoMatch.versao_demanda_id == versao.id,
+            CandidatoMatch.tipo_candidato == "group",
+            CandidatoMatch.status == "active",
+        )
+    ).all()
+    substituidos = [id_ for id_, explicacao in candidatos if (explicacao or {}).get("grupo_id") in grupo_ids]
+    if substituidos:
+        db.execute(update(CandidatoMatch).where(CandidatoMatch.id.in_(substituidos)).values(status="superseded"))
+
+    # Direto nas tabelas: grupos "forming" nao consomem capacidade nem entram na marca d'agua,
+    # e o DELETE em massa do ORM invalidaria o ledger de capacidade inteiro (match_capacidade)
+    for tabela in (AlocacaoGrupo.__table__, MembroGrupo.__table__):
+        db.execute(delete(tabela).where(tabela.c.grupo_id.in_(grupo_ids)))
+    tabela = GrupoFornecedor.__table__
+    db.execute(delete(tabela).where(tabela.c.id.in_(grupo_ids)))
+
+
+def carregar_resultado(db: Session, execucao: ExecucaoMatch) -> MatchResultResponse:
+    """Remonta o MatchResultResponse de uma execucao concluida a partir das linhas gravadas."""
+    cabecalho = execucao.parametros_json or {}
+    if cabecalho.get("formato") != FORMATO_COMPACTO:
+        # Execucoes anteriores guardavam a resposta inteira
+        return MatchResultResponse.model_validate(cabecalho)
+
+    ativos = (
+        db.query(CandidatoMatch)
+        .filter(CandidatoMatch.execucao_match_id == execucao.id, CandidatoMatch.status == "active")
+        .order_by(CandidatoMatch.id)
+        .all()
+    )
+    individuais = sorted(
+        (c for c in ativos if c.tipo_candidato == "single"), key=lambda c: (-float(c.score_total), c.id)
+    )
+    grupos = sorted(
+        (c for c in ativos if c.tipo_candidato == "group"), key=lambda c: (c.explicacao_json["posicao"], c.id)
+    )
+
+    produtor_ids = {c.produtor_id for c in individuais}
+    for grupo in grupos:
+        produtor_ids.update(membro[0] for membro in grupo.explicacao_json["membros"])
+    nomes = {}
+    if produtor_ids:
+        nomes = dict(
+            db.query(PerfilProdutor.id, User.name)
+            .outerjoin(User, User.id == PerfilProdutor.user_id)
+            .filter(PerfilProdutor.id.in_(produtor_ids))
+            .all()
+        )
+
+    alocacoes: Dict[tuple, List[AlocacaoItemOption]] = {}
+    grupo_ids = [grupo.explicacao_json["grupo_id"] for grupo in grupos]
+    if grupo_ids:
+        for alocacao, produto_id in (
+            db.query(AlocacaoGrupo, ItemDemanda.produto_id)
+            .join(ItemDemanda, ItemDemanda.id == AlocacaoGrupo.item_demanda_id)
+            .filter(AlocacaoGrupo.grupo_id.in_(grupo_ids))
+            .order_by(AlocacaoGrupo.id)
+        ):
+            alocacoes.setdefault((alocacao.grupo_id, alocacao.produtor_id), []).append(
+                AlocacaoItemOption(
+                    item_demanda_id=alocacao.item_demanda_id,
+                    produto_id=produto_id,
+                    quantidade=float(alocacao.quantidade_alocada),
+                    unidade_id=alocacao.unidade_id,
+                )
+            )
+
+    def nome(produtor_id: int) -> str:
+        return nomes.get(produtor_id) or f"Produtor {produtor_id}"
+
+    opcoes: List[MatchOption] = []
+    for candidato in individuais:
+        score = float(candidato.score_total)
+        opcoes.append(MatchOption(
+            tipo="individual",
+            score_agregado=score,
+            produtores=[MatchOptionProdutor(
+                id=candidato.produtor_id,
+                nome=nome(candidato.produtor_id),
+                score=score,
+                quantidade_fornecida=candidato.explicacao_json["quantidade"],
+                percentual_da_demanda=float(candidato.percentual_cobertura),
+                justificativa=candidato.explicacao_json["justificativa"],
+            )],
+        ))
+    for candidato in grupos:
+        grupo_id = candidato.explicacao_json["grupo_id"]
+        opcoes.append(MatchOption(
+            tipo="grupo",
+            score_agregado=float(candidato.score_total),
+            produtores=[
+                MatchOptionProdutor(
+                    id=produtor_id,
+                    nome=nome(produtor_id),
+                    score=score,
+                    quantidade_fornecida=quantidade,
+                    percentual_da_demanda=percentual,
+                    justificativa=JUSTIFICATIVA_MEMBRO,
+                    alocacoes=alocacoes.get((grupo_id, produtor_id), []),
+                )
+                for produtor_id, score, quantidade, percentual in candidato.explicacao_json["membros"]
+            ],
+        ))
+
+    return MatchResultResponse(
+        demanda_id=cabecalho["demanda_id"],
+        status=cabecalho["status"],
+        cobertura_percentual=cabecalho["cobertura_percentual"],
+        opcoes=opcoes,
+        alternativas=cabecalho.get("alternativas", []),
+        substituicoes_sugeridas=cabecalho.get("substituicoes_sugeridas", []),
+    )
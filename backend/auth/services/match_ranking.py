@@ -0,0 +1,170 @@
+"""
+Ranking em fluxo do motor de match (RF-14).
+
+Os candidatos chegam em lotes (cursor do lado do servidor); cada lote e pontuado pelo kernel
+e depois descartado. Ficam em memoria apenas:
+
+- RankingTopK: os K melhores candidatos (heap limitado), cada um com a referencia para sua
+  linha na ScoreMatrix do lote, usada para renderizar a justificativa so de quem e retornado;
+- AcumuladorCapacidade: para cada candidato com alguma capacidade nos produtos da demanda, o
+  id, o score final e a capacidade por produto, que e o que a formacao de grupos consome,
+  alem da soma das capacidades por produto.
+
+Os dois podem ser combinados (combinar), para juntar rankings parciais de varios lotes.
+A ordem de desempate e a posicao global do candidato no fluxo (`ordem`), o que reproduz a
+ordenacao estavel por score sobre a lista completa.
+"""
+import heapq
+from dataclasses import dataclass, replace
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models.PerfilProdutor_model import PerfilProdutor
+from services import group_solver
+from services.match_kernel import ScoreMatrix
+
+
+@dataclass
+class CandidatoPontuado:
+    """
+    Candidato ja pontuado; `linha` aponta para a linha correspondente em `matriz`.
+    Destacado (vindo de outro processo), nao tem produtor nem matriz e traz em `opcao` a
+    opcao individual ja renderizada (ou None, se nao cobre a demanda).
+    """
+
+    produtor: Optional[PerfilProdutor]
+    final_score: float
+    quantidade_coberta: float
+    linha: int
+    matriz: Optional[ScoreMatrix] = None
+    ordem: int = 0  # posicao global no fluxo de candidatos (desempate)
+    opcao: Any = None
+
+
+class RankingTopK:
+    """Heap limitado com os K melhores candidatos (maior score; no empate, menor ordem)."""
+
+    def __init__(self, k: int):
+        self.k = max(0, k)
+        # Min-heap pela chave (score, -ordem): o topo e o pior dos retidos
+        self._heap: List[Tuple[Tuple[float, int], CandidatoPontuado]] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def oferecer(self, candidato: CandidatoPontuado) -> None:
+        if self.k == 0:
+            return
+        item = ((candidato.final_score, -candidato.ordem), candidato)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def oferecer_lote(
+        self,
+        produtores: Sequence[PerfilProdutor],
+        final_scores: np.ndarray,
+        matriz: ScoreMatrix,
+        ordem_inicial: int,
+    ) -> None:
+        """Oferece so os K melhores do lote (ordenacao estavel no NumPy, sem passar todos pelo heap)."""
+        if self.k == 0 or not len(produtores):
+            return
+        for linha in np.argsort(-final_scores, kind="stable")[:self.k].tolist():
+            self.oferecer(CandidatoPontuado(
+                produtor=produtores[linha],
+                final_score=float(final_scores[linha]),
+                quantidade_coberta=matriz.quantidade_coberta[linha],
+                linha=linha,
+                matriz=matriz,
+                ordem=ordem_inicial + linha,
+            ))
+
+    def combinar(self, outro: "RankingTopK") -> None:
+        for _, candidato in outro._heap:
+            self.oferecer(candidato)
+
+    def destacar(self, renderizar: Callable[[CandidatoPontuado], Any]) -> "RankingTopK":
+        """Copia serializavel: sem ORM nem matriz, com a opcao de cada candidato ja renderizada."""
+        destacado = RankingTopK(self.k)
+        destacado._heap = [
+            (chave, replace(candidato, produtor=None, matriz=None, opcao=renderizar(candidato)))
+            for chave, candidato in self._heap
+        ]
+        return destacado
+
+    def melhores(self) -> List[CandidatoPontuado]:
+        return [candidato for _, candidato in sorted(self._heap, key=lambda item: (-item[0][0], -item[0][1]))]
+
+
+class AcumuladorCapacidade:
+    """
+    Capacidade por produto dos candidatos uteis para grupos. Sem capacidade declarada, o
+    candidato e tratado como capaz de cobrir os produtos do seu portfolio, como no score.
+    """
+
+    def __init__(self):
+        self.produto_ids: List[int] = []
+        self.demanda: Optional[np.ndarray] = None
+        self.soma_por_produto: Optional[np.ndarray] = None
+        self._ids: List[np.ndarray] = []
+        self._scores: List[np.ndarray] = []
+        self._ordens: List[np.ndarray] = []
+        self._capacidades: List[np.ndarray] = []
+
+    def adicionar(
+        self, matriz: ScoreMatrix, produtor_ids: Sequence[int], final_scores: np.ndarray, ordem_inicial: int
+    ) -> None:
+        if self.demanda is None:
+            self.produto_ids = list(matriz.produto_ids)
+            self.demanda = matriz.demanda_quantidades
+            self.soma_por_produto = np.zeros(len(self.produto_ids), dtype=float)
+        if not len(produtor_ids) or not self.produto_ids:
+            return
+
+        assumida = matriz.produtos_cobertos * matriz.demanda_quantidades
+        capacidades = np.where(matriz.tem_capacidade[:, None], matriz.capacidade_por_produto, assumida)
+        uteis = np.flatnonzero(capacidades.sum(axis=1) > 0)
+        if uteis.size == 0:
+            return
+        self._ids.append(np.asarray(produtor_ids, dtype=np.int64)[uteis])
+        self._scores.append(np.asarray(final_scores, dtype=float)[uteis])
+        self._ordens.append(uteis + ordem_inicial)
+        self._capacidades.append(capacidades[uteis])
+        self.soma_por_produto = self.soma_por_produto + capacidades[uteis].sum(axis=0)
+
+    def combinar(self, outro: "AcumuladorCapacidade") -> None:
+        if outro.demanda is None:
+            return
+        if self.demanda is None:
+            self.produto_ids = list(outro.produto_ids)
+            self.demanda = outro.demanda
+            self.soma_por_produto = np.zeros(len(self.produto_ids), dtype=float)
+        self._ids.extend(outro._ids)
+        self._scores.extend(outro._scores)
+        self._ordens.extend(outro._ordens)
+        self._capacidades.extend(outro._capacidades)
+        self.soma_por_produto = self.soma_por_produto + outro.soma_por_produto
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._ids)
+
+    def cobre_demanda(self) -> bool:
+        """Soma de todos os candidatos cobre cada produto? (senao nenhum grupo e viavel)"""
+        return self.demanda is not None and bool(
+            np.all(self.soma_por_produto >= self.demanda - group_solver.TOLERANCIA)
+        )
+
+    def ordenado(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(produtor_ids, scores, capacidades) do maior score para o menor, desempate pela ordem."""
+        if not self._ids:
+            vazio = np.zeros((0, len(self.produto_ids)), dtype=float)
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=float), vazio
+        ids = np.concatenate(self._ids)
+        scores = np.concatenate(self._scores)
+        ordens = np.concatenate(self._ordens)
+        capacidades = np.concatenate(self._capacidades)
+        posicoes = np.lexsort((ordens, -scores))
+        return ids[posicoes], scores[posicoes], capacidades[posicoes]
@@ -1,19 +1,16 @@
-import json
-import math
 from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 from sqlalchemy.orm import Session
 
-from models.Contrato_model import Contrato
 from models.Demanda_model import VersaoDemanda
-from models.Documento_model import DocumentoProdutor
 from models.PerfilProdutor_model import PerfilProdutor
-from models.Producao_model import ItemProducao
-from models.Proposta_model import ConfirmacaoParticipante, Proposta
 from schemas.Match_schema import MatchContextInput
+from services import equivalencias, janelas_entrega, match_capacidade, match_features, match_kernel, perfis_pesos
+from services.geo_index import haversine_km
 
 
 @dataclass
@@ -33,14 +30,7 @@ class CriterionResult:
 class MatchScoringService:
     """Calcula o score de correspondencia entre um produtor e uma demanda."""
 
-    FIELD_MAP = {
-        "produto": "compatibilidade_produto",
-        "capacidade": "capacidade_entrega",
-        "historico": "historico_sucesso",
-        "proximidade": "proximidade_geografica",
-        "tempo_resposta": "tempo_resposta",
-        "certificacoes": "certificacoes",
-    }
+    FIELD_MAP = perfis_pesos.CAMPOS
 
     def __init__(self, db: Session):
         self.db = db
@@ -50,39 +40,88 @@ class MatchScoringService:
         versao_demanda: VersaoDemanda,
         produtor: PerfilProdutor,
         contexto: Optional[MatchContextInput] = None,
+        plano: Optional[perfis_pesos.PlanoScore] = None,
     ) -> Dict[str, object]:
-        criterios = self._build_base_criterios()
+        return self.calculate_many(versao_demanda, [produtor], contexto, plano)[0]
 
-        demanda_itens = versao_demanda.itens or []
-        itens_produtor = produtor.itens_producao or []
+    def calculate_many(
+        self,
+        versao_demanda: VersaoDemanda,
+        produtores: List[PerfilProdutor],
+        contexto: Optional[MatchContextInput] = None,
+        plano: Optional[perfis_pesos.PlanoScore] = None,
+    ) -> List[Dict[str, object]]:
+        """
+        Versao em lote de calculate: agrega historico, tempo de resposta e documentos de
+        todos os produtores em poucas consultas GROUP BY e calcula o score a partir de
+        lookups em memoria. Retorna os mesmos dicts de calculate, na ordem recebida.
+        """
+        if not produtores:
+            return []
+
+        matriz = self.score_batch(versao_demanda, produtores, contexto, plano=plano)
+        return [
+            self.render(versao_demanda, produtor, matriz, linha, contexto)
+            for linha, produtor in enumerate(produtores)
+        ]
 
-        criterios["produto"].score, criterios["produto"].available, criterios["produto"].details = (
-            self._score_produtos(demanda_itens, itens_produtor)
-        )
-        criterios["capacidade"].score, criterios["capacidade"].available, criterios["capacidade"].details = (
-            self._score_capacidade(demanda_itens, itens_produtor)
-        )
-        criterios["historico"].score, criterios["historico"].available, criterios["historico"].details = (
-            self._score_historico(produtor.id)
-        )
-        criterios["proximidade"].score, criterios["proximidade"].available, criterios["proximidade"].details = (
-            self._score_proximidade(versao_demanda, produtor)
-        )
-        criterios["tempo_resposta"].score, criterios["tempo_resposta"].available, criterios["tempo_resposta"].details = (
-            self._score_tempo_resposta(produtor.id)
-        )
-        criterios["certificacoes"].score, criterios["certificacoes"].available, criterios["certificacoes"].details = (
-            self._score_certificacoes(produtor)
+    def score_batch(
+        self,
+        versao_demanda: VersaoDemanda,
+        produtores: List[PerfilProdutor],
+        contexto: Optional[MatchContextInput] = None,
+        features: Optional[Dict[int, Any]] = None,
+        ledger: Optional[match_capacidade.LedgerCapacidade] = None,
+        plano: Optional[perfis_pesos.PlanoScore] = None,
+        fecho: Optional[equivalencias.FechoEquivalencias] = None,
+    ) -> match_kernel.ScoreMatrix:
+        """
+        Calcula apenas a parte numerica do score para todos os candidatos (kernel NumPy).
+        Textos de justificativa ficam para render(), chamado so para quem for retornado.
+        `features` (match_features.carregar_features) e `ledger` (capacidade ja
+        reservada/alocada por periodo, match_capacidade) podem vir prontos quando o mesmo lote
+        de produtores e pontuado contra varias versoes. `plano` (services/perfis_pesos) traz os
+        pesos e as regras ja compiladas; sem ele, valem os pesos padrao. `fecho` (fecho das
+        equivalencias) vem pronto de quem pontua em outro processo; sem ele, sai do cache.
+        """
+        colunas, demanda_quantidades = self._montar_colunas(versao_demanda, produtores, features, ledger, fecho)
+        demanda_coords = self._extract_coords(getattr(versao_demanda.demanda, "local_entrega_json", None))
+        plano = (plano or perfis_pesos.PLANO_PADRAO).com_contexto(contexto)
+        return match_kernel.calcular(
+            colunas,
+            demanda_quantidades,
+            demanda_coords,
+            plano.pesos,
+            regras_contexto_fn=plano.avaliar,
         )
 
-        base_score = sum(crit.contribution for crit in criterios.values())
-        contexto_ajustes_valor, contexto_notas = self._aplicar_contexto(contexto, criterios)
-        total_score = max(0.0, min(1.0, base_score + contexto_ajustes_valor))
+    def render_justificativa(self, matriz: match_kernel.ScoreMatrix, linha: int) -> str:
+        """So a justificativa de uma linha da matriz (sem breakdown nem pontos fortes/fracos)."""
+        criterios = self._build_base_criterios(matriz.pesos)
+        for key, crit in criterios.items():
+            crit.score = float(matriz.scores[linha, match_kernel.IDX[key]])
+        return self._build_justificativa(criterios, float(matriz.total[linha]))
+
+    def render(
+        self,
+        versao_demanda: VersaoDemanda,
+        produtor: PerfilProdutor,
+        matriz: match_kernel.ScoreMatrix,
+        linha: int,
+        contexto: Optional[MatchContextInput] = None,
+    ) -> Dict[str, object]:
+        """Monta o payload completo (breakdown e textos) de uma linha da matriz."""
+        criterios = self._build_base_criterios(matriz.pesos)
+        detalhes = match_kernel.detalhes(matriz, linha)
+        for key, crit in criterios.items():
+            pos = match_kernel.IDX[key]
+            crit.score = float(matriz.scores[linha, pos])
+            crit.available = bool(matriz.disponivel[linha, pos])
+            crit.details = detalhes[key]
 
-        confidence = self._calcular_confianca(criterios)
-        justification = self._build_justificativa(criterios, total_score)
-        strengths = self._build_pontos_fortes(criterios)
-        weaknesses = self._build_pontos_fracos(criterios)
+        total_score = float(matriz.total[linha])
+        confidence = float(matriz.confianca[linha])
+        contexto_notas = [regra.nota for regra in matriz.regras_contexto if regra.mascara[linha]]
 
         breakdown = {
             self.FIELD_MAP[key]: {
@@ -100,116 +139,172 @@ class MatchScoringService:
             "versao_demanda_id": versao_demanda.id,
             "produtor_id": produtor.id,
             "score_percentual": round(total_score * 100, 2),
-            "justificativa": justification,
-            "pontos_fortes": strengths,
-            "pontos_fracos": weaknesses,
+            "justificativa": self._build_justificativa(criterios, total_score),
+            "pontos_fortes": self._build_pontos_fortes(criterios),
+            "pontos_fracos": self._build_pontos_fracos(criterios),
             "confianca_percentual": round(confidence * 100, 2),
             "confianca_label": self._confidence_label(confidence),
             "contexto_ajustes": contexto_notas,
             "breakdown": breakdown,
             "pesos_utilizados": {self.FIELD_MAP[k]: crit.weight for k, crit in criterios.items()},
             "metadados": {
-                "itens_demanda": len(demanda_itens),
-                "itens_produtor": len(itens_produtor),
+                "itens_demanda": len(versao_demanda.itens or []),
+                "itens_produtor": len(produtor.itens_producao or []),
                 "contexto_fornecido": bool(contexto),
             },
         }
 
-    # --- Scoring helpers -------------------------------------------------
-
-    def _build_base_criterios(self) -> Dict[str, CriterionResult]:
-        return {
-            "produto": CriterionResult("produto", "Compatibilidade de produto", 0.28),
-            "capacidade": CriterionResult("capacidade", "Capacidade de entrega", 0.22),
-            "historico": CriterionResult("historico", "Historico de sucesso", 0.18),
-            "proximidade": CriterionResult("proximidade", "Proximidade geografica", 0.12),
-            "tempo_resposta": CriterionResult("tempo_resposta", "Tempo medio de resposta", 0.10),
-            "certificacoes": CriterionResult("certificacoes", "Certificacoes e selos", 0.10),
-        }
-
-    def _score_produtos(
-        self, demanda_itens, itens_produtor: List[ItemProducao]
-    ) -> Tuple[float, bool, Dict[str, float]]:
-        demand_products = {item.produto_id for item in demanda_itens if getattr(item, "produto_id", None)}
-        producer_products = {item.produto_id for item in itens_produtor if getattr(item, "produto_id", None)}
-
-        if not demand_products:
-            return 0.0, False, {"total_itens_demanda": 0, "itens_cobertos": 0}
-        if not producer_products:
-            return 0.0, False, {"total_itens_demanda": len(demand_products), "itens_cobertos": 0}
-
-        matched = len(demand_products.intersection(producer_products))
-        score = matched / len(demand_products)
-        details = {"total_itens_demanda": len(demand_products), "itens_cobertos": matched}
-        return score, True, details
+    # --- Column extraction -----------------------------------------------
 
-    def _score_capacidade(
-        self, demanda_itens, itens_produtor: List[ItemProducao]
-    ) -> Tuple[float, bool, Dict[str, float]]:
+    def _montar_colunas(
+        self,
+        versao_demanda: VersaoDemanda,
+        produtores: List[PerfilProdutor],
+        features: Optional[Dict[int, Any]] = None,
+        ledger: Optional[match_capacidade.LedgerCapacidade] = None,
+        fecho: Optional[equivalencias.FechoEquivalencias] = None,
+    ) -> Tuple[match_kernel.ColunasCandidatos, np.ndarray]:
         demanda_por_produto: Dict[int, float] = {}
-        for item in demanda_itens:
+        parcelas_por_produto: Dict[int, List[janelas_entrega.Parcela]] = {}
+        for item in versao_demanda.itens or []:
             if not getattr(item, "produto_id", None):
                 continue
-            demanda_por_produto[item.produto_id] = demanda_por_produto.get(item.produto_id, 0.0) + self._as_float(
-                getattr(item, "quantidade", 0)
+            quantidade = self._as_float(getattr(item, "quantidade", 0))
+            demanda_por_produto[item.produto_id] = demanda_por_produto.get(item.produto_id, 0.0) + quantidade
+            parcelas_por_produto.setdefault(item.produto_id, []).extend(
+                janelas_entrega.parcelas_entrega(getattr(item, "cronograma_entrega_json", None), quantidade)
             )
+        posicao = {produto_id: pos for pos, produto_id in enumerate(demanda_por_produto)}
+
+        # Substitutos de produtos da demanda (fecho em cache, services/equivalencias): produto
+        # ofertado -> [(produto demandado, unidades demandadas por unidade ofertada)].
+        # Produto que a propria demanda pede nao entra como substituto de outro.
+        if fecho is None:
+            fecho = equivalencias.obter(self.db)
+        substituicoes: Dict[int, List[Tuple[int, float]]] = {}
+        for produto_id in posicao:
+            for ofertado_id, fator in fecho.substitutos(produto_id).items():
+                if ofertado_id not in posicao:
+                    substituicoes.setdefault(ofertado_id, []).append((produto_id, fator))
+
+        n = len(produtores)
+        colunas = match_kernel.ColunasCandidatos(
+            n=n,
+            produtos_cobertos=np.zeros((n, len(posicao)), dtype=bool),
+            capacidade_por_produto=np.zeros((n, len(posicao)), dtype=float),
+            tem_produtos=np.zeros(n, dtype=bool),
+            tem_itens=np.zeros(n, dtype=bool),
+            tem_capacidade=np.zeros(n, dtype=bool),
+            total_propostas=np.zeros(n, dtype=int),
+            contratos_fechados=np.zeros(n, dtype=int),
+            respostas=np.zeros(n, dtype=int),
+            total_horas_resposta=np.zeros(n, dtype=float),
+            documentos_avaliados=np.zeros(n, dtype=int),
+            documentos_aprovados=np.zeros(n, dtype=int),
+            perfil_completo=np.zeros(n, dtype=bool),
+            latitude=np.full(n, np.nan),
+            longitude=np.full(n, np.nan),
+            produto_ids=list(posicao),
+            produtos_substitutos=np.zeros((n, len(posicao)), dtype=bool) if substituicoes else None,
+        )
 
-        capacidade_produtor: Dict[int, float] = {}
-        for item in itens_produtor:
-            if not getattr(item, "produto_id", None):
+        # Agregados pre-calculados (producer_match_features), lidos em uma consulta
+        if features is None:
+            features = match_features.carregar_features(self.db, [p.id for p in produtores])
+        # Reservas ativas e alocacoes de grupos assumidos saem da capacidade declarada
+        if ledger is None:
+            ledger = match_capacidade.obter(self.db, produtores=produtores)
+        for linha, produtor in enumerate(produtores):
+            itens_produtor = produtor.itens_producao or []
+            colunas.tem_itens[linha] = bool(itens_produtor)
+            colunas.perfil_completo[linha] = produtor.status_perfil == "complete"
+            for item in itens_produtor:
+                if not getattr(item, "produto_id", None):
+                    continue
+                colunas.tem_produtos[linha] = True
+                pos = posicao.get(item.produto_id)
+                if pos is not None:
+                    colunas.produtos_cobertos[linha, pos] = True
+                total_cap = 0.0
+                for periodo in getattr(item, "periodos_capacidade", []) or []:
+                    total_cap += self._as_float(getattr(periodo, "quantidade_capacidade", 0))
+                if total_cap > 0:
+                    colunas.tem_capacidade[linha] = True
+                    if pos is not None:
+                        colunas.capacidade_por_produto[linha, pos] += total_cap
+                for demandado_id, fator in substituicoes.get(item.produto_id, ()):
+                    colunas.produtos_substitutos[linha, posicao[demandado_id]] = True
+                    if total_cap > 0:
+                        colunas.capacidade_por_produto[linha, posicao[demandado_id]] += total_cap * fator
+
+            dados = features.get(produtor.id)
+            if dados is None:
                 continue
-            total_cap = 0.0
-            for periodo in getattr(item, "periodos_capacidade", []) or []:
-                total_cap += self._as_float(getattr(periodo, "quantidade_capacidade", 0))
-            if total_cap > 0:
-                capacidade_produtor[item.produto_id] = capacidade_produtor.get(item.produto_id, 0.0) + total_cap
-
-        demanda_total = sum(demanda_por_produto.values())
-        if not demanda_total:
-            return 0.0, False, {
-                "quantidade_demandada": 0.0,
-                "quantidade_coberta": 0.0,
-            }
+            colunas.total_propostas[linha] = dados.total_propostas
+            colunas.contratos_fechados[linha] = dados.contratos_fechados
+            colunas.respostas[linha] = dados.respostas
+            colunas.total_horas_resposta[linha] = dados.total_horas_resposta
+            colunas.documentos_avaliados[linha] = dados.documentos_avaliados
+            colunas.documentos_aprovados[linha] = dados.documentos_aprovados
+            if dados.latitude is not None and dados.longitude is not None:
+                colunas.latitude[linha], colunas.longitude[linha] = dados.latitude, dados.longitude
+
+        # Produtos com cronograma: so conta a capacidade livre dos periodos que cruzam cada
+        # parcela (o ledger ja debitou cada compromisso dos periodos da sua janela)
+        agendados = {
+            produto_id: parcelas
+            for produto_id, parcelas in parcelas_por_produto.items()
+            if janelas_entrega.tem_cronograma(parcelas)
+        }
+        if agendados and n:
+            arvores = janelas_entrega.indexar_periodos(
+                produtores, agendados, substituicoes, livres=ledger.livre_por_periodo()
+            )
+            for produto_id, parcelas in agendados.items():
+                pos = posicao[produto_id]
+                colunas.capacidade_por_produto[:, pos] = 0.0
+                for linha, quantidade in janelas_entrega.capacidade_por_janela(arvores[produto_id], parcelas).items():
+                    colunas.capacidade_por_produto[linha, pos] = quantidade
+
+        # Produtos sem cronograma: o total comprometido sai da capacidade total
+        comprometido = ledger.comprometido_por_chave()
+        if comprometido:
+            # (produto comprometido, coluna, fator): o proprio produto e os substitutos
+            descontos = [(produto_id, pos, 1.0) for produto_id, pos in posicao.items() if produto_id not in agendados]
+            for ofertado_id, destinos in substituicoes.items():
+                descontos.extend(
+                    (ofertado_id, posicao[demandado_id], fator)
+                    for demandado_id, fator in destinos
+                    if demandado_id not in agendados
+                )
+            for linha, produtor in enumerate(produtores):
+                for produto_id, pos, fator in descontos:
+                    usado = comprometido.get((produtor.id, produto_id))
+                    if usado:
+                        colunas.capacidade_por_produto[linha, pos] = max(
+                            0.0, colunas.capacidade_por_produto[linha, pos] - usado * fator
+                        )
 
-        if not capacidade_produtor:
-            fallback = 0.4 if itens_produtor else 0.0
-            return fallback, False, {
-                "quantidade_demandada": round(demanda_total, 2),
-                # Sem capacidade declarada, assume cobrir a demanda para fins de match inicial
-                "quantidade_coberta": round(demanda_total, 2),
-            }
+        return colunas, np.array(list(demanda_por_produto.values()), dtype=float)
 
-        cobertura = 0.0
-        for produto_id, qtd_demanda in demanda_por_produto.items():
-            cobertura += min(qtd_demanda, capacidade_produtor.get(produto_id, 0.0))
-        score = min(1.0, cobertura / demanda_total) if demanda_total else 0.0
-        return score, True, {
-            "quantidade_demandada": round(demanda_total, 2),
-            "quantidade_coberta": round(cobertura, 2),
-        }
+    # --- Scoring helpers -------------------------------------------------
 
-    def _score_historico(self, produtor_id: int) -> Tuple[float, bool, Dict[str, float]]:
-        total_propostas = (
-            self.db.query(Proposta.id)
-            .filter(Proposta.produtor_id == produtor_id)
-            .count()
-        )
-        contratos_sucesso = (
-            self.db.query(Contrato.id)
-            .join(Proposta, Proposta.id == Contrato.proposta_id)
-            .filter(
-                Proposta.produtor_id == produtor_id,
-                Contrato.status.in_(["generated", "signed"]),
-            )
-            .count()
-        )
-        if not total_propostas:
-            return 0.35, False, {"total_propostas": 0, "contratos_fechados": 0}
+    LABELS = {
+        "produto": "Compatibilidade de produto",
+        "capacidade": "Capacidade de entrega",
+        "historico": "Historico de sucesso",
+        "proximidade": "Proximidade geografica",
+        "tempo_resposta": "Tempo medio de resposta",
+        "certificacoes": "Certificacoes e selos",
+    }
 
-        score = contratos_sucesso / total_propostas if total_propostas else 0.0
-        return score, True, {
-            "total_propostas": total_propostas,
-            "contratos_fechados": contratos_sucesso,
+    def _build_base_criterios(self, pesos: Optional[np.ndarray] = None) -> Dict[str, CriterionResult]:
+        """Criterios com os pesos do plano usado na matriz (padrao: perfis_pesos.PESOS_PADRAO)."""
+        if pesos is None:
+            pesos = perfis_pesos.PLANO_PADRAO.pesos
+        return {
+            key: CriterionResult(key, self.LABELS[key], float(pesos[pos]))
+            for pos, key in enumerate(match_kernel.CRITERIOS)
         }
 
     def _score_proximidade(
@@ -233,109 +328,7 @@ class MatchScoringService:
             score = 0.25
         return score, True, {"distancia_km": round(distancia, 1)}
 
-    def _score_tempo_resposta(self, produtor_id: int) -> Tuple[float, bool, Dict[str, float]]:
-        confirmacoes = (
-            self.db.query(ConfirmacaoParticipante)
-            .filter(
-                ConfirmacaoParticipante.produtor_id == produtor_id,
-                ConfirmacaoParticipante.respondido_em.isnot(None),
-                ConfirmacaoParticipante.convidado_em.isnot(None),
-            )
-            .all()
-        )
-        if not confirmacoes:
-            return 0.5, False, {"tempo_medio_horas": None}
-
-        total_horas = 0.0
-        for conf in confirmacoes:
-            delta = conf.respondido_em - conf.convidado_em
-            total_horas += max(delta.total_seconds(), 0) / 3600.0
-        media = total_horas / len(confirmacoes)
-        score = max(0.0, min(1.0, 1 - (media / 168)))  # 7 dias como limite inferior
-        return score, True, {"tempo_medio_horas": round(media, 1)}
-
-    def _score_certificacoes(self, produtor: PerfilProdutor) -> Tuple[float, bool, Dict[str, float]]:
-        documentos = (
-            self.db.query(DocumentoProdutor)
-            .filter(DocumentoProdutor.produtor_id == produtor.id)
-            .all()
-        )
-        if not documentos:
-            fallback = 0.4 if produtor.status_perfil == "complete" else 0.25
-            return fallback, False, {"documentos_avaliados": 0, "documentos_aprovados": 0}
-
-        aprovados = sum(1 for doc in documentos if doc.status == "approved")
-        score = aprovados / len(documentos) if documentos else 0.0
-        return score, True, {
-            "documentos_avaliados": len(documentos),
-            "documentos_aprovados": aprovados,
-        }
-
-    # --- Context and qualitative helpers --------------------------------
-
-    def _aplicar_contexto(
-        self,
-        contexto: Optional[MatchContextInput],
-        criterios: Dict[str, CriterionResult],
-    ) -> Tuple[float, List[str]]:
-        if not contexto:
-            return 0.0, []
-
-        ajuste = 0.0
-        notas: List[str] = []
-        tempo = criterios["tempo_resposta"].score
-        proximidade = criterios["proximidade"].score
-        capacidade = criterios["capacidade"].score
-
-        if contexto.urgencia:
-            urg = contexto.urgencia.lower()
-            if urg == "alta":
-                if tempo >= 0.75:
-                    ajuste += 0.02
-                    notas.append("Bonus por boa resposta frente a urgencia alta.")
-                else:
-                    ajuste -= 0.03
-                    notas.append("Penalidade: urgencia alta e tempo de resposta moderado.")
-            elif urg == "baixa" and tempo >= 0.5:
-                ajuste += 0.01
-                notas.append("Urgencia baixa libera pequeno bonus.")
-
-        if contexto.sazonalidade:
-            saz = contexto.sazonalidade.lower()
-            if "safra" in saz and capacidade >= 0.6:
-                ajuste += 0.015
-                notas.append("Capacidade aderente a janela de safra informada.")
-            elif "entressafra" in saz and capacidade < 0.5:
-                ajuste -= 0.015
-                notas.append("Risco de capacidade em periodo de entressafra.")
-
-        if contexto.prioridades_edital:
-            prioridades = [p.lower() for p in contexto.prioridades_edital]
-            if any("regional" in p for p in prioridades):
-                if proximidade >= 0.7:
-                    ajuste += 0.02
-                    notas.append("Bonus por proximidade alinhada a prioridade regional.")
-                else:
-                    ajuste -= 0.02
-                    notas.append("Penalidade: prioridade regional sem proximidade suficiente.")
-            if any("certificacao" in p for p in prioridades):
-                cert = criterios["certificacoes"].score
-                if cert < 0.5:
-                    ajuste -= 0.02
-                    notas.append("Prioridade por certificacoes nao atendida.")
-
-        return ajuste, notas
-
-    def _calcular_confianca(self, criterios: Dict[str, CriterionResult]) -> float:
-        disponiveis = sum(1 for crit in criterios.values() if crit.available)
-        base = disponiveis / len(criterios)
-        media_scores = (
-            sum(crit.score for crit in criterios.values() if crit.available) / disponiveis
-            if disponiveis
-            else 0.5
-        )
-        confianca = (base * 0.7) + (media_scores * 0.3)
-        return max(0.2, min(1.0, confianca))
+    # --- Qualitative helpers -------------------------------------------
 
     def _confidence_label(self, confidence: float) -> str:
         if confidence >= 0.8:
@@ -417,46 +410,18 @@ class MatchScoringService:
     # --- Utilities -------------------------------------------------------
 
     def _extract_coords(self, payload) -> Optional[Tuple[float, float]]:
-        if not payload:
-            return None
-        data = payload
-        if isinstance(payload, str):
-            try:
-                data = json.loads(payload)
-            except json.JSONDecodeError:
-                return None
-
-        if not isinstance(data, dict):
-            return None
-
-        candidates = [
-            data,
-            data.get("coords") if isinstance(data.get("coords"), dict) else None,
-            data.get("geo") if isinstance(data.get("geo"), dict) else None,
-        ]
-        for candidate in candidates:
-            if not isinstance(candidate, dict):
-                continue
-            lat = candidate.get("lat") or candidate.get("latitude")
-            lon = candidate.get("lng") or candidate.get("lon") or candidate.get("longitude")
-            if lat is not None and lon is not None:
-                return float(lat), float(lon)
-        return None
+        return match_features.extrair_coordenadas(payload)
 
     def _get_produtor_coords(self, produtor: PerfilProdutor) -> Optional[Tuple[float, float]]:
         user = getattr(produtor, "user", None)
-        if user and getattr(user, "latitude", None) is not None and getattr(user, "longitude", None) is not None:
-            return float(user.latitude), float(user.longitude)
-        return self._extract_coords(getattr(produtor, "endereco_json", None))
+        return match_features.coordenadas_produtor(
+            getattr(user, "latitude", None),
+            getattr(user, "longitude", None),
+            getattr(produtor, "endereco_json", None),
+        )
 
     def _haversine(self, coord_a: Tuple[float, float], coord_b: Tuple[float, float]) -> float:
-        lat1, lon1 = math.radians(coord_a[0]), math.radians(coord_a[1])
-        lat2, lon2 = math.radians(coord_b[0]), math.radians(coord_b[1])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return 6371 * c
+        return haversine_km(coord_a, coord_b)
 
     def _as_float(self, value) -> float:
         if value is None:
@@ -0,0 +1,126 @@
+"""
+Execucao particionada do motor de match em varios processos (RF-14).
+
+O score e Python puro (haversine, dicionarios, textos de justificativa) e preso ao GIL; com
+MATCH_SHARD_PROCESSES > 1 os lotes de ids que saem do cursor de filtros (Passo 2) sao
+pontuados em um ProcessPoolExecutor. Cada processo abre sua propria engine/sessao
+(db.get_session_local no processo filho), hidrata o lote, pontua, renderiza a justificativa
+dos seus K melhores e devolve so objetos serializaveis: o RankingTopK parcial (sem ORM nem
+matriz) e o AcumuladorCapacidade do lote. O processo pai combina os parciais; a ordem
+global de cada candidato no fluxo mantem o mesmo desempate da execucao sequencial.
+
+O plano de score (perfis de pesos) e o fecho das equivalencias seguem do pai junto com cada
+lote: os filhos tem caches proprios, que o invalidar() dos endpoints admin (no pai) nao
+alcanca. Pelo mesmo motivo o ledger de capacidade do filho nao fica em cache (TTL zero): as
+reservas e os grupos gravados no pai so invalidam o ledger do pai.
+"""
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+from db.db import get_session_local, import_all_models
+from models.Demanda_model import VersaoDemanda
+from services import match_capacidade
+from services.equivalencias import FechoEquivalencias
+from services.perfis_pesos import PlanoScore
+from services.match_ranking import AcumuladorCapacidade, RankingTopK
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_processos = 0
+_executor_lock = threading.Lock()
+
+
+def get_executor(processos: int) -> ProcessPoolExecutor:
+    """Pool de processos compartilhado; recriado apenas se o numero de processos mudar."""
+    global _executor, _executor_processos
+    with _executor_lock:
+        if _executor is None or _executor_processos != processos:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # spawn: o filho nao herda conexoes abertas do pool do SQLAlchemy do pai
+            _executor = ProcessPoolExecutor(
+                max_workers=processos,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_inicializar_processo,
+            )
+            _executor_processos = processos
+        return _executor
+
+
+def _inicializar_processo() -> None:
+    # O processo filho nao passa pelo startup da API: registra todos os modelos nos mappers
+    import_all_models()
+    match_capacidade.TTL_SEGUNDOS = 0.0
+
+
+def encerrar_processos(wait: bool = False) -> None:
+    global _executor, _executor_processos
+    with _executor_lock:
+        executor, _executor, _executor_processos = _executor, None, 0
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def ranquear_em_processos(
+    versao_id: int,
+    lotes: Iterable[Tuple[List[int], set]],
+    ranking: RankingTopK,
+    capacidade: AcumuladorCapacidade,
+    processos: int,
+    plano: Optional[PlanoScore] = None,
+    fecho: Optional[FechoEquivalencias] = None,
+) -> None:
+    """
+    Distribui os lotes de ids entre os processos e combina os parciais em `ranking` e
+    `capacidade`. Mantem no maximo 2 lotes por processo em voo, para o cursor seguir em fluxo.
+    """
+    executor = get_executor(processos)
+    em_voo = deque()
+    ordem = 0
+    for lote_ids, sem_features in lotes:
+        em_voo.append(executor.submit(pontuar_shard, versao_id, lote_ids, sem_features, ordem, ranking.k, plano, fecho))
+        ordem += len(lote_ids)
+        if len(em_voo) >= 2 * processos:
+            _combinar(em_voo.popleft().result(), ranking, capacidade)
+    while em_voo:
+        _combinar(em_voo.popleft().result(), ranking, capacidade)
+
+
+def _combinar(
+    parcial: Tuple[RankingTopK, AcumuladorCapacidade], ranking: RankingTopK, capacidade: AcumuladorCapacidade
+) -> None:
+    ranking_parcial, capacidade_parcial = parcial
+    ranking.combinar(ranking_parcial)
+    capacidade.combinar(capacidade_parcial)
+
+
+def pontuar_shard(
+    versao_id: int,
+    lote_ids: List[int],
+    sem_features: set,
+    ordem_inicial: int,
+    k: int,
+    plano: Optional[PlanoScore] = None,
+    fecho: Optional[FechoEquivalencias] = None,
+) -> Tuple[RankingTopK, AcumuladorCapacidade]:
+    """Roda no processo filho: pontua um lote com sessao propria e devolve os parciais."""
+    # Import tardio: match_engine importa este modulo
+    from services.match_engine import MatchEngineService
+
+    db = get_session_local()()
+    try:
+        versao = db.get(VersaoDemanda, versao_id)
+        engine = MatchEngineService(db)
+        ranking = RankingTopK(k)
+        capacidade = AcumuladorCapacidade()
+        engine.pontuar_lote(versao, lote_ids, sem_features, ordem_inicial, ranking, capacidade, plano=plano, fecho=fecho)
+
+        total_demand = sum(engine.scoring_service._as_float(i.quantidade) for i in versao.itens)
+        return ranking.destacar(lambda cand: engine._opcao_individual(versao, cand, total_demand)), capacidade
+    finally:
+        db.close()
@@ -0,0 +1,243 @@
+"""
+Perfis nomeados de pesos e regras de contexto do score de match, por organizacao (RF-31).
+
+Um PerfilPesosMatch guarda pesos por criterio (os ausentes ficam com PESOS_PADRAO) e um
+contexto padrao de edital (urgencia, sazonalidade, prioridades). Cada combinacao de pesos
+e contexto e compilada uma unica vez em um PlanoScore: vetor de pesos na ordem do kernel e
+regras de contexto ja resolvidas (criterio, limiar, sentido, ajuste, nota). Avaliar o plano
+sobre a matriz de scores so faz comparacoes vetorizadas; nenhum texto e interpretado por
+candidato nem por lote.
+
+Os perfis ficam em memoria no processo, como o fecho de equivalencias: remontados quando
+/admin/perfis-pesos grava (invalidar()) ou quando passa TTL_SEGUNDOS.
+"""
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models.Match_model import PerfilPesosMatch
+from services import match_kernel
+
+TTL_SEGUNDOS = float(os.getenv("MATCH_PERFIS_TTL_S", "300"))
+
+# Nome publico de cada criterio (breakdown, pesos_utilizados e pesos_json dos perfis)
+CAMPOS = {
+    "produto": "compatibilidade_produto",
+    "capacidade": "capacidade_entrega",
+    "historico": "historico_sucesso",
+    "proximidade": "proximidade_geografica",
+    "tempo_resposta": "tempo_resposta",
+    "certificacoes": "certificacoes",
+}
+PESOS_PADRAO = {
+    "produto": 0.28,
+    "capacidade": 0.22,
+    "historico": 0.18,
+    "proximidade": 0.12,
+    "tempo_resposta": 0.10,
+    "certificacoes": 0.10,
+}
+
+
+@dataclass(frozen=True)
+class RegraCompilada:
+    """Ajuste `delta` onde o score do criterio fica >= limiar (acima) ou < limiar."""
+
+    criterio: int  # posicao em match_kernel.CRITERIOS
+    limiar: float
+    acima: bool
+    delta: float
+    nota: str
+
+
+@dataclass(frozen=True, eq=False)
+class PlanoScore:
+    pesos: np.ndarray  # (6,), na ordem de match_kernel.CRITERIOS
+    regras: Tuple[RegraCompilada, ...]
+    contexto: Tuple[Optional[str], Optional[str], Tuple[str, ...]]  # (urgencia, sazonalidade, prioridades)
+    assinatura: str
+
+    def avaliar(self, scores: np.ndarray) -> List[match_kernel.RegraContexto]:
+        """Regras do plano resolvidas sobre a matriz de scores (n, 6)."""
+        regras = []
+        for regra in self.regras:
+            coluna = scores[:, regra.criterio]
+            mascara = coluna >= regra.limiar if regra.acima else coluna < regra.limiar
+            regras.append(match_kernel.RegraContexto(mascara, regra.delta, regra.nota))
+        return regras
+
+    def com_contexto(self, contexto=None) -> "PlanoScore":
+        """
+        Plano com o contexto da requisicao (MatchContextInput) por cima do contexto do perfil:
+        cada campo informado substitui o do perfil.
+        """
+        if contexto is None:
+            return self
+        urgencia, sazonalidade, prioridades = self.contexto
+        return compilar(
+            tuple(self.pesos.tolist()),
+            contexto.urgencia or urgencia,
+            contexto.sazonalidade or sazonalidade,
+            tuple(contexto.prioridades_edital) or prioridades,
+        )
+
+
+def _regras_contexto(
+    urgencia: Optional[str], sazonalidade: Optional[str], prioridades: Tuple[str, ...]
+) -> Tuple[RegraCompilada, ...]:
+    """Interpreta o contexto do edital (uma vez por combinacao) em regras por criterio."""
+    Regra = RegraCompilada
+    tempo = match_kernel.IDX["tempo_resposta"]
+    capacidade = match_kernel.IDX["capacidade"]
+    proximidade = match_kernel.IDX["proximidade"]
+    regras: List[RegraCompilada] = []
+
+    if urgencia:
+        urg = urgencia.lower()
+        if urg == "alta":
+            regras.append(Regra(tempo, 0.75, True, 0.02, "Bonus por boa resposta frente a urgencia alta."))
+            regras.append(Regra(tempo, 0.75, False, -0.03, "Penalidade: urgencia alta e tempo de resposta moderado."))
+        elif urg == "baixa":
+            regras.append(Regra(tempo, 0.5, True, 0.01, "Urgencia baixa libera pequeno bonus."))
+
+    if sazonalidade:
+        saz = sazonalidade.lower()
+        if "safra" in saz:
+            regras.append(Regra(capacidade, 0.6, True, 0.015, "Capacidade aderente a janela de safra informada."))
+        # "entressafra" tambem contem "safra": quem ganhou o bonus de safra (>= 0.6) nunca
+        # cai abaixo de 0.5, entao a penalidade vale so para capacidade < 0.5
+        if "entressafra" in saz:
+            regras.append(Regra(capacidade, 0.5, False, -0.015, "Risco de capacidade em periodo de entressafra."))
+
+    if prioridades:
+        minusculas = [p.lower() for p in prioridades]
+        if any("regional" in p for p in minusculas):
+            regras.append(Regra(proximidade, 0.7, True, 0.02, "Bonus por proximidade alinhada a prioridade regional."))
+            regras.append(Regra(proximidade, 0.7, False, -0.02, "Penalidade: prioridade regional sem proximidade suficiente."))
+        if any("certificacao" in p for p in minusculas):
+            regras.append(Regra(match_kernel.IDX["certificacoes"], 0.5, False, -0.02, "Prioridade por certificacoes nao atendida."))
+
+    return tuple(regras)
+
+
+@lru_cache(maxsize=512)
+def compilar(
+    pesos: Tuple[float, ...],
+    urgencia: Optional[str] = None,
+    sazonalidade: Optional[str] = None,
+    prioridades: Tuple[str, ...] = (),
+) -> PlanoScore:
+    """Plano de uma combinacao de pesos (ordem do kernel) e contexto; memoizado por combinacao."""
+    contexto = (urgencia, sazonalidade, prioridades)
+    assinatura = hashlib.sha256(repr((pesos, contexto)).encode("utf-8")).hexdigest()[:16]
+    return PlanoScore(np.array(pesos, dtype=float), _regras_contexto(*contexto), contexto, assinatura)
+
+
+PLANO_PADRAO = compilar(tuple(PESOS_PADRAO[key] for key in match_kernel.CRITERIOS))
+
+
+def pesos_do_perfil(pesos_json: Optional[Dict[str, float]]) -> Tuple[float, ...]:
+    """
+    Vetor de pesos de um perfil: nomes publicos (CAMPOS) ou chaves do kernel; os ausentes
+    ficam com o padrao. Se a soma nao for 1, os pesos sao normalizados.
+    """
+    por_nome = {nome: key for key, nome in CAMPOS.items()}
+    pesos = dict(PESOS_PADRAO)
+    for nome, valor in (pesos_json or {}).items():
+        key = por_nome.get(nome, nome)
+        if key not in pesos:
+            raise ValueError(f"Criterio desconhecido: {nome}")
+        if valor is None or float(valor) < 0:
+            raise ValueError(f"Peso invalido para {nome}: {valor}")
+        pesos[key] = float(valor)
+    vetor = [pesos[key] for key in match_kernel.CRITERIOS]
+    total = sum(vetor)
+    if total <= 0:
+        raise ValueError("A soma dos pesos deve ser positiva.")
+    if abs(total - 1.0) > 1e-9:
+        vetor = [valor / total for valor in vetor]
+    return tuple(vetor)
+
+
+def pesos_efetivos(pesos_json: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """Pesos de um perfil por nome publico, como o motor vai usar."""
+    return {CAMPOS[key]: valor for key, valor in zip(match_kernel.CRITERIOS, pesos_do_perfil(pesos_json))}
+
+
+def compilar_perfil(perfil: PerfilPesosMatch) -> PlanoScore:
+    contexto = perfil.contexto_json or {}
+    return compilar(
+        pesos_do_perfil(perfil.pesos_json),
+        contexto.get("urgencia"),
+        contexto.get("sazonalidade"),
+        tuple(contexto.get("prioridades_edital") or ()),
+    )
+
+
+class CatalogoPerfis:
+    """Planos compilados dos perfis ativos, por organizacao."""
+
+    def __init__(self, planos: Dict[int, Dict[str, PlanoScore]], padroes: Dict[int, str]):
+        self._planos = planos
+        self._padroes = padroes
+
+    def plano(self, organizacao_id: Optional[int], nome: Optional[str] = None) -> PlanoScore:
+        """
+        Perfil `nome` da organizacao ou, sem nome, o perfil padrao dela (PLANO_PADRAO se
+        nao houver). KeyError se o perfil nomeado nao existir.
+        """
+        planos = self._planos.get(organizacao_id, {})
+        if nome is not None:
+            return planos[nome]
+        padrao = self._padroes.get(organizacao_id)
+        return planos[padrao] if padrao is not None else PLANO_PADRAO
+
+
+def carregar(db: Session) -> CatalogoPerfis:
+    planos: Dict[int, Dict[str, PlanoScore]] = {}
+    padroes: Dict[int, str] = {}
+    perfis = (
+        db.query(PerfilPesosMatch)
+        .filter(PerfilPesosMatch.ativo.is_(True))
+        .order_by(PerfilPesosMatch.id)
+        .all()
+    )
+    for perfil in perfis:
+        planos.setdefault(perfil.organizacao_id, {})[perfil.nome] = compilar_perfil(perfil)
+        if perfil.padrao:
+            padroes[perfil.organizacao_id] = perfil.nome  # mais de um padrao: vale o de maior id
+    return CatalogoPerfis(planos, padroes)
+
+
+_lock = threading.Lock()
+_catalogo: Optional[CatalogoPerfis] = None
+_carregado_em = 0.0
+_geracao = 0  # muda a cada invalidar(): um catalogo montado antes dela nao e guardado
+
+
+def obter(db: Session) -> CatalogoPerfis:
+    """Catalogo em cache no processo (remontado apos invalidar() ou TTL_SEGUNDOS)."""
+    global _catalogo, _carregado_em
+    with _lock:
+        if _catalogo is not None and time.monotonic() - _carregado_em < TTL_SEGUNDOS:
+            return _catalogo
+        geracao = _geracao
+    catalogo = carregar(db)
+    with _lock:
+        if geracao == _geracao:
+            _catalogo, _carregado_em = catalogo, time.monotonic()
+    return catalogo
+
+
+def invalidar() -> None:
+    global _catalogo, _geracao
+    with _lock:
+        _catalogo = None
+        _geracao += 1
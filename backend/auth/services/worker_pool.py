@@ -0,0 +1,70 @@
+"""
+Pools de execucao em segundo plano, limitados, compartilhados pelo processo.
+
+Cada pool tem um numero fixo de threads e um limite de tarefas pendentes; quando o
+limite e atingido, submit levanta FilaCheiaError em vez de acumular trabalho sem fim.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class FilaCheiaError(RuntimeError):
+    """O pool ja tem o maximo de tarefas em execucao/pendentes."""
+
+
+class PoolTrabalho:
+    def __init__(self, nome: str, max_workers: int, max_pendentes: int):
+        self.nome = nome
+        self.max_workers = max(1, max_workers)
+        self.max_pendentes = max(0, max_pendentes)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"pool-{nome}")
+        self._vagas = threading.BoundedSemaphore(self.max_workers + self.max_pendentes)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if not self._vagas.acquire(blocking=False):
+            raise FilaCheiaError(f"Fila '{self.nome}' cheia")
+        try:
+            futuro = self._executor.submit(self._executar, fn, *args, **kwargs)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        return futuro
+
+    def _executar(self, fn: Callable, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Tarefa do pool '%s' falhou", self.nome)
+            raise
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+_POOLS: Dict[str, PoolTrabalho] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(nome: str, max_workers: int, max_pendentes: int) -> PoolTrabalho:
+    """Retorna o pool `nome`, criando-o na primeira chamada (os limites valem so nessa hora)."""
+    pool = _POOLS.get(nome)
+    if pool is None:
+        with _pools_lock:
+            pool = _POOLS.get(nome)
+            if pool is None:
+                pool = PoolTrabalho(nome, max_workers, max_pendentes)
+                _POOLS[nome] = pool
+    return pool
+
+
+def encerrar_pools(wait: bool = False) -> None:
+    with _pools_lock:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
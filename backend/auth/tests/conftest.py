@@ -10,12 +10,14 @@ from db.base import Base
 from main import app
 from security.security import get_db
 from db.db import get_engine # Import get_engine
+from services import match_capacidade
 
 # Inicia o container PostgreSQL para os testes
 postgres_container = PostgresContainer("postgres:16-alpine")
 
 pytest_plugins = [
    "tests.fixtures.user_fixtures",
+   "tests.fixtures.match_fixtures",
 ]
 
 @pytest.fixture(scope="session", autouse=True)
@@ -68,6 +70,9 @@ def db_session(setup_test_db):
     session.close()
     transaction.rollback()
     connection.close()
+    # O rollback da transacao externa nao passa pelos eventos da sessao: o ledger de
+    # capacidade do processo pode ter guardado dados que deixaram de existir
+    match_capacidade.invalidar()
     
     # Limpa a sobrescrita da dependência
     if get_db in app.dependency_overrides:
@@ -0,0 +1,159 @@
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models.Catalogo_model import CatalogoProduto, Unidade
+from models.Contrato_model import Contrato
+from models.Demanda_model import Demanda, ItemDemanda, VersaoDemanda
+from models.Documento_model import DocumentoProdutor, TipoDocumento
+from models.Organizacao_model import Organizacao
+from models.PerfilProdutor_model import PerfilProdutor
+from models.Producao_model import ItemProducao, PeriodoCapacidade
+from models.Proposta_model import ConfirmacaoParticipante, Proposta
+from models.User_model import User
+
+
+@pytest.fixture
+def match_cenario(client, db_session):
+    """
+    Monta um cenario pequeno de match: uma demanda com dois itens e tres produtores
+    com capacidades, historico, confirmacoes e documentos diferentes.
+    Retorna um dict com a versao da demanda e os perfis criados.
+    """
+    sufixo = uuid.uuid4().hex[:8]
+    agora = datetime(2026, 3, 1, 12, 0, 0)
+
+    unidade = Unidade(codigo=f"kg_{sufixo}", nome="Quilograma", tipo="mass")
+    db_session.add(unidade)
+    db_session.flush()
+
+    produtos = [
+        CatalogoProduto(nome=f"Produto {i} {sufixo}", categoria="hortifruti", unidade_padrao_id=unidade.id)
+        for i in range(3)
+    ]
+    db_session.add_all(produtos)
+
+    organizacao = Organizacao(tipo="municipality", nome=f"Prefeitura {sufixo}")
+    tipo_doc = TipoDocumento(codigo=f"DAP_{sufixo}", nome="DAP")
+    governo = User(
+        name="Governo Teste",
+        email=f"governo_{sufixo}@example.com",
+        senha="senha_segura_123",
+        tipo_usuario="entidade_executora",
+        subtipo_usuario="governo",
+    )
+    db_session.add_all([organizacao, tipo_doc, governo])
+    db_session.flush()
+
+    demanda = Demanda(
+        titulo="Demanda de teste",
+        status="published",
+        local_entrega_json={"cidade": "Niteroi", "coords": {"lat": -22.88, "lng": -43.10}},
+        criada_por_user_id=governo.id,
+    )
+    db_session.add(demanda)
+    db_session.flush()
+
+    versao = VersaoDemanda(demanda_id=demanda.id, numero_versao=1)
+    db_session.add(versao)
+    db_session.flush()
+
+    for produto, quantidade in ((produtos[0], 100), (produtos[1], 50)):
+        db_session.add(
+            ItemDemanda(
+                versao_demanda_id=versao.id,
+                produto_id=produto.id,
+                user_id=governo.id,
+                unidade_id=unidade.id,
+                quantidade=quantidade,
+            )
+        )
+
+    # (coordenadas, produtos com capacidade, propostas, contratos, horas de resposta, docs aprovados/total)
+    perfis_config = [
+        ((-22.90, -43.20), {0: 120, 1: 60}, 4, 2, [10, 30], (2, 3)),
+        ((-21.75, -41.33), {0: 40}, 1, 0, [], (0, 0)),
+        (None, {1: 80, 2: 10}, 0, 0, [200], (1, 1)),
+    ]
+    perfis = []
+    for indice, (coords, capacidades, n_propostas, n_contratos, horas, docs) in enumerate(perfis_config):
+        user = User(
+            name=f"Produtor {indice} {sufixo}",
+            email=f"produtor_{indice}_{sufixo}@example.com",
+            senha="senha_segura_123",
+            tipo_usuario="produtor",
+            subtipo_usuario="fornecedor_individual",
+            latitude=coords[0] if coords else None,
+            longitude=coords[1] if coords else None,
+        )
+        db_session.add(user)
+        db_session.flush()
+
+        perfil = PerfilProdutor(
+            user_id=user.id,
+            tipo_produtor="individual",
+            endereco_json={"cidade": "Niteroi" if indice == 0 else "Campos"},
+            status_perfil="complete",
+        )
+        db_session.add(perfil)
+        db_session.flush()
+        perfis.append(perfil)
+
+        for produto_idx, capacidade in capacidades.items():
+            item = ItemProducao(produtor_id=perfil.id, produto_id=produtos[produto_idx].id, unidade_id=unidade.id)
+            db_session.add(item)
+            db_session.flush()
+            db_session.add(
+                PeriodoCapacidade(
+                    item_producao_id=item.id,
+                    tipo_periodo="month",
+                    periodo_inicio=date(2026, 3, 1),
+                    periodo_fim=date(2026, 3, 31),
+                    quantidade_capacidade=capacidade,
+                )
+            )
+
+        for n in range(n_propostas):
+            proposta = Proposta(
+                versao_demanda_id=versao.id,
+                organizacao_id=organizacao.id,
+                tipo_proposta="single",
+                produtor_id=perfil.id,
+                status="selected",
+            )
+            db_session.add(proposta)
+            db_session.flush()
+            if n < n_contratos:
+                db_session.add(
+                    Contrato(
+                        organizacao_id=organizacao.id,
+                        demanda_id=demanda.id,
+                        proposta_id=proposta.id,
+                        status="signed",
+                    )
+                )
+            if n < len(horas):
+                db_session.add(
+                    ConfirmacaoParticipante(
+                        proposta_id=proposta.id,
+                        produtor_id=perfil.id,
+                        status="accepted",
+                        convidado_em=agora,
+                        respondido_em=agora + timedelta(hours=horas[n]),
+                    )
+                )
+
+        aprovados, total = docs
+        for n in range(total):
+            db_session.add(
+                DocumentoProdutor(
+                    produtor_id=perfil.id,
+                    tipo_documento_id=tipo_doc.id,
+                    status="approved" if n < aprovados else "pending",
+                )
+            )
+
+    db_session.flush()
+    db_session.expire_all()
+    return {"versao": versao, "perfis": perfis, "produtos": produtos, "unidade": unidade}
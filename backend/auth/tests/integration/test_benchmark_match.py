@@ -0,0 +1,58 @@
+from models.Demanda_model import ItemDemanda
+from models.Producao_model import ItemProducao, PeriodoCapacidade
+from scripts.benchmark_match import comparar
+from scripts.gerar_dados_match import gerar
+from services.match_engine import MatchEngineService
+
+
+def _assinatura(db_session, cenario):
+    """Conteudo gerado sem os ids (que dependem do que ja existe no banco)."""
+    itens = (
+        db_session.query(ItemDemanda.quantidade)
+        .filter(ItemDemanda.versao_demanda_id.in_(cenario.versao_ids))
+        .order_by(ItemDemanda.id)
+        .all()
+    )
+    capacidades = (
+        db_session.query(PeriodoCapacidade.periodo_inicio, PeriodoCapacidade.quantidade_capacidade)
+        .join(ItemProducao, ItemProducao.id == PeriodoCapacidade.item_producao_id)
+        .filter(ItemProducao.produtor_id.in_(cenario.produtor_ids))
+        .order_by(PeriodoCapacidade.id)
+        .all()
+    )
+    return [tuple(linha) for linha in itens], [tuple(linha) for linha in capacidades]
+
+
+def test_gerador_e_deterministico_e_alimenta_o_match(db_session):
+    """
+    Testa se a mesma semente gera o mesmo conteudo e se o cenario gerado passa pelo motor
+    de match de ponta a ponta.
+    """
+    primeiro = gerar(db_session, produtores=40, itens_por_demanda=3, produtos=20, semente=7)
+    segundo = gerar(db_session, produtores=40, itens_por_demanda=3, produtos=20, semente=7)
+
+    assert len(primeiro.produtor_ids) == 40
+    assert _assinatura(db_session, primeiro) == _assinatura(db_session, segundo)
+
+    resultado = MatchEngineService(db_session).execute_match(primeiro.versao_ids[0], force=True)
+    assert resultado.demanda_id == primeiro.demanda_ids[0]
+
+
+def test_comparar_aponta_so_regressoes_acima_da_tolerancia():
+    anterior = {"resultados": [{"escala": 1000, "operacoes": {
+        "execute_match": {"mediana_s": 1.0},
+        "scoring_calculate": {"mediana_s": 2.0},
+    }}]}
+    atual = {"resultados": [
+        {"escala": 1000, "operacoes": {
+            "execute_match": {"mediana_s": 1.2},
+            "scoring_calculate": {"mediana_s": 2.6},
+            "demanda_produtores": {"mediana_s": 9.0},
+        }},
+        {"escala": 10000, "operacoes": {"execute_match": {"mediana_s": 50.0}}},
+    ]}
+
+    regressoes = comparar(atual, anterior, tolerancia=0.25)
+
+    assert len(regressoes) == 1
+    assert regressoes[0].startswith("scoring_calculate @ 1000")
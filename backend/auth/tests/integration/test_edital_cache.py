@@ -0,0 +1,131 @@
+import asyncio
+import io
+from datetime import datetime, timedelta
+
+from fastapi import UploadFile
+
+from models.EditalRascunho_model import AnaliseEditalCache
+from services import edital_ai, edital_cache
+from services.edital_ai import EditalProcessor
+
+PAYLOAD_GEMINI = {
+    "titulo": "Chamada publica 01/2026",
+    "resumo": "Aquisicao de hortifruti",
+    "itens": [{"produto_nome": "Alface crespa - kg", "quantidade": "100", "unidade": "kg"}],
+}
+
+
+def _chave(indice: int) -> edital_cache.ChaveAnalise:
+    return edital_cache.ChaveAnalise(f"{indice:064d}", "modelo-teste", "1")
+
+
+def _gravar(db_session, indice: int, agora: datetime) -> None:
+    edital_cache.gravar(
+        db_session, _chave(indice), texto=f"texto {indice}", payload={"titulo": str(indice)},
+        caminho_storage=f"storage/editais/{indice}.pdf", tamanho_bytes=10, agora=agora,
+    )
+
+
+def test_cache_expira_por_ttl_e_descarta_o_menos_usado(db_session, monkeypatch):
+    """
+    Testa se, com limite de duas entradas, gravar a terceira remove a acessada ha mais
+    tempo (nao a mais antiga), e se uma entrada passada do TTL nao e devolvida.
+    """
+    db_session.query(AnaliseEditalCache).delete()
+    monkeypatch.setattr(edital_cache, "MAX_ENTRADAS", 2)
+    inicio = datetime(2026, 3, 1, 12, 0, 0)
+
+    _gravar(db_session, 1, inicio)
+    _gravar(db_session, 2, inicio + timedelta(minutes=1))
+    assert edital_cache.buscar(db_session, _chave(1), agora=inicio + timedelta(minutes=2)) is not None
+    _gravar(db_session, 3, inicio + timedelta(minutes=3))
+
+    restantes = {entrada.hash_arquivo for entrada in db_session.query(AnaliseEditalCache).all()}
+    assert restantes == {_chave(1).hash_arquivo, _chave(3).hash_arquivo}
+
+    depois_do_ttl = inicio + timedelta(hours=edital_cache.TTL_HORAS, minutes=5)
+    assert edital_cache.buscar(db_session, _chave(3), agora=depois_do_ttl) is None
+    assert edital_cache.buscar_texto(db_session, _chave(3).hash_arquivo, agora=depois_do_ttl) is None
+
+
+def test_mesmo_pdf_reaproveita_analise_sem_gravar_nem_chamar_o_gemini(db_session, monkeypatch, tmp_path):
+    """
+    Testa se o segundo envio do mesmo PDF devolve o mesmo payload sem gravar outro arquivo,
+    extrair texto ou chamar o Gemini, e se uma nova versao de prompt chama o Gemini de novo
+    reaproveitando o texto ja extraido.
+    """
+    db_session.query(AnaliseEditalCache).delete()
+    monkeypatch.setattr(edital_ai, "get_session_local", lambda: (lambda: db_session))
+    processor = EditalProcessor(
+        upload_dir=tmp_path, project_root=tmp_path, api_key="chave-teste", extraction_mode="completo"
+    )
+    chamadas = {"extracao": 0, "gemini": 0}
+
+    def extrair(caminho, max_pages=None):
+        chamadas["extracao"] += 1
+        return "texto do edital"
+
+    def analisar(texto):
+        chamadas["gemini"] += 1
+        return PAYLOAD_GEMINI
+
+    monkeypatch.setattr(processor.pdf_processor, "extract_text", extrair)
+    monkeypatch.setattr(processor.gemini_client, "analyze_edital", analisar)
+
+    def enviar():
+        upload = UploadFile(file=io.BytesIO(b"%PDF-1.4 edital de teste"), filename="edital.pdf")
+        return asyncio.run(processor.process_upload(
+            upload, organization_id=None, current_user=None, gerar_rascunho=False,
+        ))
+
+    primeiro = enviar()
+    segundo = enviar()
+
+    assert (primeiro["cache_hit"], segundo["cache_hit"]) == (False, True)
+    assert segundo["dados_extraidos"] == primeiro["dados_extraidos"]
+    assert segundo["arquivo_processado"] == primeiro["arquivo_processado"]
+    assert chamadas == {"extracao": 1, "gemini": 1}
+    assert len(list(tmp_path.glob("*.pdf"))) == 1
+
+    monkeypatch.setattr(processor.gemini_client, "VERSAO_PROMPT", "2")
+    terceiro = enviar()
+    assert terceiro["cache_hit"] is False
+    assert chamadas == {"extracao": 1, "gemini": 2}
+    assert len(list(tmp_path.glob("*.pdf"))) == 1
+
+
+def test_modo_relevante_nao_reaproveita_texto_do_modo_completo(db_session, monkeypatch, tmp_path):
+    """
+    Testa se o modo de extracao faz parte da chave: o mesmo PDF ja analisado no modo
+    completo e extraido e analisado de novo no modo relevante, reaproveitando so o arquivo.
+    """
+    db_session.query(AnaliseEditalCache).delete()
+    monkeypatch.setattr(edital_ai, "get_session_local", lambda: (lambda: db_session))
+    chamadas = []
+
+    def processador(modo):
+        processor = EditalProcessor(
+            upload_dir=tmp_path, project_root=tmp_path, api_key="chave-teste", max_chars=500, extraction_mode=modo
+        )
+        monkeypatch.setattr(processor.pdf_processor, "extract_text", lambda caminho: chamadas.append("completo") or "texto")
+        monkeypatch.setattr(
+            processor.pdf_processor,
+            "extract_relevant_text",
+            lambda caminho, max_chars: chamadas.append(f"relevante:{max_chars}") or "[pagina 1]\ntexto",
+        )
+        monkeypatch.setattr(processor.gemini_client, "analyze_edital", lambda texto: PAYLOAD_GEMINI)
+        return processor
+
+    def enviar(processor):
+        upload = UploadFile(file=io.BytesIO(b"%PDF-1.4 edital relevante"), filename="edital.pdf")
+        return asyncio.run(processor.process_upload(
+            upload, organization_id=None, current_user=None, gerar_rascunho=False,
+        ))
+
+    assert enviar(processador("completo"))["cache_hit"] is False
+    assert enviar(processador("relevante"))["cache_hit"] is False
+    assert enviar(processador("relevante"))["cache_hit"] is True
+    assert chamadas == ["completo", "relevante:500"]
+    modos = {entrada.modo_extracao for entrada in db_session.query(AnaliseEditalCache).all()}
+    assert modos == {"completo", "relevante:500"}
+    assert len(list(tmp_path.glob("*.pdf"))) == 1
@@ -0,0 +1,152 @@
+import importlib
+import inspect
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from models.EditalRascunho_model import AnaliseEditalCache, ItemRascunho, JobEdital, RascunhoEdital
+from models.User_model import User
+from security.security import get_current_user
+from services import edital_ai, edital_jobs
+from services.edital_ai import EditalProcessor, PDFExtractionError
+
+PAYLOAD_GEMINI = {
+    "titulo": "Chamada publica 02/2026",
+    "resumo": "Aquisicao de hortifruti",
+    "itens": [{"produto_nome": "Tomate - kg", "quantidade": "300", "unidade": "kg", "preco_estimado": "R$ 6,50"}],
+}
+
+
+def _processador(db_session, monkeypatch, tmp_path, extrair):
+    db_session.query(AnaliseEditalCache).delete()
+    db_session.commit()
+    # O cache e a consulta do job abrem sessoes proprias: ligadas a mesma conexao do teste
+    monkeypatch.setattr(edital_ai, "get_session_local", lambda: _sessoes(db_session))
+    processor = EditalProcessor(
+        upload_dir=tmp_path, project_root=tmp_path, api_key="chave-teste", extraction_mode="completo"
+    )
+    monkeypatch.setattr(processor.pdf_processor, "extract_text", extrair)
+    monkeypatch.setattr(processor.gemini_client, "analyze_edital", lambda texto: PAYLOAD_GEMINI)
+    # routers/__init__ reexporta o objeto APIRouter com o nome do modulo
+    editais_routers = importlib.import_module("routers.Editais_routers")
+    monkeypatch.setattr(editais_routers, "get_edital_processor", lambda: processor)
+    monkeypatch.setattr(editais_routers, "get_session_local", lambda: _sessoes(db_session))
+    monkeypatch.setattr(edital_jobs, "get_edital_processor", lambda: processor)
+    enfileirados = []
+    monkeypatch.setattr(editais_routers, "enfileirar_job", enfileirados.append)
+    return enfileirados
+
+
+def _sessoes(db_session):
+    return sessionmaker(bind=db_session.get_bind(), autoflush=False)
+
+
+def _enviar(client):
+    return client.post(
+        "/editais/processar",
+        params={"assincrono": True},
+        files={"arquivo": ("edital.pdf", b"%PDF-1.4 edital em segundo plano", "application/pdf")},
+    )
+
+
+def test_job_de_edital_processa_em_segundo_plano_e_grava_rascunho(client, db_session, match_cenario, monkeypatch, tmp_path):
+    """
+    Testa se o envio assincrono grava o PDF e devolve 202 com o job na fila, se o worker
+    passa pelas etapas em ordem e grava o rascunho com os itens, e se o job so e visivel
+    para quem o criou.
+    """
+    # A consulta do job fecha a sessao da requisicao (a do teste): o usuario e lido a cada chamada
+    dono_id, outro_id = match_cenario["perfis"][0].user.id, match_cenario["perfis"][1].user.id
+    enfileirados = _processador(db_session, monkeypatch, tmp_path, lambda caminho: "texto do edital")
+    etapas = []
+    avancar = edital_jobs._avancar
+    monkeypatch.setattr(edital_jobs, "_avancar", lambda db, job, etapa: etapas.append(etapa) or avancar(db, job, etapa))
+
+    app.dependency_overrides[get_current_user] = lambda: db_session.get(User, dono_id)
+    try:
+        resposta = _enviar(client)
+        assert resposta.status_code == 202
+        job_id = resposta.json()["id"]
+        assert (resposta.json()["status"], resposta.json()["etapa"]) == ("queued", "upload")
+        assert enfileirados == [job_id]
+        assert len(list(tmp_path.glob("*.pdf"))) == 1
+
+        # Simula o worker do pool
+        edital_jobs._executar_em_background(job_id, session_factory=_sessoes(db_session))
+        consulta = client.get(f"/editais/jobs/{job_id}")
+
+        app.dependency_overrides[get_current_user] = lambda: db_session.get(User, outro_id)
+        assert client.get(f"/editais/jobs/{job_id}").status_code == 404
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert etapas == ["extracao", "ia", "normalizacao", "persistencia"]
+    corpo = consulta.json()
+    assert (corpo["status"], corpo["etapa"], corpo["progresso"]) == ("completed", "concluido", 100)
+    assert corpo["resultado"]["dados_extraidos"]["titulo"] == PAYLOAD_GEMINI["titulo"]
+    assert corpo["resultado"]["processado_por"]["id"] == dono_id
+    rascunho = db_session.get(RascunhoEdital, corpo["rascunho_db_id"])
+    assert rascunho.titulo == PAYLOAD_GEMINI["titulo"]
+    itens = db_session.query(ItemRascunho).filter(ItemRascunho.rascunho_id == rascunho.id).all()
+    normalizados = corpo["resultado"]["dados_extraidos"]["itens"]
+    assert [item.produto_nome for item in itens] == [item["produto_nome"] for item in normalizados]
+
+
+def test_job_com_falha_na_extracao_fica_failed_com_o_erro(client, db_session, match_cenario, monkeypatch, tmp_path):
+    def extrair(caminho):
+        raise PDFExtractionError("Nenhum texto foi encontrado no PDF enviado.")
+
+    _processador(db_session, monkeypatch, tmp_path, extrair)
+    app.dependency_overrides[get_current_user] = lambda: match_cenario["perfis"][0].user
+    try:
+        job_id = _enviar(client).json()["id"]
+        edital_jobs._executar_em_background(job_id, session_factory=_sessoes(db_session))
+        corpo = client.get(f"/editais/jobs/{job_id}").json()
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert (corpo["status"], corpo["etapa"]) == ("failed", "extracao")
+    assert corpo["erro"] == "Nenhum texto foi encontrado no PDF enviado."
+    assert corpo["resultado"] is None and corpo["rascunho_db_id"] is None
+
+
+def test_long_polling_do_job_espera_sem_segurar_thread(client, db_session, match_cenario, monkeypatch, tmp_path):
+    """
+    Testa se a consulta com aguardar segura a resposta ate o tempo acabar num job que nao
+    sai da fila, numa rota async (a espera e um asyncio.sleep, sem thread do threadpool).
+    """
+    _processador(db_session, monkeypatch, tmp_path, lambda caminho: "texto do edital")
+    editais_routers = importlib.import_module("routers.Editais_routers")
+    assert inspect.iscoroutinefunction(editais_routers.obter_job_edital)
+
+    usuario_id = match_cenario["perfis"][0].user.id
+    app.dependency_overrides[get_current_user] = lambda: db_session.get(User, usuario_id)
+    try:
+        job_id = _enviar(client).json()["id"]
+        inicio = time.monotonic()
+        corpo = client.get(f"/editais/jobs/{job_id}", params={"aguardar": 1}).json()
+        espera = time.monotonic() - inicio
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert (corpo["status"], corpo["etapa"]) == ("queued", "upload")
+    assert espera >= 1
+
+
+def test_jobs_interrompidos_voltam_para_a_fila_na_subida(db_session, monkeypatch):
+    jobs = [
+        JobEdital(status=status, etapa="ia", progresso=50, nome_original="edital.pdf",
+                  caminho_storage="storage/editais/edital.pdf", hash_arquivo="0" * 64)
+        for status in ("running", "queued", "completed")
+    ]
+    db_session.add_all(jobs)
+    db_session.commit()
+    enfileirados = []
+    monkeypatch.setattr(edital_jobs, "enfileirar_job", enfileirados.append)
+
+    assert edital_jobs.retomar_jobs_pendentes(db_session) >= 2
+
+    assert {jobs[0].id, jobs[1].id} <= set(enfileirados) and jobs[2].id not in enfileirados
+    assert [(job.status, job.etapa) for job in jobs[:2]] == [("queued", "upload")] * 2
+    assert jobs[2].status == "completed"
@@ -0,0 +1,216 @@
+from datetime import date
+
+from sqlalchemy import event
+
+from models.Demanda_model import ItemDemanda, VersaoDemanda
+from models.Match_model import AlocacaoGrupo, GrupoFornecedor
+from models.Producao_model import PeriodoCapacidade
+from models.Proposta_model import Proposta, ReservaCapacidade
+from services import match_capacidade
+from services.match_engine import MatchEngineService
+from services.match_scoring import MatchScoringService
+from services.match_lote import alocar_global
+
+
+def _reservar(db_session, match_cenario, perfil, quantidade):
+    versao = match_cenario["versao"]
+    proposta = db_session.query(Proposta).filter(Proposta.produtor_id == perfil.id).first()
+    db_session.add(
+        ReservaCapacidade(
+            produtor_id=perfil.id,
+            proposta_id=proposta.id,
+            demanda_id=versao.demanda_id,
+            periodo_inicio=date(2026, 3, 1),
+            periodo_fim=date(2026, 3, 31),
+            quantidades_reservadas_json={str(match_cenario["produtos"][0].id): quantidade},
+            status="active",
+        )
+    )
+    db_session.commit()
+
+
+def test_reserva_ativa_sai_da_capacidade_do_match(db_session, match_cenario):
+    """
+    Testa se uma reserva ativa reduz a capacidade livre do produtor: com 30 dos 120 do
+    produto 0 reservados, ele nao cobre mais os 100 pedidos e deixa de ser match individual.
+    """
+    versao = match_cenario["versao"]
+    perfil_forte = match_cenario["perfis"][0]
+    service = MatchEngineService(db_session)
+
+    antes = service.execute_match(versao.id)
+    assert [p.id for o in antes.opcoes if o.tipo == "individual" for p in o.produtores] == [perfil_forte.id]
+
+    _reservar(db_session, match_cenario, perfil_forte, 30)
+    depois = service.execute_match(versao.id)
+    assert not [o for o in depois.opcoes if o.tipo == "individual"]
+
+
+def test_alocacao_global_divide_capacidade_entre_demandas(db_session, match_cenario):
+    """
+    Testa se a alocacao global atende duas versoes que disputam o mesmo produto sem passar
+    da capacidade livre de nenhum produtor (reserva descontada).
+    """
+    versao = match_cenario["versao"]
+    perfil_forte, perfil_parcial, _ = match_cenario["perfis"]
+    produto = match_cenario["produtos"][0]
+    segunda = VersaoDemanda(demanda_id=versao.demanda_id, numero_versao=2)
+    db_session.add(segunda)
+    db_session.flush()
+    db_session.add(
+        ItemDemanda(
+            versao_demanda_id=segunda.id,
+            produto_id=produto.id,
+            user_id=versao.demanda.criada_por_user_id,
+            unidade_id=match_cenario["unidade"].id,
+            quantidade=30,
+        )
+    )
+    db_session.commit()
+    # Produto 0: 120 (forte) - 30 reservados + 40 (parcial) = 130 livres para 100 + 30 pedidos
+    _reservar(db_session, match_cenario, perfil_forte, 30)
+
+    plano = alocar_global(db_session, [versao, segunda])
+
+    por_produtor = {}
+    for versao_id in (versao.id, segunda.id):
+        assert plano.nao_atendido[versao_id] == {}
+        for alocacao in plano.alocacoes[versao_id]:
+            if alocacao.produto_id == produto.id:
+                por_produtor[alocacao.produtor_id] = por_produtor.get(alocacao.produtor_id, 0) + alocacao.quantidade
+    assert por_produtor == {perfil_forte.id: 90, perfil_parcial.id: 40}
+
+    itens = {item.id: float(item.quantidade) for item in versao.itens + segunda.itens}
+    atendido = {}
+    for alocacoes in plano.alocacoes.values():
+        for alocacao in alocacoes:
+            atendido[alocacao.item_demanda_id] = atendido.get(alocacao.item_demanda_id, 0) + alocacao.quantidade
+    assert atendido == itens
+
+
+def test_parcela_fora_dos_periodos_nao_conta_capacidade(db_session, match_cenario):
+    """
+    Testa se a capacidade vem so dos periodos que cruzam a janela de entrega: com metade do
+    produto 0 pedida para junho, fora do periodo de marco de todos, ninguem cobre o item inteiro.
+    """
+    versao = match_cenario["versao"]
+    produto = match_cenario["produtos"][0]
+    item = next(i for i in versao.itens if i.produto_id == produto.id)
+    item.cronograma_entrega_json = {"parcelas": [
+        {"data": "2026-03-15", "quantidade": 50},
+        {"data": "2026-06-15", "quantidade": 50},
+    ]}
+    db_session.commit()
+
+    resultado = MatchEngineService(db_session).execute_match(versao.id, force=True)
+
+    assert not [o for o in resultado.opcoes if o.tipo == "individual"]
+    plano = alocar_global(db_session, [versao])
+    assert plano.nao_atendido[versao.id] == {item.id: 50}
+
+
+def test_reserva_em_outro_periodo_nao_tira_capacidade_da_janela(db_session, match_cenario):
+    """
+    Testa se o compromisso sai do periodo da sua janela: com marco inteiro reservado e 100
+    livres em junho, uma entrega em junho ainda conta os 100, no score e na alocacao global.
+    """
+    versao = match_cenario["versao"]
+    perfil_forte = match_cenario["perfis"][0]
+    produto = match_cenario["produtos"][0]
+    item_producao = next(i for i in perfil_forte.itens_producao if i.produto_id == produto.id)
+    db_session.add(
+        PeriodoCapacidade(
+            item_producao_id=item_producao.id,
+            tipo_periodo="month",
+            periodo_inicio=date(2026, 6, 1),
+            periodo_fim=date(2026, 6, 30),
+            quantidade_capacidade=100,
+        )
+    )
+    item = next(i for i in versao.itens if i.produto_id == produto.id)
+    item.cronograma_entrega_json = {"parcelas": [{"data": "2026-06-15", "quantidade": 100}]}
+    db_session.commit()
+    _reservar(db_session, match_cenario, perfil_forte, 120)
+    db_session.expire_all()
+
+    matriz = MatchScoringService(db_session).score_batch(versao, [perfil_forte])
+
+    assert matriz.capacidade_por_produto[0, matriz.produto_ids.index(produto.id)] == 100
+    resultado = MatchEngineService(db_session).execute_match(versao.id, force=True)
+    assert [p.id for o in resultado.opcoes if o.tipo == "individual" for p in o.produtores] == [perfil_forte.id]
+    plano = alocar_global(db_session, [versao])
+    assert item.id not in plano.nao_atendido[versao.id]
+
+
+def test_ledger_do_processo_e_reaproveitado_ate_um_commit_do_produtor(db_session, match_cenario):
+    """
+    Testa se o ledger fica em memoria: a segunda leitura nao consulta o banco, e so o commit
+    de uma reserva do produtor forte o tira do cache (o parcial continua sem consulta).
+    Escritas nao commitadas (o cenario so faz flush) nunca entram no ledger do processo.
+    """
+    perfil_forte, perfil_parcial, _ = match_cenario["perfis"]
+    forte, parcial, produto = perfil_forte.id, perfil_parcial.id, match_cenario["produtos"][0].id
+    db_session.commit()
+    consultas = []
+    event.listen(db_session.get_bind(), "before_cursor_execute", lambda *args: consultas.append(args[2]))
+
+    match_capacidade.obter(db_session, [forte, parcial])
+    lidas = len(consultas)
+    ledger = match_capacidade.obter(db_session, [forte, parcial])
+    assert len(consultas) == lidas
+    assert ledger.disponivel(forte, produto) == 120
+
+    # A copia devolvida pode ser debitada sem mexer no ledger do processo
+    ledger.comprometer(forte, produto, 120)
+    assert match_capacidade.obter(db_session, [forte]).disponivel(forte, produto) == 120
+
+    _reservar(db_session, match_cenario, perfil_forte, 30)
+    del consultas[:]
+    assert match_capacidade.obter(db_session, [parcial]).disponivel(parcial, produto) == 40
+    assert consultas == []
+    assert match_capacidade.obter(db_session, [forte]).disponivel(forte, produto) == 90
+    assert consultas
+
+
+def test_alocacao_de_grupo_assumido_sai_da_janela_do_cronograma(db_session, match_cenario):
+    """
+    Testa se a alocacao de um grupo so consome capacidade depois de assumido, e no periodo
+    da entrega do item (junho), nao no primeiro periodo do produtor (marco).
+    """
+    versao = match_cenario["versao"]
+    perfil_forte = match_cenario["perfis"][0]
+    produto = match_cenario["produtos"][0]
+    item_producao = next(i for i in perfil_forte.itens_producao if i.produto_id == produto.id)
+    db_session.add(
+        PeriodoCapacidade(
+            item_producao_id=item_producao.id,
+            tipo_periodo="month",
+            periodo_inicio=date(2026, 6, 1),
+            periodo_fim=date(2026, 6, 30),
+            quantidade_capacidade=100,
+        )
+    )
+    item = next(i for i in versao.itens if i.produto_id == produto.id)
+    item.cronograma_entrega_json = {"parcelas": [{"data": "2026-06-15", "quantidade": 100}]}
+    grupo = GrupoFornecedor(versao_demanda_id=versao.id, status="forming")
+    grupo.alocacoes.append(
+        AlocacaoGrupo(
+            item_demanda_id=item.id,
+            produtor_id=perfil_forte.id,
+            quantidade_alocada=100,
+            unidade_id=match_cenario["unidade"].id,
+        )
+    )
+    db_session.add(grupo)
+    db_session.commit()
+
+    junho = (date(2026, 6, 1), date(2026, 6, 30))
+    ledger = match_capacidade.obter(db_session, [perfil_forte.id])
+    assert ledger.disponivel(perfil_forte.id, produto.id, *junho) == 100
+
+    grupo.status = "validated"
+    db_session.commit()
+
+    ledger = match_capacidade.obter(db_session, [perfil_forte.id])
+    assert ledger.disponivel(perfil_forte.id, produto.id, *junho) == 0
+    assert ledger.disponivel(perfil_forte.id, produto.id) == 120
@@ -0,0 +1,82 @@
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from models.Catalogo_model import SubstitucaoEquivalencia
+from security.security import get_current_user
+from services import equivalencias, match_sharding
+from services.match_engine import MatchEngineService
+from services.match_scoring import MatchScoringService
+
+
+def _capacidade(db_session, match_cenario, perfil):
+    resultado = MatchScoringService(db_session).calculate(match_cenario["versao"], perfil)
+    return resultado["breakdown"]["capacidade_entrega"]["detalhes"]["quantidade_coberta"]
+
+
+def test_substituto_entra_no_match_com_capacidade_convertida(client, db_session, match_cenario):
+    """
+    Testa se, depois de aprovada em /admin/equivalencias, a troca do produto 0 pelo produto 2
+    ("1:0.5": cada unidade do produto 2 vale duas do produto 0) conta a capacidade do produto 2
+    convertida para o produtor 2, e se o PATCH que desativa a troca volta ao calculo exato.
+    """
+    produtos = match_cenario["produtos"]
+    perfil_substituto = match_cenario["perfis"][2]  # produto 1: 80, produto 2: 10
+    equivalencias.invalidar()
+    assert _capacidade(db_session, match_cenario, perfil_substituto) == 50
+
+    app.dependency_overrides[get_current_user] = lambda: match_cenario["perfis"][0].user
+    try:
+        criada = client.post("/admin/equivalencias", json={
+            "from_product_id": produtos[0].id,
+            "to_product_id": produtos[2].id,
+            "razao_equivalencia": "1:0.5",
+        })
+        assert criada.status_code == 201
+        assert _capacidade(db_session, match_cenario, perfil_substituto) == 70
+
+        resultado = MatchEngineService(db_session).execute_match(match_cenario["versao"].id, force=True)
+        assert resultado.substituicoes_sugeridas == [{
+            "produto_id": produtos[0].id,
+            "substituto_id": produtos[2].id,
+            "quantidade_por_unidade_substituta": 2.0,
+        }]
+
+        desativada = client.patch(f"/admin/equivalencias/{criada.json()['id']}", json={"ativo": False})
+        assert desativada.status_code == 200
+        assert _capacidade(db_session, match_cenario, perfil_substituto) == 50
+    finally:
+        del app.dependency_overrides[get_current_user]
+        equivalencias.invalidar()
+
+
+def test_shard_pontua_com_o_fecho_do_processo_pai(db_session, match_cenario, monkeypatch):
+    """
+    Testa se o lote pontuado em outro processo usa o fecho recebido do pai, e nao o cache
+    proprio do processo, que o invalidar() de /admin/equivalencias no pai nao alcanca.
+    """
+    produtos = match_cenario["produtos"]
+    perfil_substituto = match_cenario["perfis"][2]  # produto 1: 80, produto 2: 10
+    equivalencias.invalidar()
+    equivalencias.obter(db_session)  # cache do "filho", montado antes da troca
+    db_session.add(SubstitucaoEquivalencia(
+        from_product_id=produtos[0].id,
+        to_product_id=produtos[2].id,
+        razao_equivalencia="1:0.5",
+        aprovado_por_user_id=match_cenario["perfis"][0].user.id,
+    ))
+    db_session.commit()
+    monkeypatch.setattr(
+        match_sharding, "get_session_local", lambda: sessionmaker(bind=db_session.get_bind(), autoflush=False)
+    )
+
+    try:
+        def pontuar(fecho):
+            _, capacidade = match_sharding.pontuar_shard(
+                match_cenario["versao"].id, [perfil_substituto.id], set(), 0, 5, fecho=fecho
+            )
+            return dict(zip(capacidade.produto_ids, capacidade.soma_por_produto.tolist()))
+
+        assert pontuar(None)[produtos[0].id] == 0
+        assert pontuar(equivalencias.carregar(db_session))[produtos[0].id] == 20
+    finally:
+        equivalencias.invalidar()
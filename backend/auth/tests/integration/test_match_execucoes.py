@@ -0,0 +1,367 @@
+import importlib
+import inspect
+import time
+from datetime import date
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from models.Match_model import ExecucaoMatch, GrupoFornecedor, MembroGrupo, VersaoDadosMatch
+from models.Producao_model import ItemProducao, PeriodoCapacidade
+from security.security import get_current_user
+from services import match_cache
+from services.match_engine import MatchEngineService
+from services.match_persistencia import carregar_resultado
+
+
+def _sessoes_curtas(db_session, monkeypatch, abertas=None):
+    """A consulta de execucao abre sessoes proprias: ligadas a mesma conexao do teste."""
+    match_routers = importlib.import_module("routers.Match_routers")
+    fabrica = sessionmaker(bind=db_session.get_bind(), autoflush=False)
+
+    def abrir():
+        if abertas is not None:
+            abertas.append(1)
+        return fabrica()
+
+    monkeypatch.setattr(match_routers, "get_session_local", lambda: abrir)
+
+
+def test_execucao_assincrona_enfileira_e_expoe_resultado(client, db_session, match_cenario, monkeypatch):
+    versao = match_cenario["versao"]
+    enfileiradas = []
+    # routers/__init__ reexporta o objeto APIRouter com o nome do modulo
+    match_routers = importlib.import_module("routers.Match_routers")
+    monkeypatch.setattr(match_routers, "enfileirar_execucao", enfileiradas.append)
+    _sessoes_curtas(db_session, monkeypatch)
+
+    app.dependency_overrides[get_current_user] = lambda: match_cenario["perfis"][0].user
+    try:
+        resposta = client.post(f"/match/execute/{versao.id}", params={"assincrono": True})
+        assert resposta.status_code == 202
+        execucao_id = resposta.json()["id"]
+        assert resposta.json()["status"] == "queued"
+        assert enfileiradas == [execucao_id]
+
+        # Simula o worker do pool processando a execucao
+        execucao = db_session.get(ExecucaoMatch, execucao_id)
+        esperado = MatchEngineService(db_session).executar(execucao)
+
+        consulta = client.get(f"/match/execucoes/{execucao_id}")
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert consulta.status_code == 200
+    corpo = consulta.json()
+    assert corpo["status"] == "completed"
+    assert corpo["resultado"] == esperado.model_dump(mode="json")
+
+
+def test_long_polling_espera_sem_segurar_thread_nem_sessao(client, db_session, match_cenario, monkeypatch):
+    """
+    Testa se a consulta com aguardar segura a resposta ate o tempo acabar numa execucao que
+    nao termina, esperando com asyncio.sleep (rota async, sem thread do threadpool parada)
+    e abrindo uma sessao curta a cada verificacao do status, em vez de uma para a espera toda.
+    """
+    match_routers = importlib.import_module("routers.Match_routers")
+    monkeypatch.setattr(match_routers, "enfileirar_execucao", lambda execucao_id: None)
+    abertas = []
+    _sessoes_curtas(db_session, monkeypatch, abertas)
+    assert inspect.iscoroutinefunction(match_routers.obter_execucao_match)
+
+    app.dependency_overrides[get_current_user] = lambda: match_cenario["perfis"][0].user
+    try:
+        execucao_id = client.post(f"/match/execute/{match_cenario['versao'].id}", params={"assincrono": True}).json()["id"]
+        inicio = time.monotonic()
+        consulta = client.get(f"/match/execucoes/{execucao_id}", params={"aguardar": 1})
+        espera = time.monotonic() - inicio
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert consulta.json()["status"] == "queued"
+    assert espera >= 1
+    # Status inicial, uma verificacao a cada 0.5 s e a resposta final
+    assert len(abertas) >= 4
+
+
+def test_execucao_inexistente_retorna_404(client, db_session, match_cenario, monkeypatch):
+    _sessoes_curtas(db_session, monkeypatch)
+    app.dependency_overrides[get_current_user] = lambda: match_cenario["perfis"][0].user
+    try:
+        assert client.get("/match/execucoes/999999").status_code == 404
+        assert client.post("/match/execute/999999", params={"assincrono": True}).status_code == 404
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+
+def test_resultado_reaproveitado_enquanto_dados_nao_mudam(db_session, match_cenario):
+    """
+    Testa se uma segunda execucao com os mesmos dados devolve o resultado gravado sem
+    criar outra ExecucaoMatch, e se uma nova capacidade ou force=True recalculam.
+    """
+    versao = match_cenario["versao"]
+    service = MatchEngineService(db_session)
+
+    def total_execucoes():
+        return db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).count()
+
+    primeiro = service.execute_match(versao.id)
+    segundo = service.execute_match(versao.id)
+    assert segundo == primeiro
+    assert total_execucoes() == 1
+
+    service.execute_match(versao.id, force=True)
+    assert total_execucoes() == 2
+
+    perfil = match_cenario["perfis"][1]
+    item = ItemProducao(
+        produtor_id=perfil.id,
+        produto_id=match_cenario["produtos"][1].id,
+        unidade_id=match_cenario["unidade"].id,
+    )
+    db_session.add(item)
+    db_session.flush()
+    db_session.add(
+        PeriodoCapacidade(
+            item_producao_id=item.id,
+            tipo_periodo="month",
+            periodo_inicio=date(2026, 3, 1),
+            periodo_fim=date(2026, 3, 31),
+            quantidade_capacidade=30,
+        )
+    )
+    db_session.commit()
+
+    service.execute_match(versao.id)
+    assert total_execucoes() == 3
+
+
+def _complementar_produto_0(db_session, match_cenario):
+    """Da 60 do produto 0 ao produtor complementar: parcial + complementar formam um grupo."""
+    item = ItemProducao(
+        produtor_id=match_cenario["perfis"][2].id,
+        produto_id=match_cenario["produtos"][0].id,
+        unidade_id=match_cenario["unidade"].id,
+    )
+    db_session.add(item)
+    db_session.flush()
+    db_session.add(
+        PeriodoCapacidade(
+            item_producao_id=item.id,
+            tipo_periodo="month",
+            periodo_inicio=date(2026, 3, 1),
+            periodo_fim=date(2026, 3, 31),
+            quantidade_capacidade=60,
+        )
+    )
+    db_session.commit()
+
+
+def test_grupos_persistidos_em_lote_remontam_o_resultado(db_session, match_cenario):
+    """
+    Testa se grupos, membros e alocacoes sao gravados nas tabelas proprias e se o
+    resultado remontado das linhas compactas e igual ao devolvido pela execucao.
+    """
+    versao = match_cenario["versao"]
+    _, perfil_parcial, perfil_complementar = match_cenario["perfis"]
+    _complementar_produto_0(db_session, match_cenario)
+
+    resultado = MatchEngineService(db_session).execute_match(versao.id)
+    execucao = db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).one()
+
+    grupos = [opcao for opcao in resultado.opcoes if opcao.tipo == "grupo"]
+    assert len(grupos) == 1
+    assert {p.id for p in grupos[0].produtores} == {perfil_parcial.id, perfil_complementar.id}
+
+    grupo = db_session.query(GrupoFornecedor).filter(GrupoFornecedor.criado_de_match_id == execucao.id).one()
+    assert {m.produtor_id for m in grupo.membros} == {perfil_parcial.id, perfil_complementar.id}
+    assert sum(float(a.quantidade_alocada) for a in grupo.alocacoes) == 150.0
+    assert "opcoes" not in execucao.parametros_json
+
+    assert carregar_resultado(db_session, execucao) == resultado
+
+
+def test_nova_execucao_apaga_os_grupos_sugeridos_pelas_anteriores(db_session, match_cenario):
+    """
+    Testa se recalcular a mesma versao deixa so os grupos "forming" da ultima execucao (sem
+    membros nem alocacoes orfaos), se os candidatos de grupo das anteriores viram
+    "superseded" e se um grupo ja assumido nao e apagado.
+    """
+    versao = match_cenario["versao"]
+    _complementar_produto_0(db_session, match_cenario)
+    service = MatchEngineService(db_session)
+
+    service.execute_match(versao.id)
+    service.execute_match(versao.id, force=True)
+    primeira, segunda = (
+        db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).order_by(ExecucaoMatch.id).all()
+    )
+    db_session.commit()
+
+    def grupos(execucao):
+        return db_session.query(GrupoFornecedor).filter(GrupoFornecedor.criado_de_match_id == execucao.id).all()
+
+    assert grupos(primeira) == []
+    assert len(grupos(segunda)) == 1
+    membros = db_session.query(MembroGrupo).filter(
+        MembroGrupo.grupo_id.in_([g.id for g in grupos(segunda)])
+        | ~MembroGrupo.grupo_id.in_(db_session.query(GrupoFornecedor.id))
+    )
+    assert membros.count() == 2
+    assert {c.status for c in primeira.candidatos if c.tipo_candidato == "group"} == {"superseded"}
+    assert all(opcao.tipo == "individual" for opcao in carregar_resultado(db_session, primeira).opcoes)
+
+    assumido = grupos(segunda)[0]
+    assumido.status = "validated"
+    db_session.commit()
+    terceira_resultado = service.execute_match(versao.id, force=True)
+    terceira = (
+        db_session.query(ExecucaoMatch)
+        .filter(ExecucaoMatch.versao_demanda_id == versao.id)
+        .order_by(ExecucaoMatch.id.desc())
+        .first()
+    )
+
+    assert db_session.get(GrupoFornecedor, assumido.id) is not None
+    assert carregar_resultado(db_session, terceira) == terceira_resultado
+
+
+def test_execucao_grava_diagnostico_por_etapa_e_metricas(client, db_session, match_cenario):
+    """
+    Testa se a execucao grava tempo, comandos SQL e candidatos de cada etapa em
+    parametros_json["diagnosticos"], sem mudar o resultado remontado, e se as etapas
+    aparecem nas metricas de /match/metrics.
+    """
+    versao = match_cenario["versao"]
+    resultado = MatchEngineService(db_session).execute_match(versao.id, force=True)
+
+    execucao = (
+        db_session.query(ExecucaoMatch)
+        .filter(ExecucaoMatch.versao_demanda_id == versao.id)
+        .order_by(ExecucaoMatch.id.desc())
+        .first()
+    )
+    diagnostico = execucao.parametros_json["diagnosticos"]
+    etapas = diagnostico["etapas"]
+    assert list(etapas) == ["filtro", "score", "ranking", "individual", "grupos", "persistencia"]
+    assert etapas["filtro"]["candidatos"] == etapas["score"]["candidatos"] == 3
+    assert etapas["filtro"]["consultas_sql"] > 0 and etapas["persistencia"]["consultas_sql"] > 0
+    assert diagnostico["consultas_sql"] == sum(etapa["consultas_sql"] for etapa in etapas.values())
+    assert carregar_resultado(db_session, execucao) == resultado
+
+    metricas = client.get("/match/metrics")
+    assert metricas.status_code == 200
+    assert 'match_execucoes_total{status="completed"}' in metricas.text
+    assert 'match_etapa_duracao_segundos_count{etapa="persistencia"}' in metricas.text
+
+
+def test_explicacao_sob_demanda_de_candidato(client, db_session, match_cenario):
+    """
+    Testa se a explicacao completa sai para um candidato retornado (com o mesmo texto da
+    opcao individual) e para um produtor que ficou de fora da execucao.
+    """
+    versao = match_cenario["versao"]
+    perfis = match_cenario["perfis"]
+    resultado = MatchEngineService(db_session).execute_match(versao.id, force=True)
+    execucao = (
+        db_session.query(ExecucaoMatch)
+        .filter(ExecucaoMatch.versao_demanda_id == versao.id)
+        .order_by(ExecucaoMatch.id.desc())
+        .first()
+    )
+    individual = next(opcao for opcao in resultado.opcoes if opcao.tipo == "individual").produtores[0]
+    retornados = {produtor.id for opcao in resultado.opcoes for produtor in opcao.produtores}
+    fora = next(perfil for perfil in perfis if perfil.id not in retornados)
+
+    app.dependency_overrides[get_current_user] = lambda: perfis[0].user
+    try:
+        url = f"/match/execucoes/{execucao.id}/candidatos/{{}}/explicacao"
+        retornado = client.get(url.format(individual.id))
+        ausente = client.get(url.format(fora.id))
+        assert client.get(url.format(999999)).status_code == 404
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert retornado.status_code == 200
+    corpo = retornado.json()
+    assert corpo["retornado"] is True and corpo["elegivel"] is True
+    assert corpo["score_execucao"] == individual.score == corpo["score_final"]
+    assert corpo["explicacao"]["justificativa"] == individual.justificativa
+    assert set(corpo["explicacao"]["breakdown"]) and corpo["explicacao"]["pontos_fortes"] is not None
+
+    assert ausente.status_code == 200
+    corpo = ausente.json()
+    assert corpo["retornado"] is False and corpo["score_execucao"] is None
+    assert corpo["explicacao"]["produtor_id"] == fora.id
+
+
+def test_remocao_e_atualizacao_em_massa_invalidam_o_cache(db_session, match_cenario):
+    """
+    Testa se a marca d'agua muda com exclusoes e com UPDATE em massa do ORM (que nao mexem
+    no maior updated_at) e se escrita em tabela que nao alimenta o match mantem o cache.
+    """
+    versao = match_cenario["versao"]
+    service = MatchEngineService(db_session)
+
+    def total_execucoes():
+        return db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).count()
+
+    service.execute_match(versao.id)
+    assert total_execucoes() == 1
+
+    perfil = match_cenario["perfis"][1]
+    periodo = (
+        db_session.query(PeriodoCapacidade)
+        .join(ItemProducao, ItemProducao.id == PeriodoCapacidade.item_producao_id)
+        .filter(ItemProducao.produtor_id == perfil.id)
+        .first()
+    )
+    db_session.delete(periodo)
+    db_session.commit()
+    service.execute_match(versao.id)
+    assert total_execucoes() == 2
+
+    db_session.query(ItemProducao).filter(ItemProducao.produtor_id == perfil.id).update(
+        {ItemProducao.preco_base: 9}, synchronize_session=False
+    )
+    db_session.commit()
+    service.execute_match(versao.id)
+    assert total_execucoes() == 3
+
+    db_session.add(GrupoFornecedor(versao_demanda_id=versao.id, status="forming"))
+    db_session.commit()
+    service.execute_match(versao.id)
+    assert total_execucoes() == 3
+
+
+def test_contador_da_marca_muda_depois_do_commit_fora_da_transacao_do_escritor(db_session, match_cenario):
+    """
+    Testa se a transacao que grava nao toca versoes_dados_match (nenhuma trava na linha do
+    contador ate o commit), se o contador sobe depois do commit e se, antes dele, a propria
+    sessao ja nao reaproveita a chave antiga.
+    """
+    versao = match_cenario["versao"]
+    db_session.commit()
+
+    def contador():
+        return db_session.get(VersaoDadosMatch, "itens_producao", populate_existing=True)
+
+    antes = contador().versao if contador() else 0
+    chave_antes = match_cache.chave_execucao(db_session, versao.id, {})
+    consultas = []
+    event.listen(db_session.get_bind(), "before_cursor_execute", lambda *args: consultas.append(args[2]))
+
+    perfil = match_cenario["perfis"][1]
+    db_session.query(ItemProducao).filter(ItemProducao.produtor_id == perfil.id).update(
+        {ItemProducao.preco_base: 9}, synchronize_session=False
+    )
+    db_session.flush()
+    assert not [sql for sql in consultas if "versoes_dados_match" in sql]
+    chave_pendente = match_cache.chave_execucao(db_session, versao.id, {})
+    assert chave_pendente != chave_antes
+
+    db_session.commit()
+    assert contador().versao == antes + 1
+    chave_depois = match_cache.chave_execucao(db_session, versao.id, {})
+    assert chave_depois not in (chave_antes, chave_pendente)
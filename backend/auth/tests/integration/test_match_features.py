@@ -0,0 +1,117 @@
+from sqlalchemy import event
+
+from main import app
+from models.Documento_model import DocumentoProdutor
+from models.FeaturesMatch_model import FeaturesMatchProdutor
+from security.security import get_current_user
+from services.match_features import (
+    CAMPOS_FEATURES,
+    atualizar_features,
+    calcular_features,
+    carregar_features,
+    reconstruir_features,
+)
+
+
+def _valores(feature):
+    return {campo: getattr(feature, campo) for campo in CAMPOS_FEATURES}
+
+
+def test_calcular_features_agrega_historico_respostas_e_documentos(db_session, match_cenario):
+    perfis = match_cenario["perfis"]
+
+    features = calcular_features(db_session, [p.id for p in perfis])
+
+    primeiro = features[perfis[0].id]
+    assert primeiro.total_propostas == 4
+    assert primeiro.contratos_fechados == 2
+    assert primeiro.respostas == 2
+    assert primeiro.total_horas_resposta == 40.0
+    assert (primeiro.documentos_avaliados, primeiro.documentos_aprovados) == (3, 2)
+    assert (primeiro.latitude, primeiro.longitude) == (-22.90, -43.20)
+
+    sem_coordenadas = features[perfis[2].id]
+    assert sem_coordenadas.latitude is None and sem_coordenadas.longitude is None
+
+
+def test_reconstruir_e_carregar_features(db_session, match_cenario):
+    perfis = match_cenario["perfis"]
+    ids = [p.id for p in perfis]
+
+    # Sem linhas na tabela, as features sao calculadas em memoria
+    sob_demanda = carregar_features(db_session, ids)
+    assert set(sob_demanda) == set(ids)
+
+    assert reconstruir_features(db_session, somente_ausentes=True) >= len(ids)
+    persistidas = db_session.query(FeaturesMatchProdutor).filter(FeaturesMatchProdutor.produtor_id.in_(ids)).all()
+    assert {f.produtor_id: _valores(f) for f in persistidas} == {
+        pid: _valores(f) for pid, f in sob_demanda.items()
+    }
+
+
+def test_atualizar_features_reflete_nova_escrita(db_session, match_cenario):
+    produtor = match_cenario["perfis"][1]
+    atualizar_features(db_session, [produtor.id])
+    tipo_documento_id = db_session.query(DocumentoProdutor.tipo_documento_id).first()[0]
+
+    db_session.add(DocumentoProdutor(produtor_id=produtor.id, tipo_documento_id=tipo_documento_id, status="approved"))
+    atualizar_features(db_session, [produtor.id])
+
+    feature = db_session.get(FeaturesMatchProdutor, produtor.id)
+    assert (feature.documentos_avaliados, feature.documentos_aprovados) == (1, 1)
+
+
+def test_router_de_documentos_atualiza_features(client, db_session, match_cenario):
+    produtor = match_cenario["perfis"][0]
+    atualizar_features(db_session, [produtor.id])
+    documento = (
+        db_session.query(DocumentoProdutor)
+        .filter(DocumentoProdutor.produtor_id == produtor.id, DocumentoProdutor.status == "pending")
+        .first()
+    )
+
+    app.dependency_overrides[get_current_user] = lambda: produtor.user
+    try:
+        response = client.patch(f"/documentos/{documento.id}", json={"status": "approved"})
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert response.status_code == 200
+    db_session.expire_all()
+    feature = db_session.get(FeaturesMatchProdutor, produtor.id)
+    assert (feature.documentos_avaliados, feature.documentos_aprovados) == (3, 3)
+
+
+def test_listar_produtores_com_raio_usa_indice_espacial(client, db_session, match_cenario):
+    perfis = match_cenario["perfis"]
+    reconstruir_features(db_session)
+    demanda_id = match_cenario["versao"].demanda_id
+
+    consultas = []
+
+    def contar(*args):
+        consultas[-1] += 1
+
+    def listar(raio_km=None):
+        consultas.append(0)
+        params = {"raio_km": raio_km} if raio_km is not None else {}
+        return client.get(f"/demandas/{demanda_id}/produtores", params=params)
+
+    app.dependency_overrides[get_current_user] = lambda: perfis[0].user
+    event.listen(db_session.get_bind(), "before_cursor_execute", contar)
+    try:
+        todos = listar()
+        perto = listar(50)
+        regiao = listar(300)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", contar)
+        del app.dependency_overrides[get_current_user]
+
+    assert perto.status_code == 200
+    assert [p["produtor_id"] for p in perto.json()] == [perfis[0].id]
+    assert perto.json()[0]["distancia_km"] < 50
+    # Produtor sem localizacao conhecida fica fora do filtro por raio
+    assert {p["produtor_id"] for p in regiao.json()} == {perfis[0].id, perfis[1].id}
+    # Raio e relacionamentos resolvidos em consultas fixas: nada por produtor
+    assert consultas[1] == consultas[2]
+    assert len(todos.json()) == len(perfis)
@@ -0,0 +1,107 @@
+from datetime import date
+
+from models.Match_model import CandidatoMatch, ExecucaoMatch
+from models.Producao_model import ItemProducao, PeriodoCapacidade
+from services.match_engine import MatchEngineService
+from services.match_incremental import execucoes_afetadas, rematch_produtor
+from services.match_persistencia import carregar_resultado
+
+
+def _ativos(db_session, execucao_id):
+    return {
+        c.produtor_id: c
+        for c in db_session.query(CandidatoMatch).filter(
+            CandidatoMatch.execucao_match_id == execucao_id,
+            CandidatoMatch.tipo_candidato == "single",
+            CandidatoMatch.status == "active",
+        )
+    }
+
+
+def _adicionar_capacidade(db_session, item_id, quantidade):
+    db_session.add(
+        PeriodoCapacidade(
+            item_producao_id=item_id,
+            tipo_periodo="month",
+            periodo_inicio=date(2026, 3, 1),
+            periodo_fim=date(2026, 3, 31),
+            quantidade_capacidade=quantidade,
+        )
+    )
+
+
+def test_rematch_incremental_atualiza_ranking_sem_nova_execucao(db_session, match_cenario):
+    """
+    Testa se a nova capacidade de um produtor o coloca no ranking persistido da ultima
+    execucao, sem criar outra ExecucaoMatch e sem mexer nos demais candidatos.
+    """
+    versao = match_cenario["versao"]
+    perfil_forte, perfil_parcial, _ = match_cenario["perfis"]
+    MatchEngineService(db_session).execute_match(versao.id)
+    execucao = db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).one()
+
+    ativos = _ativos(db_session, execucao.id)
+    assert set(ativos) == {perfil_forte.id}
+    candidato_forte = ativos[perfil_forte.id]
+
+    # O produtor parcial passa a cobrir os dois produtos da demanda
+    item = db_session.query(ItemProducao).filter(ItemProducao.produtor_id == perfil_parcial.id).one()
+    _adicionar_capacidade(db_session, item.id, 60)
+    novo_item = ItemProducao(
+        produtor_id=perfil_parcial.id,
+        produto_id=match_cenario["produtos"][1].id,
+        unidade_id=match_cenario["unidade"].id,
+    )
+    db_session.add(novo_item)
+    db_session.flush()
+    _adicionar_capacidade(db_session, novo_item.id, 50)
+    db_session.commit()
+
+    assert [e.id for e in execucoes_afetadas(db_session, perfil_parcial.id)] == [execucao.id]
+    # Linha individual sem produtor_id (anterior a coluna) tira a execucao do re-match
+    candidato_forte.produtor_id = None
+    db_session.commit()
+    assert execucoes_afetadas(db_session, perfil_parcial.id) == []
+    candidato_forte.produtor_id = perfil_forte.id
+    db_session.commit()
+    assert rematch_produtor(db_session, perfil_parcial.id) == 1
+
+    ativos = _ativos(db_session, execucao.id)
+    assert set(ativos) == {perfil_forte.id, perfil_parcial.id}
+    assert ativos[perfil_forte.id].id == candidato_forte.id
+    assert float(ativos[perfil_parcial.id].percentual_cobertura) == 100.0
+    assert db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).count() == 1
+
+    # Repontuar de novo substitui a linha anterior do produtor
+    rematch_produtor(db_session, perfil_parcial.id)
+    superseded = (
+        db_session.query(CandidatoMatch)
+        .filter(CandidatoMatch.produtor_id == perfil_parcial.id, CandidatoMatch.status == "superseded")
+        .count()
+    )
+    assert superseded == 1
+    assert set(_ativos(db_session, execucao.id)) == {perfil_forte.id, perfil_parcial.id}
+
+
+def test_rematch_incremental_recalcula_status_da_execucao(db_session, match_cenario):
+    """
+    Testa se o produtor que deixa de atender a demanda sai do ranking e se o status e a
+    cobertura devolvidos pela consulta da execucao acompanham o ranking atualizado.
+    """
+    versao = match_cenario["versao"]
+    perfil_forte = match_cenario["perfis"][0]
+    MatchEngineService(db_session).execute_match(versao.id)
+    execucao = db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).one()
+    assert carregar_resultado(db_session, execucao).status == "match_encontrado"
+
+    # Sem capacidade declarada o motor assume cobertura total: reduz em vez de apagar
+    for item in db_session.query(ItemProducao).filter(ItemProducao.produtor_id == perfil_forte.id):
+        for periodo in item.periodos_capacidade:
+            periodo.quantidade_capacidade = 1
+    db_session.commit()
+    rematch_produtor(db_session, perfil_forte.id)
+
+    assert _ativos(db_session, execucao.id) == {}
+    db_session.refresh(execucao)
+    resultado = carregar_resultado(db_session, execucao)
+    assert (resultado.status, resultado.cobertura_percentual) == ("sem_match", 0.0)
@@ -0,0 +1,64 @@
+from main import app
+from models.Demanda_model import ItemDemanda, VersaoDemanda
+from models.Match_model import ExecucaoMatch
+from security.security import get_current_user
+from services.match_engine import MatchEngineService
+from services.match_lote import executar_lote
+
+
+def _segunda_versao(db_session, match_cenario):
+    versao = match_cenario["versao"]
+    segunda = VersaoDemanda(demanda_id=versao.demanda_id, numero_versao=2)
+    db_session.add(segunda)
+    db_session.flush()
+    db_session.add(
+        ItemDemanda(
+            versao_demanda_id=segunda.id,
+            produto_id=match_cenario["produtos"][0].id,
+            user_id=versao.demanda.criada_por_user_id,
+            unidade_id=match_cenario["unidade"].id,
+            quantidade=30,
+        )
+    )
+    db_session.commit()
+    return segunda
+
+
+def test_lote_equivale_a_execucoes_individuais(db_session, match_cenario):
+    """
+    Testa se a passada compartilhada do lote devolve, para cada versao, o mesmo resultado
+    da execucao individual, e se uma segunda chamada sem mudancas reaproveita as execucoes.
+    """
+    versao = match_cenario["versao"]
+    segunda = _segunda_versao(db_session, match_cenario)
+    service = MatchEngineService(db_session)
+    individuais = [service.execute_match(v.id, force=True).model_dump() for v in (versao, segunda)]
+
+    resultados = executar_lote(db_session, [versao, segunda], force=True)
+
+    assert [execucao.status for execucao, _ in resultados] == ["completed", "completed"]
+    assert [execucao.versao_demanda_id for execucao, _ in resultados] == [versao.id, segunda.id]
+    assert [resultado.model_dump() for _, resultado in resultados] == individuais
+
+    repetidos = executar_lote(db_session, [versao, segunda])
+    assert [execucao.id for execucao, _ in repetidos] == [execucao.id for execucao, _ in resultados]
+    assert [resultado.model_dump() for _, resultado in repetidos] == individuais
+
+
+def test_endpoint_lote(client, db_session, match_cenario):
+    versao = match_cenario["versao"]
+    segunda = _segunda_versao(db_session, match_cenario)
+
+    app.dependency_overrides[get_current_user] = lambda: match_cenario["perfis"][0].user
+    try:
+        resposta = client.post("/match/execute-batch", json={"versao_demanda_ids": [segunda.id, versao.id, segunda.id]})
+        inexistente = client.post("/match/execute-batch", json={"versao_demanda_ids": [versao.id, 999999]})
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert resposta.status_code == 200
+    execucoes = resposta.json()["execucoes"]
+    assert [e["versao_demanda_id"] for e in execucoes] == [segunda.id, versao.id]
+    assert all(e["status"] == "completed" and e["resultado"] for e in execucoes)
+    assert db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).count() == 1
+    assert inexistente.status_code == 404
@@ -0,0 +1,128 @@
+import pickle
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from models.Match_model import ExecucaoMatch
+from models.Organizacao_model import Organizacao
+from schemas.Match_schema import MatchContextInput
+from security.security import get_current_user
+from services import match_kernel, match_sharding, perfis_pesos
+from services.match_engine import MatchEngineService
+from services.match_scoring import MatchScoringService
+
+
+def test_calculate_many_nao_mistura_linhas_entre_produtores(db_session, match_cenario):
+    """
+    As agregacoes GROUP BY do lote nao podem vazar entre produtores: cada produtor recebe o
+    mesmo payload pontuado sozinho ou no lote, em qualquer ordem, com e sem contexto. O
+    score e a soma das contribuicoes mais os ajustes de contexto.
+    """
+    # Arrange
+    service = MatchScoringService(db_session)
+    versao = match_cenario["versao"]
+    perfis = match_cenario["perfis"]
+    contexto = MatchContextInput(urgencia="alta", sazonalidade="safra", prioridades_edital=["regional"])
+
+    for ctx in (None, contexto):
+        # Act
+        em_lote = service.calculate_many(versao, perfis, ctx)
+        invertido = service.calculate_many(versao, perfis[::-1], ctx)
+        sozinhos = [service.calculate_many(versao, [perfil], ctx)[0] for perfil in perfis]
+
+        # Assert
+        assert [item["produtor_id"] for item in em_lote] == [perfil.id for perfil in perfis]
+        assert invertido[::-1] == em_lote
+        assert sozinhos == em_lote
+        assert len({item["score_percentual"] for item in em_lote}) > 1
+        for item in em_lote:
+            contribuicoes = sum(c["contribuicao_percentual"] for c in item["breakdown"].values())
+            if ctx is None:
+                assert item["contexto_ajustes"] == []
+                assert item["score_percentual"] == pytest.approx(contribuicoes, abs=0.05)
+            else:
+                assert item["contexto_ajustes"]
+
+
+def test_calculate_many_lista_vazia(db_session, match_cenario):
+    """Sem candidatos nao ha consultas nem resultados."""
+    service = MatchScoringService(db_session)
+    assert service.calculate_many(match_cenario["versao"], []) == []
+
+
+def test_perfil_padrao_da_organizacao_muda_pesos_e_cache(client, db_session, match_cenario):
+    """
+    Testa se o perfil padrao criado em /admin/perfis-pesos vale para o motor e para
+    /match/score (com os pesos normalizados em pesos_utilizados), se invalida o resultado
+    em cache da versao e se um perfil nomeado inexistente da 404.
+    """
+    versao = match_cenario["versao"]
+    perfil_produtor = match_cenario["perfis"][0]
+    organizacao = Organizacao(tipo="municipality", nome="Prefeitura com perfil")
+    db_session.add(organizacao)
+    db_session.flush()
+    versao.demanda.organizacao_id = organizacao.id
+    db_session.commit()
+    perfis_pesos.invalidar()
+
+    engine = MatchEngineService(db_session)
+    antes = engine.execute_match(versao.id)
+    app.dependency_overrides[get_current_user] = lambda: perfil_produtor.user
+    try:
+        criado = client.post("/admin/perfis-pesos", json={
+            "organizacao_id": organizacao.id,
+            "nome": "regional",
+            "pesos": {"proximidade_geografica": 0.62},
+            "contexto": {"prioridades_edital": ["regional"]},
+            "padrao": True,
+        })
+        assert criado.status_code == 201
+        assert criado.json()["pesos_efetivos"]["proximidade_geografica"] == pytest.approx(0.62 / 1.5)
+
+        score = client.post("/match/score", json={"versao_demanda_id": versao.id, "produtor_id": perfil_produtor.id})
+        assert score.status_code == 200
+        assert score.json()["pesos_utilizados"]["proximidade_geografica"] == pytest.approx(0.62 / 1.5)
+        assert score.json()["contexto_ajustes"] == ["Bonus por proximidade alinhada a prioridade regional."]
+
+        inexistente = client.post("/match/score", json={
+            "versao_demanda_id": versao.id, "produtor_id": perfil_produtor.id, "perfil_pesos": "nao-existe",
+        })
+        assert inexistente.status_code == 404
+
+        invalido = client.post("/admin/perfis-pesos", json={
+            "organizacao_id": organizacao.id, "nome": "ruim", "pesos": {"preco": 1.0},
+        })
+        assert invalido.status_code == 400
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    depois = engine.execute_match(versao.id)
+    execucoes = db_session.query(ExecucaoMatch).filter(ExecucaoMatch.versao_demanda_id == versao.id).count()
+    assert execucoes == 2
+    assert depois.opcoes[0].produtores[0].justificativa != antes.opcoes[0].produtores[0].justificativa
+    perfis_pesos.invalidar()
+
+
+def test_shard_pontua_com_o_plano_do_processo_pai(db_session, match_cenario, monkeypatch):
+    """
+    Testa se o lote pontuado em outro processo usa o plano de score recebido do pai (ja
+    serializado, como vai para o filho), e nao o perfil em cache no proprio processo.
+    """
+    versao = match_cenario["versao"]
+    perfil_parcial = match_cenario["perfis"][1]  # so um dos dois produtos, longe da entrega
+    perfis_pesos.invalidar()
+    db_session.commit()  # o "filho" le por sessao propria
+    monkeypatch.setattr(
+        match_sharding, "get_session_local", lambda: sessionmaker(bind=db_session.get_bind(), autoflush=False)
+    )
+    so_produto = perfis_pesos.compilar(tuple(1.0 if key == "produto" else 0.0 for key in match_kernel.CRITERIOS))
+
+    def pontuar(plano):
+        ranking, _ = match_sharding.pontuar_shard(versao.id, [perfil_parcial.id], set(), 0, 5, plano=plano)
+        return ranking.melhores()[0].final_score
+
+    padrao = pontuar(None)
+    assert pontuar(pickle.loads(pickle.dumps(perfis_pesos.PLANO_PADRAO))) == pytest.approx(padrao)
+    assert pontuar(pickle.loads(pickle.dumps(so_produto))) == pytest.approx(0.5)
+    assert padrao != pytest.approx(0.5)
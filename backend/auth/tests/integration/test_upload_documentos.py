@@ -0,0 +1,48 @@
+import hashlib
+
+from main import app
+from models.Documento_model import Arquivo, DocumentoProdutor
+from models.Documentos_model import DocumentoUsuario
+from security.security import get_current_user
+from services import armazenamento
+
+PDF = b"%PDF-1.4 documento de teste " * 50
+
+
+def test_upload_de_documento_grava_versoes_e_recusa_acima_do_limite(client, db_session, match_cenario, tmp_path, monkeypatch):
+    """
+    Testa se /documentos/{id}/upload grava cada versao em disco com hash e tamanho, se
+    /documentos/upload-by-name grava no caminho registrado e se um arquivo acima do limite
+    recebe 413 sem deixar nada gravado.
+    """
+    monkeypatch.setattr(armazenamento, "STORAGE_DIR", tmp_path)
+    produtor = match_cenario["perfis"][0]
+    documento = db_session.query(DocumentoProdutor).filter(DocumentoProdutor.produtor_id == produtor.id).first()
+    arquivo_pdf = ("dap.pdf", PDF, "application/pdf")
+
+    app.dependency_overrides[get_current_user] = lambda: produtor.user
+    try:
+        primeira = client.post(f"/documentos/{documento.id}/upload", files={"file": arquivo_pdf})
+        segunda = client.post(f"/documentos/{documento.id}/upload", files={"file": arquivo_pdf})
+        por_nome = client.post(
+            "/documentos/upload-by-name", data={"nome_documento": "DAP"}, files={"file": arquivo_pdf}
+        )
+
+        monkeypatch.setattr(armazenamento, "LIMITE_DOCUMENTO_BYTES", len(PDF) - 1)
+        grande = client.post(f"/documentos/{documento.id}/upload", files={"file": arquivo_pdf})
+    finally:
+        del app.dependency_overrides[get_current_user]
+
+    assert (primeira.status_code, segunda.status_code, por_nome.status_code) == (201, 201, 201)
+    assert grande.status_code == 413
+
+    arquivo = db_session.get(Arquivo, segunda.json()["arquivo_id"])
+    assert arquivo.caminho_storage == f"/storage/documentos/{documento.id}/v2_dap.pdf"
+    assert arquivo.tamanho_bytes == len(PDF)
+    assert arquivo.hash_arquivo == hashlib.sha256(PDF).hexdigest()
+    assert sorted(caminho.name for caminho in (tmp_path / "documentos" / str(documento.id)).iterdir()) == [
+        "v1_dap.pdf", "v2_dap.pdf",
+    ]
+
+    registrado = db_session.get(DocumentoUsuario, por_nome.json()["documento_id"])
+    assert armazenamento.caminho_no_storage(registrado.caminho_arquivo).read_bytes() == PDF
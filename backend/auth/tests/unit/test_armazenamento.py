@@ -0,0 +1,46 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import UploadFile
+
+from services import armazenamento
+
+
+def _upload(conteudo: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(conteudo), filename="documento.pdf")
+
+
+def test_gravar_upload_copia_em_blocos_com_hash_e_tamanho(tmp_path, monkeypatch):
+    monkeypatch.setattr(armazenamento, "TAMANHO_BLOCO", 7)
+    conteudo = b"%PDF-1.4 " + bytes(range(256)) * 3
+    destino = tmp_path / "docs" / "a.pdf"
+
+    gravado = asyncio.run(armazenamento.gravar_upload(_upload(conteudo), destino, limite_bytes=len(conteudo)))
+
+    assert destino.read_bytes() == conteudo
+    assert gravado.tamanho_bytes == len(conteudo)
+    assert gravado.hash_sha256 == hashlib.sha256(conteudo).hexdigest()
+    assert [caminho.name for caminho in destino.parent.iterdir()] == ["a.pdf"]
+
+
+def test_limite_interrompe_a_copia_sem_deixar_arquivo(tmp_path, monkeypatch):
+    monkeypatch.setattr(armazenamento, "TAMANHO_BLOCO", 4)
+    destino = tmp_path / "a.pdf"
+
+    with pytest.raises(armazenamento.ArquivoMuitoGrandeError):
+        asyncio.run(armazenamento.gravar_upload(_upload(b"x" * 10), destino, limite_bytes=9))
+    assert list(tmp_path.iterdir()) == []
+
+    resumo = asyncio.run(armazenamento.resumir_upload(_upload(b"x" * 9), limite_bytes=9))
+    assert resumo.caminho is None and resumo.tamanho_bytes == 9
+
+
+def test_nome_seguro_e_caminho_no_storage():
+    assert armazenamento.nome_seguro("../../etc/passwd") == "passwd"
+    assert armazenamento.nome_seguro("Declaração DAP.pdf") == "Declara__o_DAP.pdf"
+    assert armazenamento.nome_seguro(None) == "arquivo"
+    assert armazenamento.caminho_no_storage("/storage/documentos/1/a.pdf") == (
+        armazenamento.STORAGE_DIR / "documentos" / "1" / "a.pdf"
+    )
@@ -0,0 +1,24 @@
+from services.equivalencias import FechoEquivalencias, montar_fecho, razao
+
+
+def test_razao_de_conversao():
+    assert razao("1:1") == 1.0
+    assert razao("2:1") == 0.5
+    assert razao("1kg:0,5") == 0.5
+    assert razao("3") == 3.0
+    assert razao(None) == razao("igual") == razao("0:1") == 1.0
+
+
+def test_fecho_transitivo_nos_dois_sentidos():
+    """
+    Testa se A->B (1 A = 2 B) e B->C (1 B = 3 C) dao o fecho completo com as razoes compostas:
+    fatores[demandado][ofertado] = unidades do demandado por unidade do ofertado.
+    """
+    fecho = FechoEquivalencias(montar_fecho([(1, 2, 2.0), (2, 3, 3.0), (4, 4, 1.0)]), "x")
+
+    assert fecho.substitutos(1) == {2: 0.5, 3: 0.5 / 3}
+    assert fecho.substitutos(3) == {2: 3.0, 1: 6.0}
+    assert fecho.fator(2, 1) == 2.0
+    assert fecho.fator(1, 1) == 1.0
+    assert fecho.fator(1, 4) is None
+    assert fecho.expandir({1, 5}) == {1, 2, 3, 5}
@@ -0,0 +1,95 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from services import extracao_pdf
+
+EDITAIS = Path(__file__).resolve().parents[2] / "storage" / "editais"
+
+
+def _edital() -> Path:
+    pdfs = sorted(EDITAIS.glob("*.pdf"))
+    if not pdfs:
+        pytest.skip("Nenhum edital de exemplo em storage/editais")
+    return pdfs[0]
+
+
+def test_dividir_faixas_cobre_paginas_em_ordem():
+    assert extracao_pdf.dividir_faixas(10, 4) == [(0, 3), (3, 6), (6, 8), (8, 10)]
+    assert extracao_pdf.dividir_faixas(3, 8) == [(0, 1), (1, 2), (2, 3)]
+    assert extracao_pdf.dividir_faixas(0, 4) == [(0, 0)]
+
+
+def test_extracao_paralela_igual_a_sequencial(monkeypatch):
+    caminho = _edital()
+    monkeypatch.setattr(extracao_pdf, "MIN_PAGINAS_PARALELO", 2)
+    try:
+        sequencial = extracao_pdf.extrair_paginas(caminho, processos=1)
+        paralela = extracao_pdf.extrair_paginas(caminho, processos=2, timeout_s=300)
+        limitada = extracao_pdf.extrair_paginas(caminho, max_pages=5, processos=2, timeout_s=300)
+    finally:
+        extracao_pdf.encerrar_processos(wait=True)
+
+    assert len(sequencial) == extracao_pdf.contar_paginas(caminho)
+    assert paralela == sequencial
+    assert limitada == sequencial[:5]
+
+
+def test_timeout_descarta_o_pool_e_termina_os_filhos(monkeypatch):
+    caminho = _edital()
+    monkeypatch.setattr(extracao_pdf, "MIN_PAGINAS_PARALELO", 2)
+    try:
+        # Os dois filhos ficam presos, como num PDF patologico
+        executor = extracao_pdf.get_executor(2)
+        presas = [executor.submit(time.sleep, 600) for _ in range(2)]
+        filhos = list(executor._processes.values())
+        with pytest.raises(TimeoutError):
+            extracao_pdf.extrair_paginas(caminho, processos=2, timeout_s=1)
+        assert extracao_pdf._executor is None
+        for filho in filhos:
+            filho.join(timeout=10)
+        assert filhos and not any(filho.is_alive() for filho in filhos)
+        assert all(presa.exception(timeout=10) for presa in presas)
+    finally:
+        extracao_pdf.encerrar_processos(wait=True)
+
+
+def test_relevancia_conta_termos_sem_acento_e_celulas():
+    assert extracao_pdf.relevancia("Ítem 01 - QUANTIDADE 10 kg - valor estimado R$ 5,00", 0) == 1.0 + 2.0 + 1.5 + 3.0
+    assert extracao_pdf.relevancia("kg " * 20, 0) == 1.5 * extracao_pdf.MAX_OCORRENCIAS
+    assert extracao_pdf.relevancia("sem termos", 30) == pytest.approx(3.0)
+
+
+def test_selecionar_mantem_capa_e_paginas_mais_relevantes_em_ordem():
+    Pagina = extracao_pdf.PaginaAnalisada
+    paginas = [
+        Pagina(0, 0.0, "a" * 40),
+        Pagina(1, 1.0, "b" * 40),
+        Pagina(2, 9.0, "c" * 40),
+        Pagina(3, 0.0, ""),
+        Pagina(4, 5.0, "d" * 40),
+    ]
+
+    escolhidas = extracao_pdf.selecionar(paginas, max_chars=124)
+
+    assert [pagina.indice for pagina in escolhidas] == [0, 2, 4]
+    assert [pagina.indice for pagina in extracao_pdf.selecionar(paginas, max_chars=20)] == [2]
+    assert len(extracao_pdf.selecionar(paginas, max_chars=20)[0].bloco) == 20
+
+
+def test_extracao_relevante_respeita_orcamento_e_para_cedo(monkeypatch):
+    caminho = _edital()
+    antecipada = extracao_pdf.extrair_relevante(caminho, max_chars=6000, processos=1)
+
+    assert len(antecipada.texto) <= 6000
+    assert antecipada.paginas_selecionadas[0] == 1
+    assert antecipada.paginas_selecionadas == sorted(antecipada.paginas_selecionadas)
+    assert "[tabela]" in antecipada.texto
+    assert antecipada.parada_antecipada and antecipada.paginas_lidas < antecipada.paginas_total
+
+    # Sem limiar alcancavel, le o documento inteiro antes de escolher
+    monkeypatch.setattr(extracao_pdf, "LIMIAR_RELEVANCIA", float("inf"))
+    completa = extracao_pdf.extrair_relevante(caminho, max_chars=6000, processos=1)
+    assert completa.paginas_lidas == completa.paginas_total and not completa.parada_antecipada
+    assert len(completa.texto) <= 6000
@@ -0,0 +1,48 @@
+from datetime import date
+
+import pytest
+
+from services.fluxo_solver import RedeFluxo
+from services.match_capacidade import LedgerCapacidade
+
+
+def test_fluxo_prefere_arcos_baratos_e_respeita_capacidades():
+    """
+    Testa se o fluxo atende toda a demanda possivel pelo menor custo: o produtor barato
+    enche primeiro, o caro completa, e o que sobra sai pelo arco de nao atendido.
+    """
+    rede = RedeFluxo()
+    rede.adicionar_arco("fonte", "item_a", 100, 0)
+    rede.adicionar_arco("fonte", "item_b", 50, 0)
+    barato_a = rede.adicionar_arco("item_a", "p1", 100, 1)
+    caro_a = rede.adicionar_arco("item_a", "p2", 100, 5)
+    barato_b = rede.adicionar_arco("item_b", "p1", 50, 1)
+    sobra_b = rede.adicionar_arco("item_b", "sumidouro", 50, 1000)
+    rede.adicionar_arco("p1", "sumidouro", 120, 0)
+    rede.adicionar_arco("p2", "sumidouro", 60, 0)
+
+    fluxo, custo = rede.resolver("fonte", "sumidouro")
+
+    assert fluxo == pytest.approx(150)
+    # p1 (120) e disputado pelos dois itens; p2 so atende o item a
+    assert rede.fluxo(barato_a) + rede.fluxo(barato_b) == pytest.approx(120)
+    assert rede.fluxo(caro_a) == pytest.approx(100 - rede.fluxo(barato_a))
+    assert rede.fluxo(sobra_b) == pytest.approx(0)
+    assert custo == pytest.approx(120 * 1 + 30 * 5)
+
+
+def test_ledger_debita_periodos_da_janela_do_mais_cedo_para_o_mais_tarde():
+    ledger = LedgerCapacidade()
+    ledger.adicionar_periodo(1, 10, date(2026, 4, 1), date(2026, 4, 30), 50)
+    ledger.adicionar_periodo(1, 10, date(2026, 3, 1), date(2026, 3, 31), 30)
+
+    # Reserva so de abril: marco fica intacto
+    assert ledger.comprometer(1, 10, 20, date(2026, 4, 10), date(2026, 4, 20)) == 20
+    assert ledger.disponivel(1, 10, date(2026, 3, 1), date(2026, 3, 31)) == 30
+    assert ledger.disponivel(1, 10) == 60
+
+    # Sem janela: consome marco primeiro e so cabe o que esta livre
+    assert ledger.comprometer(1, 10, 100) == 60
+    assert ledger.disponivel(1, 10) == 0
+    assert ledger.comprometido_por_chave() == {(1, 10): 80}
+    assert ledger.disponivel(2, 10) == 0
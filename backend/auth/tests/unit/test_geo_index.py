@@ -0,0 +1,39 @@
+import random
+
+from services import geo_index
+
+
+def _coberto(faixas, celula):
+    return any(inicio <= celula <= fim for inicio, fim in faixas)
+
+
+def test_faixas_cobrem_todos_os_pontos_dentro_do_raio():
+    """
+    Testa se toda celula de um ponto dentro do raio aparece nas faixas,
+    inclusive perto dos polos e do antimeridiano.
+    """
+    rnd = random.Random(7)
+    centros = [(-22.88, -43.10), (0.0, 179.9), (0.0, -179.9), (88.5, 10.0), (-89.0, -60.0)]
+    for centro in centros:
+        for raio in (10, 300, 2500):
+            faixas = geo_index.faixas_celulas(centro, raio)
+            for _ in range(300):
+                ponto = (
+                    max(-90.0, min(90.0, centro[0] + rnd.uniform(-raio / 100, raio / 100))),
+                    rnd.uniform(-180.0, 180.0),
+                )
+                if geo_index.haversine_km(centro, ponto) <= raio:
+                    assert _coberto(faixas, geo_index.celula_de(*ponto)), (centro, raio, ponto)
+
+
+def test_faixas_excluem_celulas_distantes():
+    """Testa se um raio pequeno nao inclui celulas a centenas de quilometros."""
+    faixas = geo_index.faixas_celulas((-22.88, -43.10), 50)
+
+    assert _coberto(faixas, geo_index.celula_de(-22.90, -43.20))
+    assert not _coberto(faixas, geo_index.celula_de(-21.75, -41.33))
+    assert not _coberto(faixas, geo_index.celula_de(-22.88, 136.90))
+
+
+def test_celula_sem_coordenadas():
+    assert geo_index.celula_de(None, -43.1) is None
@@ -0,0 +1,141 @@
+import itertools
+import random
+import time
+
+import numpy as np
+
+from services import group_solver
+
+
+def _cobre(capacidades, demanda, membros):
+    return np.all(capacidades[list(membros)].sum(axis=0) >= demanda - 1e-9)
+
+
+def _diferentes(grupo, outro):
+    return 2 * len(set(grupo) & set(outro)) < min(len(grupo), len(outro))
+
+
+def _instancia_estadual(n, p=30, seed=5):
+    """Todos os candidatos com um pouco de capacidade em cada produto (demanda estadual)."""
+    rng = np.random.default_rng(seed)
+    demanda = rng.integers(100, 1000, size=p).astype(float)
+    capacidades = rng.integers(1, 100, size=(n, p)).astype(float)
+    return capacidades, demanda, rng.random(n)
+
+
+def test_grupo_cobre_cada_produto_e_nao_a_soma_global():
+    """
+    Testa se o grupo precisa fechar cada produto: dois produtores fortes no mesmo produto
+    nao formam grupo se o outro produto ficar descoberto.
+    """
+    demanda = np.array([100.0, 50.0])
+    capacidades = np.array([
+        [90.0, 0.0],   # melhor score, so produto 0
+        [90.0, 0.0],
+        [20.0, 50.0],
+    ])
+    scores = np.array([0.9, 0.8, 0.5])
+
+    resultado = group_solver.resolver_grupos(capacidades, demanda, scores, k=5)
+
+    assert resultado.completo
+    assert resultado.grupos
+    for grupo in resultado.grupos:
+        assert 2 in grupo.membros
+        assert _cobre(capacidades, demanda, grupo.membros)
+    assert resultado.grupos[0].membros == [0, 2]
+
+
+def test_k_melhores_grupos_batem_com_forca_bruta():
+    """
+    Testa se os k grupos devolvidos sao exatamente os da enumeracao completa: percorrendo
+    os grupos irredundantes do melhor para o pior, fica cada um que e diferente (divide
+    menos da metade dos membros) de todos os que ja ficaram.
+    """
+    rnd = random.Random(3)
+    for _ in range(20):
+        n, p = 9, 4
+        demanda = np.array([rnd.choice([0, 50, 120]) for _ in range(p)], dtype=float)
+        capacidades = np.array(
+            [[rnd.choice([0, 0, 30, 60, 130]) for _ in range(p)] for _ in range(n)], dtype=float
+        )
+        scores = np.array([round(rnd.random(), 3) for _ in range(n)])
+
+        esperados = []
+        for tamanho in range(2, n + 1):
+            for membros in itertools.combinations(range(n), tamanho):
+                redundante = any(
+                    _cobre(capacidades, demanda, [m for m in membros if m != fora]) for fora in membros
+                )
+                if _cobre(capacidades, demanda, membros) and not redundante:
+                    esperados.append((tamanho, -float(scores[list(membros)].mean()), membros))
+        esperados.sort()
+        diversos = []
+        for esperado in esperados:
+            if len(diversos) < 4 and all(_diferentes(esperado[2], outro[2]) for outro in diversos):
+                diversos.append(esperado)
+
+        resultado = group_solver.resolver_grupos(capacidades, demanda, scores, k=4, prazo_ms=5000)
+
+        assert resultado.completo
+        assert [sorted(g.membros) for g in resultado.grupos] == [list(m) for _, _, m in diversos]
+        assert [round(g.score_medio, 9) for g in resultado.grupos] == [round(-m, 9) for _, m, _ in diversos]
+
+
+def test_prazo_interrompe_busca_em_instancia_grande():
+    """Testa se a busca respeita o prazo com dezenas de itens e centenas de fornecedores parciais."""
+    rng = np.random.default_rng(11)
+    n, p = 400, 35
+    demanda = rng.integers(50, 500, size=p).astype(float)
+    capacidades = np.where(rng.random((n, p)) < 0.15, rng.integers(10, 200, size=(n, p)), 0).astype(float)
+    scores = rng.random(n)
+
+    inicio = time.monotonic()
+    resultado = group_solver.resolver_grupos(capacidades, demanda, scores, k=3, prazo_ms=150)
+    decorrido_ms = (time.monotonic() - inicio) * 1000
+
+    assert decorrido_ms < 1000
+    assert resultado.grupos  # a semente gulosa sai antes do prazo
+    for grupo in resultado.grupos:
+        assert _cobre(capacidades, demanda, grupo.membros)
+
+
+def test_prazo_estourado_devolve_a_semente_gulosa():
+    """
+    Testa se, com milhares de candidatos cobrindo um pouco de tudo e o prazo estourando
+    antes de qualquer folha, cada rodada devolve a cobertura gulosa: grupos viaveis,
+    irredundantes e diferentes entre si.
+    """
+    capacidades, demanda, scores = _instancia_estadual(20000)
+
+    for prazo_ms in (0, 200):
+        inicio = time.monotonic()
+        resultado = group_solver.resolver_grupos(capacidades, demanda, scores, k=3, prazo_ms=prazo_ms)
+        decorrido_ms = (time.monotonic() - inicio) * 1000
+
+        assert not resultado.completo
+        assert decorrido_ms < prazo_ms + 500
+        assert len(resultado.grupos) == 3
+        for grupo in resultado.grupos:
+            assert _cobre(capacidades, demanda, grupo.membros)
+            assert not any(
+                _cobre(capacidades, demanda, [m for m in grupo.membros if m != fora]) for fora in grupo.membros
+            )
+        for primeiro, segundo in itertools.combinations(resultado.grupos, 2):
+            assert _diferentes(primeiro.membros, segundo.membros)
+        chaves = [(len(g.membros), -g.score_medio) for g in resultado.grupos]
+        assert chaves == sorted(chaves)
+
+
+def test_alocar_itens_respeita_capacidade_por_produto():
+    """Testa se itens do mesmo produto consomem a capacidade do membro so uma vez."""
+    capacidades = np.array([[60.0, 0.0], [100.0, 40.0]])
+    itens = [
+        group_solver.ItemAlocacao(produto_pos=0, quantidade=50.0),
+        group_solver.ItemAlocacao(produto_pos=0, quantidade=30.0),
+        group_solver.ItemAlocacao(produto_pos=1, quantidade=40.0),
+    ]
+
+    alocacoes = group_solver.alocar_itens([0, 1], capacidades, itens)
+
+    assert alocacoes == [[(0, 50.0)], [(0, 10.0), (1, 20.0)], [(1, 40.0)]]
@@ -0,0 +1,53 @@
+import random
+from datetime import date
+
+from services.janelas_entrega import ArvoreIntervalos, Parcela, capacidade_por_janela, parcelas_entrega
+
+
+def test_arvore_devolve_os_mesmos_intervalos_que_a_varredura():
+    """Testa se a consulta da arvore acha exatamente os intervalos que cruzam a janela, na ordem de inicio."""
+    rng = random.Random(3)
+    intervalos = []
+    for indice in range(300):
+        inicio = rng.randint(0, 1000)
+        intervalos.append((inicio, inicio + rng.randint(0, 60), indice))
+    arvore = ArvoreIntervalos(intervalos)
+    ordenados = sorted(intervalos, key=lambda item: (item[0], item[1]))
+
+    for _ in range(200):
+        inicio = rng.randint(-50, 1050)
+        fim = inicio + rng.randint(0, 80)
+        esperado = [payload for ini, fi, payload in ordenados if ini <= fim and fi >= inicio]
+        assert arvore.sobrepostos(inicio, fim) == esperado
+
+
+def test_parcelas_do_cronograma():
+    cronograma = {"parcelas": [
+        {"data": "2026-03-10", "quantidade": 40},
+        {"inicio": "2026-04-01", "fim": "2026-04-15"},
+        {"inicio": "2026-05-01", "fim": "2026-05-10"},
+    ]}
+    parcelas = parcelas_entrega(cronograma, 100)
+    assert [(p.inicio, p.fim, p.quantidade) for p in parcelas] == [
+        (date(2026, 3, 10), date(2026, 3, 10), 40),
+        (date(2026, 4, 1), date(2026, 4, 15), 30),
+        (date(2026, 5, 1), date(2026, 5, 10), 30),
+    ]
+    # Sem cronograma ou com data invalida: parcela unica sem janela
+    assert parcelas_entrega(None, 100) == [Parcela(None, None, 100)]
+    assert parcelas_entrega({"parcelas": [{"data": "10/03/2026"}]}, 100) == [Parcela(None, None, 100)]
+
+
+def test_capacidade_de_um_periodo_nao_conta_duas_vezes():
+    """
+    Testa se duas parcelas que cruzam o mesmo periodo dividem sua capacidade, e se a parcela
+    fora de todos os periodos do produtor nao e atendida por ele.
+    """
+    marco = (date(2026, 3, 1).toordinal(), date(2026, 3, 31).toordinal())
+    arvore = ArvoreIntervalos([(marco[0], marco[1], (0, 1, 60.0)), (marco[0], marco[1], (1, 2, 100.0))])
+    parcelas = [
+        Parcela(date(2026, 3, 5), date(2026, 3, 5), 50),
+        Parcela(date(2026, 3, 20), date(2026, 3, 20), 50),
+        Parcela(date(2026, 6, 1), date(2026, 6, 1), 50),
+    ]
+    assert capacidade_por_janela(arvore, parcelas) == {0: 60.0, 1: 100.0}
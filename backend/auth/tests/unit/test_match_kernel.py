@@ -0,0 +1,177 @@
+import numpy as np
+import pytest
+
+from services import match_kernel
+from services.perfis_pesos import PLANO_PADRAO, compilar
+
+IDX = match_kernel.IDX
+# 1 grau de latitude no raio medio do kernel (6371 km)
+KM_POR_GRAU = 6371 * np.pi / 180
+
+
+def _colunas(**campos) -> match_kernel.ColunasCandidatos:
+    """Colunas de um candidato por linha; campos omitidos ficam "sem dados"."""
+    n = len(campos["capacidade_por_produto"])
+    padrao = {
+        "produtos_cobertos": np.zeros((n, 2), dtype=bool),
+        "tem_produtos": np.zeros(n, dtype=bool),
+        "tem_itens": np.zeros(n, dtype=bool),
+        "tem_capacidade": np.zeros(n, dtype=bool),
+        "total_propostas": np.zeros(n, dtype=int),
+        "contratos_fechados": np.zeros(n, dtype=int),
+        "respostas": np.zeros(n, dtype=int),
+        "total_horas_resposta": np.zeros(n, dtype=float),
+        "documentos_avaliados": np.zeros(n, dtype=int),
+        "documentos_aprovados": np.zeros(n, dtype=int),
+        "perfil_completo": np.zeros(n, dtype=bool),
+        "latitude": np.full(n, np.nan),
+        "longitude": np.full(n, np.nan),
+    }
+    padrao.update({chave: np.asarray(valor) for chave, valor in campos.items() if chave != "produtos_substitutos"})
+    padrao["capacidade_por_produto"] = np.asarray(campos["capacidade_por_produto"], dtype=float)
+    substitutos = campos.get("produtos_substitutos")
+    return match_kernel.ColunasCandidatos(
+        n=n,
+        produto_ids=[10, 20],
+        produtos_substitutos=None if substitutos is None else np.asarray(substitutos),
+        **padrao,
+    )
+
+
+def _cenario() -> match_kernel.ColunasCandidatos:
+    """
+    Demanda de 100 + 50 na origem (0, 0):
+    0 - cobre os dois produtos (80 + 50), 3 de 4 propostas fechadas, 42 h de resposta,
+        2 de 4 documentos aprovados, na mesma coordenada da entrega;
+    1 - cobre so o primeiro produto, tem itens mas nenhuma capacidade, sem historico,
+        respostas, documentos nem coordenadas, perfil completo;
+    2 - portfolio vazio e nenhum outro dado.
+    """
+    return _colunas(
+        produtos_cobertos=[[True, True], [True, False], [False, False]],
+        capacidade_por_produto=[[80, 50], [0, 0], [0, 0]],
+        tem_produtos=[True, True, False],
+        tem_itens=[True, True, False],
+        tem_capacidade=[True, False, False],
+        total_propostas=[4, 0, 0],
+        contratos_fechados=[3, 0, 0],
+        respostas=[2, 0, 0],
+        total_horas_resposta=[84.0, 0.0, 0.0],
+        documentos_avaliados=[4, 0, 0],
+        documentos_aprovados=[2, 0, 0],
+        perfil_completo=[True, True, False],
+        latitude=[0.0, np.nan, np.nan],
+        longitude=[0.0, np.nan, np.nan],
+    )
+
+
+def _calcular(colunas, regras_contexto_fn=None) -> match_kernel.ScoreMatrix:
+    return match_kernel.calcular(
+        colunas, np.array([100.0, 50.0]), (0.0, 0.0), PLANO_PADRAO.pesos, regras_contexto_fn=regras_contexto_fn
+    )
+
+
+def test_scores_por_criterio_conferem_com_o_calculo_manual():
+    matriz = _calcular(_cenario())
+
+    # produto, capacidade, historico, proximidade, tempo_resposta, certificacoes
+    esperado = [
+        [1.0, 130 / 150, 3 / 4, 1.0, 1 - 42 / 168, 2 / 4],
+        [0.5, 0.4, 0.35, 0.5, 0.5, 0.4],
+        [0.0, 0.0, 0.35, 0.5, 0.5, 0.25],
+    ]
+    assert matriz.scores == pytest.approx(np.array(esperado))
+    assert matriz.disponivel.tolist() == [
+        [True] * 6,
+        [True, False, False, False, False, False],
+        [False] * 6,
+    ]
+    pesos = [0.28, 0.22, 0.18, 0.12, 0.10, 0.10]
+    bases = [sum(score * peso for score, peso in zip(linha, pesos)) for linha in esperado]
+    assert matriz.base == pytest.approx(bases)
+    assert matriz.total == pytest.approx(bases)
+    assert matriz.ajuste.tolist() == [0.0, 0.0, 0.0]
+
+    # confianca: 70% pela fracao de criterios com dados, 30% pela media dos disponiveis
+    assert matriz.confianca == pytest.approx([0.7 + 0.3 * np.mean(esperado[0]), 0.7 / 6 + 0.3 * 0.5, 0.2])
+
+
+def test_sem_capacidade_declarada_assume_a_demanda_inteira_nos_detalhes():
+    matriz = _calcular(_cenario())
+
+    assert matriz.quantidade_demandada == 150.0
+    assert matriz.quantidade_coberta == [130.0, 150.0, 150.0]
+    assert match_kernel.detalhes(matriz, 1)["capacidade"] == {"quantidade_demandada": 150.0, "quantidade_coberta": 150.0}
+    assert match_kernel.detalhes(matriz, 1)["historico"] == {"total_propostas": 0, "contratos_fechados": 0}
+    assert match_kernel.detalhes(matriz, 1)["proximidade"] == {"distancia_km": None}
+    assert match_kernel.detalhes(matriz, 0)["tempo_resposta"] == {"tempo_medio_horas": 42.0}
+
+
+def test_faixas_de_distancia():
+    graus = [0.4, 1.0, 2.0, 5.0, 6.0]
+    colunas = _colunas(
+        capacidade_por_produto=[[0, 0]] * len(graus),
+        latitude=graus,
+        longitude=[0.0] * len(graus),
+    )
+
+    matriz = _calcular(colunas)
+
+    # 44 km, 111 km, 222 km, 556 km e 667 km da entrega
+    assert matriz.scores[:, IDX["proximidade"]].tolist() == [1.0, 0.85, 0.65, 0.45, 0.25]
+    assert matriz.distancia_km == [round(grau * KM_POR_GRAU, 1) for grau in graus]
+    assert matriz.disponivel[:, IDX["proximidade"]].all()
+
+
+def test_substituto_vale_meio_item():
+    colunas = _colunas(
+        produtos_cobertos=[[True, False]],
+        produtos_substitutos=[[False, True]],
+        capacidade_por_produto=[[100, 0]],
+        tem_produtos=[True],
+    )
+
+    matriz = _calcular(colunas)
+
+    assert matriz.scores[0, IDX["produto"]] == (1 + 0.5) / 2
+    assert match_kernel.detalhes(matriz, 0)["produto"] == {
+        "total_itens_demanda": 2,
+        "itens_cobertos": 1,
+        "itens_por_substituto": 1,
+    }
+
+
+def test_regras_de_contexto_do_plano_ajustam_o_total():
+    """
+    Urgencia alta: +0.02 com tempo de resposta >= 0.75, -0.03 abaixo. Prioridade regional:
+    +0.02 com proximidade >= 0.7, -0.02 abaixo. Safra: +0.015 com capacidade >= 0.6.
+    """
+    plano = compilar(tuple(PLANO_PADRAO.pesos.tolist()), "alta", "safra", ("regional",))
+
+    matriz = _calcular(_cenario(), regras_contexto_fn=plano.avaliar)
+
+    assert matriz.ajuste == pytest.approx([0.02 + 0.015 + 0.02, -0.03 - 0.02, -0.03 - 0.02])
+    assert matriz.total == pytest.approx(matriz.base + matriz.ajuste)
+    notas = [[regra.nota for regra in matriz.regras_contexto if regra.mascara[linha]] for linha in range(3)]
+    assert notas[0] == [
+        "Bonus por boa resposta frente a urgencia alta.",
+        "Capacidade aderente a janela de safra informada.",
+        "Bonus por proximidade alinhada a prioridade regional.",
+    ]
+    assert notas[1] == notas[2] == [
+        "Penalidade: urgencia alta e tempo de resposta moderado.",
+        "Penalidade: prioridade regional sem proximidade suficiente.",
+    ]
+
+
+def test_total_fica_entre_zero_e_um():
+    def regras(scores):
+        return [
+            match_kernel.RegraContexto(np.array([True, False, False]), 0.5, "acima"),
+            match_kernel.RegraContexto(np.array([False, False, True]), -0.5, "abaixo"),
+        ]
+
+    matriz = _calcular(_cenario(), regras_contexto_fn=regras)
+
+    assert matriz.total[0] == 1.0 and matriz.total[2] == 0.0
+    assert matriz.total[1] == pytest.approx(matriz.base[1])
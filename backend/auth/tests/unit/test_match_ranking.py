@@ -0,0 +1,66 @@
+import pickle
+import random
+
+from services.match_ranking import CandidatoPontuado, RankingTopK
+
+
+def _candidatos(scores):
+    return [
+        CandidatoPontuado(produtor=None, final_score=score, quantidade_coberta=0.0, linha=ordem, ordem=ordem)
+        for ordem, score in enumerate(scores)
+    ]
+
+
+def test_heap_reproduz_top_k_da_ordenacao_estavel():
+    """
+    Testa se o heap limitado devolve os mesmos K candidatos, na mesma ordem, que ordenar a
+    lista completa por score (estavel: no empate, quem chegou antes).
+    """
+    rng = random.Random(7)
+    scores = [rng.choice([0.1, 0.25, 0.5, 0.75, 0.9]) for _ in range(200)]
+    candidatos = _candidatos(scores)
+
+    ranking = RankingTopK(5)
+    for candidato in candidatos:
+        ranking.oferecer(candidato)
+
+    esperado = sorted(candidatos, key=lambda c: -c.final_score)[:5]
+    assert [c.ordem for c in ranking.melhores()] == [c.ordem for c in esperado]
+
+
+def test_combinar_lotes_equivale_a_uma_passada():
+    """Testa se rankings parciais de varios lotes, combinados, dao o mesmo top-K."""
+    rng = random.Random(11)
+    candidatos = _candidatos([round(rng.random(), 2) for _ in range(120)])
+
+    unico = RankingTopK(5)
+    for candidato in candidatos:
+        unico.oferecer(candidato)
+
+    combinado = RankingTopK(5)
+    for inicio in range(0, len(candidatos), 17):
+        parcial = RankingTopK(5)
+        for candidato in candidatos[inicio:inicio + 17]:
+            parcial.oferecer(candidato)
+        combinado.combinar(parcial)
+
+    assert [c.ordem for c in combinado.melhores()] == [c.ordem for c in unico.melhores()]
+
+
+def test_ranking_destacado_atravessa_processos():
+    """
+    Testa se o ranking destacado (como volta de um processo de shard) e serializavel, leva a
+    opcao renderizada e combina no ranking do processo pai sem mudar a ordem.
+    """
+    candidatos = _candidatos([0.4, 0.9, 0.9, 0.1])
+    parcial = RankingTopK(3)
+    for candidato in candidatos:
+        parcial.oferecer(candidato)
+
+    destacado = pickle.loads(pickle.dumps(parcial.destacar(lambda c: f"opcao-{c.ordem}")))
+    pai = RankingTopK(3)
+    pai.combinar(destacado)
+
+    assert [c.ordem for c in pai.melhores()] == [1, 2, 0]
+    assert [c.opcao for c in pai.melhores()] == ["opcao-1", "opcao-2", "opcao-0"]
+    assert all(c.produtor is None and c.matriz is None for c in pai.melhores())
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from schemas.Match_schema import MatchContextInput
+from services import match_kernel
+from services.perfis_pesos import PLANO_PADRAO, compilar, pesos_do_perfil, pesos_efetivos
+
+
+def test_pesos_do_perfil_completa_com_o_padrao_e_normaliza():
+    assert pesos_do_perfil(None) == tuple(PLANO_PADRAO.pesos.tolist())
+
+    efetivos = pesos_efetivos({"compatibilidade_produto": 0.56, "capacidade": 0.22})
+    assert efetivos["compatibilidade_produto"] == pytest.approx(0.56 / 1.28)
+    assert efetivos["tempo_resposta"] == pytest.approx(0.10 / 1.28)
+    assert sum(efetivos.values()) == pytest.approx(1.0)
+
+    with pytest.raises(ValueError):
+        pesos_do_perfil({"preco": 0.5})
+    with pytest.raises(ValueError):
+        pesos_do_perfil({"historico_sucesso": -0.1})
+
+
+def test_plano_compilado_uma_vez_por_combinacao():
+    def contexto():
+        return MatchContextInput(urgencia="alta", prioridades_edital=["Prioridade regional"])
+
+    plano = PLANO_PADRAO.com_contexto(contexto())
+
+    assert plano is PLANO_PADRAO.com_contexto(contexto())
+    assert PLANO_PADRAO.com_contexto(None) is PLANO_PADRAO
+    assert plano.assinatura != PLANO_PADRAO.assinatura
+    tempo, proximidade = match_kernel.IDX["tempo_resposta"], match_kernel.IDX["proximidade"]
+    assert [regra.criterio for regra in plano.regras] == [tempo, tempo, proximidade, proximidade]
+
+
+def test_contexto_da_requisicao_substitui_o_do_perfil_campo_a_campo():
+    perfil = compilar(tuple(PLANO_PADRAO.pesos.tolist()), "baixa", "safra", ("certificacao",))
+    plano = perfil.com_contexto(MatchContextInput(urgencia="alta"))
+    assert plano.contexto == ("alta", "safra", ("certificacao",))
+
+
+def test_regras_avaliadas_sobre_a_matriz():
+    """Testa os limiares das regras de entressafra (capacidade < 0.5) e de safra (>= 0.6)."""
+    plano = compilar(tuple(PLANO_PADRAO.pesos.tolist()), None, "Entressafra", ())
+    scores = np.zeros((3, len(match_kernel.CRITERIOS)))
+    scores[:, match_kernel.IDX["capacidade"]] = [0.4, 0.55, 0.7]
+
+    bonus, penalidade = plano.avaliar(scores)
+    assert bonus.delta == 0.015 and bonus.mascara.tolist() == [False, False, True]
+    assert penalidade.delta == -0.015 and penalidade.mascara.tolist() == [True, False, False]
@@ -0,0 +1,24 @@
+import threading
+
+import pytest
+
+from services.worker_pool import FilaCheiaError, PoolTrabalho
+
+
+def test_pool_recusa_tarefas_acima_do_limite():
+    """Testa se o pool limita tarefas em execucao + pendentes e libera vagas ao concluir."""
+    pool = PoolTrabalho("teste", max_workers=1, max_pendentes=1)
+    liberar = threading.Event()
+    try:
+        primeira = pool.submit(liberar.wait, 5)
+        segunda = pool.submit(lambda: "ok")
+        with pytest.raises(FilaCheiaError):
+            pool.submit(lambda: "excedente")
+
+        liberar.set()
+        assert primeira.result(timeout=5) is True
+        assert segunda.result(timeout=5) == "ok"
+        assert pool.submit(lambda: 42).result(timeout=5) == 42
+    finally:
+        liberar.set()
+        pool.shutdown(wait=True)